@@ -0,0 +1,151 @@
+# benchmarks/cases.py
+"""
+รายการ hot path ที่ benchmark วัด
+
+แต่ละ case: setup(df_raw, df_ind) → (fn, items)
+- fn    : callable ไม่มี argument ที่ถูกจับเวลา (เตรียม input ไว้ใน setup แล้ว ไม่นับเวลา)
+- items : จำนวนหน่วยงานต่อ 1 ครั้งที่เรียก fn → ใช้คิด throughput (แท่ง/วินาที หรือ call/วินาที)
+
+sized=False = ไม่ขึ้นกับขนาด dataset (เช่น compute_sl_tp_by_ai) → วัดครั้งเดียว
+max_bars    = ข้ามขนาดที่ใหญ่กว่านี้ (เช่น LSTM fit บน 1M แท่งนานเกินไปสำหรับ benchmark)
+"""
+
+import contextlib
+import io
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core import indicators
+from core.position_sizing import calculate_position_size
+from core.regime import detect_regime, detect_regime_batch
+from core.rule_based import compute_rule_based_prob, compute_rule_based_prob_batch
+from core.trade_utils import compute_sl_tp_by_ai
+
+Setup = Callable[[pd.DataFrame, pd.DataFrame], Tuple[Callable[[], object], int]]
+
+# จำนวน input ต่อรอบของ case ที่เป็น scalar function เร็ว ๆ (วัดทั้งก้อนให้เวลานิ่งกว่าวัดทีละ call)
+SCALAR_BATCH = 10_000
+
+
+@dataclass
+class BenchCase:
+    name: str
+    setup: Setup
+    sized: bool = True
+    max_bars: Optional[int] = None
+    warmup: bool = True
+
+
+def _series(fn, column: str = "Close", **kwargs) -> Setup:
+    def setup(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+        series = df_raw[column]
+        return (lambda: fn(series, **kwargs)), len(df_raw)
+
+    return setup
+
+
+def _frame(fn, **kwargs) -> Setup:
+    def setup(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+        return (lambda: fn(df_raw, **kwargs)), len(df_raw)
+
+    return setup
+
+
+def _on_indicators(fn, scalar: bool) -> Setup:
+    """fn(df_ind): scalar = ดูแค่แท่งล่าสุด (1 call = 1 item) / batch = ทุกแท่ง"""
+
+    def setup(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+        return (lambda: fn(df_ind)), 1 if scalar else len(df_ind)
+
+    return setup
+
+
+def _make_lstm():
+    import torch
+
+    from core.lstm_model import ExtremeLSTM
+
+    torch.manual_seed(0)
+    return ExtremeLSTM(device="cpu")
+
+
+def _lstm_predict(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+    lstm = _make_lstm()
+    return (lambda: lstm.predict_prob(df_ind)), 1
+
+
+def _lstm_fit(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+    lstm = _make_lstm()
+
+    def run():
+        # fit() print loss ทุก epoch → กลืนไว้ไม่ให้ปนตาราง
+        with contextlib.redirect_stdout(io.StringIO()):
+            lstm.fit(df_ind, epochs=1, batch_size=32)
+
+    return run, max(len(df_ind) - 61, 0)
+
+
+def _sl_tp(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+    rng = np.random.default_rng(1)
+    regimes = np.array(["trending", "sideways", "reversal", "volatile", "unknown"])
+    inputs = list(
+        zip(
+            rng.uniform(1800, 2200, SCALAR_BATCH).tolist(),
+            rng.choice(["BUY", "SELL"], SCALAR_BATCH).tolist(),
+            rng.uniform(0.5, 8.0, SCALAR_BATCH).tolist(),
+            rng.choice(regimes, SCALAR_BATCH).tolist(),
+            rng.uniform(0.0, 1.0, SCALAR_BATCH).tolist(),
+            rng.uniform(0.0, 0.02, SCALAR_BATCH).tolist(),
+            rng.uniform(5.0, 50.0, SCALAR_BATCH).tolist(),
+        )
+    )
+
+    def run():
+        for entry, side, atr, regime, conf, bb_width, adx in inputs:
+            compute_sl_tp_by_ai(entry, side, atr, regime, conf, bb_width, adx)
+
+    return run, SCALAR_BATCH
+
+
+def _position_size(df_raw: pd.DataFrame, df_ind: pd.DataFrame):
+    rng = np.random.default_rng(2)
+    inputs = list(
+        zip(
+            rng.uniform(500, 50_000, SCALAR_BATCH).tolist(),
+            rng.uniform(0.5, 8.0, SCALAR_BATCH).tolist(),
+            rng.uniform(0.3, 0.7, SCALAR_BATCH).tolist(),
+            rng.uniform(1.0, 3.0, SCALAR_BATCH).tolist(),
+        )
+    )
+
+    def run():
+        for balance, atr, win_rate, avg_rr in inputs:
+            calculate_position_size(balance, atr, win_rate=win_rate, avg_rr=avg_rr)
+
+    return run, SCALAR_BATCH
+
+
+CASES: List[BenchCase] = [
+    BenchCase("indicators.rsi", _series(indicators.rsi, period=14)),
+    BenchCase("indicators.macd", _series(indicators.macd)),
+    BenchCase("indicators.atr", _frame(indicators.atr, period=14)),
+    BenchCase("indicators.adx", _frame(indicators.adx, period=14)),
+    BenchCase("indicators.ema", _series(indicators.ema, period=50)),
+    BenchCase("indicators.bollinger_bands", _series(indicators.bollinger_bands, period=20)),
+    BenchCase("indicators.volume_ma", _series(indicators.volume_ma, column="Volume", period=20)),
+    BenchCase("indicators.stochastic", _frame(indicators.stochastic)),
+    BenchCase("indicators.detect_candlestick_patterns", _frame(indicators.detect_candlestick_patterns)),
+    BenchCase("indicators.add_all_indicators", _frame(indicators.add_all_indicators)),
+    BenchCase("rule_based.compute_rule_based_prob", _on_indicators(compute_rule_based_prob, scalar=True)),
+    BenchCase("rule_based.compute_rule_based_prob_batch", _on_indicators(compute_rule_based_prob_batch, scalar=False)),
+    BenchCase("regime.detect_regime", _on_indicators(detect_regime, scalar=True)),
+    BenchCase("regime.detect_regime_batch", _on_indicators(detect_regime_batch, scalar=False)),
+    BenchCase("lstm.predict_prob", _lstm_predict),
+    # 1 epoch ต่อรอบ / ไม่ warm-up (รอบแรกก็คือการเทรนปกติ)
+    BenchCase("lstm.fit", _lstm_fit, max_bars=50_000, warmup=False),
+    BenchCase("trade_utils.compute_sl_tp_by_ai", _sl_tp, sized=False),
+    BenchCase("position_sizing.calculate_position_size", _position_size, sized=False),
+]
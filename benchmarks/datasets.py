@@ -0,0 +1,104 @@
+# benchmarks/datasets.py
+"""
+ชุดข้อมูล OHLC คงที่สำหรับ benchmark (time, Open, High, Low, Close, Volume แบบเดียวกับ scripts/backtest.py)
+
+- synthetic : random walk ที่ seed คงที่ + volatility สลับช่วง (ให้ regime / candlestick pattern หลากหลาย)
+              ขนาดเดียวกัน = ข้อมูลเดียวกันทุกครั้ง ทุกเครื่อง
+- recorded  : แท่งจริงจาก CSV หรือ "store:SYMBOL:TF" (ใช้ load_bars ตัวเดียวกับ backtest)
+              ถ้าแท่งจริงน้อยกว่าขนาดที่ขอ → ต่อท้ายด้วย return ชุดเดิมวนซ้ำ (รูปแท่งยังเป็นของจริง ไม่มีราคากระโดด)
+              ต้องมีแท่งจริงอย่างน้อย MIN_RECORDED_BARS (ไม่งั้นวนซ้ำ return ไม่กี่ตัว = ไม่ใช่ข้อมูลจริงแล้ว)
+              ชุดที่อยู่ใน repo: data/reference/EURUSD_H1.csv (5,000 แท่ง)
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DATASET_SIZES: Tuple[int, ...] = (500, 50_000, 1_000_000)
+
+SYNTHETIC_SEED = 20240101
+# = ขนาดเล็กสุดของ DATASET_SIZES → ขนาด 500 เป็นข้อมูลจริงล้วน
+MIN_RECORDED_BARS = 500
+_START = np.datetime64("2024-01-01T00:00:00")
+
+_cache: Dict[Tuple[str, int], pd.DataFrame] = {}
+
+
+def make_synthetic_ohlc(n: int, seed: int = SYNTHETIC_SEED) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # volatility เปลี่ยนทุก ๆ ~500 แท่ง → มีทั้งช่วง sideways / trending / volatile
+    regime_vol = rng.choice([0.3, 0.6, 1.2, 2.5], size=n // 500 + 1)
+    vol = np.repeat(regime_vol, 500)[:n]
+    drift = np.repeat(rng.normal(0.0, 0.05, size=n // 500 + 1), 500)[:n]
+
+    close = 2000.0 + np.cumsum(drift + rng.normal(0.0, 1.0, n) * vol)
+    close = np.maximum(close, 1.0)
+    open_ = np.empty(n)
+    open_[0] = close[0]
+    open_[1:] = close[:-1] + rng.normal(0.0, 0.05, n - 1) * vol[1:]
+    wick = np.abs(rng.normal(0.0, 0.6, (2, n))) * vol
+    high = np.maximum(open_, close) + wick[0]
+    low = np.maximum(np.minimum(open_, close) - wick[1], 0.5)
+
+    return pd.DataFrame(
+        {
+            "time": _START + np.arange(n) * np.timedelta64(60, "s"),
+            "Open": open_.round(2),
+            "High": high.round(2),
+            "Low": low.round(2),
+            "Close": close.round(2),
+            "Volume": rng.integers(50, 500, n),
+        }
+    )
+
+
+def _extend_by_returns(df: pd.DataFrame, n: int) -> pd.DataFrame:
+    """ต่อแท่งจริงให้ครบ n แท่ง: วนใช้ return + รูปแท่ง (ratio ต่อ close) ของข้อมูลเดิม"""
+    base = df.reset_index(drop=True)
+    m = len(base)
+    close = base["Close"].to_numpy(dtype=np.float64)
+    prev = np.r_[close[0], close[:-1]]
+    ret = close / prev
+    shape = {col: base[col].to_numpy(dtype=np.float64) / close for col in ("Open", "High", "Low")}
+
+    idx = np.arange(n) % m
+    new_close = close[0] * np.cumprod(ret[idx])
+    step = np.diff(base["time"].to_numpy()[-2:])[0] if m > 1 else np.timedelta64(60, "s")
+    return pd.DataFrame(
+        {
+            "time": base["time"].to_numpy()[0] + np.arange(n) * step,
+            "Open": new_close * shape["Open"][idx],
+            "High": new_close * shape["High"][idx],
+            "Low": new_close * shape["Low"][idx],
+            "Close": new_close,
+            "Volume": base["Volume"].to_numpy()[idx],
+        }
+    )
+
+
+def load_recorded_ohlc(path: str, n: int) -> pd.DataFrame:
+    from scripts.backtest import load_bars
+
+    key = (path, n)
+    if key not in _cache:
+        df = load_bars(path)[["time", "Open", "High", "Low", "Close", "Volume"]]
+        if len(df) < MIN_RECORDED_BARS:
+            raise ValueError(f"recorded dataset {path} มีแท่งไม่พอ ({len(df)} < {MIN_RECORDED_BARS})")
+        if len(df) >= n:
+            df = df.iloc[-n:].reset_index(drop=True)
+        else:
+            print(f"[BENCH] recorded {path}: {len(df)} bars → ต่อด้วย return เดิมให้ครบ {n}")
+            df = _extend_by_returns(df, n)
+        _cache[key] = df
+    return _cache[key]
+
+
+def get_dataset(n: int, recorded: Optional[str] = None) -> pd.DataFrame:
+    """recorded=None → synthetic"""
+    if recorded:
+        return load_recorded_ohlc(recorded, n)
+    key = ("synthetic", n)
+    if key not in _cache:
+        _cache[key] = make_synthetic_ohlc(n)
+    return _cache[key]
@@ -0,0 +1,288 @@
+# benchmarks/run.py
+"""
+Microbenchmark ของ hot path (indicators / rule engine / regime / LSTM / SL-TP / position sizing)
+
+    python -m benchmarks.run                                  # synthetic 500 / 50k / 1M แท่ง เทียบกับ baseline
+    python -m benchmarks.run --sizes 500,50000 --only indicators
+    python -m benchmarks.run data/reference/EURUSD_H1.csv     # recorded dataset (CSV)
+    python -m benchmarks.run --store                          # recorded จาก bar store ของ SYMBOL / TIMEFRAME
+    python -m benchmarks.run --save-baseline                  # บันทึกผลรอบนี้เป็น baseline
+
+- รัน offline ทั้งหมด: backend ของ core.broker เป็น SimulatedMT5 ที่ไม่มี feed (ไม่แตะ terminal จริง)
+- เวลา: median ของหลายรอบ (warm-up 1 รอบก่อน, ปิด gc ระหว่างจับเวลาแบบ timeit)
+- memory: peak จาก tracemalloc ของ 1 รอบแยกต่างหาก (ไม่นับ buffer ภายในของ torch)
+- ช้ากว่า baseline เกิน --tolerance หรือ memory เกิน --mem-tolerance → exit code 1
+  ไม่มี baseline (หรือไม่มี case ไหนใน baseline เลย) ก็ exit code 1 — ไม่ถือว่าผ่านโดยไม่ได้เทียบ
+  baseline ผูกกับเครื่อง: บันทึกใหม่ทุกครั้งที่เปลี่ยนเครื่อง / เวอร์ชัน numpy-pandas-torch
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.cases import CASES, BenchCase
+from benchmarks.datasets import DATASET_SIZES, get_dataset
+from core.broker import SimulatedMT5, set_broker
+from core.config import settings
+from core.indicators import add_all_indicators
+from core.state_bus import atomic_write_text
+
+# hot path ที่วัดไม่เรียกโบรก — ถ้ามีอะไรเรียก mt5.* ก็ได้โบรกจำลองแทน terminal จริง
+set_broker(SimulatedMT5())
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# ต่างกันน้อยกว่านี้ถือเป็น noise (ไม่ว่า % จะเท่าไร)
+NOISE_FLOOR_MS = 0.05
+MEM_NOISE_FLOOR_KB = 256
+
+
+def _environment() -> Dict[str, Any]:
+    env = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+    try:
+        import torch
+
+        env["torch"] = torch.__version__
+        env["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return env
+
+
+def time_calls(
+    fn: Callable[[], object],
+    warmup: bool,
+    min_time: float,
+    min_runs: int = 3,
+    max_runs: int = 200,
+) -> List[float]:
+    """เรียก fn ซ้ำจนครบ min_time วินาที (อย่างน้อย min_runs รอบ ยกเว้น 1 รอบนานเกิน 5×min_time)"""
+    if warmup:
+        fn()
+    samples: List[float] = []
+    total = 0.0
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(samples) < max_runs:
+            t0 = time.perf_counter()
+            fn()
+            dt = time.perf_counter() - t0
+            samples.append(dt)
+            total += dt
+            if total >= min_time and len(samples) >= min_runs:
+                break
+            if total >= 5 * min_time:
+                break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+
+def peak_memory_kb(fn: Callable[[], object]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024.0
+
+
+def run_case(case: BenchCase, df_raw, df_ind, dataset: str, min_time: float, memory: bool) -> Dict[str, Any]:
+    fn, items = case.setup(df_raw, df_ind)
+    samples = time_calls(fn, case.warmup, min_time)
+    median = float(np.median(samples))
+    return {
+        "case": case.name,
+        "dataset": dataset,
+        "bars": len(df_raw) if case.sized else None,
+        "runs": len(samples),
+        "median_ms": round(median * 1000.0, 4),
+        "min_ms": round(min(samples) * 1000.0, 4),
+        "items": items,
+        "items_per_sec": round(items / median, 1) if median > 0 else None,
+        "peak_kb": round(peak_memory_kb(fn), 1) if memory else None,
+    }
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    bars = result["bars"] if result["bars"] is not None else "-"
+    return f"{result['dataset']}:{result['case']}:{bars}"
+
+
+def _fmt_rate(rate: Optional[float]) -> str:
+    if not rate:
+        return "-"
+    for div, unit in ((1e9, "G"), (1e6, "M"), (1e3, "k")):
+        if rate >= div:
+            return f"{rate / div:.2f}{unit}/s"
+    return f"{rate:.1f}/s"
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    mem_tolerance: float,
+) -> List[str]:
+    """ใส่ "vs_baseline" ลงใน result แต่ละตัว + คืนรายการ regression (ว่าง = ผ่าน)"""
+    base_results = baseline.get("results", {})
+    regressions = []
+    for r in results:
+        base = base_results.get(result_key(r))
+        if not base:
+            continue
+        ratio = r["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        r["vs_baseline"] = round(ratio - 1.0, 4)
+        if ratio > 1.0 + tolerance and r["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS:
+            regressions.append(
+                f"{result_key(r)} time {base['median_ms']:.3f}ms → {r['median_ms']:.3f}ms (+{(ratio - 1) * 100:.0f}%)"
+            )
+        if r["peak_kb"] is not None and base.get("peak_kb"):
+            if (
+                r["peak_kb"] > base["peak_kb"] * (1.0 + mem_tolerance)
+                and r["peak_kb"] - base["peak_kb"] > MEM_NOISE_FLOOR_KB
+            ):
+                regressions.append(
+                    f"{result_key(r)} memory {base['peak_kb'] / 1024:.1f}MB → {r['peak_kb'] / 1024:.1f}MB"
+                )
+    return regressions
+
+
+def print_result(r: Dict[str, Any]) -> None:
+    bars = f"{r['bars']:,}" if r["bars"] is not None else "-"
+    peak = f"{r['peak_kb'] / 1024:.1f}MB" if r["peak_kb"] is not None else "-"
+    delta = f"{r['vs_baseline'] * 100:+.0f}%" if "vs_baseline" in r else ""
+    print(
+        f"{r['case']:<45} {bars:>10} {r['median_ms']:>11.3f}ms {r['min_ms']:>11.3f}ms "
+        f"{_fmt_rate(r['items_per_sec']):>11} {peak:>9} {delta:>6}"
+    )
+
+
+def run(
+    sizes: List[int],
+    only: Optional[List[str]] = None,
+    recorded: Optional[str] = None,
+    min_time: float = 0.5,
+    memory: bool = True,
+) -> List[Dict[str, Any]]:
+    dataset = f"recorded:{os.path.basename(recorded)}" if recorded else "synthetic"
+    cases = [c for c in CASES if not only or any(o in c.name for o in only)]
+    print(f"{'case':<45} {'bars':>10} {'median':>13} {'min':>13} {'throughput':>11} {'peak':>9}")
+
+    results = []
+    unsized = [c for c in cases if not c.sized]
+    for n in sizes:
+        sized = [c for c in cases if c.sized and (c.max_bars is None or n <= c.max_bars)]
+        if not sized:
+            continue
+        df_raw = get_dataset(n, recorded)
+        df_ind = add_all_indicators(df_raw)
+        for case in sized:
+            results.append(run_case(case, df_raw, df_ind, dataset, min_time, memory))
+            print_result(results[-1])
+
+    if unsized:
+        df_raw = get_dataset(min(sizes), recorded)
+        df_ind = add_all_indicators(df_raw)
+        for case in unsized:
+            results.append(run_case(case, df_raw, df_ind, dataset, min_time, memory))
+            print_result(results[-1])
+    return results
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: List[Dict[str, Any]]) -> None:
+    """merge ทับ baseline เดิม → รันบาง case / บางขนาดแล้ว save ได้โดยไม่ลบของเดิม"""
+    baseline = load_baseline(path)
+    baseline["environment"] = _environment()
+    baseline["saved_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    merged = baseline.get("results", {})
+    for r in results:
+        merged[result_key(r)] = {k: v for k, v in r.items() if k != "vs_baseline"}
+    baseline["results"] = dict(sorted(merged.items()))
+    atomic_write_text(path, json.dumps(baseline, ensure_ascii=False, indent=2))
+    print(f"[BENCH] baseline saved → {path} ({len(results)} results)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmark ของ hot path")
+    parser.add_argument("csv", nargs="?", help="recorded dataset (CSV หรือ store:SYMBOL:TF) — ไม่ใส่ = synthetic")
+    parser.add_argument("--store", action="store_true", help="ใช้ bar store ของ SYMBOL / TIMEFRAME ใน .env")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DATASET_SIZES), help="จำนวนแท่ง คั่นด้วย ,")
+    parser.add_argument("--only", help="วัดเฉพาะ case ที่ชื่อมีคำนี้ (คั่นด้วย ,)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="เวลาขั้นต่ำต่อ case (วินาที)")
+    parser.add_argument("--no-memory", action="store_true", help="ข้ามการวัด peak memory (เร็วขึ้น)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="ช้าลงได้ไม่เกิน (0.25 = 25%%)")
+    parser.add_argument("--mem-tolerance", type=float, default=0.25, help="memory เพิ่มได้ไม่เกิน")
+    parser.add_argument("--out", help="เขียนผลทั้งหมดเป็น JSON")
+    args = parser.parse_args(argv)
+
+    recorded = f"store:{settings.SYMBOL}:{settings.TIMEFRAME}" if args.store else args.csv
+    sizes = sorted({int(s) for s in args.sizes.split(",") if s.strip()})
+    only = [o.strip() for o in args.only.split(",") if o.strip()] if args.only else None
+
+    results = run(sizes, only, recorded, args.min_time, not args.no_memory)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.tolerance, args.mem_tolerance) if baseline else []
+    if baseline and baseline.get("environment") != _environment():
+        print(f"[BENCH] WARNING: baseline มาจาก environment อื่น {baseline.get('environment')} — ผลเทียบอาจไม่ตรง")
+
+    if args.out:
+        atomic_write_text(
+            args.out,
+            json.dumps({"environment": _environment(), "results": results}, ensure_ascii=False, indent=2),
+        )
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        return 0
+
+    if not baseline:
+        print(f"[BENCH] ERROR: ไม่มี baseline ที่ {args.baseline} (สร้างด้วย --save-baseline)")
+        return 1
+    compared = sum(1 for r in results if "vs_baseline" in r)
+    if not compared:
+        print(f"[BENCH] ERROR: ไม่มี case ไหนตรงกับ baseline {args.baseline} (dataset / ขนาดต่างกัน)")
+        return 1
+    if regressions:
+        print("=" * 80)
+        print(f"[BENCH] REGRESSION: {len(regressions)} รายการช้าลง / ใช้ memory มากกว่า baseline")
+        for line in regressions:
+            print("  -", line)
+        print("=" * 80)
+        return 1
+    print(f"[BENCH] OK — {compared}/{len(results)} case ไม่มี regression เกิน {args.tolerance:.0%} เทียบกับ {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,18 @@
 from typing import Dict, Optional
 
+import numpy as np
 import pandas as pd
 
 from .config import settings
-from .rule_based import compute_rule_based_prob
-from .lstm_model import ExtremeLSTM
-from .regime import detect_regime
+from .rule_based import compute_rule_based_prob, compute_rule_based_prob_batch
+from .lstm_model import ExtremeLSTM, FrozenLSTMInference, StreamingLSTMInference
+from .regime import detect_regime, detect_regime_batch
+from .ai_profile import get_amplify_factor
+
+
+def amplify_prob_up(raw_prob_up: np.ndarray, amplify_factor: float) -> np.ndarray:
+    """ขยายความต่างจาก 0.5 แล้ว clamp [0.05, 0.95] — สูตรเดียวกับ compute_ai() แบบ array"""
+    return np.clip(0.5 + (raw_prob_up - 0.5) * amplify_factor, 0.05, 0.95)
 
 
 class ExtremeAIEngine:
@@ -21,7 +28,23 @@ class ExtremeAIEngine:
         else:
             print("[AI] LSTM model not found, using Rule-based only.")
 
-    def compute_ai(self, df: pd.DataFrame) -> Dict:
+        # live inference: TorchScript frozen + buffer จองไว้ (ผลเท่ากับ predict_prob เดิม)
+        self.lstm_infer: Optional[FrozenLSTMInference] = None
+        if self.lstm_enabled and settings.LSTM_FROZEN_INFERENCE:
+            try:
+                self.lstm_infer = FrozenLSTMInference(self.lstm, num_threads=settings.LSTM_NUM_THREADS)
+            except Exception as e:
+                print(f"[AI] frozen LSTM unavailable, using eager model: {e}")
+
+        # streaming: เก็บ (h, c) ต่อ symbol เดินทีละแท่ง + resync กับ window เต็มทุก LSTM_RESYNC_BARS แท่ง
+        self.lstm_stream: Optional[StreamingLSTMInference] = None
+        if self.lstm_enabled and settings.LSTM_STREAMING:
+            self.lstm_stream = StreamingLSTMInference(self.lstm, resync_every=settings.LSTM_RESYNC_BARS)
+
+    def compute_ai(self, df: pd.DataFrame, stream_key: Optional[str] = None) -> Dict:
+        """
+        stream_key: ชื่อ stream (เช่น "XAUUSDm_M1") — ถ้าเปิด LSTM_STREAMING จะใช้ LSTM แบบ stateful ของ key นั้น
+        """
         regime = detect_regime(df)
 
         # --- Rule-based ---
@@ -31,7 +54,11 @@ class ExtremeAIEngine:
 
         # --- LSTM (ถ้ามีโมเดล) ---
         prob_up_lstm: Optional[float] = None
-        if self.lstm_enabled:
+        if self.lstm_stream is not None and stream_key is not None:
+            prob_up_lstm = self.lstm_stream.update(stream_key, df)
+        elif self.lstm_infer is not None:
+            prob_up_lstm = self.lstm_infer.predict_prob(df)
+        elif self.lstm_enabled:
             prob_up_lstm = self.lstm.predict_prob(df)
 
         # --- รวมผล: LSTM 70% + Rule-based 30% ถ้ามี LSTM ---
@@ -42,9 +69,9 @@ class ExtremeAIEngine:
 
         # ========== ขยายความต่างจาก 0.5 ให้ชัดขึ้น ==========
         # delta = raw_prob_up - 0.5
-        # amplified_delta = delta * factor  (ปรับได้ใน .env ผ่าน AI_AMPLIFY_FACTOR)
+        # amplified_delta = delta * factor  (AI_AMPLIFY_FACTOR ใน .env หรือ amplify_factor ของ AI profile)
         # prob_up = 0.5 + amplified_delta แล้วค่อย clamp ให้อยู่ใน [0.05, 0.95]
-        amplify_factor = float(getattr(settings, "AI_AMPLIFY_FACTOR", 3.0))
+        amplify_factor = get_amplify_factor()
         delta = raw_prob_up - 0.5
         amplified_delta = delta * amplify_factor
         prob_up = 0.5 + amplified_delta
@@ -81,3 +108,42 @@ class ExtremeAIEngine:
             "direction_rule": direction_rule,
             "direction_lstm": direction_lstm,
         }
+
+    def compute_ai_batch(self, df: pd.DataFrame, with_reasons: bool = False) -> Dict[str, np.ndarray]:
+        """
+        compute_ai() แบบ vectorized ทุกแถวของ indicator frame (สำหรับ backtest / research)
+        แถวที่ k ได้ค่าเดียวกับ compute_ai(df.iloc[: k + 1])
+        (ส่วน LSTM อาจต่างระดับ float32 rounding — ดู ExtremeLSTM.predict_prob_batch)
+        """
+        regime = detect_regime_batch(df)
+        rb = compute_rule_based_prob_batch(df, with_reasons=with_reasons)
+        prob_up_rb = rb["prob_up"]
+
+        prob_up_lstm = None
+        if self.lstm_enabled:
+            prob_up_lstm = self.lstm.predict_prob_batch(df)
+
+        if prob_up_lstm is not None:
+            has_lstm = ~np.isnan(prob_up_lstm)
+            raw_prob_up = np.where(has_lstm, 0.7 * prob_up_lstm + 0.3 * prob_up_rb, prob_up_rb)
+        else:
+            has_lstm = np.zeros(len(df), dtype=bool)
+            raw_prob_up = prob_up_rb
+
+        prob_up = amplify_prob_up(raw_prob_up, get_amplify_factor())
+        prob_down = 1.0 - prob_up
+
+        result = {
+            "prob_up": prob_up,
+            "prob_down": prob_down,
+            "direction": np.where(prob_up > 0.5, "UP", "DOWN"),
+            "confidence": np.abs(prob_up - 0.5) * 2.0,
+            "regime": regime,
+            "use_lstm": has_lstm,
+            "prob_up_lstm": prob_up_lstm,
+            "raw_prob_up": raw_prob_up,
+            "prob_up_rule": prob_up_rb,
+        }
+        if with_reasons:
+            result["reason_mask"] = rb["reason_mask"]
+        return result
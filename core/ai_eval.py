@@ -0,0 +1,263 @@
+# core/ai_eval.py
+"""
+ประเมินทิศทางของ AI จาก AI log แบบ incremental (ใช้กับ /api/eval_ai ของ dashboard)
+
+- metrics ทุกตัว (accuracy / winrate / avg pnl / avg win / avg loss) แยกเป็นผลรวมได้
+  → เก็บผลรวมต่อ (วัน, symbol/timeframe, horizon) แล้วรวมช่วงวันไหนก็ได้โดยไม่ต้องอ่าน log ใหม่
+- วันก่อนหน้าอ่านครั้งเดียวต่อ signature ของไฟล์ (npz / jsonl: size + mtime) → ถ้า writer ยัง flush buffer
+  ของเมื่อวานลง jsonl ตามมาทีหลัง signature เปลี่ยน → อ่านใหม่ / วันนี้อ่านเฉพาะบรรทัดใหม่ต่อท้าย jsonl
+- แถวที่ i ใช้ close ของแถวที่ i + horizon ใน stream (symbol, timeframe) เดียวกันของวันเดียวกัน
+- confirm = แถวที่ confirm_signal เป็น true (ใช้ future close ชุดเดียวกับ all)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .ai_logger import BASE_AI_LOG_DIR, _utc_day, get_daily_log_path, load_ai_logs
+
+EVAL_COLUMNS = ["symbol", "timeframe", "close", "ai_prob_up", "ai_prob_down", "confirm_signal"]
+
+# ลำดับช่องใน array ผลรวม
+_N, _CORRECT, _WIN, _PNL, _WIN_PNL, _LOSS_N, _LOSS_PNL = range(7)
+
+Stream = Tuple[str, str]
+
+
+def _sums(pred: np.ndarray, ret: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    if mask is not None:
+        pred, ret = pred[mask], ret[mask]
+    true_dir = np.sign(ret)
+    pnl = np.where(pred == 1, ret, -ret)
+    win = pnl > 0
+    loss = pnl < 0
+    return np.array(
+        [
+            len(pnl),
+            np.count_nonzero(pred == true_dir),
+            np.count_nonzero(win),
+            pnl.sum(),
+            pnl[win].sum(),
+            np.count_nonzero(loss),
+            pnl[loss].sum(),
+        ],
+        dtype=np.float64,
+    )
+
+
+def metrics_from_sums(s: np.ndarray) -> Dict[str, Any]:
+    n = int(s[_N])
+    if n == 0:
+        return {
+            "samples": 0,
+            "direction_acc": None,
+            "winrate": None,
+            "avg_pnl": None,
+            "avg_win": None,
+            "avg_loss": None,
+        }
+    return {
+        "samples": n,
+        "direction_acc": float(s[_CORRECT] / n),
+        "winrate": float(s[_WIN] / n),
+        "avg_pnl": float(s[_PNL] / n),
+        "avg_win": float(s[_WIN_PNL] / s[_WIN]) if s[_WIN] else None,
+        "avg_loss": float(-s[_LOSS_PNL] / s[_LOSS_N]) if s[_LOSS_N] else None,
+    }
+
+
+class _StreamSeries:
+    """close / ทิศที่ AI ทาย / confirm ของ 1 stream ใน 1 วัน + ผลรวมที่ finalize แล้วต่อ horizon"""
+
+    def __init__(self):
+        self.close = np.empty(0, dtype=np.float64)
+        self.pred = np.empty(0, dtype=np.int8)
+        self.confirm = np.empty(0, dtype=bool)
+        # horizon → (จำนวนแถวที่นับแล้ว, sums ของ all, sums ของ confirm)
+        self._done: Dict[int, Tuple[int, np.ndarray, np.ndarray]] = {}
+
+    def extend(self, close: np.ndarray, pred: np.ndarray, confirm: np.ndarray) -> None:
+        self.close = np.concatenate([self.close, close])
+        self.pred = np.concatenate([self.pred, pred])
+        self.confirm = np.concatenate([self.confirm, confirm])
+
+    def sums(self, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        """เดินต่อเฉพาะแถวที่เพิ่งมี future close ครบ horizon — แถวที่นับแล้วไม่คำนวณซ้ำ"""
+        done, s_all, s_conf = self._done.get(horizon) or (0, np.zeros(7), np.zeros(7))
+        ready = len(self.close) - horizon
+        if ready > done:
+            close = self.close[done:ready]
+            ret = self.close[done + horizon : ready + horizon] / close - 1.0
+            valid = np.isfinite(ret)
+            pred = self.pred[done:ready]
+            s_all = s_all + _sums(pred, ret, valid)
+            s_conf = s_conf + _sums(pred, ret, valid & self.confirm[done:ready])
+            done = ready
+        self._done[horizon] = (done, s_all, s_conf)
+        return s_all, s_conf
+
+
+def _extend_streams(series: Dict[Stream, _StreamSeries], df: pd.DataFrame) -> None:
+    if df.empty or "close" not in df.columns:
+        return
+    n = len(df)
+    symbol = df["symbol"].astype(str).to_numpy() if "symbol" in df.columns else np.full(n, "")
+    timeframe = df["timeframe"].astype(str).to_numpy() if "timeframe" in df.columns else np.full(n, "")
+
+    def num(col: str) -> np.ndarray:
+        if col not in df.columns:
+            return np.full(n, np.nan)
+        return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+
+    close = num("close")
+    prob_up = num("ai_prob_up")
+    prob_down = num("ai_prob_down")
+    pred = np.where(prob_up >= prob_down, 1, -1).astype(np.int8)
+    if "confirm_signal" in df.columns:
+        confirm = df["confirm_signal"].fillna(False).astype(bool).to_numpy()
+    else:
+        confirm = np.zeros(n, dtype=bool)
+
+    keys = pd.MultiIndex.from_arrays([symbol, timeframe])
+    for key, idx in pd.Series(np.arange(n)).groupby(keys).groups.items():
+        idx = np.asarray(idx)
+        series.setdefault(tuple(key), _StreamSeries()).extend(close[idx], pred[idx], confirm[idx])
+
+
+class AIEvalCache:
+    """
+    ผลประเมินแบบ incremental + cache ต่อ (ช่วงวัน, horizons, symbol)
+    refresh() อ่านเฉพาะบรรทัดใหม่ของ jsonl วันนี้ (จำกัดไม่เกิน 1 ครั้ง / min_refresh_sec)
+    วันก่อนหน้าเก็บไว้ไม่เกิน max_days วัน (LRU)
+    """
+
+    def __init__(
+        self,
+        base_dir: Optional[str] = None,
+        min_refresh_sec: float = 1.0,
+        max_results: int = 128,
+        max_days: int = 62,
+    ):
+        self.base_dir = base_dir or BASE_AI_LOG_DIR
+        self.min_refresh_sec = min_refresh_sec
+        self.max_results = max_results
+        self.max_days = max(int(max_days), 1)
+        self._lock = threading.Lock()
+        # วันก่อนหน้า: day → (signature ของไฟล์ตอนอ่าน, streams)
+        self._closed: "OrderedDict[str, Tuple[Optional[tuple], Dict[Stream, _StreamSeries]]]" = OrderedDict()
+        self._today: Optional[str] = None
+        self._today_offset = 0
+        self._today_series: Dict[Stream, _StreamSeries] = {}
+        self._version = 0
+        self._last_refresh = 0.0
+        self._results: "OrderedDict[tuple, Tuple[tuple, Dict[str, Any]]]" = OrderedDict()
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_refresh < self.min_refresh_sec:
+                return
+            self._last_refresh = now
+
+            today = _utc_day()
+            path = get_daily_log_path(today, base_dir=self.base_dir)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            if today != self._today or size < self._today_offset:
+                # ขึ้นวันใหม่ / ไฟล์ถูกเขียนใหม่ → เริ่มนับวันนี้ใหม่ (วันก่อนหน้าไปอ่านจากไฟล์ตอนถูกขอ)
+                self._today = today
+                self._today_offset = 0
+                self._today_series = {}
+                self._version += 1
+            if size <= self._today_offset:
+                return
+
+            with open(path, "rb") as f:
+                f.seek(self._today_offset)
+                chunk = f.read(size - self._today_offset)
+            end = chunk.rfind(b"\n") + 1  # อ่านเฉพาะบรรทัดที่เขียนจบแล้ว
+            if end <= 0:
+                return
+            self._today_offset += end
+
+            rows = []
+            for line in chunk[:end].decode("utf-8", errors="replace").splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue
+            if rows:
+                _extend_streams(self._today_series, pd.DataFrame(rows))
+                self._version += 1
+
+    def _day_signature(self, day: str) -> Optional[tuple]:
+        """npz = วันที่ compact แล้ว (ปิดจริง) / jsonl = (size, mtime) — เปลี่ยนเมื่อ writer flush เพิ่ม"""
+        for ext in ("npz", "jsonl"):
+            try:
+                st = os.stat(get_daily_log_path(day, ext, self.base_dir))
+            except OSError:
+                continue
+            return (ext, st.st_size, st.st_mtime_ns)
+        return None
+
+    def _day_series(self, day: str, signature: Optional[tuple]) -> Dict[Stream, _StreamSeries]:
+        if day == self._today:
+            return self._today_series
+        cached = self._closed.get(day)
+        if cached is not None and cached[0] == signature:
+            self._closed.move_to_end(day)
+            return cached[1]
+        series: Dict[Stream, _StreamSeries] = {}
+        _extend_streams(series, load_ai_logs(days=[day], columns=EVAL_COLUMNS, base_dir=self.base_dir))
+        self._closed[day] = (signature, series)
+        self._closed.move_to_end(day)
+        while len(self._closed) > self.max_days:
+            self._closed.popitem(last=False)
+        return series
+
+    def evaluate(
+        self,
+        days: Iterable[str],
+        horizons: Iterable[int],
+        symbol: Optional[str] = None,
+    ) -> Dict[int, Dict[str, Dict[str, Any]]]:
+        """คืน {horizon: {"all": metrics, "confirm": metrics}} ของช่วงวันที่ขอ"""
+        self.refresh()
+        days = tuple(sorted(set(days)))
+        horizons = tuple(sorted({max(int(h), 1) for h in horizons}))
+        key = (days, horizons, symbol or "")
+        with self._lock:
+            signatures = {day: self._day_signature(day) for day in days if day != self._today}
+            version = (self._version if self._today in days else 0, tuple(signatures.items()))
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == version:
+                self._results.move_to_end(key)
+                return cached[1]
+
+            result = {}
+            for h in horizons:
+                s_all, s_conf = np.zeros(7), np.zeros(7)
+                for day in days:
+                    for (sym, _tf), series in self._day_series(day, signatures.get(day)).items():
+                        if symbol and sym != symbol:
+                            continue
+                        a, c = series.sums(h)
+                        s_all += a
+                        s_conf += c
+                result[h] = {"all": metrics_from_sums(s_all), "confirm": metrics_from_sums(s_conf)}
+
+            self._results[key] = (version, result)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return result
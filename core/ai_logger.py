@@ -1,40 +1,383 @@
+import atexit
 import json
 import os
+import re
+import threading
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
 
 from .config import settings
+from .state_bus import atomic_write_text, state_bus
 
 # เดิม settings.AI_LOG_PATH อาจเป็น "logs/ai_log.jsonl"
 # ตรงนี้เราใช้เป็น base directory แทน
 BASE_AI_LOG_DIR = os.path.dirname(settings.AI_LOG_PATH) or "logs"
 LAST_STATE_PATH = settings.AI_LAST_STATE_PATH
 
+# ai_log_YYYY-MM-DD.jsonl = วันที่ยังเขียนอยู่ | ai_log_YYYY-MM-DD.npz = วันที่ปิดแล้ว (columnar)
+_DAY_FILE_RE = re.compile(r"^ai_log_(\d{4}-\d{2}-\d{2})\.(jsonl|npz)$")
+
+TimeArg = Union[str, datetime, pd.Timestamp, None]
+
+
+def _utc_day() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
-def get_daily_log_path() -> str:
+
+def get_daily_log_path(day: Optional[str] = None, ext: str = "jsonl", base_dir: Optional[str] = None) -> str:
     """
     สร้าง path สำหรับไฟล์ log ประจำวัน เช่น logs/ai_log_2025-12-09.jsonl
     """
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    filename = f"ai_log_{today}.jsonl"
-    return os.path.join(BASE_AI_LOG_DIR, filename)
+    filename = f"ai_log_{day or _utc_day()}.{ext}"
+    return os.path.join(base_dir or BASE_AI_LOG_DIR, filename)
+
+
+class AILogWriter:
+    """
+    เขียน AI log แบบ buffer: เปิดไฟล์ของวันค้างไว้ เก็บ record ไว้ใน memory
+    แล้วเขียนทีเดียวเมื่อครบ AI_LOG_FLUSH_ROWS แถว หรือเกิน AI_LOG_FLUSH_SEC วินาที
+    ขึ้นวันใหม่ (UTC) → ปิดไฟล์เก่าแล้ว compact วันที่ปิดแล้วเป็น .npz ใน background
+    """
+
+    def __init__(self, base_dir: str, flush_rows: int, flush_sec: float):
+        self.base_dir = base_dir
+        self.flush_rows = max(int(flush_rows), 1)
+        self.flush_sec = float(flush_sec)
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._lines: List[str] = []
+        self._file = None
+        self._day: Optional[str] = None
+        self._last_flush = time.time()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        day = _utc_day()
+        rolled = False
+        with self._lock:
+            if day != self._day:
+                self._flush_locked()
+                self._close_locked()
+                rolled = True
+                self._day = day
+            self._buffer.append(record)
+            self._lines.append(line)
+            if len(self._lines) >= self.flush_rows or time.time() - self._last_flush >= self.flush_sec:
+                self._flush_locked()
+        if rolled and settings.AI_LOG_COMPACT:
+            # วันก่อนหน้าปิดแล้ว (หรือเพิ่งเริ่มโปรแกรม) → compact โดยไม่ถ่วง loop เทรด
+            threading.Thread(
+                target=compact_ai_logs,
+                kwargs={"base_dir": self.base_dir},
+                name="ai-log-compact",
+                daemon=True,
+            ).start()
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """record ที่ยังอยู่ใน buffer (ยังไม่ลงไฟล์) — ให้ loader ใน process เดียวกันเห็นด้วย"""
+        with self._lock:
+            return list(self._buffer)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            self._close_locked()
+
+    def _flush_locked(self) -> None:
+        self._last_flush = time.time()
+        if not self._lines:
+            return
+        try:
+            if self._file is None:
+                os.makedirs(self.base_dir, exist_ok=True)
+                self._file = open(get_daily_log_path(self._day, base_dir=self.base_dir), "a", encoding="utf-8")
+            self._file.write("".join(self._lines))
+            self._file.flush()
+        except OSError as e:
+            print("[AI_LOG] write error:", e)
+            self._close_locked()
+            return
+        self._lines.clear()
+        self._buffer.clear()
+
+    def _close_locked(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+_writer = AILogWriter(BASE_AI_LOG_DIR, settings.AI_LOG_FLUSH_ROWS, settings.AI_LOG_FLUSH_SEC)
+atexit.register(_writer.close)
 
 
 def append_ai_log(record: Dict[str, Any]) -> None:
     """
-    เขียน 1 บรรทัดลงไฟล์ log ของวันปัจจุบัน (jsonl)
+    เพิ่ม 1 record ลง log ของวันปัจจุบัน (jsonl) — เขียนจริงเป็นชุดตาม AI_LOG_FLUSH_ROWS / AI_LOG_FLUSH_SEC
+    """
+    _writer.append(record)
+
+
+def flush_ai_log() -> None:
+    _writer.flush()
+
+
+# ---------- columnar compaction ----------
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except Exception:
+                # บรรทัดที่เขียนไม่จบ (เช่นโปรแกรมถูก kill) ข้ามไป
+                continue
+    return rows
+
+
+def _frame_from_rows(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    if "time" in df.columns:
+        # ISO8601 = แยก parse ทีละแถว (แถวของแท่ง / perf row เก่าที่มี microsecond ปนกันในวันเดียวได้)
+        df["time"] = pd.to_datetime(df["time"], errors="coerce", format="ISO8601")
+    return df
+
+
+def _column_array(series: pd.Series) -> np.ndarray:
+    """แปลง column เป็น array ที่ np.load ได้โดยไม่ต้อง pickle (datetime / float / int / bool / str)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=bool)
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype=np.int64)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=np.float64)
+
+    values = series.dropna()
+    if len(values) and values.map(lambda v: isinstance(v, bool)).all():
+        return series.fillna(False).to_numpy(dtype=bool)
+    numeric = pd.to_numeric(series, errors="coerce")
+    if len(values) and numeric.notna().sum() == len(values):
+        return numeric.to_numpy(dtype=np.float64)
+    return series.map(lambda v: "" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)).to_numpy(dtype=str)
+
+
+def compact_ai_logs(base_dir: Optional[str] = None) -> List[str]:
+    """
+    แปลงไฟล์ jsonl ของวันที่ปิดแล้ว (ก่อนวันนี้ UTC) เป็น ai_log_YYYY-MM-DD.npz (1 array ต่อ column)
+    แล้วลบ jsonl ทิ้ง — คืน list ของไฟล์ npz ที่สร้าง
+    """
+    base_dir = base_dir or BASE_AI_LOG_DIR
+    today = _utc_day()
+    created = []
+    for day in list_ai_log_days(base_dir):
+        if day >= today:
+            continue
+        jsonl_path = get_daily_log_path(day, "jsonl", base_dir)
+        npz_path = get_daily_log_path(day, "npz", base_dir)
+        if not os.path.exists(jsonl_path):
+            continue
+        try:
+            if not os.path.exists(npz_path):
+                df = _frame_from_rows(_read_jsonl(jsonl_path))
+                if "time" in df.columns:
+                    df = df.sort_values("time", kind="stable")
+                tmp_path = f"{npz_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **{str(col): _column_array(df[col]) for col in df.columns})
+                os.replace(tmp_path, npz_path)
+                created.append(npz_path)
+                print(f"[AI_LOG] compacted {os.path.basename(jsonl_path)} → {os.path.basename(npz_path)} ({len(df)} rows)")
+            # npz มีแล้ว = วันนั้นปิดไปแล้ว → ลบ jsonl (ถ้าครั้งก่อนลบไม่สำเร็จก็ลองใหม่)
+            os.remove(jsonl_path)
+        except Exception as e:
+            print(f"[AI_LOG] compact error {day}:", e)
+    return created
+
+
+# ---------- shared loader (eval / train / dashboard) ----------
+
+
+def list_ai_log_days(base_dir: Optional[str] = None) -> List[str]:
+    """วันที่มี log (YYYY-MM-DD) เรียงจากเก่า → ใหม่"""
+    base_dir = base_dir or BASE_AI_LOG_DIR
+    try:
+        names = os.listdir(base_dir)
+    except OSError:
+        return []
+    return sorted({m.group(1) for m in map(_DAY_FILE_RE.match, names) if m})
+
+
+def _to_datetime64(value: TimeArg) -> Optional[np.datetime64]:
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return np.datetime64(ts.value, "ns")
+
+
+def _match(values: np.ndarray, expected: Any) -> np.ndarray:
+    if isinstance(expected, (list, tuple, set, frozenset)):
+        return np.isin(values, list(expected))
+    return values == expected
+
+
+def _load_npz(
+    path: str,
+    start: Optional[np.datetime64],
+    end: Optional[np.datetime64],
+    columns: Optional[List[str]],
+    where: Dict[str, Any],
+) -> pd.DataFrame:
+    # np.load ของ npz อ่านทีละ array ตอนเรียก → กรองด้วย time / where ก่อน แล้วค่อยอ่าน column ที่ต้องใช้
+    with np.load(path, allow_pickle=False) as z:
+        names = z.files
+        mask = None
+        if "time" in names and (start is not None or end is not None):
+            t = z["time"]
+            mask = np.ones(len(t), dtype=bool)
+            if start is not None:
+                mask &= t >= start
+            if end is not None:
+                mask &= t < end
+        for col, expected in where.items():
+            if col not in names:
+                return pd.DataFrame()
+            m = _match(z[col], expected)
+            mask = m if mask is None else mask & m
+        wanted = [c for c in (columns or names) if c in names]
+        data = {c: z[c] if mask is None else z[c][mask] for c in wanted}
+    return pd.DataFrame(data)
+
+
+def _filter_frame(
+    df: pd.DataFrame,
+    start: Optional[np.datetime64],
+    end: Optional[np.datetime64],
+    columns: Optional[List[str]],
+    where: Dict[str, Any],
+) -> pd.DataFrame:
+    if df.empty:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if "time" in df.columns:
+        t = df["time"].to_numpy(dtype="datetime64[ns]")
+        if start is not None:
+            mask &= t >= start
+        if end is not None:
+            mask &= t < end
+    for col, expected in where.items():
+        if col not in df.columns:
+            return pd.DataFrame()
+        mask &= _match(df[col].to_numpy(), expected)
+    df = df[mask]
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def load_ai_logs(
+    start: TimeArg = None,
+    end: TimeArg = None,
+    columns: Optional[Iterable[str]] = None,
+    where: Optional[Dict[str, Any]] = None,
+    base_dir: Optional[str] = None,
+    days: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    โหลด AI log หลายวันเป็น DataFrame เดียว (เรียงตาม time) — ใช้ร่วมกันทั้ง eval / train / dashboard
+
+    start / end : ช่วงเวลา [start, end) ของ column time (เวลาแท่ง) — เลือกเฉพาะไฟล์ของวันที่เกี่ยวข้อง ±1 วัน
+    columns     : อ่านเฉพาะ column ที่ต้องใช้ (time ติดมาเสมอ)
+    where       : เงื่อนไขเท่ากับ เช่น {"symbol": "XAUUSDm", "confirm_signal": True}
+                  หรือ list ของค่าที่ยอมรับ เช่น {"timeframe": ["M1", "M5"]}
+    days        : ระบุวัน (YYYY-MM-DD) ตรง ๆ แทน start / end
+    ไฟล์ .npz อ่านแบบ column + กรองก่อนสร้าง DataFrame / วันนี้ (.jsonl) รวม record ที่ยังค้างใน buffer ด้วย
+    """
+    base_dir = base_dir or BASE_AI_LOG_DIR
+    where = dict(where or {})
+    columns = list(columns) if columns is not None else None
+    if columns is not None and "time" not in columns:
+        columns = ["time"] + columns
+    t_start, t_end = _to_datetime64(start), _to_datetime64(end)
+
+    same_dir = os.path.abspath(base_dir) == os.path.abspath(_writer.base_dir)
+    pending_day = _writer._day if same_dir else None
+    if days is not None:
+        selected = list(days)
+    else:
+        selected = list_ai_log_days(base_dir)
+        if pending_day and pending_day not in selected:
+            selected.append(pending_day)
+        # ไฟล์ตั้งชื่อตามวัน UTC ตอนเขียน แต่ column time เป็นเวลาแท่ง (เวลา server ของโบรก ต่างได้หลายชั่วโมง)
+        # → เลือกไฟล์เผื่อ ±1 วัน แล้วกรองแถวตาม time จริงอีกที
+        one_day = np.timedelta64(1, "D")
+        if start is not None:
+            first_day = str(t_start.astype("datetime64[D]") - one_day)
+            selected = [d for d in selected if d >= first_day]
+        if end is not None:
+            last_day = str(t_end.astype("datetime64[D]") + one_day)
+            selected = [d for d in selected if d <= last_day]
+
+    frames = []
+    for day in selected:
+        npz_path = get_daily_log_path(day, "npz", base_dir)
+        jsonl_path = get_daily_log_path(day, "jsonl", base_dir)
+        if os.path.exists(npz_path):
+            frames.append(_load_npz(npz_path, t_start, t_end, columns, where))
+        elif os.path.exists(jsonl_path):
+            df = _frame_from_rows(_read_jsonl(jsonl_path))
+            frames.append(_filter_frame(df, t_start, t_end, columns, where))
+
+    # record ที่ยังไม่ flush (bot กับ dashboard อยู่ process เดียวกัน)
+    if pending_day in selected:
+        pending = _writer.pending()
+        if pending:
+            frames.append(_filter_frame(_frame_from_rows(pending), t_start, t_end, columns, where))
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+    if "time" in df.columns:
+        df = df.sort_values("time", kind="stable").reset_index(drop=True)
+    return df
+
+
+def get_last_state_path(pair_key: Optional[str] = None) -> str:
+    """
+    pair_key=None → logs/last_state.json (pair หลัก / โหมดคู่เดียว)
+    pair_key="XAUUSDm_M5" → logs/last_state_XAUUSDm_M5.json
     """
-    path = get_daily_log_path()
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    if not pair_key:
+        return LAST_STATE_PATH
+    base, ext = os.path.splitext(LAST_STATE_PATH)
+    return f"{base}_{pair_key}{ext}"
 
 
-def write_last_state(state: Dict[str, Any]) -> None:
+def write_last_state(state: Dict[str, Any], pair_key: Optional[str] = None) -> None:
     """
-    เก็บ last_state สำหรับ Dashboard (ไฟล์เดียว)
+    เก็บ last_state สำหรับ Dashboard (ต่อ pair)
+    - publish เข้า state bus (dashboard ใน process เดียวกันได้ทันที ไม่ต้องอ่านไฟล์)
+    - เขียนไฟล์แบบ atomic เป็น fallback สำหรับ dashboard ที่รันแยก process
     """
-    path = LAST_STATE_PATH
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False)
+    payload = state_bus.publish(state, pair_key)
+    if settings.STATE_FILE_FALLBACK:
+        atomic_write_text(get_last_state_path(pair_key), payload)
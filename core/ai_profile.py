@@ -0,0 +1,147 @@
+# core/ai_profile.py
+"""
+AI profile: พารามิเตอร์ที่เคย hardcode ไว้ใน main.py / trade_utils.py / ai_engine.py
+
+- modes       : threshold CONFIRM ของแต่ละ AI_MODE (th_up, th_down, th_conf, macd_margin)
+                + amplify_factor / rr_matrix ของ mode นั้น (optional — optimize แยกทีละ mode)
+- rr_matrix   : regime → [[min_confidence, atr_mult_sl, rr], ...] (เรียงจาก confidence สูง → ต่ำ)
+- amplify_factor : ตัวขยาย prob_up รอบ 0.5 (None = ใช้ AI_AMPLIFY_FACTOR จาก .env)
+  lookup: ค่าใน modes[AI_MODE] → ค่าระดับบนของ profile → default
+
+ไฟล์ profile สร้างจาก scripts/optimize.py (walk-forward) แล้วชี้ด้วย AI_PROFILE_PATH
+ไม่ได้ตั้ง / ไฟล์ไม่มี → ใช้ค่า default ชุดเดิมทั้งหมด
+"""
+
+import copy
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .state_bus import atomic_write_text
+
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "version": 1,
+    "amplify_factor": None,
+    "modes": {
+        # SAFE: ยิงน้อยมาก เน้นชัวร์
+        "SAFE": {"th_up": 0.65, "th_down": 0.65, "th_conf": 0.60, "macd_margin": 0.00},
+        # NORMAL: กลาง ๆ
+        "NORMAL": {"th_up": 0.58, "th_down": 0.58, "th_conf": 0.45, "macd_margin": 0.03},
+        # AGGRESSIVE: ยิงบ่อยขึ้น เน้นตามตลาดเร็ว
+        "AGGRESSIVE": {"th_up": 0.53, "th_down": 0.53, "th_conf": 0.35, "macd_margin": 0.07},
+    },
+    "rr_matrix": {
+        # ตลาด volatile → SL กว้างขึ้นป้องกันถูก stop ก่อนเวลา
+        "volatile": [[0.0, 2.2, 1.5]],
+        "trending": [[0.7, 1.8, 2.5], [0.5, 1.6, 2.0], [0.0, 1.4, 1.8]],
+        "reversal": [[0.65, 1.5, 2.0], [0.0, 1.3, 1.6]],
+        # sideways / unknown
+        "sideways": [[0.0, 1.2, 1.4]],
+    },
+}
+
+_lock = threading.Lock()
+# (path, mtime, profile) — โหลดใหม่เมื่อไฟล์ถูกแก้ (optimize แล้ว bot ไม่ต้อง restart)
+_cache: Tuple[Optional[str], Optional[float], Dict[str, Any]] = (None, None, DEFAULT_PROFILE)
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """merge profile จากไฟล์ทับ default — ไฟล์ที่มีแค่บางส่วน (เช่น mode เดียว) ก็ใช้ได้"""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_ai_profile(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    คืน profile ปัจจุบัน (default + ค่าจากไฟล์) — cache ไว้จนกว่า mtime ของไฟล์จะเปลี่ยน
+    """
+    global _cache
+    path = settings.AI_PROFILE_PATH if path is None else path
+    if not path:
+        return DEFAULT_PROFILE
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return DEFAULT_PROFILE
+
+    cached_path, cached_mtime, cached = _cache
+    if cached_path == path and cached_mtime == mtime:
+        return cached
+
+    with _lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = _merge(DEFAULT_PROFILE, json.load(f))
+        except (OSError, ValueError) as e:
+            print("[AI_PROFILE] load error:", e)
+            profile = DEFAULT_PROFILE
+        else:
+            print(f"[AI_PROFILE] loaded {path}")
+        _cache = (path, mtime, profile)
+    return profile
+
+
+def save_ai_profile(profile: Dict[str, Any], path: str) -> None:
+    atomic_write_text(path, json.dumps(profile, ensure_ascii=False, indent=2))
+
+
+def _mode_profile(mode: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(profile, ค่าของ mode) — mode None = AI_MODE, mode ที่ไม่มีใน profile = NORMAL"""
+    mode = (mode or getattr(settings, "AI_MODE", "NORMAL")).upper()
+    profile = load_ai_profile()
+    modes = profile["modes"]
+    return profile, modes.get(mode) or modes["NORMAL"]
+
+
+def get_mode_thresholds(mode: Optional[str] = None) -> Tuple[float, float, float, float]:
+    """คืน (th_up, th_down, th_conf, macd_margin) ของ mode (default = AI_MODE)"""
+    _, th = _mode_profile(mode)
+    return (
+        float(th["th_up"]),
+        float(th["th_down"]),
+        float(th["th_conf"]),
+        float(th["macd_margin"]),
+    )
+
+
+def get_rr_matrix(mode: Optional[str] = None) -> Dict[str, List[List[float]]]:
+    profile, th = _mode_profile(mode)
+    return th.get("rr_matrix") or profile["rr_matrix"]
+
+
+def lookup_rr(
+    regime: str,
+    confidence: float,
+    rr_matrix: Optional[Dict[str, List[List[float]]]] = None,
+    mode: Optional[str] = None,
+) -> Tuple[float, float]:
+    """
+    คืน (atr_mult_sl, rr) ของ regime + confidence
+    ใช้แถวแรกที่ confidence > min_confidence (แถวสุดท้ายเป็นค่า fallback เสมอ)
+    rr_matrix None = matrix ของ mode (default = AI_MODE)
+    """
+    matrix = rr_matrix if rr_matrix is not None else get_rr_matrix(mode)
+    rows = matrix.get(regime) or matrix["sideways"]
+    for min_conf, atr_mult_sl, rr in rows[:-1]:
+        if confidence > min_conf:
+            return float(atr_mult_sl), float(rr)
+    _, atr_mult_sl, rr = rows[-1]
+    return float(atr_mult_sl), float(rr)
+
+
+def get_amplify_factor(mode: Optional[str] = None) -> float:
+    profile, th = _mode_profile(mode)
+    factor = th.get("amplify_factor")
+    if factor is None:
+        factor = profile.get("amplify_factor")
+    if factor is None:
+        return float(getattr(settings, "AI_AMPLIFY_FACTOR", 3.0))
+    return float(factor)
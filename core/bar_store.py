@@ -0,0 +1,180 @@
+# core/bar_store.py
+"""
+Local columnar OHLC bar store (ต่อ symbol / timeframe)
+
+เก็บแท่งเป็นไฟล์ binary ของ numpy structured records (time, open, high, low, close, volume)
+อ่านผ่าน np.memmap → ดึงแค่ช่วงที่ต้องการโดยไม่ต้องโหลดทั้งไฟล์
+เขียนแบบ append-only: แท่งที่ time ซ้ำกับแท่งท้ายไฟล์ (แท่งที่ยังไม่ปิด) จะถูกเขียนทับในที่เดิม
+ไฟล์ไม่ถูก truncate ระหว่าง append → memmap / view ที่ reader ถืออยู่ยังอ่านได้เสมอ
+
+ใช้โดย core.data_feed (live loop), scripts/train_ai.py และ scripts/backtest.py
+ข้อมูลอยู่บน disk → อยู่รอดแม้ MT5 terminal restart
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import settings
+
+BAR_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),  # epoch seconds (เวลาของโบรก แบบเดียวกับ MT5 rates)
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<i8"),
+    ]
+)
+
+
+def rates_to_records(rates) -> np.ndarray:
+    """แปลง rates จาก MT5 (structured array: time, open, ..., tick_volume) เป็น BAR_DTYPE"""
+    rates = np.asarray(rates)
+    out = np.empty(len(rates), dtype=BAR_DTYPE)
+    out["time"] = rates["time"]
+    out["open"] = rates["open"]
+    out["high"] = rates["high"]
+    out["low"] = rates["low"]
+    out["close"] = rates["close"]
+    vol_field = "tick_volume" if "tick_volume" in rates.dtype.names else "volume"
+    out["volume"] = rates[vol_field]
+    return out
+
+
+def records_to_frame(records: np.ndarray) -> pd.DataFrame:
+    """records → DataFrame แบบเดียวกับ get_recent_ohlc() (time, Open, High, Low, Close, Volume)"""
+    return pd.DataFrame(
+        {
+            "time": pd.to_datetime(records["time"], unit="s"),
+            "Open": records["open"],
+            "High": records["high"],
+            "Low": records["low"],
+            "Close": records["close"],
+            "Volume": records["volume"],
+        }
+    )
+
+
+class BarStore:
+    """
+    ไฟล์แท่งเทียนของ 1 symbol / timeframe: <base_dir>/<SYMBOL>_<TF>.bars
+    """
+
+    def __init__(self, base_dir: str, symbol: str, timeframe: str):
+        self.symbol = symbol
+        self.timeframe = timeframe.upper()
+        self.path = os.path.join(base_dir, f"{symbol}_{self.timeframe}.bars")
+        self._lock = threading.Lock()
+        self._mm: Optional[np.memmap] = None
+        self._mm_size = -1
+
+    def _records(self) -> np.ndarray:
+        """memmap ของทั้งไฟล์ (เปิดใหม่เมื่อขนาดไฟล์เปลี่ยน)"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        count = size // BAR_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        if self._mm is None or self._mm_size != size:
+            self._mm = np.memmap(self.path, dtype=BAR_DTYPE, mode="r", shape=(count,))
+            self._mm_size = size
+        return self._mm
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records())
+
+    def first_time(self) -> Optional[int]:
+        with self._lock:
+            recs = self._records()
+            return int(recs["time"][0]) if len(recs) else None
+
+    def last_time(self) -> Optional[int]:
+        with self._lock:
+            recs = self._records()
+            return int(recs["time"][-1]) if len(recs) else None
+
+    def tail(self, n: int) -> np.ndarray:
+        with self._lock:
+            return np.array(self._records()[-n:]) if n > 0 else np.empty(0, dtype=BAR_DTYPE)
+
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """อ่านแท่งช่วง time ∈ [start, end] (epoch seconds) — memmap view ไม่ copy"""
+        with self._lock:
+            recs = self._records()
+            times = recs["time"]
+            lo = int(np.searchsorted(times, start, side="left")) if start is not None else 0
+            hi = int(np.searchsorted(times, end, side="right")) if end is not None else len(recs)
+            return recs[lo:hi]
+
+    def append(self, records: np.ndarray) -> int:
+        """
+        เพิ่มแท่งใหม่ (เรียงตาม time) — แท่งที่ time >= แท่งแรกของ records ในไฟล์จะถูกเขียนทับ
+        เขียนที่ offset ของแท่งนั้นแล้วต่อท้าย (ไม่ truncate) — ไฟล์ยาวขึ้นหรือเท่าเดิมเสมอ
+        records จบก่อนแท่งท้ายไฟล์ (จะทำให้ไฟล์สั้นลง) → merge() แทน
+        คืนจำนวนแท่งที่เขียน
+        """
+        if len(records) == 0:
+            return 0
+        records = np.asarray(records, dtype=BAR_DTYPE)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            recs = self._records()
+            keep = int(np.searchsorted(recs["time"], records["time"][0], side="left")) if len(recs) else 0
+            shrink = keep + len(records) < len(recs)
+            if not shrink:
+                mode = "r+b" if os.path.exists(self.path) else "wb"
+                with open(self.path, mode) as f:
+                    f.seek(keep * BAR_DTYPE.itemsize)
+                    f.write(records.tobytes())
+                return len(records)
+        self.merge(records)
+        return len(records)
+
+    def replace(self, records: np.ndarray) -> None:
+        """เขียนทั้งไฟล์ใหม่ (ใช้ตอน backfill history ที่เก่ากว่าแท่งแรกในไฟล์)"""
+        records = np.asarray(records, dtype=BAR_DTYPE)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._mm = None
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(records.tobytes())
+            os.replace(tmp_path, self.path)
+
+    def merge(self, records: np.ndarray) -> None:
+        """รวม records เข้ากับของเดิม (time ซ้ำ → ใช้ของใหม่)"""
+        records = np.asarray(records, dtype=BAR_DTYPE)
+        with self._lock:
+            old = np.array(self._records())
+        if len(old) == 0:
+            self.replace(records)
+            return
+        old = old[~np.isin(old["time"], records["time"])]
+        merged = np.concatenate([old, records])
+        merged = merged[np.argsort(merged["time"], kind="stable")]
+        self.replace(merged)
+
+    def to_frame(self, n: Optional[int] = None) -> pd.DataFrame:
+        records = self.tail(n) if n is not None else np.array(self.read())
+        return records_to_frame(records)
+
+
+_STORES: Dict[Tuple[str, str], BarStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_bar_store(symbol: str, timeframe: str, base_dir: Optional[str] = None) -> BarStore:
+    """BarStore ตัวเดียวต่อ symbol/timeframe ทั้ง process"""
+    base_dir = base_dir or settings.BAR_STORE_DIR
+    key = (os.path.join(base_dir, symbol), timeframe.upper())
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = BarStore(base_dir, symbol, timeframe)
+            _STORES[key] = store
+        return store
@@ -0,0 +1,905 @@
+# core/broker.py
+"""
+Broker / feed backend ที่สลับได้ (BROKER_BACKEND=mt5 | sim)
+
+core.data_feed / core.mt5_trader เรียกผ่าน `mt5` ในไฟล์นี้ (proxy) แทน `import MetaTrader5` ตรง ๆ
+- LiveMT5Backend : ส่งต่อทุก call ไปที่ package MetaTrader5 (import ตอนใช้ครั้งแรก) — พฤติกรรมเดิม
+- SimulatedMT5   : โบรกจำลองในเครื่อง replay แท่ง (CSV / bar store) หรือ tick ด้วยนาฬิกาจำลอง
+                   API ชุดเดียวกับ MT5 (copy_rates_from_pos / symbol_info_tick / order_send /
+                   positions_get / account_info / history_deals_get) → รัน main.main_loop บน Linux / CI ได้
+
+นอกจาก API ของ MT5 แล้ว backend มีนาฬิกาของตัวเอง:
+- time()                 : เวลาปัจจุบัน (epoch seconds) — live = time.time(), sim = เวลาที่ replay ถึง
+- server_offset()        : วินาทีที่นาฬิกาโบรก (tick.time / deal.time) นำหน้า time() — sim = 0
+- server_time()          : time() + server_offset() → เทียบกับ deal.time / history_deals_get ได้ตรง
+- sleep(sec, stop_event) : live = รอจริง, sim = เลื่อนนาฬิกาจำลอง (SIM_SPEED=0 → ไม่รอเลย)
+- register_worker() / unregister_worker() : หลาย pair thread ใช้นาฬิกาจำลองร่วมกัน
+  (นาฬิกาเดินเมื่อทุก worker เข้า sleep แล้ว → ไม่มี pair ไหนวิ่งล้ำหน้า)
+"""
+
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .bar_store import BAR_DTYPE, get_bar_store
+from .config import settings
+from .stability import MT5_LOCK
+from .tick_store import frame_to_ticks, open_ticks
+
+# ค่าคงที่ตามตัวเลขจริงของ MetaTrader5
+TIMEFRAME_SECONDS = {
+    1: 60,  # M1
+    5: 300,  # M5
+    15: 900,  # M15
+    30: 1800,  # M30
+    16385: 3600,  # H1
+    16388: 14400,  # H4
+    16408: 86400,  # D1
+}
+
+RATES_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("tick_volume", "<u8"),
+        ("spread", "<i4"),
+        ("real_volume", "<u8"),
+    ]
+)
+
+Tick = namedtuple("Tick", "time bid ask last volume time_msc flags volume_real")
+SymbolInfo = namedtuple(
+    "SymbolInfo",
+    "name visible point digits spread filling_mode trade_tick_size trade_tick_value "
+    "volume_min volume_max volume_step bid ask",
+)
+AccountInfo = namedtuple(
+    "AccountInfo",
+    "login server currency leverage balance equity profit margin margin_free margin_level",
+)
+TradePosition = namedtuple(
+    "TradePosition",
+    "ticket time type magic identifier volume price_open sl tp price_current profit symbol comment",
+)
+TradeDeal = namedtuple(
+    "TradeDeal",
+    "ticket order time type entry magic position_id reason volume price profit symbol comment",
+)
+OrderCheckResult = namedtuple(
+    "OrderCheckResult",
+    "retcode balance equity profit margin margin_free margin_level comment request",
+)
+OrderSendResult = namedtuple(
+    "OrderSendResult",
+    "retcode deal order volume price bid ask comment request_id retcode_external request",
+)
+
+
+class LiveMT5Backend:
+    """MetaTrader5 จริง — attribute ที่ไม่มีในคลาสนี้ส่งต่อไปที่ module MetaTrader5"""
+
+    simulated = False
+    finished = False
+    # MT5_SERVER_UTC_OFFSET=auto: ประมาณ offset ใหม่ทุก SERVER_OFFSET_REFRESH_SEC จาก tick ล่าสุดของ SYMBOL
+    # (ปัดเป็น 30 นาที) — tick ที่ห่างจากค่าปัดเกิน SERVER_OFFSET_MAX_LAG_SEC (ตลาดปิด) = ใช้ค่าเดิม
+    SERVER_OFFSET_REFRESH_SEC = 600.0
+    SERVER_OFFSET_MAX_LAG_SEC = 120.0
+
+    def __init__(self):
+        self._module = None
+        self._server_offset: Optional[float] = None
+        self._server_offset_checked = 0.0
+
+    def _mt5(self):
+        if self._module is None:
+            import MetaTrader5
+
+            self._module = MetaTrader5
+        return self._module
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._mt5(), name)
+
+    def time(self) -> float:
+        return time.time()
+
+    def server_offset(self) -> float:
+        fixed = settings.MT5_SERVER_UTC_OFFSET.strip().lower()
+        if fixed not in ("", "auto"):
+            return float(fixed) * 3600.0
+        now = time.time()
+        if self._server_offset is None or now - self._server_offset_checked >= self.SERVER_OFFSET_REFRESH_SEC:
+            self._server_offset_checked = now
+            offset = self._estimate_server_offset(now)
+            if offset is not None:
+                self._server_offset = offset
+        return self._server_offset or 0.0
+
+    def _estimate_server_offset(self, now: float) -> Optional[float]:
+        try:
+            with MT5_LOCK:
+                tick = self._mt5().symbol_info_tick(settings.SYMBOL)
+        except Exception as e:
+            print("[BROKER] server offset error:", e)
+            return None
+        if tick is None or not tick.time:
+            return None
+        raw = float(tick.time) - now
+        offset = round(raw / 1800.0) * 1800.0
+        if abs(raw - offset) > self.SERVER_OFFSET_MAX_LAG_SEC:
+            return None
+        return offset
+
+    def server_time(self) -> float:
+        return self.time() + self.server_offset()
+
+    def sleep(self, seconds: float, stop_event: Optional[threading.Event] = None) -> None:
+        if stop_event is None:
+            time.sleep(seconds)
+        else:
+            stop_event.wait(seconds)
+
+    def register_worker(self) -> None:
+        pass
+
+    def unregister_worker(self) -> None:
+        pass
+
+
+class _Feed:
+    """แท่ง (BAR_DTYPE) + tick (optional) ของ 1 symbol"""
+
+    def __init__(self, symbol: str, bars: np.ndarray, spread_points: float, ticks: Optional[np.ndarray] = None):
+        if len(bars) < 2:
+            raise ValueError(f"[SIM] {symbol}: ต้องมีอย่างน้อย 2 แท่ง")
+        self.symbol = symbol
+        self.bars = bars
+        self.times = bars["time"]
+        diffs = np.diff(self.times)
+        self.bar_sec = int(np.median(diffs[diffs > 0])) if np.any(diffs > 0) else 60
+        self.spread_points = float(spread_points)
+        # ticks: structured (time float64, bid, ask) เรียงตามเวลา
+        self.ticks = ticks
+        self.end_time = int(self.times[-1]) + self.bar_sec
+
+    def bar_index(self, t: float) -> int:
+        """index ของแท่งที่กำลังก่อตัว ณ เวลา t (-1 = ยังไม่ถึงแท่งแรก)"""
+        return int(np.searchsorted(self.times, t, side="right")) - 1
+
+    def _path(self, i: int):
+        """
+        เส้นทางราคา bid ภายในแท่ง i (ไม่มี tick): O → L → H → C (แท่งเขียว) / O → H → L → C (แท่งแดง)
+        คืน (เวลา, ราคา) ของจุดหักเห
+        """
+        bar = self.bars[i]
+        t0 = float(bar["time"])
+        o, h, l, c = float(bar["open"]), float(bar["high"]), float(bar["low"]), float(bar["close"])
+        first, second = (l, h) if c >= o else (h, l)
+        d = self.bar_sec
+        return (t0, t0 + d / 3.0, t0 + 2.0 * d / 3.0, t0 + d - 1e-6), (o, first, second, c)
+
+    def bid_at(self, t: float) -> float:
+        if self.ticks is not None and len(self.ticks):
+            k = int(np.searchsorted(self.ticks["time"], t, side="right")) - 1
+            return float(self.ticks["bid"][max(k, 0)])
+        i = min(max(self.bar_index(t), 0), len(self.bars) - 1)
+        ts, ps = self._path(i)
+        return float(np.interp(t, ts, ps))
+
+    def ask_at(self, t: float) -> float:
+        if self.ticks is not None and len(self.ticks):
+            k = int(np.searchsorted(self.ticks["time"], t, side="right")) - 1
+            return float(self.ticks["ask"][max(k, 0)])
+        return self.bid_at(t) + self.spread_points * settings.TICK_SIZE
+
+    def path_between(self, t_from: float, t_to: float) -> np.ndarray:
+        """ราคา bid ตามลำดับเวลาจาก t_from ถึง t_to (รวมจุดปลาย) — ใช้ตรวจ SL/TP ระหว่างทาง"""
+        if self.ticks is not None and len(self.ticks):
+            lo = int(np.searchsorted(self.ticks["time"], t_from, side="right"))
+            hi = int(np.searchsorted(self.ticks["time"], t_to, side="right"))
+            return np.r_[self.bid_at(t_from), self.ticks["bid"][lo:hi]]
+        points = [self.bid_at(t_from)]
+        i_from = max(self.bar_index(t_from), 0)
+        i_to = min(self.bar_index(t_to), len(self.bars) - 1)
+        for i in range(i_from, i_to + 1):
+            ts, ps = self._path(i)
+            points.extend(p for tv, p in zip(ts, ps) if t_from < tv <= t_to)
+        points.append(self.bid_at(t_to))
+        return np.asarray(points, dtype=np.float64)
+
+    def rates(self, t: float, start_pos: int, count: int) -> np.ndarray:
+        """แท่งที่มองเห็น ณ เวลา t แบบ MT5 rates (แท่งสุดท้าย = แท่งที่ยังไม่ปิด มีราคาถึงเวลา t เท่านั้น)"""
+        i = self.bar_index(t)
+        if i < 0:
+            return np.empty(0, dtype=RATES_DTYPE)
+        need = start_pos + count
+        lo = max(i + 1 - need, 0)
+        src = self.bars[lo : i + 1]
+        out = np.zeros(len(src), dtype=RATES_DTYPE)
+        for name in ("time", "open", "high", "low", "close"):
+            out[name] = src[name]
+        out["tick_volume"] = src["volume"]
+        out["spread"] = int(round(self.spread_points))
+
+        # แท่งที่กำลังก่อตัว: ราคาถึงเวลา t เท่านั้น (ไม่เห็น high / low / close ในอนาคต)
+        last = out[-1]
+        t0 = float(last["time"])
+        if self.ticks is not None and len(self.ticks):
+            lo_k = int(np.searchsorted(self.ticks["time"], t0, side="left"))
+            hi_k = int(np.searchsorted(self.ticks["time"], t, side="right"))
+            seen = self.ticks["bid"][lo_k:hi_k]
+            if len(seen):
+                last["open"] = seen[0]
+        else:
+            ts, ps = self._path(i)
+            seen = np.r_[[p for tv, p in zip(ts, ps) if tv <= t]]
+        price = self.bid_at(t)
+        seen = np.r_[seen, price]
+        last["high"] = seen.max()
+        last["low"] = seen.min()
+        last["close"] = price
+        frac = min(max((t - t0) / self.bar_sec, 0.0), 1.0)
+        last["tick_volume"] = int(self.bars[i]["volume"] * frac)
+        out[-1] = last
+        return out[: len(out) - start_pos] if start_pos else out
+
+
+def _aggregate_rates(rates: np.ndarray, tf_sec: int) -> np.ndarray:
+    """รวมแท่งเล็กเป็น timeframe ใหญ่ (เช่น feed M1 → ขอ M5)"""
+    if len(rates) == 0:
+        return rates
+    keys = rates["time"] // tf_sec * tf_sec
+    _, starts = np.unique(keys, return_index=True)
+    ends = np.r_[starts[1:], len(rates)] - 1
+    out = np.zeros(len(starts), dtype=RATES_DTYPE)
+    out["time"] = keys[starts]
+    out["open"] = rates["open"][starts]
+    out["high"] = np.maximum.reduceat(rates["high"], starts)
+    out["low"] = np.minimum.reduceat(rates["low"], starts)
+    out["close"] = rates["close"][ends]
+    out["tick_volume"] = np.add.reduceat(rates["tick_volume"], starts)
+    out["spread"] = rates["spread"][ends]
+    return out
+
+
+class SimulatedMT5:
+    """
+    โบรกจำลอง: นาฬิกาเริ่มที่แท่ง start_bar แล้วเดินตาม sleep()
+    - market order: BUY เข้าที่ ask / SELL ที่ bid + slippage (สุ่มแบบ seed คงที่ 0..slippage_points)
+    - SL / TP: ตรวจตามเส้นทางราคาระหว่างเวลาเดิม → เวลาใหม่ (tick จริง หรือ O-H-L-C ในแท่ง)
+      SL เป็น stop order (โดน slippage / ราคากระโดดข้ามได้), TP เป็น limit (ได้ราคาที่ตั้ง)
+    - กำไร = ระยะราคา / TICK_SIZE × TICK_VALUE × volume (สูตรเดียวกับ position_sizing)
+    - balance เปลี่ยนเมื่อปิดไม้เท่านั้น / equity = balance + กำไรลอยของไม้ที่เปิดอยู่
+    """
+
+    simulated = True
+
+    TIMEFRAME_M1 = 1
+    TIMEFRAME_M5 = 5
+    TIMEFRAME_M15 = 15
+    TIMEFRAME_M30 = 30
+    TIMEFRAME_H1 = 16385
+    TIMEFRAME_H4 = 16388
+    TIMEFRAME_D1 = 16408
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    POSITION_TYPE_BUY = 0
+    POSITION_TYPE_SELL = 1
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    ORDER_TIME_GTC = 0
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_SLTP = 6
+    DEAL_TYPE_BUY = 0
+    DEAL_TYPE_SELL = 1
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+    DEAL_REASON_EXPERT = 3
+    DEAL_REASON_SL = 4
+    DEAL_REASON_TP = 5
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_INVALID_VOLUME = 10014
+    TRADE_RETCODE_INVALID_STOPS = 10016
+    TRADE_RETCODE_NO_MONEY = 10019
+    TRADE_RETCODE_POSITION_CLOSED = 10036
+
+    def __init__(
+        self,
+        balance: float = 10_000.0,
+        spread_points: float = 3.0,
+        slippage_points: float = 0.0,
+        speed: float = 0.0,
+        seed: int = 0,
+        leverage: int = 100,
+    ):
+        self.initial_balance = float(balance)
+        self.balance = float(balance)
+        self.spread_points = float(spread_points)
+        self.slippage_points = float(slippage_points)
+        self.speed = float(speed)
+        self.leverage = int(leverage)
+        self._rng = np.random.default_rng(seed)
+        self._feeds: Dict[str, _Feed] = {}
+        self._positions: Dict[int, Dict[str, Any]] = {}
+        self._deals: List[TradeDeal] = []
+        self._next_ticket = 1
+        self._now = 0.0
+        self.start_time = 0.0
+        self._lock = threading.RLock()
+        # นาฬิการ่วมของหลาย worker
+        self._clock = threading.Condition()
+        self._workers: set = set()
+        self._targets: Dict[int, float] = {}
+
+    # ── setup ─────────────────────────────────────────────────────────
+    def add_feed(self, symbol: str, bars, ticks=None, spread_points: Optional[float] = None) -> None:
+        """bars: BAR_DTYPE records หรือ DataFrame (time, Open, High, Low, Close, Volume) / ticks: DataFrame (time, bid, ask)"""
+        records = bars if isinstance(bars, np.ndarray) else frame_to_records(bars)
+        tick_arr = None
+        if ticks is not None:
+            tick_arr = ticks if isinstance(ticks, np.ndarray) else frame_to_ticks(ticks)
+        spread = self.spread_points if spread_points is None else spread_points
+        self._feeds[symbol.upper()] = _Feed(symbol, records, spread, tick_arr)
+
+    def start(self, start_bar: int = 0) -> None:
+        """ตั้งนาฬิกาไว้ที่เวลาเปิดของแท่ง start_bar (แท่งก่อนหน้าปิดแล้วทั้งหมด)"""
+        first = min(f.times[min(max(start_bar, 0), len(f.times) - 1)] for f in self._feeds.values())
+        self._now = self.start_time = float(first)
+        print(f"[SIM] replay start {pd.to_datetime(int(first), unit='s')} ({len(self._feeds)} symbol)")
+
+    @classmethod
+    def from_settings(cls) -> "SimulatedMT5":
+        sim = cls(
+            balance=settings.SIM_BALANCE,
+            spread_points=settings.SIM_SPREAD_POINTS,
+            slippage_points=settings.SIM_SLIPPAGE_POINTS,
+            speed=settings.SIM_SPEED,
+            seed=settings.SIM_SEED,
+        )
+        data = _parse_sources(settings.SIM_DATA)
+        ticks = _parse_sources(settings.SIM_TICKS)
+        for symbol, _tf, _ in settings.trading_pairs():
+            key = symbol.upper()
+            if key in sim._feeds:
+                continue
+            source = data.get(key) or data.get("") or f"store:{symbol}:{settings.TIMEFRAME}"
+            tick_source = ticks.get(key) or ticks.get("")
+            sim.add_feed(
+                symbol,
+                load_bar_records(source),
+                load_ticks(tick_source) if tick_source else None,
+            )
+        sim.start(settings.SIM_START_BAR if settings.SIM_START_BAR > 0 else settings.LOOKBACK_BARS + 1)
+        return sim
+
+    def _feed(self, symbol: str) -> Optional[_Feed]:
+        return self._feeds.get(str(symbol).upper())
+
+    # ── clock ─────────────────────────────────────────────────────────
+    @property
+    def finished(self) -> bool:
+        return bool(self._feeds) and self._now >= max(f.end_time for f in self._feeds.values())
+
+    def time(self) -> float:
+        return self._now
+
+    def server_offset(self) -> float:
+        """แท่ง / tick ที่ replay ใช้เวลาเดียวกับ deal ที่จำลอง → ไม่มี offset"""
+        return 0.0
+
+    def server_time(self) -> float:
+        return self.time()
+
+    @property
+    def bar_seconds(self) -> int:
+        """ความยาวแท่งที่สั้นที่สุดของ feed (ใช้คิดจำนวนแท่งที่ replay ไปแล้ว)"""
+        return min(f.bar_sec for f in self._feeds.values())
+
+    def register_worker(self) -> None:
+        with self._clock:
+            self._workers.add(threading.get_ident())
+
+    def unregister_worker(self) -> None:
+        with self._clock:
+            ident = threading.get_ident()
+            self._workers.discard(ident)
+            self._targets.pop(ident, None)
+            self._maybe_advance()
+
+    def sleep(self, seconds: float, stop_event: Optional[threading.Event] = None) -> None:
+        ident = threading.get_ident()
+        with self._clock:
+            target = self._now + max(float(seconds), 0.0)
+            if ident not in self._workers:
+                self._advance_to(target)
+                return
+            self._targets[ident] = target
+            self._maybe_advance()
+            while self._now < target and not self.finished and not (stop_event and stop_event.is_set()):
+                self._clock.wait(0.1)
+            self._targets.pop(ident, None)
+
+    def _maybe_advance(self) -> None:
+        """(ถือ self._clock อยู่) ทุก worker รออยู่ → เลื่อนนาฬิกาไปเวลาที่ใกล้ที่สุด"""
+        if self._targets and all(w in self._targets for w in self._workers):
+            self._advance_to(min(self._targets.values()))
+            self._clock.notify_all()
+
+    def _advance_to(self, target: float) -> None:
+        if self._feeds:
+            target = min(target, max(f.end_time for f in self._feeds.values()))
+        if target <= self._now:
+            return
+        if self.speed > 0:
+            time.sleep((target - self._now) / self.speed)
+        with self._lock:
+            self._check_stops(self._now, target)
+            self._now = target
+
+    # ── fills ─────────────────────────────────────────────────────────
+    def _slip(self) -> float:
+        if self.slippage_points <= 0:
+            return 0.0
+        return float(self._rng.uniform(0.0, self.slippage_points)) * settings.TICK_SIZE
+
+    def _profit(self, pos: Dict[str, Any], exit_price: float, volume: Optional[float] = None) -> float:
+        direction = 1.0 if pos["type"] == self.POSITION_TYPE_BUY else -1.0
+        volume = pos["volume"] if volume is None else volume
+        return (exit_price - pos["price_open"]) * direction / settings.TICK_SIZE * settings.TICK_VALUE * volume
+
+    def _check_stops(self, t_from: float, t_to: float) -> None:
+        """ไม้ที่ราคาแตะ SL / TP ระหว่าง t_from → t_to ปิดที่จุดแรกที่แตะ"""
+        by_symbol: Dict[str, List[int]] = {}
+        for ticket, pos in self._positions.items():
+            if pos["sl"] or pos["tp"]:
+                by_symbol.setdefault(pos["symbol"].upper(), []).append(ticket)
+        for key, tickets in by_symbol.items():
+            feed = self._feeds.get(key)
+            if feed is None:
+                continue
+            bid = feed.path_between(t_from, t_to)
+            spread = feed.spread_points * settings.TICK_SIZE
+            for ticket in tickets:
+                pos = self._positions[ticket]
+                hit = _first_stop_hit(pos, bid, spread, self.POSITION_TYPE_BUY)
+                if hit is None:
+                    continue
+                k, price, reason = hit
+                if reason == "sl":
+                    # stop order → slippage ฝั่งเสีย
+                    slip = self._slip()
+                    price = price - slip if pos["type"] == self.POSITION_TYPE_BUY else price + slip
+                frac = k / max(len(bid) - 1, 1)
+                when = t_from + (t_to - t_from) * frac
+                self._close(ticket, price, pos["volume"], self.DEAL_REASON_SL if reason == "sl" else self.DEAL_REASON_TP, when)
+
+    def _close(self, ticket: int, price: float, volume: float, reason: int, when: float) -> TradeDeal:
+        pos = self._positions[ticket]
+        volume = min(volume, pos["volume"])
+        profit = round(self._profit(pos, price, volume), 2)
+        self.balance += profit
+        deal = self._add_deal(
+            pos,
+            self.DEAL_TYPE_SELL if pos["type"] == self.POSITION_TYPE_BUY else self.DEAL_TYPE_BUY,
+            self.DEAL_ENTRY_OUT,
+            reason,
+            volume,
+            price,
+            profit,
+            when,
+        )
+        pos["volume"] = round(pos["volume"] - volume, 8)
+        if pos["volume"] <= 0:
+            del self._positions[ticket]
+        return deal
+
+    def _add_deal(self, pos, deal_type, entry, reason, volume, price, profit, when) -> TradeDeal:
+        deal = TradeDeal(
+            ticket=self._next_ticket,
+            order=self._next_ticket,
+            time=int(when),
+            type=deal_type,
+            entry=entry,
+            magic=pos["magic"],
+            position_id=pos["ticket"],
+            reason=reason,
+            volume=volume,
+            price=price,
+            profit=profit,
+            symbol=pos["symbol"],
+            comment=pos["comment"],
+        )
+        self._next_ticket += 1
+        self._deals.append(deal)
+        return deal
+
+    # ── MetaTrader5 API ───────────────────────────────────────────────
+    def initialize(self, *args, **kwargs) -> bool:
+        return bool(self._feeds)
+
+    def login(self, *args, **kwargs) -> bool:
+        return True
+
+    def shutdown(self) -> None:
+        pass
+
+    def last_error(self):
+        return (1, "Success")
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        return self._feed(symbol) is not None
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        feed = self._feed(symbol)
+        if feed is None:
+            return None
+        tf_sec = TIMEFRAME_SECONDS.get(int(timeframe), feed.bar_sec)
+        with self._lock:
+            if tf_sec <= feed.bar_sec:
+                return feed.rates(self._now, int(start_pos), int(count))
+            ratio = -(-tf_sec // feed.bar_sec)
+            base = feed.rates(self._now, 0, (int(start_pos) + int(count) + 1) * ratio)
+        rates = _aggregate_rates(base, tf_sec)
+        if start_pos:
+            rates = rates[: len(rates) - int(start_pos)]
+        return rates[-int(count) :]
+
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from, date_to):
+        """แท่งที่เปิดในช่วง [date_from, date_to] และมองเห็นแล้ว ณ นาฬิกาจำลอง"""
+        feed = self._feed(symbol)
+        if feed is None:
+            return None
+        visible = feed.bar_index(self._now) + 1
+        if visible <= 0:
+            return np.empty(0, dtype=RATES_DTYPE)
+        rates = self.copy_rates_from_pos(symbol, timeframe, 0, visible)
+        lo, hi = _to_epoch(date_from), _to_epoch(date_to)
+        return rates[(rates["time"] >= lo) & (rates["time"] <= hi)]
+
+    def symbol_info_tick(self, symbol: str) -> Optional[Tick]:
+        feed = self._feed(symbol)
+        if feed is None:
+            return None
+        now = self._now
+        bid = feed.bid_at(now)
+        return Tick(int(now), bid, feed.ask_at(now), bid, 0, int(now * 1000), 0, 0.0)
+
+    def symbol_info(self, symbol: str) -> Optional[SymbolInfo]:
+        feed = self._feed(symbol)
+        if feed is None:
+            return None
+        tick = self.symbol_info_tick(symbol)
+        return SymbolInfo(
+            name=feed.symbol,
+            visible=True,
+            point=settings.TICK_SIZE,
+            digits=max(-int(np.floor(np.log10(settings.TICK_SIZE))), 0),
+            spread=int(round(feed.spread_points)),
+            filling_mode=1 | 2,
+            trade_tick_size=settings.TICK_SIZE,
+            trade_tick_value=settings.TICK_VALUE,
+            volume_min=settings.MIN_VOLUME,
+            volume_max=settings.MAX_VOLUME,
+            volume_step=0.01,
+            bid=tick.bid,
+            ask=tick.ask,
+        )
+
+    def _position_tuple(self, pos: Dict[str, Any]) -> TradePosition:
+        feed = self._feeds[pos["symbol"].upper()]
+        current = feed.bid_at(self._now) if pos["type"] == self.POSITION_TYPE_BUY else feed.ask_at(self._now)
+        return TradePosition(
+            ticket=pos["ticket"],
+            time=pos["time"],
+            type=pos["type"],
+            magic=pos["magic"],
+            identifier=pos["ticket"],
+            volume=pos["volume"],
+            price_open=pos["price_open"],
+            sl=pos["sl"],
+            tp=pos["tp"],
+            price_current=current,
+            profit=round(self._profit(pos, current), 2),
+            symbol=pos["symbol"],
+            comment=pos["comment"],
+        )
+
+    def positions_get(self, symbol: Optional[str] = None, group: Optional[str] = None, ticket: Optional[int] = None):
+        with self._lock:
+            out = []
+            for pos in self._positions.values():
+                if symbol and pos["symbol"].upper() != symbol.upper():
+                    continue
+                if ticket is not None and pos["ticket"] != ticket:
+                    continue
+                out.append(self._position_tuple(pos))
+            return tuple(out)
+
+    def positions_total(self) -> int:
+        return len(self._positions)
+
+    def orders_get(self, *args, **kwargs):
+        return ()
+
+    def history_deals_get(self, date_from=None, date_to=None, position: Optional[int] = None, **kwargs):
+        lo = _to_epoch(date_from) if date_from is not None else None
+        hi = _to_epoch(date_to) if date_to is not None else None
+        with self._lock:
+            return tuple(
+                d
+                for d in self._deals
+                if (position is None or d.position_id == position)
+                and (lo is None or d.time >= lo)
+                and (hi is None or d.time <= hi)
+            )
+
+    def _margin(self, price: float, volume: float) -> float:
+        """margin = มูลค่าสัญญา / leverage (มูลค่าต่อราคา 1.0 ต่อ lot = TICK_VALUE / TICK_SIZE)"""
+        return price * volume * settings.TICK_VALUE / settings.TICK_SIZE / self.leverage
+
+    def _account_numbers(self):
+        """(ถือ self._lock อยู่) → (floating, equity, margin)"""
+        floating = sum((self._position_tuple(p).profit for p in self._positions.values()), 0.0)
+        margin = sum((self._margin(p["price_open"], p["volume"]) for p in self._positions.values()), 0.0)
+        return floating, self.balance + floating, margin
+
+    def account_info(self) -> AccountInfo:
+        with self._lock:
+            floating, equity, margin = self._account_numbers()
+            return AccountInfo(
+                login=0,
+                server="SIM",
+                currency="USD",
+                leverage=self.leverage,
+                balance=round(self.balance, 2),
+                equity=round(equity, 2),
+                profit=round(floating, 2),
+                margin=round(margin, 2),
+                margin_free=round(equity - margin, 2),
+                margin_level=round(equity / margin * 100.0, 2) if margin else 0.0,
+            )
+
+    def order_calc_margin(self, action: int, symbol: str, volume: float, price: float) -> Optional[float]:
+        if self._feed(symbol) is None:
+            return None
+        return round(self._margin(float(price), float(volume)), 2)
+
+    def _validate(self, request: dict, feed: Optional[_Feed], is_buy: bool, price: float):
+        """(ถือ self._lock อยู่) ตรวจ order เปิดไม้ใหม่ → (retcode, comment) ถ้าไม่ผ่าน / None ถ้าผ่าน"""
+        volume = float(request.get("volume", 0.0))
+        if feed is None:
+            return self.TRADE_RETCODE_INVALID, "unknown symbol"
+        if volume <= 0:
+            return self.TRADE_RETCODE_INVALID_VOLUME, "invalid volume"
+        sl = float(request.get("sl") or 0.0)
+        tp = float(request.get("tp") or 0.0)
+        if (is_buy and ((sl and sl >= price) or (tp and tp <= price))) or (
+            not is_buy and ((sl and sl <= price) or (tp and tp >= price))
+        ):
+            return self.TRADE_RETCODE_INVALID_STOPS, "invalid stops"
+        _, equity, margin = self._account_numbers()
+        if margin + self._margin(price, volume) > equity:
+            return self.TRADE_RETCODE_NO_MONEY, "no money"
+        return None
+
+    def order_check(self, request: dict) -> OrderCheckResult:
+        """เหมือน MT5: retcode 0 = ผ่าน (ไม่เปิดไม้จริง)"""
+        with self._lock:
+            feed = self._feed(request.get("symbol", ""))
+            is_buy = request.get("type") == self.ORDER_TYPE_BUY
+            price = 0.0
+            if feed is not None:
+                price = feed.ask_at(self._now) if is_buy else feed.bid_at(self._now)
+            problem = None
+            if request.get("action") != self.TRADE_ACTION_DEAL:
+                problem = (self.TRADE_RETCODE_INVALID, "unsupported action")
+            elif not request.get("position"):
+                problem = self._validate(request, feed, is_buy, price)
+            floating, equity, margin = self._account_numbers()
+            if feed is not None and not request.get("position"):
+                margin += self._margin(price, float(request.get("volume", 0.0)))
+            retcode, comment = problem or (0, "Done")
+            return OrderCheckResult(
+                retcode=retcode,
+                balance=round(self.balance, 2),
+                equity=round(equity, 2),
+                profit=round(floating, 2),
+                margin=round(margin, 2),
+                margin_free=round(equity - margin, 2),
+                margin_level=round(equity / margin * 100.0, 2) if margin else 0.0,
+                comment=comment,
+                request=dict(request),
+            )
+
+    def _result(self, retcode: int, request: dict, comment: str, deal: int = 0, volume: float = 0.0, price: float = 0.0):
+        feed = self._feed(request.get("symbol", ""))
+        bid = feed.bid_at(self._now) if feed else 0.0
+        ask = feed.ask_at(self._now) if feed else 0.0
+        return OrderSendResult(retcode, deal, deal, volume, price, bid, ask, comment, 0, 0, dict(request))
+
+    def order_send(self, request: dict) -> OrderSendResult:
+        with self._lock:
+            action = request.get("action")
+            if action == self.TRADE_ACTION_SLTP:
+                return self._modify(request)
+            if action != self.TRADE_ACTION_DEAL:
+                return self._result(self.TRADE_RETCODE_INVALID, request, "unsupported action")
+
+            feed = self._feed(request.get("symbol", ""))
+            volume = float(request.get("volume", 0.0))
+            if feed is None:
+                return self._result(self.TRADE_RETCODE_INVALID, request, "unknown symbol")
+            if volume <= 0:
+                return self._result(self.TRADE_RETCODE_INVALID_VOLUME, request, "invalid volume")
+
+            is_buy = request.get("type") == self.ORDER_TYPE_BUY
+            slip = self._slip()
+            price = feed.ask_at(self._now) + slip if is_buy else feed.bid_at(self._now) - slip
+
+            if request.get("position"):
+                ticket = int(request["position"])
+                if ticket not in self._positions:
+                    return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, "position closed")
+                deal = self._close(ticket, price, volume, self.DEAL_REASON_EXPERT, self._now)
+                return self._result(self.TRADE_RETCODE_DONE, request, "done", deal.ticket, deal.volume, price)
+
+            problem = self._validate(request, feed, is_buy, price)
+            if problem:
+                return self._result(problem[0], request, problem[1])
+            sl = float(request.get("sl") or 0.0)
+            tp = float(request.get("tp") or 0.0)
+
+            ticket = self._next_ticket
+            pos = {
+                "ticket": ticket,
+                "time": int(self._now),
+                "type": self.POSITION_TYPE_BUY if is_buy else self.POSITION_TYPE_SELL,
+                "magic": int(request.get("magic", 0)),
+                "volume": volume,
+                "price_open": price,
+                "sl": sl,
+                "tp": tp,
+                "symbol": feed.symbol,
+                "comment": str(request.get("comment", ""))[:31],
+            }
+            self._positions[ticket] = pos
+            deal = self._add_deal(
+                pos,
+                self.DEAL_TYPE_BUY if is_buy else self.DEAL_TYPE_SELL,
+                self.DEAL_ENTRY_IN,
+                self.DEAL_REASON_EXPERT,
+                volume,
+                price,
+                0.0,
+                self._now,
+            )
+            return self._result(self.TRADE_RETCODE_DONE, request, "done", deal.ticket, volume, price)
+
+    def _modify(self, request: dict) -> OrderSendResult:
+        pos = self._positions.get(int(request.get("position", 0)))
+        if pos is None:
+            return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, "position closed")
+        pos["sl"] = float(request.get("sl") or 0.0)
+        pos["tp"] = float(request.get("tp") or 0.0)
+        return self._result(self.TRADE_RETCODE_DONE, request, "done")
+
+
+def _first_stop_hit(pos: Dict[str, Any], bid: np.ndarray, spread: float, buy_type: int):
+    """
+    คืน (index ของจุดบนเส้นทาง, ราคาที่ fill, "sl" | "tp") ของ stop แรกที่โดน หรือ None
+    BUY ปิดด้วย bid / SELL ปิดด้วย ask (= bid + spread)
+    จุดแรก (index 0) เลยระดับไปแล้ว = ราคากระโดดข้าม → fill ที่ราคานั้น
+    """
+    is_buy = pos["type"] == buy_type
+    price = bid if is_buy else bid + spread
+    sl, tp = pos["sl"], pos["tp"]
+    hits = []
+    if sl:
+        idx = np.flatnonzero(price <= sl if is_buy else price >= sl)
+        if len(idx):
+            hits.append((int(idx[0]), "sl", sl))
+    if tp:
+        idx = np.flatnonzero(price >= tp if is_buy else price <= tp)
+        if len(idx):
+            hits.append((int(idx[0]), "tp", tp))
+    if not hits:
+        return None
+    k, reason, level = min(hits)
+    fill = float(price[0]) if k == 0 else float(level)
+    return k, fill, reason
+
+
+def _to_epoch(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return pd.Timestamp(value).timestamp()
+
+
+def frame_to_records(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame (time, Open/open, ...) → BAR_DTYPE"""
+    cols = {c.lower(): c for c in df.columns}
+    out = np.empty(len(df), dtype=BAR_DTYPE)
+    t = df[cols["time"]]
+    if pd.api.types.is_numeric_dtype(t):
+        out["time"] = t.to_numpy(dtype=np.int64)
+    else:
+        out["time"] = pd.to_datetime(t).to_numpy().astype("datetime64[s]").astype(np.int64)
+    for name in ("open", "high", "low", "close"):
+        out[name] = df[cols[name]].to_numpy(dtype=np.float64)
+    vol = cols.get("volume") or cols.get("tick_volume")
+    out["volume"] = df[vol].to_numpy(dtype=np.int64) if vol else 0
+    out.sort(order="time")
+    return out
+
+
+def load_bar_records(source: str) -> np.ndarray:
+    """source: ไฟล์ CSV (time, Open, High, Low, Close, Volume) หรือ "store:SYMBOL:TF" """
+    if source.startswith("store:"):
+        _, symbol, timeframe = source.split(":", 2)
+        return np.array(get_bar_store(symbol, timeframe).read())
+    return frame_to_records(pd.read_csv(source))
+
+
+def load_ticks(source: str) -> np.ndarray:
+    """source: CSV (time, bid, ask) หรือไฟล์ .ticks ของ core/tick_store.py — โหลดเข้า RAM ทั้งก้อน"""
+    return np.array(open_ticks(source).read())
+
+
+def _parse_sources(value: str) -> Dict[str, str]:
+    """ "path" → ใช้กับทุก symbol / "XAUUSDm=a.csv,EURUSDm=b.csv" → แยกต่อ symbol """
+    out: Dict[str, str] = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "=" in item:
+            symbol, path = item.split("=", 1)
+            out[symbol.strip().upper()] = path.strip()
+        else:
+            out[""] = item
+    return out
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_broker():
+    """backend ตัวเดียวทั้ง process ตาม BROKER_BACKEND (สร้างตอนเรียกครั้งแรก)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.BROKER_BACKEND == "SIM":
+                    _backend = SimulatedMT5.from_settings()
+                else:
+                    _backend = LiveMT5Backend()
+    return _backend
+
+
+def set_broker(backend) -> None:
+    """เปลี่ยน backend เอง (เช่น script soak / benchmark สร้าง SimulatedMT5 ด้วยพารามิเตอร์ของตัวเอง)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+class _BrokerProxy:
+    """`mt5.xxx` → backend ปัจจุบัน — ให้ core.data_feed / core.mt5_trader ใช้โค้ดเดิมได้"""
+
+    def __getattr__(self, name: str):
+        return getattr(get_broker(), name)
+
+
+mt5 = _BrokerProxy()
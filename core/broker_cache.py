@@ -0,0 +1,163 @@
+# core/broker_cache.py
+"""
+Cache สถานะจากโบรก (symbol spec / account / positions) สำหรับ core.mt5_trader
+
+ทุกการเรียก mt5.* คือ IPC ไป terminal (และต้องถือ MT5_LOCK ร่วมกับทุก pair) → hot path เรียกให้น้อยที่สุด
+- symbol_info + filling mode : แทบไม่เปลี่ยน → SYMBOL_INFO_TTL_SEC (default 1 ชม.)
+- account / positions        : BROKER_STATE_TTL_SEC (default 5 วินาที) หรือทันทีหลังส่งออเดอร์ (invalidate)
+- positions ถูก index เป็นจำนวนไม้ต่อ symbol และต่อ (symbol, comment) ตอน refresh
+- invalidate() เพิ่ม generation → refresh ที่ดึงค้างอยู่ตอน invalidate ไม่เขียน snapshot เก่ากลับเข้า cache
+  และแตะไฟล์ BROKER_CACHE_STAMP_PATH → process อื่น (dashboard แยก process ส่งออเดอร์) เห็นแล้วล้าง cache ของตัวเอง
+  → ทุก pair นับไม้ของตัวเองจาก snapshot เดียว ไม่ต้อง positions_get ทั้งพอร์ตคนละรอบ
+
+เวลาใช้นาฬิกาของ backend (core.broker) → บนโบรกจำลอง TTL นับตามเวลาที่ replay ไม่ใช่เวลาจริง
+TTL <= 0 = ไม่ cache (ดึงใหม่ทุกครั้งแบบเดิม)
+"""
+
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from .broker import get_broker, mt5
+from .config import settings
+from .stability import MT5_LOCK
+
+
+class BrokerStateCache:
+    # จำกัดขนาดไฟล์ stamp (1 byte ต่อ invalidate)
+    STAMP_MAX_BYTES = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._symbols: Dict[str, Tuple[float, Any]] = {}
+        self._account: Optional[Tuple[float, Any]] = None
+        self._positions: Optional[Tuple[float, Counter]] = None
+        self._generation = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+
+    @staticmethod
+    def _fresh(entry: Optional[Tuple[float, Any]], ttl: float, now: float) -> bool:
+        return entry is not None and ttl > 0 and now - entry[0] < ttl
+
+    # ── symbol spec ───────────────────────────────────────────────────
+    def symbol_info(self, symbol: str):
+        """mt5.symbol_info(symbol) — None ไม่ถูก cache (ลองใหม่รอบหน้า)"""
+        now = get_broker().time()
+        key = symbol.upper()
+        with self._lock:
+            entry = self._symbols.get(key)
+        if self._fresh(entry, settings.SYMBOL_INFO_TTL_SEC, now):
+            return entry[1]
+        with MT5_LOCK:
+            info = mt5.symbol_info(symbol)
+        if info is not None:
+            with self._lock:
+                self._symbols[key] = (now, info)
+        return info
+
+    # ── account ───────────────────────────────────────────────────────
+    def account_info(self):
+        now = get_broker().time()
+        self._check_stamp()
+        with self._lock:
+            entry = self._account
+            generation = self._generation
+        if self._fresh(entry, settings.BROKER_STATE_TTL_SEC, now):
+            return entry[1]
+        with MT5_LOCK:
+            info = mt5.account_info()
+        if info is not None:
+            with self._lock:
+                if self._generation == generation:
+                    self._account = (now, info)
+        return info
+
+    # ── positions ─────────────────────────────────────────────────────
+    def _position_counts(self) -> Counter:
+        now = get_broker().time()
+        self._check_stamp()
+        with self._lock:
+            entry = self._positions
+            generation = self._generation
+        if self._fresh(entry, settings.BROKER_STATE_TTL_SEC, now):
+            return entry[1]
+        with MT5_LOCK:
+            positions = mt5.positions_get()
+        counts: Counter = Counter()
+        for pos in positions or ():
+            s = pos.symbol.upper()
+            counts[None] += 1
+            counts[s] += 1
+            counts[(s, pos.comment)] += 1
+        if positions is not None:
+            with self._lock:
+                # invalidate() ระหว่างรอ terminal → snapshot นี้อาจเป็นก่อนออเดอร์ใหม่ ไม่เก็บ
+                if self._generation == generation:
+                    self._positions = (now, counts)
+        return counts
+
+    def open_positions(self, symbol: Optional[str] = None, comment: Optional[str] = None) -> int:
+        """จำนวนไม้ที่เปิดอยู่ (ทั้งพอร์ต / ต่อ symbol / ต่อ symbol + comment ของ pair)"""
+        counts = self._position_counts()
+        if comment:
+            if symbol:
+                return counts[(symbol.upper(), comment[:31])]
+            return sum(n for k, n in counts.items() if isinstance(k, tuple) and k[1] == comment[:31])
+        return counts[symbol.upper() if symbol else None]
+
+    # ── invalidation ──────────────────────────────────────────────────
+    def invalidate(self, symbols: bool = False) -> None:
+        """เรียกหลังส่งออเดอร์ (account / positions เปลี่ยนแน่) — symbols=True ล้าง spec ด้วย (เช่น reconnect)"""
+        with self._lock:
+            self._generation += 1
+            self._account = None
+            self._positions = None
+            if symbols:
+                self._symbols.clear()
+        self._touch_stamp()
+
+    # ── cross-process ─────────────────────────────────────────────────
+    @staticmethod
+    def _stamp_signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    def _check_stamp(self) -> None:
+        """ไฟล์ stamp เปลี่ยนตั้งแต่ครั้งก่อน = process อื่นเพิ่งส่งออเดอร์ → ล้าง account / positions"""
+        path = settings.BROKER_CACHE_STAMP_PATH
+        if not path:
+            return
+        signature = self._stamp_signature(path)
+        with self._lock:
+            if signature == self._stamp:
+                return
+            self._stamp = signature
+            self._generation += 1
+            self._account = None
+            self._positions = None
+
+    def _touch_stamp(self) -> None:
+        path = settings.BROKER_CACHE_STAMP_PATH
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            signature = self._stamp_signature(path)
+            # ต่อท้าย 1 byte (size เปลี่ยนเสมอ แม้ mtime ละเอียดไม่พอ) / เกินขนาด → เริ่มไฟล์ใหม่
+            mode = "w" if signature and signature[0] >= self.STAMP_MAX_BYTES else "a"
+            with open(path, mode) as f:
+                f.write(".")
+        except OSError as e:
+            print("[BROKER_CACHE] stamp error:", e)
+            return
+        with self._lock:
+            # process นี้ล้างไปแล้ว — ไม่ต้องล้างซ้ำตอนเห็นไฟล์ที่ตัวเองแตะ
+            if self._stamp == signature:
+                self._stamp = self._stamp_signature(path)
+
+
+broker_cache = BrokerStateCache()
@@ -1,8 +1,12 @@
 import os
+import threading
 from typing import Optional
 
-import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .profiler import profiler
 
 
 def generate_signal_chart(
@@ -15,12 +19,16 @@ def generate_signal_chart(
     """
     วาดกราฟ Close + RSI + MACD (hist) และจุด pre/confirm
     คืน path ของไฟล์ png
+
+    ใช้ Figure + Agg canvas ตรง ๆ (ไม่ผ่าน pyplot global state) → เรียกจาก worker thread ได้
     """
     if df.empty:
         return None
     os.makedirs(save_dir, exist_ok=True)
 
-    fig, axes = plt.subplots(3, 1, figsize=(10, 8), sharex=True)
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(3, 1, sharex=True)
 
     # price
     axes[0].plot(df["time"], df["Close"])
@@ -41,9 +49,38 @@ def generate_signal_chart(
     axes[2].bar(df["time"], df["MACD_HIST"])
     axes[2].set_title("MACD Histogram")
 
-    plt.tight_layout()
-    filename = f"{filename_prefix}_{pd.Timestamp.utcnow().strftime('%Y%m%d_%H%M%S')}.png"
+    fig.tight_layout()
+    filename = f"{filename_prefix}_{pd.Timestamp.utcnow().strftime('%Y%m%d_%H%M%S_%f')}.png"
     path = os.path.join(save_dir, filename)
-    plt.savefig(path)
-    plt.close(fig)
+    fig.savefig(path)
     return path
+
+
+class DeferredChart:
+    """
+    กราฟที่ยังไม่วาด — loop หลักสร้าง object นี้ (copy เฉพาะคอลัมน์ที่ใช้) แล้วส่งเข้า notification queue
+    worker เรียก render() ตอนจะส่งจริง, PRE + CONFIRM ในรอบเดียวกันวาดครั้งเดียวแล้วใช้ไฟล์ร่วมกัน
+    """
+
+    COLUMNS = ["time", "Close", "RSI", "MACD_HIST"]
+
+    def __init__(self, df: pd.DataFrame, pre_idx: Optional[int], confirm_idx: Optional[int]):
+        self.df = df[self.COLUMNS].copy()
+        self.pre_idx = pre_idx
+        self.confirm_idx = confirm_idx
+        self._path: Optional[str] = None
+        self._done = False
+        self._lock = threading.Lock()
+
+    def render(self) -> Optional[str]:
+        with self._lock:
+            if not self._done:
+                try:
+                    # วาดใน notification worker → stage "chart" ไม่นับรวมในเวลา iteration
+                    with profiler.stage("chart"):
+                        self._path = generate_signal_chart(self.df, self.pre_idx, self.confirm_idx)
+                except Exception as e:
+                    print("[CHART] render error:", e)
+                    self._path = None
+                self._done = True
+            return self._path
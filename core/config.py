@@ -1,5 +1,6 @@
 from dataclasses import dataclass, field
 import os
+from typing import List, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,25 +33,76 @@ class Settings:
     # Trading parameters
     SYMBOL: str = field(default_factory=lambda: _str("SYMBOL", "XAUUSDm"))
     TIMEFRAME: str = field(default_factory=lambda: _str("TIMEFRAME", "M1"))
+    # หลาย symbol / timeframe พร้อมกัน เช่น "XAUUSDm:M1,XAUUSDm:M5,EURUSDm:M1:2"
+    # (SYMBOL:TF[:MAX_OPEN_TRADES]) — ว่าง = ใช้ SYMBOL / TIMEFRAME คู่เดียว
+    TRADING_PAIRS: str = field(default_factory=lambda: _str("TRADING_PAIRS", ""))
     LOOP_INTERVAL_SEC: int = field(default_factory=lambda: _int("LOOP_INTERVAL_SEC", 5))
+    # POLL = คำนวณใหม่ทุก LOOP_INTERVAL_SEC | BAR_CLOSE = คำนวณเต็มครั้งเดียวต่อแท่งที่ปิด
+    LOOP_MODE: str = field(default_factory=lambda: _str("LOOP_MODE", "POLL").upper())
     AI_LOG_INTERVAL_SEC: int = field(default_factory=lambda: _int("AI_LOG_INTERVAL_SEC", 5))
     DASHBOARD_REFRESH_SEC: int = field(default_factory=lambda: _int("DASHBOARD_REFRESH_SEC", 5))
     LOOKBACK_BARS: int = field(default_factory=lambda: _int("LOOKBACK_BARS", 500))
     TRAIN_BARS: int = field(default_factory=lambda: _int("TRAIN_BARS", 5000))
+    BAR_STORE_ENABLED: bool = field(default_factory=lambda: _bool("BAR_STORE_ENABLED", False))
+    BAR_STORE_DIR: str = field(default_factory=lambda: _str("BAR_STORE_DIR", "data/bars"))
+
+    # Broker backend: MT5 = MetaTrader5 จริง | SIM = โบรกจำลอง replay ข้อมูลย้อนหลัง (core/broker.py)
+    BROKER_BACKEND: str = field(default_factory=lambda: _str("BROKER_BACKEND", "MT5").upper())
+    # SIM: CSV / "store:SYMBOL:TF" (หรือ "SYM=path,SYM2=path2") — ว่าง = bar store ของแต่ละ symbol
+    SIM_DATA: str = field(default_factory=lambda: _str("SIM_DATA", ""))
+    SIM_TICKS: str = field(default_factory=lambda: _str("SIM_TICKS", ""))  # CSV (time, bid, ask) — optional
+    SIM_BALANCE: float = field(default_factory=lambda: _float("SIM_BALANCE", 10000.0))
+    SIM_SPREAD_POINTS: float = field(default_factory=lambda: _float("SIM_SPREAD_POINTS", 3.0))
+    SIM_SLIPPAGE_POINTS: float = field(default_factory=lambda: _float("SIM_SLIPPAGE_POINTS", 1.0))
+    SIM_SPEED: float = field(default_factory=lambda: _float("SIM_SPEED", 0.0))  # 0 = เร็วที่สุด, 60 = เร็วกว่าจริง 60 เท่า
+    SIM_START_BAR: int = field(default_factory=lambda: _int("SIM_START_BAR", 0))  # 0 = LOOKBACK_BARS + 1
+    SIM_SEED: int = field(default_factory=lambda: _int("SIM_SEED", 0))
 
     # MT5 Connection
     MT5_SERVER: str = field(default_factory=lambda: _str("MT5_SERVER", ""))
     MT5_LOGIN: int = field(default_factory=lambda: _int("MT5_LOGIN", 0))
     MT5_PASSWORD: str = field(default_factory=lambda: _str("MT5_PASSWORD", ""))
     MT5_DEVIATION: int = field(default_factory=lambda: _int("MT5_DEVIATION", 20))
+    # เวลาโบรก (deal.time) - UTC เป็นชั่วโมง เช่น 2 / 3 / 0 — "auto" = ประมาณจาก tick ล่าสุดของ SYMBOL
+    MT5_SERVER_UTC_OFFSET: str = field(default_factory=lambda: _str("MT5_SERVER_UTC_OFFSET", "auto"))
     MT5_MAGIC_NUMBER: int = field(default_factory=lambda: _int("MT5_MAGIC_NUMBER", 123456))
 
+    # Broker state cache (core/broker_cache.py) — 0 = ดึงจาก terminal ทุกครั้ง
+    SYMBOL_INFO_TTL_SEC: float = field(default_factory=lambda: _float("SYMBOL_INFO_TTL_SEC", 3600.0))
+    BROKER_STATE_TTL_SEC: float = field(default_factory=lambda: _float("BROKER_STATE_TTL_SEC", 5.0))
+    # ไฟล์ที่ทุก process แตะหลังส่งออเดอร์ (dashboard แยก process) → process อื่นล้าง cache ทันที / "" = ปิด
+    BROKER_CACHE_STAMP_PATH: str = field(
+        default_factory=lambda: _str("BROKER_CACHE_STAMP_PATH", "logs/broker_cache.stamp")
+    )
+
+    # Order gateway (core/order_gateway.py)
+    ORDER_ASYNC: bool = field(default_factory=lambda: _bool("ORDER_ASYNC", True))  # ส่งจาก worker thread
+    ORDER_PRECHECK: bool = field(default_factory=lambda: _bool("ORDER_PRECHECK", True))  # order_check + margin ก่อนส่ง
+    ORDER_QUEUE_SIZE: int = field(default_factory=lambda: _int("ORDER_QUEUE_SIZE", 32))
+
+    # Trade journal (core/trade_logger.py) — ไม้ที่ fill + ผลปิดจาก deal history
+    TRADE_JOURNAL_PATH: str = field(default_factory=lambda: _str("TRADE_JOURNAL_PATH", "logs/trades_log.jsonl"))
+    TRADE_JOURNAL_RECONCILE_SEC: float = field(default_factory=lambda: _float("TRADE_JOURNAL_RECONCILE_SEC", 10.0))
+
+    # Position manager (core/position_manager.py) — ดูแลไม้ที่เปิดแล้ว (magic = MT5_MAGIC_NUMBER)
+    POSITION_MANAGER_ENABLED: bool = field(default_factory=lambda: _bool("POSITION_MANAGER_ENABLED", False))
+    POSITION_MANAGE_INTERVAL_SEC: float = field(default_factory=lambda: _float("POSITION_MANAGE_INTERVAL_SEC", 1.0))
+    BREAKEVEN_ATR_MULT: float = field(default_factory=lambda: _float("BREAKEVEN_ATR_MULT", 1.0))  # 0 = ปิด
+    BREAKEVEN_BUFFER_POINTS: float = field(default_factory=lambda: _float("BREAKEVEN_BUFFER_POINTS", 10.0))
+    TRAIL_START_ATR: float = field(default_factory=lambda: _float("TRAIL_START_ATR", 1.5))
+    TRAIL_ATR_MULT: float = field(default_factory=lambda: _float("TRAIL_ATR_MULT", 1.5))  # 0 = ปิด
+    TRAIL_STEP_POINTS: float = field(default_factory=lambda: _float("TRAIL_STEP_POINTS", 5.0))
+    PARTIAL_TP_R: float = field(default_factory=lambda: _float("PARTIAL_TP_R", 1.0))
+    PARTIAL_TP_FRACTION: float = field(default_factory=lambda: _float("PARTIAL_TP_FRACTION", 0.5))  # 0 = ปิด
+
     # ---- AI Confirm thresholds (ปรับจาก .env ได้) ----
     AI_CONFIRM_PROB_UP_THRESHOLD: float = field(default_factory=lambda: _float("AI_CONFIRM_PROB_UP_THRESHOLD", 0.65))
     AI_CONFIRM_PROB_DOWN_THRESHOLD: float = field(default_factory=lambda: _float("AI_CONFIRM_PROB_DOWN_THRESHOLD", 0.65))
     AI_CONFIRM_CONFIDENCE_THRESHOLD: float = field(default_factory=lambda: _float("AI_CONFIRM_CONFIDENCE_THRESHOLD", 0.60))
     AI_CONFIRM_MACD_MARGIN: float = field(default_factory=lambda: _float("AI_CONFIRM_MACD_MARGIN", 0.00))
     AI_MODE: str = field(default_factory=lambda: _str("AI_MODE", "NORMAL"))  # 🟢 SAFE / 🟡 NORMAL / 🔴 AGGRESSIVE
+    # profile จาก scripts/optimize.py (threshold ของแต่ละ mode / RR matrix / amplify) — ว่าง = ค่า default
+    AI_PROFILE_PATH: str = field(default_factory=lambda: _str("AI_PROFILE_PATH", ""))
 
     # AI probability amplification factor (higher = more aggressive signal separation)
     AI_AMPLIFY_FACTOR: float = field(default_factory=lambda: _float("AI_AMPLIFY_FACTOR", 3.0))
@@ -67,12 +119,27 @@ class Settings:
 
     # Notifications
     DISCORD_WEBHOOK_URL: str = field(default_factory=lambda: _str("DISCORD_WEBHOOK_URL", ""))
+    DISCORD_QUEUE_SIZE: int = field(default_factory=lambda: _int("DISCORD_QUEUE_SIZE", 100))
+    DISCORD_MAX_RETRIES: int = field(default_factory=lambda: _int("DISCORD_MAX_RETRIES", 3))
 
     # File paths
     AI_LOG_PATH: str = field(default_factory=lambda: _str("AI_LOG_PATH", "logs/ai_log.jsonl"))
+    # AI log: เขียนเป็นชุด (buffer) + compact วันที่ปิดแล้วเป็น .npz
+    AI_LOG_FLUSH_ROWS: int = field(default_factory=lambda: _int("AI_LOG_FLUSH_ROWS", 50))
+    AI_LOG_FLUSH_SEC: float = field(default_factory=lambda: _float("AI_LOG_FLUSH_SEC", 30.0))
+    AI_LOG_COMPACT: bool = field(default_factory=lambda: _bool("AI_LOG_COMPACT", True))
     AI_LAST_STATE_PATH: str = field(default_factory=lambda: _str("AI_LAST_STATE_PATH", "logs/last_state.json"))
+    # เขียน last_state.json ด้วย (ต้องเปิดถ้ารัน dashboard แยก process จาก main.py)
+    STATE_FILE_FALLBACK: bool = field(default_factory=lambda: _bool("STATE_FILE_FALLBACK", True))
     LSTM_MODEL_PATH: str = field(default_factory=lambda: _str("LSTM_MODEL_PATH", "models/extreme_lstm.keras"))
 
+    # LSTM training: per-feature normalization (stats เก็บคู่กับไฟล์ model)
+    LSTM_NORMALIZE: bool = field(default_factory=lambda: _bool("LSTM_NORMALIZE", False))
+    LSTM_FROZEN_INFERENCE: bool = field(default_factory=lambda: _bool("LSTM_FROZEN_INFERENCE", True))
+    LSTM_NUM_THREADS: int = field(default_factory=lambda: _int("LSTM_NUM_THREADS", 0))  # 0 = ค่า default ของ torch
+    LSTM_STREAMING: bool = field(default_factory=lambda: _bool("LSTM_STREAMING", False))
+    LSTM_RESYNC_BARS: int = field(default_factory=lambda: _int("LSTM_RESYNC_BARS", 60))
+
     # Manual trading volume
     MANUAL_TRADE_VOLUME: float = field(default_factory=lambda: _float("MANUAL_TRADE_VOLUME", 0.10))
 
@@ -96,17 +163,66 @@ class Settings:
     GEMINI_MODEL: str = field(default_factory=lambda: _str("GEMINI_MODEL", "gemini-2.0-flash"))
     LLM_ADVISOR_ENABLED: bool = field(default_factory=lambda: _bool("LLM_ADVISOR_ENABLED", False))
     LLM_REQUIRE_CONSENSUS: bool = field(default_factory=lambda: _bool("LLM_REQUIRE_CONSENSUS", False))
+    LLM_TIMEOUT_SEC: float = field(default_factory=lambda: _float("LLM_TIMEOUT_SEC", 8.0))
+    # model ที่ timeout / error โหวตเป็น: HOLD | AGREE (ตามฝั่งที่ AI เสนอ) | SKIP (ไม่นับ)
+    LLM_FALLBACK_DECISION: str = field(default_factory=lambda: _str("LLM_FALLBACK_DECISION", "HOLD").upper())
+    LLM_CACHE_TTL_SEC: int = field(default_factory=lambda: _int("LLM_CACHE_TTL_SEC", 60))
+    # base URL สำหรับ proxy / stub server ตอนทดสอบ (ว่าง = endpoint จริง)
+    OPENAI_BASE_URL: str = field(default_factory=lambda: _str("OPENAI_BASE_URL", ""))
+    GEMINI_BASE_URL: str = field(default_factory=lambda: _str("GEMINI_BASE_URL", ""))
+
+    # ---- Performance profiling ----
+    # เขียน p50 / p99 / max ของแต่ละ stage ลง AI log ทุกกี่วินาที (0 = ปิด)
+    PERF_LOG_INTERVAL_SEC: int = field(default_factory=lambda: _int("PERF_LOG_INTERVAL_SEC", 300))
+    # > 0 = cProfile ทุกรอบ แล้วเก็บไฟล์ .prof ของ N รอบที่ช้าที่สุด (มี overhead — เปิดตอน debug)
+    PERF_PROFILE_SLOWEST: int = field(default_factory=lambda: _int("PERF_PROFILE_SLOWEST", 0))
+    PERF_PROFILE_DIR: str = field(default_factory=lambda: _str("PERF_PROFILE_DIR", "logs/profiles"))
 
     # ---- Kelly Criterion ----
     KELLY_CRITERION_ENABLED: bool = field(default_factory=lambda: _bool("KELLY_CRITERION_ENABLED", False))
     KELLY_FRACTION: float = field(default_factory=lambda: _float("KELLY_FRACTION", 0.5))  # Half-Kelly
+    KELLY_WINDOW_TRADES: int = field(default_factory=lambda: _int("KELLY_WINDOW_TRADES", 50))  # ไม้ปิดล่าสุดที่ใช้คิด
+    KELLY_MIN_TRADES: int = field(default_factory=lambda: _int("KELLY_MIN_TRADES", 20))  # น้อยกว่านี้ = ไม่ใช้ Kelly
+    KELLY_STATS_SCOPE: str = field(default_factory=lambda: _str("KELLY_STATS_SCOPE", "symbol"))  # all / symbol / regime / mode
+    PERFORMANCE_WINDOWS: str = field(default_factory=lambda: _str("PERFORMANCE_WINDOWS", "20,50,200"))  # core/performance.py
 
     # ---- Initial balance (for drawdown protection) ----
     INITIAL_BALANCE: float = field(default_factory=lambda: _float("INITIAL_BALANCE", 0.0))
 
+    # ---- Equity tracker + circuit breaker (core/equity_tracker.py) — 0 = ปิดเงื่อนไขนั้น ----
+    EQUITY_SAMPLE_SEC: float = field(default_factory=lambda: _float("EQUITY_SAMPLE_SEC", 60.0))
+    EQUITY_RING_SIZE: int = field(default_factory=lambda: _int("EQUITY_RING_SIZE", 10080))  # 1 สัปดาห์ที่ 60 วินาที
+    MAX_DAILY_LOSS_PCT: float = field(default_factory=lambda: _float("MAX_DAILY_LOSS_PCT", 0.05))
+    MAX_WEEKLY_LOSS_PCT: float = field(default_factory=lambda: _float("MAX_WEEKLY_LOSS_PCT", 0.10))
+    MAX_DRAWDOWN_PCT: float = field(default_factory=lambda: _float("MAX_DRAWDOWN_PCT", 0.0))
+    MAX_CONSECUTIVE_LOSSES: int = field(default_factory=lambda: _int("MAX_CONSECUTIVE_LOSSES", 0))
+    LOSS_STREAK_COOLDOWN_SEC: float = field(default_factory=lambda: _float("LOSS_STREAK_COOLDOWN_SEC", 14400.0))
+    # peak / baseline วัน-สัปดาห์ / breaker ที่ทำงานแล้ว (restart + dashboard ใช้ร่วม) — ว่าง = เก็บในหน่วยความจำอย่างเดียว
+    EQUITY_STATE_PATH: str = field(default_factory=lambda: _str("EQUITY_STATE_PATH", "logs/equity_state.json"))
+
     # ---- Session filter ----
     SESSION_FILTER_ENABLED: bool = field(default_factory=lambda: _bool("SESSION_FILTER_ENABLED", False))
     SESSION_ACTIVE_HOURS: str = field(default_factory=lambda: _str("SESSION_ACTIVE_HOURS", "07:00-17:00"))  # UTC
 
+    def trading_pairs(self) -> List[Tuple[str, str, int]]:
+        """
+        คืน [(symbol, timeframe, max_open_trades), ...] จาก TRADING_PAIRS
+        ถ้าไม่ได้ตั้ง → [(SYMBOL, TIMEFRAME, MAX_OPEN_TRADES)]
+        """
+        pairs: List[Tuple[str, str, int]] = []
+        for item in self.TRADING_PAIRS.split(","):
+            parts = [p.strip() for p in item.strip().split(":")]
+            if not parts[0]:
+                continue
+            symbol = parts[0]
+            timeframe = parts[1].upper() if len(parts) > 1 and parts[1] else self.TIMEFRAME
+            try:
+                max_open = int(parts[2]) if len(parts) > 2 else self.MAX_OPEN_TRADES
+            except ValueError:
+                max_open = self.MAX_OPEN_TRADES
+            if (symbol, timeframe) not in [(s, t) for s, t, _ in pairs]:
+                pairs.append((symbol, timeframe, max_open))
+        return pairs or [(self.SYMBOL, self.TIMEFRAME, self.MAX_OPEN_TRADES)]
+
 
 settings = Settings()
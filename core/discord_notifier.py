@@ -1,55 +1,164 @@
+import atexit
 import json
-from typing import Optional
+import queue
+import threading
+import time
+from typing import Optional, Union
 
 import requests
 
+from .charting import DeferredChart
 from .config import settings
+from .profiler import profiler
 
+# notify_* แค่ใส่งานลง queue แล้วคืนทันที — worker thread เป็นคนวาดกราฟ / ยิง webhook
+# (webhook ช้า / Discord rate limit ไม่ถ่วง loop เทรดอีกต่อไป)
+ChartArg = Union[str, DeferredChart, None]
 
-def _post(content: str, file_path: Optional[str] = None):
-    if not settings.DISCORD_WEBHOOK_URL:
-        return
-    data = {"content": content}
+_QUEUE: "queue.Queue[tuple]" = queue.Queue(maxsize=max(settings.DISCORD_QUEUE_SIZE, 1))
+_SESSION: Optional[requests.Session] = None
+_WORKER: Optional[threading.Thread] = None
+_WORKER_LOCK = threading.Lock()
+# เวลาที่ห้ามยิงก่อนหน้านั้น (จาก 429 / X-RateLimit-Remaining=0)
+_BLOCKED_UNTIL = 0.0
+
+
+def _session() -> requests.Session:
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+    return _SESSION
+
+
+def _retry_after(resp: requests.Response) -> float:
+    """วินาทีที่ Discord ให้รอ (body.retry_after หรือ header Retry-After)"""
+    try:
+        return float(resp.json().get("retry_after", 1.0))
+    except Exception:
+        pass
+    try:
+        return float(resp.headers.get("Retry-After", 1.0))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _post_once(data: dict, file_path: Optional[str]) -> requests.Response:
     if file_path:
+        with open(file_path, "rb") as f:
+            return _session().post(
+                settings.DISCORD_WEBHOOK_URL,
+                data=data,
+                files={"file": f},
+                timeout=10,
+            )
+    return _session().post(settings.DISCORD_WEBHOOK_URL, data=data, timeout=10)
+
+
+def _send(content: str, file_path: Optional[str]) -> None:
+    """ยิง webhook 1 ข้อความ พร้อม retry / backoff / เคารพ 429"""
+    global _BLOCKED_UNTIL
+    data = {"payload_json": json.dumps({"content": content})}
+    attempt = 0
+    while True:
+        wait_sec = _BLOCKED_UNTIL - time.time()
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+
         try:
-            with open(file_path, "rb") as f:
-                files = {"file": f}
+            resp = _post_once(data, file_path)
+        except requests.RequestException as e:
+            resp, error = None, e
+        except OSError as e:
+            print("[DISCORD] file error:", e)
+            file_path = None  # ส่งข้อความอย่างเดียวแทน
+            continue
+
+        if resp is not None:
+            # bucket หมดแล้ว → เว้นจนกว่าจะ reset (ยังนับว่าส่งสำเร็จ)
+            if resp.headers.get("X-RateLimit-Remaining") == "0":
                 try:
-                    resp = requests.post(
-                        settings.DISCORD_WEBHOOK_URL,
-                        data={"payload_json": json.dumps(data)},
-                        files=files,
-                        timeout=10,
-                    )
-                    if not resp.ok:
-                        print("[DISCORD] error:", resp.status_code, resp.text)
-                except Exception as e:
-                    print("[DISCORD] exception:", e)
+                    reset_after = float(resp.headers.get("X-RateLimit-Reset-After", 0))
+                    _BLOCKED_UNTIL = max(_BLOCKED_UNTIL, time.time() + reset_after)
+                except ValueError:
+                    pass
+
+            if resp.status_code == 429:
+                retry = _retry_after(resp)
+                print(f"[DISCORD] rate limited, retry in {retry:.2f}s")
+                _BLOCKED_UNTIL = time.time() + retry
+                attempt += 1
+                if attempt > settings.DISCORD_MAX_RETRIES + 2:
+                    print("[DISCORD] drop message after repeated 429")
+                    return
+                continue
+            if resp.ok:
+                return
+            if resp.status_code < 500:
+                # 4xx อื่น ๆ (URL ผิด / payload ผิด) retry ไปก็ไม่ผ่าน
+                print("[DISCORD] error:", resp.status_code, resp.text)
+                return
+            error = f"HTTP {resp.status_code}"
+
+        attempt += 1
+        if attempt > settings.DISCORD_MAX_RETRIES:
+            print("[DISCORD] exception:", error)
+            return
+        time.sleep(min(2.0 ** (attempt - 1), 30.0))
+
+
+def _worker() -> None:
+    while True:
+        content, chart = _QUEUE.get()
+        try:
+            file_path = chart.render() if isinstance(chart, DeferredChart) else chart
+            with profiler.stage("discord"):
+                _send(content, file_path)
         except Exception as e:
-            print("[DISCORD] file error:", e)
-        return
+            print("[DISCORD] worker error:", e)
+        finally:
+            _QUEUE.task_done()
+
+
+def _ensure_worker() -> None:
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None or not _WORKER.is_alive():
+            _WORKER = threading.Thread(target=_worker, name="discord-notifier", daemon=True)
+            _WORKER.start()
 
+
+def _post(content: str, file_path: ChartArg = None):
+    if not settings.DISCORD_WEBHOOK_URL:
+        return
+    _ensure_worker()
     try:
-        resp = requests.post(
-            settings.DISCORD_WEBHOOK_URL,
-            data={"payload_json": json.dumps(data)},
-            timeout=10,
-        )
-        if not resp.ok:
-            print("[DISCORD] error:", resp.status_code, resp.text)
-    except Exception as e:
-        print("[DISCORD] exception:", e)
+        _QUEUE.put_nowait((content, file_path))
+    except queue.Full:
+        print("[DISCORD] queue full, drop message:", content.splitlines()[0] if content else "")
+
+
+def flush(timeout: float = 10.0) -> bool:
+    """รอให้ข้อความใน queue ส่งหมด (ใช้ตอนปิดโปรแกรม / script สั้น ๆ) คืน False ถ้าไม่ทัน"""
+    deadline = time.time() + timeout
+    while _QUEUE.unfinished_tasks:
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+atexit.register(flush, 5.0)
 
 
 def notify_bot_started():
     _post("🚀 **Extreme AI v4 Bot Started**")
 
 
-def notify_pre_signal(message: str, chart_path: Optional[str] = None):
+def notify_pre_signal(message: str, chart_path: ChartArg = None):
     _post("🔔 **PRE Signal**\n" + message, chart_path)
 
 
-def notify_confirm_signal(message: str, chart_path: Optional[str] = None):
+def notify_confirm_signal(message: str, chart_path: ChartArg = None):
     _post("✅ **CONFIRM Signal**\n" + message, chart_path)
 
 
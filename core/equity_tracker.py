@@ -0,0 +1,232 @@
+# core/equity_tracker.py
+"""
+Equity curve + circuit breaker
+
+    equity_tracker.sample()          # ทุกรอบของ loop — เก็บจริงทุก EQUITY_SAMPLE_SEC (นาฬิกาของ backend)
+    equity_tracker.halt_reason()     # None = เทรดได้ / ข้อความ = หยุดเปิดไม้ใหม่ (O(1))
+    equity_tracker.drawdown_pct      # drawdown จาก peak equity → calculate_position_size
+
+- equity (รวมกำไรลอย) จาก account_info ถูกเก็บใน ring buffer ของ numpy (EQUITY_RING_SIZE จุด, 24 bytes ต่อจุด)
+- ตัวนับที่อัปเดตตอน sample: peak equity (ไม่ต่ำกว่า INITIAL_BALANCE), equity ต้นวัน / ต้นสัปดาห์
+  (นับวันตามเวลา server โบรก get_broker().server_time() — นาฬิกาเดียวกับ deal.time ใน journal)
+- peak / equity ต้นวัน-สัปดาห์ / วัน-สัปดาห์ที่ breaker ทำงานแล้ว บันทึกลง EQUITY_STATE_PATH ทุกครั้งที่เปลี่ยน
+  และอ่านกลับเมื่อไฟล์เปลี่ยน → restart ไม่ปลด breaker, dashboard (อีก process) ใช้ state ชุดเดียวกับ loop
+- แพ้ติดกันนับจากไม้ที่ปิดใน trade journal (core.trade_logger, replay ตอนเริ่ม) — ไม้ชนะ = เริ่มนับใหม่
+- circuit breaker (คำนวณตอน sample / ไม้ปิด แล้ว cache ไว้):
+    ขาดทุนวันนี้ >= MAX_DAILY_LOSS_PCT      → หยุดถึงวันใหม่
+    ขาดทุนสัปดาห์นี้ >= MAX_WEEKLY_LOSS_PCT → หยุดถึงสัปดาห์ใหม่ (จันทร์)
+    drawdown จาก peak >= MAX_DRAWDOWN_PCT   → หยุดจนกว่า equity กลับขึ้นมา
+    แพ้ติดกัน >= MAX_CONSECUTIVE_LOSSES     → หยุด LOSS_STREAK_COOLDOWN_SEC นับจากไม้ที่แพ้ล่าสุด
+  ค่า 0 = ปิดเงื่อนไขนั้น · ไม้ที่เปิดอยู่ยังถูกดูแลตามปกติ (SL / TP / position manager)
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from .broker import get_broker
+from .broker_cache import broker_cache
+from .config import settings
+from .trade_logger import trade_journal
+
+EQUITY_DTYPE = np.dtype([("time", "<f8"), ("balance", "<f8"), ("equity", "<f8")])
+
+DAY_SEC = 86400
+
+
+def _day(t: float) -> int:
+    return int(t // DAY_SEC)
+
+
+def _week(t: float) -> int:
+    # 1970-01-01 เป็นวันพฤหัส → +3 วันให้สัปดาห์เริ่มวันจันทร์
+    return (_day(t) + 3) // 7
+
+
+class EquityTracker:
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._ring = np.zeros(max(int(size), 1), dtype=EQUITY_DTYPE)
+        self._next = 0
+        self._count = 0
+        self._last_sample: Optional[float] = None
+        self.peak = 0.0
+        self.equity = 0.0
+        self.drawdown_pct = 0.0
+        self._day: Optional[int] = None
+        self._day_start = 0.0
+        self._week: Optional[int] = None
+        self._week_start = 0.0
+        self.loss_streak = 0
+        self._last_loss_time: Optional[float] = None
+        self._halt: Optional[str] = None
+        self._halt_kind: Optional[str] = None
+        self._tripped_day: Optional[int] = None
+        self._tripped_week: Optional[int] = None
+        self._journal_attached = False
+        self._state_signature: Optional[Tuple[int, int, int]] = None
+        self._saved_state: Optional[Tuple[Any, ...]] = None
+
+    # ── sampling ──────────────────────────────────────────────────────
+    def sample(self, force: bool = False) -> bool:
+        """เก็บ equity 1 จุด (ไม่เกินทุก EQUITY_SAMPLE_SEC) คืน True ถ้าเก็บจริง"""
+        self._attach_journal()
+        now = get_broker().server_time()
+        if not force and self._last_sample is not None and now - self._last_sample < settings.EQUITY_SAMPLE_SEC:
+            return False
+        account = broker_cache.account_info()
+        if account is None:
+            return False
+        self.record(now, float(account.balance), float(account.equity))
+        return True
+
+    def record(self, t: float, balance: float, equity: float) -> None:
+        with self._lock:
+            self._load_state()
+            self._last_sample = t
+            self._ring[self._next] = (t, balance, equity)
+            self._next = (self._next + 1) % len(self._ring)
+            self._count = min(self._count + 1, len(self._ring))
+
+            self.equity = equity
+            self.peak = max(self.peak, equity, settings.INITIAL_BALANCE)
+            self.drawdown_pct = (self.peak - equity) / self.peak if self.peak > 0 else 0.0
+            if _day(t) != self._day:
+                self._day, self._day_start = _day(t), equity
+            if _week(t) != self._week:
+                self._week, self._week_start = _week(t), equity
+            self._evaluate(t)
+            self._save_state()
+
+    def _attach_journal(self) -> None:
+        if self._journal_attached:
+            return
+        self._journal_attached = True
+        trade_journal.subscribe(self._on_close, replay=True)
+
+    def _on_close(self, trade: Dict[str, Any]) -> None:
+        with self._lock:
+            if trade.get("profit", 0.0) > 0:
+                self.loss_streak = 0
+            else:
+                self.loss_streak += 1
+                self._last_loss_time = trade.get("exit_time")
+            self._evaluate(self._last_sample or get_broker().server_time())
+
+    # ── persisted state ───────────────────────────────────────────────
+    def _state(self) -> Tuple[Any, ...]:
+        return (self.peak, self._day, self._day_start, self._week, self._week_start, self._tripped_day, self._tripped_week)
+
+    def _load_state(self) -> None:
+        """
+        (ถือ self._lock อยู่) รวม state จากไฟล์เมื่อไฟล์เปลี่ยน (restart / process อื่นเขียน)
+        peak = ค่าสูงสุด, baseline ของวัน / สัปดาห์ที่ใหม่กว่าหรือที่ยังไม่มี, latch ที่ใหม่กว่า
+        """
+        path = settings.EQUITY_STATE_PATH
+        if not path:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if signature == self._state_signature:
+            return
+        self._state_signature = signature
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print("[RISK] equity state read error:", e)
+            return
+        self.peak = max(self.peak, float(state.get("peak") or 0.0))
+        day, week = state.get("day"), state.get("week")
+        if day is not None and (self._day is None or day > self._day):
+            self._day, self._day_start = int(day), float(state["day_start"])
+        if week is not None and (self._week is None or week > self._week):
+            self._week, self._week_start = int(week), float(state["week_start"])
+        for key in ("_tripped_day", "_tripped_week"):
+            value = state.get(key[1:])
+            if value is not None and (getattr(self, key) is None or value > getattr(self, key)):
+                setattr(self, key, int(value))
+
+    def _save_state(self) -> None:
+        """(ถือ self._lock อยู่) เขียนเมื่อค่าเปลี่ยนเท่านั้น (tmp + os.replace → reader ไม่เห็นไฟล์ครึ่งเดียว)"""
+        path = settings.EQUITY_STATE_PATH
+        state = self._state()
+        if not path or state == self._saved_state:
+            return
+        keys = ("peak", "day", "day_start", "week", "week_start", "tripped_day", "tripped_week")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(dict(zip(keys, state)), f)
+            os.replace(tmp_path, path)
+            st = os.stat(path)
+        except OSError as e:
+            print("[RISK] equity state write error:", e)
+            return
+        self._saved_state = state
+        self._state_signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    # ── circuit breaker ───────────────────────────────────────────────
+    @staticmethod
+    def _loss_pct(start: float, equity: float) -> float:
+        return (start - equity) / start if start > 0 else 0.0
+
+    def _evaluate(self, now: float) -> None:
+        """(ถือ self._lock อยู่) คำนวณเหตุผลที่ต้องหยุดใหม่ แล้ว cache ไว้ให้ halt_reason()"""
+        reason = kind = None
+        daily = self._loss_pct(self._day_start, self.equity)
+        weekly = self._loss_pct(self._week_start, self.equity)
+        # ขาดทุนวัน / สัปดาห์ถึงเกณฑ์ครั้งเดียว = หยุดทั้งวัน / สัปดาห์ (equity เด้งกลับก็ไม่ปลด)
+        if settings.MAX_DAILY_LOSS_PCT > 0 and daily >= settings.MAX_DAILY_LOSS_PCT:
+            self._tripped_day = self._day
+        if settings.MAX_WEEKLY_LOSS_PCT > 0 and weekly >= settings.MAX_WEEKLY_LOSS_PCT:
+            self._tripped_week = self._week
+        if self._tripped_day is not None and self._tripped_day == self._day:
+            reason, kind = f"daily loss limit {settings.MAX_DAILY_LOSS_PCT:.1%} hit (now {daily:.1%})", "daily"
+        elif self._tripped_week is not None and self._tripped_week == self._week:
+            reason, kind = f"weekly loss limit {settings.MAX_WEEKLY_LOSS_PCT:.1%} hit (now {weekly:.1%})", "weekly"
+        elif settings.MAX_DRAWDOWN_PCT > 0 and self.drawdown_pct >= settings.MAX_DRAWDOWN_PCT:
+            reason, kind = f"drawdown {self.drawdown_pct:.1%} from peak {self.peak:.2f}", "drawdown"
+        elif settings.MAX_CONSECUTIVE_LOSSES > 0 and self.loss_streak >= settings.MAX_CONSECUTIVE_LOSSES:
+            if self._last_loss_time is not None and now - self._last_loss_time >= settings.LOSS_STREAK_COOLDOWN_SEC:
+                self.loss_streak = 0  # พักครบแล้ว → เริ่มนับใหม่
+            else:
+                reason, kind = f"{self.loss_streak} consecutive losses", "streak"
+        if kind != self._halt_kind:
+            print(f"[RISK] circuit breaker: {reason}" if reason else "[RISK] circuit breaker cleared")
+        self._halt, self._halt_kind = reason, kind
+
+    def halt_reason(self) -> Optional[str]:
+        """None = เปิดไม้ใหม่ได้ — อ่านค่าที่ cache ไว้ (O(1))"""
+        return self._halt
+
+    # ── queries ───────────────────────────────────────────────────────
+    def curve(self, limit: Optional[int] = None) -> np.ndarray:
+        """จุดใน ring buffer เรียงเก่า → ใหม่ (copy)"""
+        with self._lock:
+            n = self._count if limit is None else min(int(limit), self._count)
+            idx = (self._next - n + np.arange(n)) % len(self._ring)
+            return self._ring[idx]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "equity": round(self.equity, 2),
+                "peak": round(self.peak, 2),
+                "drawdown_pct": round(self.drawdown_pct, 4),
+                "daily_loss_pct": round(self._loss_pct(self._day_start, self.equity), 4),
+                "weekly_loss_pct": round(self._loss_pct(self._week_start, self.equity), 4),
+                "loss_streak": self.loss_streak,
+                "halt": self._halt,
+                "samples": self._count,
+            }
+
+
+equity_tracker = EquityTracker(settings.EQUITY_RING_SIZE)
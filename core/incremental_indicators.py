@@ -0,0 +1,376 @@
+# core/incremental_indicators.py
+"""
+Incremental (streaming) version of core.indicators.add_all_indicators.
+
+add_all_indicators() recomputes every indicator over the whole lookback window
+on every loop, even though at most one bar changed. IncrementalIndicatorEngine
+keeps the rolling windows / EWM state of each indicator and updates it in O(1)
+per new or revised bar, producing the same columns and values as
+add_all_indicators() on the full bar history it has been fed.
+
+Usage:
+    engine = IncrementalIndicatorEngine(max_rows=settings.LOOKBACK_BARS)
+    df = engine.update_frame(df_raw)   # ป้อนแท่งใหม่ / แท่งที่ยังไม่ปิด (revise) เท่านั้น
+"""
+
+import math
+from collections import deque
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ลำดับคอลัมน์เหมือน add_all_indicators() ทุกตัว
+OHLCV_COLUMNS = ["time", "Open", "High", "Low", "Close", "Volume"]
+INDICATOR_COLUMNS = [
+    "RSI", "MACD", "MACD_SIGNAL", "MACD_HIST", "ATR", "ADX", "RET",
+    "EMA9", "EMA21", "EMA50", "EMA_TREND",
+    "BB_UPPER", "BB_MIDDLE", "BB_LOWER", "BB_WIDTH", "BB_PCT_B",
+    "STOCH_K", "STOCH_D", "VOL_MA20", "VOL_RATIO",
+    "BULLISH_ENGULF", "BEARISH_ENGULF", "HAMMER", "SHOOTING_STAR", "DOJI",
+]
+COLUMNS = OHLCV_COLUMNS + INDICATOR_COLUMNS
+
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+ADX_PERIOD = 14
+BB_PERIOD = 20
+BB_STD_DEV = 2.0
+STOCH_K_PERIOD = 14
+STOCH_D_PERIOD = 3
+VOL_MA_PERIOD = 20
+
+
+def _ewm_alpha_span(span: int) -> float:
+    return 2.0 / (span + 1.0)
+
+
+def _ewm_next(prev: Optional[float], x: float, alpha: float) -> Optional[float]:
+    """
+    1 step ของ pandas ewm(adjust=False).mean() (สูตรเดียวกับ pandas ทุกตัว
+    รวมถึงการหารด้วย old_wt + new_wt และการข้าม NaN ช่วงต้น series)
+    """
+    if x != x:  # NaN
+        return prev
+    if prev is None:
+        return x
+    if prev != x:
+        old_wt = 1.0 - alpha
+        return (old_wt * prev + alpha * x) / (old_wt + alpha)
+    return prev
+
+
+def _window_mean(window: Deque[float], period: int) -> float:
+    if len(window) < period:
+        return math.nan
+    return sum(window) / period
+
+
+class _State:
+    """state ของทุก indicator หลังป้อนแท่งที่ปิดแล้วครบ (committed)"""
+
+    __slots__ = (
+        "n", "prev_open", "prev_high", "prev_low", "prev_close",
+        "gains", "losses", "tr", "ema_fast", "ema_slow", "macd_signal",
+        "pdm_ewm", "mdm_ewm", "adx", "ema9", "ema21", "ema50",
+        "closes", "highs", "lows", "pct_k", "volumes",
+    )
+
+    def __init__(self):
+        self.n = 0
+        self.prev_open: Optional[float] = None
+        self.prev_high: Optional[float] = None
+        self.prev_low: Optional[float] = None
+        self.prev_close: Optional[float] = None
+        self.gains: Deque[float] = deque(maxlen=RSI_PERIOD)
+        self.losses: Deque[float] = deque(maxlen=RSI_PERIOD)
+        self.tr: Deque[float] = deque(maxlen=ATR_PERIOD)
+        self.ema_fast: Optional[float] = None
+        self.ema_slow: Optional[float] = None
+        self.macd_signal: Optional[float] = None
+        self.pdm_ewm: Optional[float] = None
+        self.mdm_ewm: Optional[float] = None
+        self.adx: Optional[float] = None
+        self.ema9: Optional[float] = None
+        self.ema21: Optional[float] = None
+        self.ema50: Optional[float] = None
+        self.closes: Deque[float] = deque(maxlen=BB_PERIOD)
+        self.highs: Deque[float] = deque(maxlen=STOCH_K_PERIOD)
+        self.lows: Deque[float] = deque(maxlen=STOCH_K_PERIOD)
+        self.pct_k: Deque[float] = deque(maxlen=STOCH_D_PERIOD)
+        self.volumes: Deque[float] = deque(maxlen=VOL_MA_PERIOD)
+
+    def clone(self) -> "_State":
+        other = _State.__new__(_State)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, deque):
+                value = deque(value, maxlen=value.maxlen)
+            setattr(other, name, value)
+        return other
+
+
+def _step(state: _State, bar: Tuple) -> Tuple[_State, Tuple]:
+    """
+    ป้อน 1 แท่งเข้า state แล้วคืน (state ใหม่, แถว output)
+    bar = (time, open, high, low, close, volume)
+    ไม่แก้ state เดิม → ใช้ซ้ำได้ตอนแท่งล่าสุดถูก revise
+    """
+    t, o, h, l, c, v = bar
+    o, h, l, c = float(o), float(h), float(l), float(c)
+    s = state.clone()
+    pc = state.prev_close
+
+    # --- RSI (rolling mean ของ gain/loss) ---
+    delta = c - pc if pc is not None else math.nan
+    s.gains.append(delta if delta > 0 else 0.0)
+    s.losses.append(-delta if delta < 0 else 0.0)
+    avg_gain = _window_mean(s.gains, RSI_PERIOD)
+    avg_loss = _window_mean(s.losses, RSI_PERIOD)
+    rs = avg_gain / (avg_loss + 1e-9)
+    rsi_val = 100 - (100 / (1 + rs))
+
+    # --- MACD (12, 26, 9) ---
+    s.ema_fast = _ewm_next(state.ema_fast, c, _ewm_alpha_span(12))
+    s.ema_slow = _ewm_next(state.ema_slow, c, _ewm_alpha_span(26))
+    macd_line = s.ema_fast - s.ema_slow
+    s.macd_signal = _ewm_next(state.macd_signal, macd_line, _ewm_alpha_span(9))
+    macd_hist = macd_line - s.macd_signal
+
+    # --- ATR (true range, rolling mean) ---
+    if pc is None:
+        tr = h - l
+    else:
+        tr = max(h - l, abs(h - pc), abs(l - pc))
+    s.tr.append(tr)
+    atr_val = _window_mean(s.tr, ATR_PERIOD)
+
+    # --- ADX (DM แบบเดียวกับ indicators.adx: minus_dm เทียบกับ plus_dm ที่กรองแล้ว) ---
+    if state.prev_high is None:
+        plus_dm = 0.0
+        minus_dm = 0.0
+    else:
+        plus_dm = h - state.prev_high
+        minus_dm = state.prev_low - l
+        plus_dm = plus_dm if (plus_dm > minus_dm and plus_dm > 0) else 0.0
+        minus_dm = minus_dm if (minus_dm > plus_dm and minus_dm > 0) else 0.0
+    adx_alpha = 1.0 / ADX_PERIOD
+    s.pdm_ewm = _ewm_next(state.pdm_ewm, plus_dm, adx_alpha)
+    s.mdm_ewm = _ewm_next(state.mdm_ewm, minus_dm, adx_alpha)
+    plus_di = 100 * (s.pdm_ewm / (atr_val + 1e-9))
+    minus_di = 100 * (s.mdm_ewm / (atr_val + 1e-9))
+    dx = (abs(plus_di - minus_di) / (plus_di + minus_di + 1e-9)) * 100
+    s.adx = _ewm_next(state.adx, dx, adx_alpha)
+    adx_val = s.adx if s.adx is not None else math.nan
+
+    ret = c / pc - 1.0 if pc is not None else math.nan
+
+    # --- EMA Trend System (9 / 21 / 50) ---
+    s.ema9 = _ewm_next(state.ema9, c, _ewm_alpha_span(9))
+    s.ema21 = _ewm_next(state.ema21, c, _ewm_alpha_span(21))
+    s.ema50 = _ewm_next(state.ema50, c, _ewm_alpha_span(50))
+    ema_bull = int(s.ema9 > s.ema21) + int(s.ema21 > s.ema50)
+    ema_bear = int(s.ema9 < s.ema21) + int(s.ema21 < s.ema50)
+    ema_trend = ema_bull - ema_bear
+
+    # --- Bollinger Bands (20, 2σ, std ddof=1) ---
+    s.closes.append(c)
+    if len(s.closes) < BB_PERIOD:
+        middle = std = math.nan
+    else:
+        middle = sum(s.closes) / BB_PERIOD
+        std = math.sqrt(sum((x - middle) ** 2 for x in s.closes) / (BB_PERIOD - 1))
+    upper = middle + BB_STD_DEV * std
+    lower = middle - BB_STD_DEV * std
+    bb_width = (upper - lower) / (middle + 1e-9)
+    bb_pct_b = (c - lower) / (upper - lower + 1e-9)
+
+    # --- Stochastic (14, 3) ---
+    s.highs.append(h)
+    s.lows.append(l)
+    if len(s.highs) < STOCH_K_PERIOD:
+        pct_k = math.nan
+    else:
+        high_roll = max(s.highs)
+        low_roll = min(s.lows)
+        pct_k = 100 * (c - low_roll) / (high_roll - low_roll + 1e-9)
+        s.pct_k.append(pct_k)
+    pct_d = _window_mean(s.pct_k, STOCH_D_PERIOD) if pct_k == pct_k else math.nan
+
+    # --- Volume MA ---
+    s.volumes.append(float(v))
+    vol_ma = _window_mean(s.volumes, VOL_MA_PERIOD)
+    vol_ratio = v / (vol_ma + 1e-9)
+
+    # --- Candlestick Patterns ---
+    body = abs(c - o)
+    upper_shadow = h - (c if c > o else o)
+    lower_shadow = (c if c < o else o) - l
+    candle_range = h - l + 1e-9
+    prev_o = state.prev_open
+    prev_c = pc
+    if prev_o is not None:
+        bullish_engulf = int(c > o and prev_c < prev_o and o < prev_c and c > prev_o)
+        bearish_engulf = int(c < o and prev_c > prev_o and o > prev_c and c < prev_o)
+    else:
+        bullish_engulf = bearish_engulf = 0
+    hammer = int(lower_shadow >= 2 * body and upper_shadow <= 0.3 * body + 1e-9 and body > 0)
+    shooting_star = int(upper_shadow >= 2 * body and lower_shadow <= 0.3 * body + 1e-9 and body > 0)
+    doji = int(body < 0.1 * candle_range)
+
+    s.n = state.n + 1
+    s.prev_open, s.prev_high, s.prev_low, s.prev_close = o, h, l, c
+
+    row = (
+        t, o, h, l, c, v,
+        rsi_val, macd_line, s.macd_signal, macd_hist, atr_val, adx_val, ret,
+        s.ema9, s.ema21, s.ema50, ema_trend,
+        upper, middle, lower, bb_width, bb_pct_b,
+        pct_k, pct_d, vol_ma, vol_ratio,
+        bullish_engulf, bearish_engulf, hammer, shooting_star, doji,
+    )
+    return s, row
+
+
+def _row_complete(row: Sequence) -> bool:
+    # เทียบเท่า df.dropna() ใน add_all_indicators
+    for value in row[1:]:
+        if isinstance(value, float) and value != value:
+            return False
+    return True
+
+
+class IncrementalIndicatorEngine:
+    """
+    Stateful indicator engine: ป้อนทีละแท่ง (ใหม่ หรือ revise แท่งล่าสุดที่ยังไม่ปิด)
+    แต่ละ update ใช้เวลา O(1) ไม่ขึ้นกับ lookback
+
+    - update(bar)          : ป้อน 1 แท่ง (time, Open, High, Low, Close, Volume)
+    - update_frame(df_raw) : ป้อนเฉพาะแท่งใน df_raw ที่ใหม่กว่า/เท่ากับแท่งล่าสุดที่เห็น
+                             แล้วคืน DataFrame แบบเดียวกับ add_all_indicators()
+    - to_frame()           : DataFrame ของแถวที่คำนวณครบแล้ว (สูงสุด max_rows แถว)
+
+    แท่งที่มี time เท่ากับแท่งล่าสุด = revise (คำนวณใหม่จาก state ก่อนหน้า)
+    แท่งที่ time ใหม่กว่า = แท่งก่อนหน้าปิดแล้ว → commit state แล้วคำนวณแท่งใหม่
+
+    แถวที่ครบแล้วถูกเขียนลง buffer แบบ column (numpy, จุ 2 × max_rows แถว) ทีละแถวด้วย
+    → to_frame() สร้าง DataFrame จาก slice ของ buffer ไม่ต้องแปลง tuple ทั้ง window ใหม่ทุก loop
+    """
+
+    def __init__(self, max_rows: int = 500):
+        self.max_rows = max_rows
+        self.reset()
+
+    def reset(self) -> None:
+        self._committed = _State()  # state ถึงแท่งก่อนหน้าแท่งล่าสุด
+        self._pending: Optional[_State] = None  # state รวมแท่งล่าสุด (อาจถูก revise)
+        self._last_time = None
+        self._last_complete = False
+        self._rows: Deque[Tuple] = deque(maxlen=self.max_rows)
+        self._frame: Optional[pd.DataFrame] = None
+        # buffer แบบ column ของแถวใน _rows: แถวที่ [end - len(_rows), end)
+        self._times: Optional[np.ndarray] = None
+        self._values: Optional[np.ndarray] = None
+        self._dtypes: Optional[list] = None
+        self._end = 0
+
+    @property
+    def last_time(self):
+        return self._last_time
+
+    @property
+    def bars_seen(self) -> int:
+        return self._pending.n if self._pending is not None else 0
+
+    def update(self, bar: Sequence) -> Optional[Dict]:
+        """
+        ป้อน 1 แท่ง: tuple (time, Open, High, Low, Close, Volume)
+        คืน dict ของแถว indicator ล่าสุด หรือ None ถ้ายังไม่ครบ warm-up / แท่งเก่ากว่าที่เห็น
+        """
+        t = bar[0]
+        if self._last_time is not None and t < self._last_time:
+            return None  # แท่งย้อนหลัง → ข้าม
+
+        revise = self._last_time is not None and t == self._last_time
+        if not revise and self._pending is not None:
+            self._committed = self._pending
+
+        self._pending, row = _step(self._committed, tuple(bar))
+        self._last_time = t
+
+        complete = _row_complete(row)
+        if revise and self._last_complete:
+            self._rows.pop()
+            self._end -= 1
+        if complete:
+            self._rows.append(row)
+            self._buffer_append(row)
+        self._last_complete = complete
+        self._frame = None
+        return dict(zip(COLUMNS, row)) if complete else None
+
+    def update_frame(self, df_raw: pd.DataFrame) -> pd.DataFrame:
+        """
+        ป้อน df_raw (time, Open, High, Low, Close, Volume) ที่ดึงมาทุก loop
+        ใช้เฉพาะแท่งที่ time >= แท่งล่าสุดที่เห็นแล้ว ถ้ามีช่องว่าง (history ขาด) จะ reset แล้วเริ่มใหม่
+        """
+        if df_raw is None or df_raw.empty:
+            return self.to_frame()
+
+        times = df_raw["time"].to_numpy()
+        if self._last_time is None:
+            start = 0
+        else:
+            last = self._last_time
+            if isinstance(last, pd.Timestamp):
+                last = last.to_datetime64()
+            start = int(np.searchsorted(times, last, side="left"))
+            if start == 0 and times[0] > last:
+                # df_raw ไม่ต่อจากแท่งล่าสุดที่เห็น → คำนวณใหม่ทั้งหมด
+                self.reset()
+
+        if start < len(df_raw):
+            cols = [df_raw[col].to_numpy() for col in OHLCV_COLUMNS]
+            time_col = df_raw["time"].iloc[start:]
+            for i, t in zip(range(start, len(df_raw)), time_col):
+                self.update((t, cols[1][i], cols[2][i], cols[3][i], cols[4][i], cols[5][i]))
+
+        return self.to_frame()
+
+    def _buffer_append(self, row: Tuple) -> None:
+        if self._values is None:
+            # dtype ต่อคอลัมน์ตามค่าแถวแรก (แบบเดียวกับ DataFrame.from_records) — ทุกคอลัมน์เป็นตัวเลข
+            t = row[0]
+            time_dtype = t.asm8.dtype if isinstance(t, pd.Timestamp) else np.asarray(t).dtype
+            self._dtypes = [np.asarray(v).dtype for v in row[1:]]
+            self._times = np.empty(2 * self.max_rows, dtype=time_dtype)
+            self._values = np.empty((2 * self.max_rows, len(COLUMNS) - 1), dtype=np.float64)
+        if self._end == len(self._values):
+            # เต็ม → ย้ายแถวที่ยังอยู่ใน window (ไม่รวมแถวที่เพิ่ง append) ไปต้น buffer
+            keep = len(self._rows) - 1
+            self._times[:keep] = self._times[self._end - keep : self._end]
+            self._values[:keep] = self._values[self._end - keep : self._end]
+            self._end = keep
+        self._times[self._end] = row[0]
+        self._values[self._end] = row[1:]
+        self._end += 1
+
+    def to_frame(self, tail: Optional[int] = None) -> pd.DataFrame:
+        if self._frame is None:
+            if self._rows:
+                lo = self._end - len(self._rows)
+                data = {"time": self._times[lo : self._end]}
+                for j, (col, dtype) in enumerate(zip(COLUMNS[1:], self._dtypes)):
+                    data[col] = self._values[lo : self._end, j].astype(dtype)
+                self._frame = pd.DataFrame(data)
+            else:
+                self._frame = pd.DataFrame(columns=COLUMNS)
+        if tail is not None:
+            return self._frame.iloc[-tail:]
+        return self._frame
+
+    def last_row(self) -> Optional[Dict]:
+        if not self._rows or not self._last_complete:
+            return None
+        return dict(zip(COLUMNS, self._rows[-1]))
+
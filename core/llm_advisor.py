@@ -10,8 +10,11 @@ with the technical AI will be executed, adding a high-quality filter.
 
 import json
 import re
+import threading
 import time
-from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Tuple
 
 from .config import settings
 
@@ -121,15 +124,30 @@ def _parse_llm_response(text: str) -> dict:
 # OpenAI GPT
 # ---------------------------------------------------------------------------
 
-def _query_gpt(prompt: str) -> dict:
-    """Call OpenAI Chat Completion and return parsed recommendation dict."""
+def _make_gpt_client():
+    """สร้าง OpenAI client ครั้งเดียว (reuse connection pool) — None ถ้าไม่มี package"""
     try:
         import openai  # type: ignore
     except ImportError:
+        return None
+    kwargs = {
+        "api_key": settings.OPENAI_API_KEY,
+        "timeout": settings.LLM_TIMEOUT_SEC,
+        "max_retries": 0,  # retry กิน latency budget → ให้ fallback ทำงานแทน
+    }
+    if settings.OPENAI_BASE_URL:
+        kwargs["base_url"] = settings.OPENAI_BASE_URL
+    return openai.OpenAI(**kwargs)
+
+
+def _query_gpt(prompt: str, client=None) -> dict:
+    """Call OpenAI Chat Completion and return parsed recommendation dict."""
+    if client is None:
+        client = _make_gpt_client()
+    if client is None:
         return {"error": "openai package not installed"}
 
     try:
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
         response = client.chat.completions.create(
             model=settings.OPENAI_MODEL,
             messages=[
@@ -156,19 +174,32 @@ def _query_gpt(prompt: str) -> dict:
 # Google Gemini
 # ---------------------------------------------------------------------------
 
-def _query_gemini(prompt: str) -> dict:
-    """Call Google Gemini and return parsed recommendation dict."""
+def _make_gemini_model():
+    """configure genai + สร้าง GenerativeModel ครั้งเดียว — None ถ้าไม่มี package"""
     try:
         import google.generativeai as genai  # type: ignore
     except ImportError:
-        return {"error": "google-generativeai package not installed"}
+        return None
+    kwargs = {"api_key": settings.GEMINI_API_KEY}
+    if settings.GEMINI_BASE_URL:
+        # stub server / proxy ใช้ REST transport
+        kwargs["transport"] = "rest"
+        kwargs["client_options"] = {"api_endpoint": settings.GEMINI_BASE_URL}
+    genai.configure(**kwargs)
+    return genai.GenerativeModel(
+        model_name=settings.GEMINI_MODEL,
+        system_instruction=_SYSTEM_PROMPT,
+    )
 
+
+def _query_gemini(prompt: str, model=None) -> dict:
+    """Call Google Gemini and return parsed recommendation dict."""
     try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel(
-            model_name=settings.GEMINI_MODEL,
-            system_instruction=_SYSTEM_PROMPT,
-        )
+        if model is None:
+            model = _make_gemini_model()
+        if model is None:
+            return {"error": "google-generativeai package not installed"}
+
         response = model.generate_content(
             prompt,
             generation_config={
@@ -176,6 +207,7 @@ def _query_gemini(prompt: str) -> dict:
                 "max_output_tokens": 300,
                 "response_mime_type": "application/json",
             },
+            request_options={"timeout": settings.LLM_TIMEOUT_SEC},
         )
         content = response.text or ""
         parsed = _parse_llm_response(content)
@@ -189,6 +221,31 @@ def _query_gemini(prompt: str) -> dict:
         return {"error": str(e), "recommendation": "HOLD", "confidence": 0.0, "reasoning": ""}
 
 
+# ---------------------------------------------------------------------------
+# Snapshot cache key
+# ---------------------------------------------------------------------------
+
+def _snapshot_key(market_data: dict, confirm_side: str) -> tuple:
+    """
+    quantize snapshot → key ของ cache
+    confirm ซ้ำบนแท่งเดิม (ราคาขยับไม่ถึง ~0.25 ATR, indicator ไม่เปลี่ยนโซน) ได้ key เดียวกัน
+    """
+    price = float(market_data.get("price", 0.0))
+    atr = float(market_data.get("atr", 0.0))
+    step = atr * 0.25 if atr > 0 else max(abs(price) * 1e-4, 1e-9)
+    return (
+        market_data.get("symbol"),
+        confirm_side.upper(),
+        market_data.get("regime"),
+        int(market_data.get("ema_trend", 0)),
+        int(round(price / step)),
+        int(float(market_data.get("rsi", 50)) // 2),
+        int(float(market_data.get("stoch_k", 50)) // 5),
+        round(float(market_data.get("bb_pct_b", 0.5)), 1),
+        market_data.get("ai_direction"),
+    )
+
+
 # ---------------------------------------------------------------------------
 # LLMAdvisor class
 # ---------------------------------------------------------------------------
@@ -209,6 +266,11 @@ class LLMAdvisor:
         consensus: "BUY" | "SELL" | "HOLD"
         consensus_confidence: float
         llm_agrees: bool  (True if consensus matches proposed trade side)
+        llm_cached: bool  (True if served from the snapshot cache)
+
+    Both providers are queried concurrently on a persistent thread pool with
+    clients created once. Each call has a hard budget of LLM_TIMEOUT_SEC;
+    a provider that misses it (or errors) votes LLM_FALLBACK_DECISION.
     """
 
     def __init__(self):
@@ -221,6 +283,67 @@ class LLMAdvisor:
         if not self.gpt_enabled and not self.gemini_enabled:
             print("[LLM] LLM advisor disabled (set LLM_ADVISOR_ENABLED=true and provide API keys)")
 
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._gpt_client = None
+        self._gemini_model = None
+        self._init_lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        if self.gpt_enabled or self.gemini_enabled:
+            # สร้าง client ตั้งแต่ตอนเริ่ม → confirm แรกไม่เสียเวลา import / handshake
+            self._ensure_ready()
+
+    # --- clients / pool (lazy, สร้างครั้งเดียว) ---
+
+    def _ensure_ready(self) -> None:
+        with self._init_lock:
+            if self._executor is None:
+                # worker เผื่อ call ที่ค้างเกิน timeout ยังไม่คืน thread
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm")
+            if self.gpt_enabled and self._gpt_client is None:
+                self._gpt_client = _make_gpt_client()
+            if self.gemini_enabled and self._gemini_model is None:
+                try:
+                    self._gemini_model = _make_gemini_model()
+                except Exception as e:
+                    print(f"[LLM][Gemini] init error: {e}")
+
+    def _fallback_output(self, confirm_side: str, error: str) -> Optional[dict]:
+        """vote แทน provider ที่ timeout / error ตาม LLM_FALLBACK_DECISION (SKIP → None)"""
+        mode = settings.LLM_FALLBACK_DECISION
+        if mode == "SKIP":
+            return None
+        if mode == "AGREE":
+            rec, conf = confirm_side.upper(), 0.5
+        else:  # HOLD
+            rec, conf = "HOLD", 0.0
+        return {"error": error, "recommendation": rec, "confidence": conf, "reasoning": "", "fallback": True}
+
+    # --- cache ---
+
+    def _cache_get(self, key: tuple) -> Optional[dict]:
+        ttl = settings.LLM_CACHE_TTL_SEC
+        if ttl <= 0:
+            return None
+        with self._cache_lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            ts, result = item
+            if time.time() - ts > ttl:
+                del self._cache[key]
+                return None
+            return dict(result)
+
+    def _cache_put(self, key: tuple, result: dict) -> None:
+        if settings.LLM_CACHE_TTL_SEC <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.time(), dict(result))
+            self._cache.move_to_end(key)
+            while len(self._cache) > 256:
+                self._cache.popitem(last=False)
+
     def analyze_signal(self, market_data: dict, confirm_side: str) -> dict:
         """
         Analyze market data with available LLMs and derive consensus.
@@ -234,23 +357,64 @@ class LLMAdvisor:
         Returns:
             dict with gpt/gemini results and consensus fields.
         """
+        if not self.gpt_enabled and not self.gemini_enabled:
+            consensus, consensus_confidence = self._derive_consensus(confirm_side, None, 0.0, None, 0.0)
+            return {
+                "consensus": consensus,
+                "consensus_confidence": consensus_confidence,
+                "llm_agrees": True,
+            }
+
+        key = _snapshot_key(market_data, confirm_side)
+        cached = self._cache_get(key)
+        if cached is not None:
+            cached["llm_cached"] = True
+            print(f"[LLM] cache hit → {cached.get('consensus')} (conf={cached.get('consensus_confidence', 0):.2f})")
+            return cached
+
         data = {**market_data, "confirm_side": confirm_side}
         prompt = _build_market_prompt(data)
 
+        self._ensure_ready()
+        futures = {}
+        if self.gpt_enabled:
+            futures["gpt"] = self._executor.submit(_query_gpt, prompt, self._gpt_client)
+        if self.gemini_enabled:
+            futures["gemini"] = self._executor.submit(_query_gemini, prompt, self._gemini_model)
+
+        # ยิงพร้อมกัน รอรวมไม่เกิน LLM_TIMEOUT_SEC
+        done, _ = wait(list(futures.values()), timeout=settings.LLM_TIMEOUT_SEC)
+        outputs = {}
+        for name, fut in futures.items():
+            if fut in done:
+                out = fut.result()
+                if "error" in out:
+                    out = {**out, **(self._fallback_output(confirm_side, out["error"]) or {"skip": True})}
+            else:
+                fut.cancel()
+                out = self._fallback_output(confirm_side, f"timeout > {settings.LLM_TIMEOUT_SEC}s") or {
+                    "error": f"timeout > {settings.LLM_TIMEOUT_SEC}s",
+                    "skip": True,
+                }
+            outputs[name] = out
+
         result: dict = {}
+        any_error = False
 
         # --- GPT ---
         gpt_rec: Optional[str] = None
         gpt_conf = 0.0
-        if self.gpt_enabled:
-            gpt_out = _query_gpt(prompt)
-            gpt_rec = gpt_out.get("recommendation", "HOLD")
-            gpt_conf = float(gpt_out.get("confidence", 0.0))
+        if "gpt" in outputs:
+            gpt_out = outputs["gpt"]
+            if not gpt_out.get("skip"):
+                gpt_rec = gpt_out.get("recommendation", "HOLD")
+                gpt_conf = float(gpt_out.get("confidence", 0.0))
             result["gpt_recommendation"] = gpt_rec
             result["gpt_confidence"] = gpt_conf
             result["gpt_reasoning"] = gpt_out.get("reasoning", "")
             result["gpt_risk_note"] = gpt_out.get("risk_note", "")
             if "error" in gpt_out:
+                any_error = True
                 result["gpt_error"] = gpt_out["error"]
                 print(f"[LLM][GPT] error: {gpt_out['error']}")
             else:
@@ -259,15 +423,17 @@ class LLMAdvisor:
         # --- Gemini ---
         gemini_rec: Optional[str] = None
         gemini_conf = 0.0
-        if self.gemini_enabled:
-            gemini_out = _query_gemini(prompt)
-            gemini_rec = gemini_out.get("recommendation", "HOLD")
-            gemini_conf = float(gemini_out.get("confidence", 0.0))
+        if "gemini" in outputs:
+            gemini_out = outputs["gemini"]
+            if not gemini_out.get("skip"):
+                gemini_rec = gemini_out.get("recommendation", "HOLD")
+                gemini_conf = float(gemini_out.get("confidence", 0.0))
             result["gemini_recommendation"] = gemini_rec
             result["gemini_confidence"] = gemini_conf
             result["gemini_reasoning"] = gemini_out.get("reasoning", "")
             result["gemini_risk_note"] = gemini_out.get("risk_note", "")
             if "error" in gemini_out:
+                any_error = True
                 result["gemini_error"] = gemini_out["error"]
                 print(f"[LLM][Gemini] error: {gemini_out['error']}")
             else:
@@ -280,6 +446,11 @@ class LLMAdvisor:
         result["consensus"] = consensus
         result["consensus_confidence"] = consensus_confidence
         result["llm_agrees"] = (consensus == confirm_side.upper())
+        result["llm_cached"] = False
+
+        # ไม่ cache ผลที่มาจาก timeout / error → รอบหน้าลองถามใหม่
+        if not any_error:
+            self._cache_put(key, result)
         return result
 
     def _derive_consensus(
@@ -1,11 +1,16 @@
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import os
+import threading
+import warnings
 
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, TensorDataset
+from numpy.lib.stride_tricks import sliding_window_view
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
+
+FEATURE_COLUMNS = ["Close", "RSI", "MACD", "MACD_HIST", "ATR", "ADX", "RET"]
 
 
 class _LSTMNet(nn.Module):
@@ -26,43 +31,118 @@ class _LSTMNet(nn.Module):
         return out
 
 
+def norm_stats_path(model_path: str) -> str:
+    """ไฟล์เก็บ normalization stats ข้างไฟล์ model เช่น models/extreme_lstm.norm.npz"""
+    return os.path.splitext(model_path)[0] + ".norm.npz"
+
+
+class SlidingWindowDataset(Dataset):
+    """
+    Dataset แบบ index-based บน feature matrix ก้อนเดียว
+    window ที่ i = feats[i : i + seq_len] เป็น view (ไม่ copy) → ใช้ memory คงที่
+    ไม่ว่าข้อมูลจะยาวแค่ไหน นอกจากตัว feature matrix เอง
+
+    ใช้คู่กับ BatchSampler: __getitem__ รับ list ของ index แล้ว copy เฉพาะ batch นั้น
+    """
+
+    def __init__(
+        self,
+        feats: np.ndarray,
+        labels: np.ndarray,
+        seq_len: int = 60,
+        mean: Optional[np.ndarray] = None,
+        std: Optional[np.ndarray] = None,
+    ):
+        self.feats = np.ascontiguousarray(feats, dtype=np.float32)
+        self.windows = sliding_window_view(self.feats, seq_len, axis=0).transpose(0, 2, 1)
+        self.labels = np.asarray(labels, dtype=np.float32).reshape(-1, 1)
+        self.mean = mean
+        self.std = std
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        x = self.windows[idx]
+        if self.mean is not None:
+            x = (x - self.mean) / self.std
+        x = torch.from_numpy(np.ascontiguousarray(x, dtype=np.float32))
+        y = torch.from_numpy(self.labels[idx])
+        return x, y
+
+
 class ExtremeLSTM:
     """
     LSTM Model แบบง่าย ๆ
     - input: ลำดับ feature 60 แท่ง (features 7 ตัว)
     - output: ค่า scalar แทนทิศทาง (บวก=ขึ้น / ลบ=ลง)
+    - normalization stats (optional) เก็บคู่กับไฟล์ model และใช้ตอน predict อัตโนมัติ
     """
 
     def __init__(self, device: Optional[str] = None):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.model = _LSTMNet().to(self.device)
+        self.norm_mean: Optional[np.ndarray] = None
+        self.norm_std: Optional[np.ndarray] = None
+
+    def _features(self, df: pd.DataFrame) -> np.ndarray:
+        return df[FEATURE_COLUMNS].values.astype("float32")
+
+    def _normalize(self, x: np.ndarray) -> np.ndarray:
+        if self.norm_mean is None:
+            return x
+        return (x - self.norm_mean) / self.norm_std
 
     def prepare_sequences(
         self,
         df: pd.DataFrame,
         seq_len: int = 60,
     ) -> Tuple[np.ndarray, np.ndarray]:
-        feats = df[["Close", "RSI", "MACD", "MACD_HIST", "ATR", "ADX", "RET"]].values
+        """
+        คืน (X, y): X เป็น sliding-window view ขนาด (N, seq_len, 7) บน feature matrix
+        (ไม่ copy ข้อมูลซ้ำ seq_len เท่า), y = sign ของ return ถัดไป ขนาด (N, 1)
+        """
+        feats = self._features(df)
         # label = sign of next return
         y_raw = df["RET"].shift(-1).fillna(0).values
         y_sign = np.sign(y_raw)
 
-        X, y = [], []
-        for i in range(len(df) - seq_len - 1):
-            X.append(feats[i : i + seq_len])
-            y.append(y_sign[i + seq_len])
-        X = np.array(X, dtype=np.float32)
-        y = np.array(y, dtype=np.float32).reshape(-1, 1)
+        n = max(len(df) - seq_len - 1, 0)
+        if n == 0:
+            return np.empty((0, seq_len, feats.shape[1]), dtype=np.float32), np.empty((0, 1), dtype=np.float32)
+        X = sliding_window_view(feats, seq_len, axis=0).transpose(0, 2, 1)[:n]
+        y = y_sign[seq_len : seq_len + n].astype(np.float32).reshape(-1, 1)
         return X, y
 
-    def fit(self, df: pd.DataFrame, epochs: int = 5, batch_size: int = 32):
-        X, y = self.prepare_sequences(df)
-        if len(X) == 0:
+    def fit(
+        self,
+        df: pd.DataFrame,
+        epochs: int = 5,
+        batch_size: int = 32,
+        seq_len: int = 60,
+        normalize: bool = False,
+    ):
+        n = len(df) - seq_len - 1
+        if n <= 0:
             print("[LSTM] Not enough data to train.")
             return
 
-        dataset = TensorDataset(torch.tensor(X), torch.tensor(y))
-        loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+        feats = self._features(df)
+        y_raw = df["RET"].shift(-1).fillna(0).values
+        labels = np.sign(y_raw)[seq_len : seq_len + n]
+
+        if normalize:
+            # per-feature stats จากแท่งที่ใช้เทรน (เก็บไว้ใช้ตอน predict)
+            self.norm_mean = feats.mean(axis=0).astype(np.float32)
+            self.norm_std = (feats.std(axis=0) + 1e-8).astype(np.float32)
+        else:
+            self.norm_mean = None
+            self.norm_std = None
+
+        dataset = SlidingWindowDataset(feats, labels, seq_len, self.norm_mean, self.norm_std)
+        # BatchSampler → dataset ได้ index ทีละ batch, สร้าง tensor เฉพาะ batch (lazy)
+        sampler = BatchSampler(RandomSampler(dataset), batch_size=batch_size, drop_last=False)
+        loader = DataLoader(dataset, sampler=sampler, batch_size=None)
 
         criterion = nn.MSELoss()
         optimizer = torch.optim.Adam(self.model.parameters(), lr=1e-3)
@@ -83,8 +163,8 @@ class ExtremeLSTM:
     def predict_prob(self, df: pd.DataFrame, seq_len: int = 60) -> Optional[float]:
         if len(df) < seq_len + 1:
             return None
-        feats = df[["Close", "RSI", "MACD", "MACD_HIST", "ATR", "ADX", "RET"]].values
-        x = feats[-seq_len:].astype("float32")
+        feats = df[FEATURE_COLUMNS].values
+        x = self._normalize(feats[-seq_len:].astype("float32"))
         x = torch.tensor(x).unsqueeze(0).to(self.device)
         self.model.eval()
         with torch.no_grad():
@@ -93,13 +173,289 @@ class ExtremeLSTM:
         prob_up = 1 / (1 + torch.exp(torch.tensor(-out))).item()
         return float(prob_up)
 
+    def predict_prob_batch(
+        self,
+        df: pd.DataFrame,
+        seq_len: int = 60,
+        batch_size: int = 1024,
+    ) -> np.ndarray:
+        """
+        predict_prob() ของทุกแถวในครั้งเดียว (sliding window, forward ทีละ batch)
+        แถวที่ k ได้ค่าเดียวกับ predict_prob(df.iloc[: k + 1]) (ต่างกันได้แค่ระดับ float32 rounding
+        ของ forward แบบ batch), แถวที่ history ไม่พอ = NaN
+        """
+        n = len(df)
+        probs = np.full(n, np.nan, dtype=np.float64)
+        if n < seq_len + 1:
+            return probs
+
+        feats = self._features(df)
+        # window ที่ w ครอบคลุมแถว w .. w+seq_len-1 (view ไม่ copy)
+        windows = sliding_window_view(feats, seq_len, axis=0).transpose(0, 2, 1)
+        self.model.eval()
+        with torch.no_grad():
+            for start in range(1, len(windows), batch_size):
+                chunk = np.ascontiguousarray(self._normalize(windows[start : start + batch_size]))
+                x = torch.from_numpy(chunk).to(self.device)
+                out = self.model(x).cpu()
+                # sigmoid แบบเดียวกับ predict_prob(): ตัวหารเป็น float32 แล้วหารใน float64
+                denom = (1 + torch.exp(-out))[:, 0].numpy().astype(np.float64)
+                end_row = start + seq_len - 1
+                probs[end_row : end_row + len(chunk)] = 1 / denom
+        return probs
+
     def save(self, path: str):
         os.makedirs(os.path.dirname(path), exist_ok=True)
         torch.save(self.model.state_dict(), path)
 
+        stats_path = norm_stats_path(path)
+        if self.norm_mean is not None:
+            np.savez(stats_path, mean=self.norm_mean, std=self.norm_std)
+        elif os.path.exists(stats_path):
+            # model ใหม่ไม่ได้ normalize → ลบ stats เก่าทิ้ง กันโหลดผิดคู่
+            os.remove(stats_path)
+
     def load(self, path: str) -> bool:
         if not os.path.exists(path):
             return False
         state = torch.load(path, map_location=self.device)
         self.model.load_state_dict(state)
+
+        stats_path = norm_stats_path(path)
+        if os.path.exists(stats_path):
+            stats = np.load(stats_path)
+            self.norm_mean = stats["mean"].astype(np.float32)
+            self.norm_std = stats["std"].astype(np.float32)
+        else:
+            self.norm_mean = None
+            self.norm_std = None
         return True
+
+
+class FrozenLSTMInference:
+    """
+    inference path สำหรับ live (CPU): model ถูก trace + freeze เป็น TorchScript ครั้งเดียว
+    - ไม่มี model.eval() / สร้าง tensor ใหม่ทุก call: copy window ลง input buffer ที่จองไว้แล้ว forward
+    - predict_windows() รับหลาย window (หลาย symbol) แล้ว forward ครั้งเดียว
+    - ผลเท่ากับ ExtremeLSTM.predict_prob() (sigmoid แบบเดียวกัน)
+
+    num_threads > 0 → torch.set_num_threads() (มีผลทั้ง process) ให้ latency คงที่
+    """
+
+    def __init__(
+        self,
+        lstm: ExtremeLSTM,
+        seq_len: int = 60,
+        max_batch: int = 64,
+        num_threads: int = 0,
+    ):
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        self.seq_len = seq_len
+        self.max_batch = max_batch
+        self.norm_mean = lstm.norm_mean
+        self.norm_std = lstm.norm_std
+
+        n_feat = len(FEATURE_COLUMNS)
+        # CPU เสมอ — buffer แชร์ memory กับ numpy view ด้านล่าง
+        self._buf = torch.zeros((max_batch, seq_len, n_feat), dtype=torch.float32)
+        self._buf_np = self._buf.numpy()
+        self._lock = threading.Lock()
+
+        net = _LSTMNet().eval()
+        net.load_state_dict({k: v.detach().cpu() for k, v in lstm.model.state_dict().items()})
+        with warnings.catch_warnings():
+            # torch รุ่นใหม่เตือนว่า jit deprecated แต่ยังเป็นทางที่ไม่ต้องพึ่ง dependency เพิ่ม
+            warnings.simplefilter("ignore", FutureWarning)
+            # nn.LSTM ตรวจ shape ของ input เป็น Python bool → trace เป็นค่าคงที่ (shape คงที่อยู่แล้ว)
+            warnings.simplefilter("ignore", torch.jit.TracerWarning)
+            with torch.no_grad():
+                traced = torch.jit.trace(net, self._buf[:1])
+                self._model = torch.jit.freeze(traced)
+                # warm-up: ให้ TorchScript profile / optimize graph ก่อนใช้งานจริง
+                for n in (1, max_batch):
+                    self._model(self._buf[:n])
+
+    def predict_windows(self, windows: np.ndarray) -> np.ndarray:
+        """
+        windows: (B, seq_len, 7) feature ดิบ (ยังไม่ normalize) → prob_up (B,) float64
+        B เกิน max_batch จะถูกแบ่งเป็นหลาย forward
+        """
+        windows = np.asarray(windows)
+        n = len(windows)
+        probs = np.empty(n, dtype=np.float64)
+        with self._lock, torch.no_grad():
+            for start in range(0, n, self.max_batch):
+                chunk = windows[start : start + self.max_batch]
+                b = len(chunk)
+                buf = self._buf_np[:b]
+                buf[...] = chunk
+                if self.norm_mean is not None:
+                    buf -= self.norm_mean
+                    buf /= self.norm_std
+                out = self._model(self._buf[:b])
+                # sigmoid แบบเดียวกับ predict_prob(): ตัวหารเป็น float32 แล้วหารใน float64
+                denom = (1 + torch.exp(-out))[:, 0].numpy().astype(np.float64)
+                probs[start : start + b] = 1 / denom
+        return probs
+
+    def window(self, df: pd.DataFrame) -> Optional[np.ndarray]:
+        """window ล่าสุดของ indicator frame (None ถ้า history ไม่พอเหมือน predict_prob)"""
+        if len(df) < self.seq_len + 1:
+            return None
+        return df.iloc[-self.seq_len :][FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+
+    def predict_prob(self, df: pd.DataFrame) -> Optional[float]:
+        w = self.window(df)
+        if w is None:
+            return None
+        return float(self.predict_windows(w[None])[0])
+
+    def predict_frames(self, frames: List[pd.DataFrame]) -> List[Optional[float]]:
+        """หลาย symbol / timeframe ใน forward เดียว — frame ที่ history ไม่พอได้ None"""
+        windows = [self.window(df) for df in frames]
+        idx = [i for i, w in enumerate(windows) if w is not None]
+        result: List[Optional[float]] = [None] * len(frames)
+        if idx:
+            probs = self.predict_windows(np.stack([windows[i] for i in idx]))
+            for i, p in zip(idx, probs):
+                result[i] = float(p)
+        return result
+
+
+class _StreamState:
+    __slots__ = ("last_time", "hc_before", "steps", "prob")
+
+    def __init__(self, last_time, hc_before, prob: float):
+        self.last_time = last_time
+        # (h, c) หลังแท่งก่อนแท่งล่าสุด — แท่งล่าสุดอาจยังไม่ปิด (โหมด poll) จึงไม่ commit
+        self.hc_before = hc_before
+        self.steps = 0
+        self.prob = prob
+
+
+class StreamingLSTMInference:
+    """
+    LSTM แบบ stateful ต่อ symbol: เก็บ (h, c) ไว้แล้วเดินทีละแท่ง แทนการรัน window 60 แท่งใหม่ทุกครั้ง
+    - แท่งเดิมถูกแก้ (แท่งยังไม่ปิด) → 1 step จาก state ก่อนแท่งนั้น
+    - มีแท่งใหม่ 1 แท่ง → commit แท่งก่อนหน้า (ค่าสุดท้าย) + 1 step แท่งใหม่
+    - ครบ resync_every แท่ง / มี gap / เริ่มต้น → คำนวณจาก window เต็ม (เท่ากับ predict_prob)
+      state ที่ต่อยาวเกิน window ทำให้ผลเบี่ยงจาก model ที่เทรนด้วย window 60 แท่งทีละน้อย
+      resync เป็นระยะจึงจำกัด drift ไว้ (ดู last_drift)
+
+    step ทีละแท่งคำนวณ LSTM cell ด้วย numpy ตรง ๆ (matvec ไม่กี่ตัว) ไม่ผ่าน overhead ของ torch
+    """
+
+    def __init__(self, lstm: ExtremeLSTM, seq_len: int = 60, resync_every: int = 60):
+        self.lstm = lstm
+        self.seq_len = seq_len
+        self.resync_every = max(int(resync_every), 1)
+        self._states: dict = {}
+        self._lock = threading.Lock()
+        # |stream - full window| ที่วัดได้ตอน resync ล่าสุดของแต่ละ key
+        self.last_drift: dict = {}
+        self.refresh_weights()
+
+    def refresh_weights(self) -> None:
+        """ดึง weight จาก model (เรียกใหม่หลัง load / retrain) แล้วล้าง state ทั้งหมด"""
+        net = self.lstm.model
+        self._layers = []
+        for k in range(net.lstm.num_layers):
+            w_ih = getattr(net.lstm, f"weight_ih_l{k}").detach().cpu().numpy()
+            w_hh = getattr(net.lstm, f"weight_hh_l{k}").detach().cpu().numpy()
+            bias = (
+                getattr(net.lstm, f"bias_ih_l{k}") + getattr(net.lstm, f"bias_hh_l{k}")
+            ).detach().cpu().numpy()
+            self._layers.append((w_ih, w_hh, bias))
+        self._fc_w = net.fc.weight.detach().cpu().numpy()[0]
+        self._fc_b = np.float32(net.fc.bias.detach().cpu().numpy()[0])
+        self._hidden = net.lstm.hidden_size
+        self.reset()
+
+    def reset(self, key=None) -> None:
+        with self._lock:
+            if key is None:
+                self._states.clear()
+            else:
+                self._states.pop(key, None)
+
+    def _rows(self, df: pd.DataFrame, n: int) -> np.ndarray:
+        x = np.column_stack([df[c].to_numpy()[-n:] for c in FEATURE_COLUMNS]).astype(np.float32)
+        return self.lstm._normalize(x)
+
+    @staticmethod
+    def _sigmoid(x: np.ndarray) -> np.ndarray:
+        with np.errstate(over="ignore"):  # exp ล้นเมื่อ gate อิ่มตัว → ได้ 0 / 1 ตามต้องการ
+            return 1.0 / (1.0 + np.exp(-x))
+
+    def _step(self, hc, x: np.ndarray):
+        """เดิน 1 แท่ง → (prob_up, (h, c)) โดย h, c เป็น array (num_layers, hidden)"""
+        h_prev, c_prev = hc
+        h_new = np.empty_like(h_prev)
+        c_new = np.empty_like(c_prev)
+        H = self._hidden
+        inp = x
+        for k, (w_ih, w_hh, bias) in enumerate(self._layers):
+            gates = w_ih @ inp + w_hh @ h_prev[k] + bias  # ลำดับ gate ของ torch: i, f, g, o
+            i = self._sigmoid(gates[:H])
+            f = self._sigmoid(gates[H : 2 * H])
+            g = np.tanh(gates[2 * H : 3 * H])
+            o = self._sigmoid(gates[3 * H :])
+            c_new[k] = f * c_prev[k] + i * g
+            h_new[k] = o * np.tanh(c_new[k])
+            inp = h_new[k]
+        logit = np.float32(self._fc_w @ inp + self._fc_b)
+        # sigmoid แบบเดียวกับ predict_prob(): ตัวหารเป็น float32 แล้วหารใน float64
+        with np.errstate(over="ignore"):
+            prob = 1 / float(np.float32(1) + np.exp(-logit))
+        return prob, (h_new, c_new)
+
+    def _full_window(self, df: pd.DataFrame):
+        """state หลัง seq_len-1 แท่ง (จาก state ศูนย์) + prob ของแท่งสุดท้าย — ผลเท่ากับ predict_prob()"""
+        window = torch.from_numpy(np.ascontiguousarray(self._rows(df, self.seq_len)))
+        window = window.to(self.lstm.device)
+        self.lstm.model.eval()
+        with torch.no_grad():
+            out, (h, c) = self.lstm.model.lstm(window.unsqueeze(0))
+            logit = self.lstm.model.fc(out[:, -1, :])
+            prob = 1 / (1 + torch.exp(-logit))[0, 0].item()
+            _, (h_b, c_b) = self.lstm.model.lstm(window[:-1].unsqueeze(0))
+        hc_before = (h_b[:, 0, :].cpu().numpy(), c_b[:, 0, :].cpu().numpy())
+        return float(prob), hc_before
+
+    def update(self, key, df: pd.DataFrame) -> Optional[float]:
+        """prob_up ของแท่งล่าสุดใน df (indicator frame) สำหรับ symbol / stream key นี้"""
+        if len(df) < self.seq_len + 1:
+            return None
+        times = df["time"]
+        t_last = times.iloc[-1]
+        t_prev = times.iloc[-2]
+
+        with self._lock:
+            st = self._states.get(key)
+            stream_prob = None
+
+            if st is not None and st.last_time in (t_last, t_prev):
+                x = self._rows(df, 2)
+                hc = st.hc_before
+                if st.last_time == t_prev:
+                    # แท่งใหม่ → commit แท่งก่อนหน้าด้วยค่าสุดท้ายของมัน
+                    _, hc = self._step(hc, x[0])
+                    steps = st.steps + 1
+                else:
+                    steps = st.steps
+                stream_prob, _ = self._step(hc, x[1])
+
+                if steps < self.resync_every:
+                    st.hc_before = hc
+                    st.last_time = t_last
+                    st.steps = steps
+                    st.prob = stream_prob
+                    return stream_prob
+
+            # เริ่มต้น / gap / ครบรอบ resync → window เต็ม
+            prob, hc_before = self._full_window(df)
+            if stream_prob is not None:
+                self.last_drift[key] = abs(stream_prob - prob)
+            self._states[key] = _StreamState(t_last, hc_before, prob)
+            return prob
@@ -1,23 +1,25 @@
 # core/mt5_trader.py
-from typing import Optional
+import threading
+from typing import Any, Dict, Optional, Tuple
 
-import MetaTrader5 as mt5
+from .broker import mt5
+from .broker_cache import broker_cache
 from .config import settings
+from .stability import MT5_LOCK
 
+# request ที่เติมค่าคงที่ไว้แล้วต่อ (SYMBOL, side) + symbol_info ที่ใช้สร้าง
+# (symbol_info ใน broker_cache ถูก refresh → สร้าง template ใหม่ เผื่อ filling mode เปลี่ยน)
+_TEMPLATES: Dict[Tuple[str, str], Tuple[Any, Dict[str, Any]]] = {}
+_TEMPLATES_LOCK = threading.Lock()
 
-def _get_filling_mode(symbol: str) -> Optional[int]:
+
+def _filling_from_info(info) -> Optional[int]:
     """
-    ตรวจสอบ filling mode ที่ broker รองรับสำหรับ symbol นั้น ๆ
     MT5 filling_mode เป็น bitmask:
       1 = ORDER_FILLING_FOK
       2 = ORDER_FILLING_IOC
       4 = ORDER_FILLING_RETURN
-    คืนค่า None ถ้าไม่สามารถหา filling mode ที่รองรับได้
     """
-    info = mt5.symbol_info(symbol)
-    if info is None:
-        return None
-
     filling_mode = info.filling_mode
     if filling_mode & 1:  # FOK supported
         return mt5.ORDER_FILLING_FOK
@@ -28,77 +30,158 @@ def _get_filling_mode(symbol: str) -> Optional[int]:
     return None
 
 
-def execute_order(
-    symbol: str,
-    side: str,
-    volume: float,
-    sl: Optional[float] = None,
-    tp: Optional[float] = None,
-):
+def _get_filling_mode(symbol: str) -> Optional[int]:
     """
-    ยิงออเดอร์ทันที (market order) พร้อม SL/TP ถ้ามี
-    สมมติว่า init_mt5() / login ถูกเรียกจากที่อื่นแล้ว (main หรือ dashboard)
+    ตรวจสอบ filling mode ที่ broker รองรับสำหรับ symbol นั้น ๆ
+    คืนค่า None ถ้าไม่สามารถหา filling mode ที่รองรับได้
+    symbol_info มาจาก broker_cache (SYMBOL_INFO_TTL_SEC) ไม่ถาม terminal ทุกออเดอร์
     """
-    side = side.upper()
+    info = broker_cache.symbol_info(symbol)
+    if info is None:
+        return None
+    return _filling_from_info(info)
 
-    tick = mt5.symbol_info_tick(symbol)
-    if tick is None:
-        return {"error": "no_tick_info"}
 
-    if side == "BUY":
-        price = tick.ask
-        order_type = mt5.ORDER_TYPE_BUY
-    else:
-        price = tick.bid
-        order_type = mt5.ORDER_TYPE_SELL
+def request_template(symbol: str, side: str) -> Optional[Dict[str, Any]]:
+    """
+    ส่วนคงที่ของ market order (action / type / filling / deviation / magic) ของ symbol + side
+    คืน dict ที่ใช้ร่วมกัน → ต้อง copy ก่อนแก้ / None = symbol ไม่มี หรือไม่รองรับ filling mode ไหนเลย
+    """
+    side = side.upper()
+    info = broker_cache.symbol_info(symbol)
+    if info is None:
+        return None
+    key = (symbol.upper(), side)
+    with _TEMPLATES_LOCK:
+        entry = _TEMPLATES.get(key)
+    if entry is not None and entry[0] is info:
+        return entry[1]
 
-    filling_mode = _get_filling_mode(symbol)
+    filling_mode = _filling_from_info(info)
     if filling_mode is None:
-        return {"error": "unsupported_filling_mode"}
-
-    request = {
+        return None
+    template = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
-        "volume": float(volume),
-        "type": order_type,
-        "price": float(price),
+        "type": mt5.ORDER_TYPE_BUY if side == "BUY" else mt5.ORDER_TYPE_SELL,
         "deviation": getattr(settings, "MT5_DEVIATION", 20),
         "magic": getattr(settings, "MT5_MAGIC_NUMBER", 123456),
-        "comment": "ExtremeAI v4",
         "type_filling": filling_mode,
     }
+    with _TEMPLATES_LOCK:
+        _TEMPLATES[key] = (info, template)
+    return template
+
 
+def build_request(
+    symbol: str,
+    side: str,
+    volume: float,
+    sl: Optional[float] = None,
+    tp: Optional[float] = None,
+    comment: Optional[str] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    template + ราคาปัจจุบัน (ask สำหรับ BUY / bid สำหรับ SELL) + volume / SL / TP
+    คืน (request, None) หรือ (None, error)
+    """
+    side = side.upper()
+    with MT5_LOCK:
+        tick = mt5.symbol_info_tick(symbol)
+    if tick is None:
+        return None, "no_tick_info"
+
+    template = request_template(symbol, side)
+    if template is None:
+        return None, "unsupported_filling_mode"
+
+    request = dict(template)
+    request["volume"] = float(volume)
+    request["price"] = float(tick.ask if side == "BUY" else tick.bid)
+    request["comment"] = (comment or "ExtremeAI v4")[:31]
     if sl is not None:
         request["sl"] = float(sl)
     if tp is not None:
         request["tp"] = float(tp)
+    return request, None
+
+
+def check_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    ตรวจ order ก่อนส่ง (ไม่เปิดไม้จริง):
+    - margin ที่ต้องใช้ (order_calc_margin) เทียบ margin_free ของ account ใน broker_cache
+    - mt5.order_check (retcode 0 = ผ่าน) — volume / stops / margin ตามกติกาของโบรก
+    """
+    with MT5_LOCK:
+        margin = mt5.order_calc_margin(request["type"], request["symbol"], request["volume"], request["price"])
+    account = broker_cache.account_info()
+    if margin is not None and account is not None and margin > account.margin_free:
+        return {
+            "ok": False,
+            "retcode": None,
+            "comment": "no_money",
+            "margin": float(margin),
+            "margin_free": float(account.margin_free),
+        }
+
+    with MT5_LOCK:
+        check = mt5.order_check(request)
+    if check is None:
+        return {"ok": False, "retcode": None, "comment": f"order_check failed: {mt5.last_error()}"}
+    return {
+        "ok": check.retcode == 0,
+        "retcode": int(check.retcode),
+        "comment": check.comment,
+        "margin": float(check.margin),
+        "margin_free": float(check.margin_free),
+    }
+
 
-    result = mt5.order_send(request)
+def send_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    with MT5_LOCK:
+        result = mt5.order_send(request)
+    # account / positions เปลี่ยนแล้ว → snapshot ถัดไปต้องดึงใหม่
+    broker_cache.invalidate()
     try:
         return result._asdict()
     except Exception:
         return {"result": str(result)}
 
 
+def execute_order(
+    symbol: str,
+    side: str,
+    volume: float,
+    sl: Optional[float] = None,
+    tp: Optional[float] = None,
+    comment: Optional[str] = None,
+):
+    """
+    ยิงออเดอร์ทันที (market order) พร้อม SL/TP ถ้ามี — รอผลจากโบรก (blocking)
+    สมมติว่า init_mt5() / login ถูกเรียกจากที่อื่นแล้ว (main หรือ dashboard)
+    comment: ใช้แยกไม้ของแต่ละ pair (MT5 จำกัด 31 ตัวอักษร) — None = "ExtremeAI v4" (โหมดคู่เดียว)
+    loop หลักส่งผ่าน core.order_gateway แทน (pre-check ล่วงหน้า + ส่งจาก worker)
+    """
+    with MT5_LOCK:
+        request, error = build_request(symbol, side, volume, sl, tp, comment)
+        if request is None:
+            return {"error": error}
+        return send_request(request)
+
+
 def get_account_balance() -> float:
     """
-    ดึง Balance ปัจจุบันจาก MT5
+    ดึง Balance ปัจจุบันจาก MT5 (snapshot จาก broker_cache — อายุไม่เกิน BROKER_STATE_TTL_SEC)
     """
-    info = mt5.account_info()
+    info = broker_cache.account_info()
     if info is None:
         return 0.0
     return float(info.balance)
 
 
-def get_open_trades_count(symbol: Optional[str] = None) -> int:
+def get_open_trades_count(symbol: Optional[str] = None, comment: Optional[str] = None) -> int:
     """
-    นับจำนวนไม้ที่เปิดอยู่ (option: filter ตาม symbol)
+    นับจำนวนไม้ที่เปิดอยู่ (option: filter ตาม symbol และ comment ของ pair)
+    นับจาก index ของ positions snapshot ใน broker_cache (ทุก pair ใช้ snapshot เดียวกัน)
     """
-    orders = mt5.positions_get()
-    if orders is None:
-        return 0
-
-    if symbol:
-        s = symbol.upper()
-        return sum(1 for pos in orders if pos.symbol.upper() == s)
-    return len(orders)
+    return broker_cache.open_positions(symbol, comment)
@@ -0,0 +1,311 @@
+# core/order_gateway.py
+"""
+Order gateway: ส่งออเดอร์จาก worker thread แทนการ block loop เทรด
+
+    ticket = order_gateway.prepare(symbol, side, volume, sl, tp, comment)   # ตอนเจอ CONFIRM
+    ...  LLM / notify / ตรวจเงื่อนไขอื่น (pre-check วิ่งขนานอยู่)
+    order_gateway.submit(ticket, on_result=...)   # หรือ order_gateway.cancel(ticket, "llm_blocked")
+
+- prepare : เติม request จาก template ของ symbol + side (core.mt5_trader.request_template)
+            แล้วรัน order_calc_margin + order_check ใน thread pool ทันที → ขนานกับ LLM / การแจ้งเตือน
+- submit  : ใส่คิวของ worker ตัวเดียว (ส่งทีละออเดอร์ตามลำดับ) — worker รอผล pre-check, ไม่ผ่าน = ไม่ส่ง,
+            ผ่าน = อัปเดตราคาล่าสุดแล้ว order_send
+- ผลทุกออเดอร์ (filled / rejected / failed / cancelled) เป็น event: on_result ของ ticket → subscribers
+  → เก็บ ORDER_EVENTS_KEEP ตัวล่าสุดไว้ให้ /api/orders
+- ออเดอร์ที่ filled ถูกบันทึกลง trade journal (core.trade_logger) พร้อม context / slippage / latency
+- latency ต่อออเดอร์: check / queue / send / signal_to_fill (ms) ใน event + histogram ใน profiler
+  ("order_check", "order_send", "signal_to_fill" → /api/perf)
+
+ORDER_ASYNC=false หรือโบรกจำลอง (BROKER_BACKEND=SIM) → ทำทุกอย่างใน thread ของผู้เรียก
+(นาฬิกาจำลองเดินตาม loop → ออเดอร์ต้อง fill ก่อน loop sleep ไม่งั้นได้ราคาของแท่งถัดไป)
+"""
+
+import atexit
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .broker import get_broker
+from .config import settings
+from .mt5_trader import build_request, check_request, send_request
+from .profiler import profiler
+from .trade_logger import trade_journal
+
+ORDER_EVENTS_KEEP = 200
+
+# retcode ที่ถือว่า fill แล้ว (DONE / DONE_PARTIAL / PLACED)
+_FILLED_RETCODES = (10008, 10009, 10010)
+
+
+@dataclass
+class OrderTicket:
+    id: int
+    symbol: str
+    side: str
+    volume: float
+    sl: Optional[float]
+    tp: Optional[float]
+    comment: Optional[str]
+    source: str
+    signal_t: float  # time.perf_counter() ตอนเจอสัญญาณ
+    context: Optional[Dict[str, Any]] = None  # context ของสัญญาณ (regime / confidence / ...) → trade journal
+    request: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    check: Optional[Future] = None
+    check_ms: Optional[float] = None
+    submitted_t: Optional[float] = None
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    event: Optional[Dict[str, Any]] = None
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """รอ event ของออเดอร์นี้ (None = ยังไม่เสร็จภายใน timeout)"""
+        self._done.wait(timeout)
+        return self.event
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000.0, 3) if seconds is not None else None
+
+
+class OrderGateway:
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._queue: "queue.Queue[OrderTicket]" = queue.Queue(maxsize=max(settings.ORDER_QUEUE_SIZE, 1))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._events: deque = deque(maxlen=ORDER_EVENTS_KEEP)
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    @property
+    def asynchronous(self) -> bool:
+        return settings.ORDER_ASYNC and not getattr(get_broker(), "simulated", False)
+
+    # ── pre-check ─────────────────────────────────────────────────────
+    def prepare(
+        self,
+        symbol: str,
+        side: str,
+        volume: float,
+        sl: Optional[float] = None,
+        tp: Optional[float] = None,
+        comment: Optional[str] = None,
+        source: str = "auto",
+        signal_t: Optional[float] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> OrderTicket:
+        ticket = OrderTicket(
+            id=next(self._ids),
+            symbol=symbol,
+            side=side.upper(),
+            volume=float(volume),
+            sl=sl,
+            tp=tp,
+            comment=comment,
+            source=source,
+            signal_t=signal_t if signal_t is not None else time.perf_counter(),
+            context=context,
+        )
+        if not settings.ORDER_PRECHECK:
+            return ticket
+        if self.asynchronous:
+            ticket.check = self._check_pool().submit(self._precheck, ticket)
+        else:
+            done: Future = Future()
+            done.set_result(self._precheck(ticket))
+            ticket.check = done
+        return ticket
+
+    def _check_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="order-check")
+            return self._pool
+
+    def _precheck(self, ticket: OrderTicket) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            request, error = build_request(
+                ticket.symbol, ticket.side, ticket.volume, ticket.sl, ticket.tp, ticket.comment
+            )
+            if request is None:
+                return {"ok": False, "retcode": None, "comment": error}
+            ticket.request = request
+            return check_request(request)
+        except Exception as e:
+            return {"ok": False, "retcode": None, "comment": f"check error: {e}"}
+        finally:
+            ticket.check_ms = _ms(time.perf_counter() - t0)
+            profiler.record("order_check", int((time.perf_counter() - t0) * 1e6))
+
+    # ── send ──────────────────────────────────────────────────────────
+    def submit(
+        self,
+        ticket: OrderTicket,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> OrderTicket:
+        """ส่ง ticket ให้ worker (คืนทันที) — ผลมาทาง on_result / ticket.wait() / subscribe()"""
+        ticket.on_result = on_result
+        ticket.submitted_t = time.perf_counter()
+        if not self.asynchronous:
+            self._execute(ticket)
+            return ticket
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(ticket)
+        except queue.Full:
+            self._publish(ticket, "failed", error="order queue full")
+        return ticket
+
+    def send(self, symbol: str, side: str, volume: float, sl=None, tp=None, comment=None, source="auto", on_result=None):
+        """prepare + submit ในครั้งเดียว (เช่นปุ่มบน dashboard)"""
+        return self.submit(self.prepare(symbol, side, volume, sl, tp, comment, source), on_result)
+
+    def cancel(self, ticket: OrderTicket, reason: str) -> None:
+        """ไม่ส่งออเดอร์ที่ prepare ไว้ (เช่น LLM ไม่เห็นด้วย) — pre-check ที่วิ่งอยู่ปล่อยให้จบเอง"""
+        self._publish(ticket, "cancelled", error=reason)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="order-gateway", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            ticket = self._queue.get()
+            try:
+                self._execute(ticket)
+            except Exception as e:
+                self._publish(ticket, "failed", error=f"gateway error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, ticket: OrderTicket) -> None:
+        picked_t = time.perf_counter()
+        check = ticket.check.result() if ticket.check is not None else None
+        if check is not None and not check.get("ok"):
+            self._publish(ticket, "rejected", check=check, picked_t=picked_t, error=check.get("comment"))
+            return
+
+        # ราคาตอน pre-check อาจเก่าแล้ว (รอ LLM) → ดึง tick ล่าสุดก่อนส่งเสมอ
+        request, error = build_request(ticket.symbol, ticket.side, ticket.volume, ticket.sl, ticket.tp, ticket.comment)
+        if request is None:
+            self._publish(ticket, "failed", check=check, picked_t=picked_t, error=error)
+            return
+        ticket.request = request
+
+        t0 = time.perf_counter()
+        result = send_request(request)
+        send_s = time.perf_counter() - t0
+        profiler.record("order_send", int(send_s * 1e6))
+        filled = result.get("retcode") in _FILLED_RETCODES
+        if filled:
+            profiler.record("signal_to_fill", int((time.perf_counter() - ticket.signal_t) * 1e6))
+        self._publish(
+            ticket,
+            "filled" if filled else "failed",
+            check=check,
+            result=result,
+            picked_t=picked_t,
+            send_s=send_s,
+            error=None if filled else result.get("comment") or result.get("error"),
+        )
+
+    # ── events ────────────────────────────────────────────────────────
+    def _publish(
+        self,
+        ticket: OrderTicket,
+        status: str,
+        check: Optional[Dict[str, Any]] = None,
+        result: Optional[Dict[str, Any]] = None,
+        picked_t: Optional[float] = None,
+        send_s: Optional[float] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        now = time.perf_counter()
+        result = result or {}
+        event = {
+            "id": ticket.id,
+            "time": get_broker().time(),
+            "status": status,
+            "source": ticket.source,
+            "symbol": ticket.symbol,
+            "side": ticket.side,
+            "volume": ticket.volume,
+            "sl": ticket.sl,
+            "tp": ticket.tp,
+            "comment": ticket.comment,
+            "requested_price": ticket.request.get("price") if ticket.request else None,
+            "price": result.get("price"),
+            "retcode": result.get("retcode"),
+            "deal": result.get("deal"),
+            "order": result.get("order"),
+            "error": error,
+            "check": check,
+            "context": ticket.context,
+            "request": ticket.request,
+            "result": result or None,
+            "latency_ms": {
+                "check": ticket.check_ms,
+                "queue": _ms(picked_t - ticket.submitted_t) if picked_t and ticket.submitted_t else None,
+                "send": _ms(send_s),
+                "signal_to_fill": _ms(now - ticket.signal_t) if status == "filled" else None,
+            },
+        }
+        ticket.event = event
+        if status == "filled":
+            try:
+                trade_journal.record_fill(event)
+            except Exception as e:
+                print("[ORDER] trade journal error:", e)
+        with self._lock:
+            self._events.append(event)
+            subscribers = list(self._subscribers)
+        if status != "cancelled":
+            lat = event["latency_ms"]
+            print(
+                f"[ORDER] #{ticket.id} {status} {ticket.side} {ticket.volume} {ticket.symbol}"
+                + (f" @ {event['price']}" if event["price"] else "")
+                + (f" ({error})" if error else "")
+                + (f" signal→fill {lat['signal_to_fill']:.1f}ms" if lat["signal_to_fill"] is not None else "")
+            )
+        for callback in ([ticket.on_result] if ticket.on_result else []) + subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print("[ORDER] event callback error:", e)
+        ticket._done.set()
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """callback(event) ถูกเรียกจาก thread ของ worker — ต้องสั้นและไม่ block"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)[-limit:]
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """รอให้ออเดอร์ในคิวส่งหมด (ตอนปิดโปรแกรม) คืน False ถ้าไม่ทัน"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+order_gateway = OrderGateway()
+atexit.register(order_gateway.flush, 5.0)
@@ -0,0 +1,173 @@
+# core/performance.py
+"""
+Rolling performance stats: win rate / avg RR ของไม้ที่ปิดล่าสุด N ไม้ สำหรับ Kelly sizing
+
+- ฟังไม้ที่ปิดจาก trade journal (core.trade_logger) — ครั้งแรกได้ไม้ที่ปิดแล้วทั้งหมดตามลำดับเวลาปิด
+- แยก bucket: ทั้งพอร์ต / ต่อ symbol / ต่อ regime / ต่อ AI_MODE (regime + mode มาจาก context ตอนเปิดไม้)
+- แต่ละ bucket มี window ตาม PERFORMANCE_WINDOWS (เช่น 20,50,200 ไม้ล่าสุด) + KELLY_WINDOW_TRADES
+  ไม้ใหม่เข้า / ไม้เก่าสุดหลุด window → ปรับผลรวมทีละไม้ (O(1)) ไม่คำนวณใหม่จาก log
+- kelly_inputs() ที่ loop เรียกก่อน sizing = อ่านผลรวมของ window เดียว (O(1))
+
+win = กำไรสุทธิ > 0 · avg RR = R เฉลี่ยของไม้ชนะ / |R เฉลี่ยของไม้แพ้| (ไม้ที่ไม่มี R ไม่นับใน avg RR)
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .trade_logger import trade_journal
+
+SCOPES = ("all", "symbol", "regime", "mode")
+
+
+def _windows() -> List[int]:
+    sizes = set()
+    for item in settings.PERFORMANCE_WINDOWS.split(","):
+        item = item.strip()
+        if item.isdigit() and int(item) > 0:
+            sizes.add(int(item))
+    sizes.add(max(settings.KELLY_WINDOW_TRADES, 1))
+    return sorted(sizes)
+
+
+class RollingWindow:
+    """ไม้ล่าสุด size ไม้ + ผลรวมที่ปรับทีละไม้"""
+
+    __slots__ = ("size", "_items", "wins", "win_r_n", "loss_r_n", "sum_win_r", "sum_loss_r", "profit")
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: deque = deque()
+        self.wins = 0
+        self.win_r_n = 0
+        self.loss_r_n = 0
+        self.sum_win_r = 0.0
+        self.sum_loss_r = 0.0
+        self.profit = 0.0
+
+    def _apply(self, item: Tuple[bool, Optional[float], float], sign: int) -> None:
+        win, r, profit = item
+        self.wins += sign * win
+        self.profit += sign * profit
+        if r is not None and r > 0:
+            self.win_r_n += sign
+            self.sum_win_r += sign * r
+        elif r is not None:
+            self.loss_r_n += sign
+            self.sum_loss_r += sign * -r
+
+    def push(self, win: bool, r: Optional[float], profit: float) -> None:
+        item = (win, r, profit)
+        self._items.append(item)
+        self._apply(item, +1)
+        if len(self._items) > self.size:
+            self._apply(self._items.popleft(), -1)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def win_rate(self) -> Optional[float]:
+        return self.wins / len(self._items) if self._items else None
+
+    def avg_rr(self) -> Optional[float]:
+        if not self.win_r_n or not self.loss_r_n or self.sum_loss_r <= 0:
+            return None
+        return (self.sum_win_r / self.win_r_n) / (self.sum_loss_r / self.loss_r_n)
+
+    def snapshot(self) -> Dict[str, Any]:
+        win_rate, avg_rr = self.win_rate(), self.avg_rr()
+        r_n = self.win_r_n + self.loss_r_n
+        return {
+            "trades": len(self._items),
+            "win_rate": round(win_rate, 4) if win_rate is not None else None,
+            "avg_rr": round(avg_rr, 4) if avg_rr is not None else None,
+            "expectancy_r": round((self.sum_win_r - self.sum_loss_r) / r_n, 4) if r_n else None,
+            "profit": round(self.profit, 2),
+        }
+
+
+class PerformanceStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._started = False
+        self._windows = _windows()
+        # (scope, key) → {size: RollingWindow}
+        self._buckets: Dict[Tuple[str, Optional[str]], Dict[int, RollingWindow]] = {}
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._init_lock:
+            if not self._started:
+                trade_journal.subscribe(self.on_close, replay=True)
+                self._started = True
+
+    @staticmethod
+    def _keys(trade: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+        context = trade.get("context") or {}
+        keys: List[Tuple[str, Optional[str]]] = [("all", None), ("symbol", trade["symbol"].upper())]
+        if context.get("regime"):
+            keys.append(("regime", str(context["regime"])))
+        if context.get("mode"):
+            keys.append(("mode", str(context["mode"]).upper()))
+        return keys
+
+    def on_close(self, trade: Dict[str, Any]) -> None:
+        """ไม้ปิด 1 ไม้ (จาก trade journal) → เข้าทุก bucket ที่เกี่ยวข้อง"""
+        profit = float(trade.get("profit") or 0.0)
+        r = trade.get("r")
+        with self._lock:
+            for key in self._keys(trade):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = {size: RollingWindow(size) for size in self._windows}
+                    self._buckets[key] = bucket
+                for window in bucket.values():
+                    window.push(profit > 0, r, profit)
+
+    def window(self, scope: str = "all", key: Optional[str] = None, size: Optional[int] = None) -> Optional[RollingWindow]:
+        self._ensure_started()
+        if scope in ("symbol", "mode") and key:
+            key = key.upper()
+        bucket = self._buckets.get((scope, key if scope != "all" else None))
+        if bucket is None:
+            return None
+        return bucket.get(size or max(settings.KELLY_WINDOW_TRADES, 1))
+
+    def kelly_inputs(
+        self,
+        symbol: Optional[str] = None,
+        regime: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> Tuple[Optional[float], Optional[float]]:
+        """
+        (win_rate, avg_rr) ของ KELLY_WINDOW_TRADES ไม้ล่าสุดตาม KELLY_STATS_SCOPE
+        ไม้ใน scope ยังไม่ถึง KELLY_MIN_TRADES → ถอยไปใช้ทั้งพอร์ต → ยังไม่ถึงอีก = (None, None) = ไม่ใช้ Kelly
+        """
+        scope = settings.KELLY_STATS_SCOPE.lower()
+        key = {"symbol": symbol, "regime": regime, "mode": mode}.get(scope)
+        candidates = [(scope, key)] if scope != "all" and key else []
+        candidates.append(("all", None))
+        for s, k in candidates:
+            window = self.window(s, k)
+            if window is None or len(window) < max(settings.KELLY_MIN_TRADES, 1):
+                continue
+            avg_rr = window.avg_rr()
+            if avg_rr is None:
+                continue
+            return window.win_rate(), avg_rr
+        return None, None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ทุก bucket ทุก window (สำหรับ /api/performance)"""
+        self._ensure_started()
+        with self._lock:
+            out: Dict[str, Any] = {scope: {} for scope in SCOPES}
+            for (scope, key), bucket in self._buckets.items():
+                out[scope][key or "ALL"] = {str(size): w.snapshot() for size, w in bucket.items()}
+        return out
+
+
+performance = PerformanceStats()
@@ -0,0 +1,256 @@
+# core/position_manager.py
+"""
+Position manager: ดูแลไม้ที่ bot เปิดไว้ (magic = MT5_MAGIC_NUMBER) หลังส่งออเดอร์ไปแล้ว
+
+    position_manager.observe(symbol, comment, atr)   # ทุกรอบของ pair (ATR ล่าสุดของ pair นั้น)
+    position_manager.run()                           # ทุกแท่ง / tick — ไม้ทั้งพอร์ตใน pass เดียว
+
+ต่อ pass:
+- positions_get 1 ครั้ง (ทั้งพอร์ต กรองด้วย magic) + symbol_info_tick 1 ครั้งต่อ symbol
+- ตัดสินใจแบบ vectorized (numpy) ทุกไม้พร้อมกัน:
+    breakeven : ราคาวิ่งถึง compute_breakeven_level(entry, side, ATR, BREAKEVEN_ATR_MULT)
+                → SL = ทุน ± BREAKEVEN_BUFFER_POINTS
+    trailing  : กำไรเกิน TRAIL_START_ATR * ATR → SL ตามราคา ห่าง TRAIL_ATR_MULT * ATR (ขยับไปทางกำไรเท่านั้น)
+    partial TP: กำไรถึง PARTIAL_TP_R เท่าของ risk ตอนเปิด (|entry - SL ตอนส่งออเดอร์| จาก trade journal)
+                → ปิด PARTIAL_TP_FRACTION ของ volume ครั้งเดียว — สำเร็จ (retcode DONE) แล้วจึงบันทึกลง journal
+                ส่งไม่ผ่านก็ลองใหม่ pass ถัดไป / restart แล้วไม่ปิดซ้ำ
+- ส่งเฉพาะไม้ที่ต้องแก้ (SL ดีขึ้นอย่างน้อย TRAIL_STEP_POINTS) รวดเดียวใน MT5_LOCK ครั้งเดียว
+  แล้ว invalidate broker_cache ครั้งเดียว — MT5 ไม่มี batch API จึง batch ที่ระดับ lock / IPC round แทน
+
+ATR ต่อไม้มาจาก pair ที่เปิด (symbol + comment ของ pair) → ไม่มีก็ใช้ ATR ล่าสุดของ symbol นั้น → ไม่มีเลย = ข้าม
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .broker import get_broker, mt5
+from .broker_cache import broker_cache
+from .config import settings
+from .mt5_trader import request_template
+from .stability import MT5_LOCK
+from .trade_logger import trade_journal
+from .trade_utils import compute_breakeven_level
+
+# retcode ที่ถือว่าสำเร็จ (DONE / DONE_PARTIAL / PLACED)
+_DONE_RETCODES = (10008, 10009, 10010)
+# ปิดบางส่วนแล้วจริง (DONE / DONE_PARTIAL) — PLACED ยังไม่ fill
+_PARTIAL_DONE_RETCODES = (10009, 10010)
+
+
+class PositionManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._atr: Dict[Any, float] = {}
+        # ticket → {"risk": ระยะ SL ตอนส่งออเดอร์, "partial": ปิดบางส่วนไปแล้ว}
+        self._state: Dict[int, Dict[str, Any]] = {}
+        self._last_run: Optional[float] = None
+        self.last_stats: Dict[str, Any] = {}
+
+    def observe(self, symbol: str, comment: Optional[str], atr: float) -> None:
+        """เก็บ ATR ล่าสุดของ pair (เรียกจาก loop ของ pair นั้น)"""
+        if not atr or atr <= 0:
+            return
+        s = symbol.upper()
+        with self._lock:
+            self._atr[(s, (comment or "ExtremeAI v4")[:31])] = float(atr)
+            self._atr[s] = float(atr)
+
+    def _atr_for(self, symbol: str, comment: str) -> float:
+        s = symbol.upper()
+        return self._atr.get((s, comment), self._atr.get(s, 0.0))
+
+    # ── pass ──────────────────────────────────────────────────────────
+    def run(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        1 pass ทั้งพอร์ต — ทุก pair เรียกได้ แต่ทำจริงไม่เกิน 1 ครั้งต่อ POSITION_MANAGE_INTERVAL_SEC
+        (นาฬิกาของ backend) และมี thread เดียวที่ทำอยู่ — ที่เหลือคืน None ทันที
+        """
+        now = get_broker().time()
+        if not force and self._last_run is not None and now - self._last_run < settings.POSITION_MANAGE_INTERVAL_SEC:
+            return None
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            self._last_run = now
+            return self._pass()
+        finally:
+            self._run_lock.release()
+
+    def _pass(self) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        with MT5_LOCK:
+            positions = mt5.positions_get()
+        magic = settings.MT5_MAGIC_NUMBER
+        own = [p for p in positions or () if p.magic == magic]
+
+        ticks: Dict[str, Any] = {}
+        for sym in {p.symbol for p in own}:
+            with MT5_LOCK:
+                ticks[sym] = mt5.symbol_info_tick(sym)
+
+        live = {p.ticket for p in own}
+        for ticket in [t for t in self._state if t not in live]:
+            del self._state[ticket]
+
+        modifies: List[Dict[str, Any]] = []
+        partials: List[Dict[str, Any]] = []
+        by_symbol: Dict[str, List[Any]] = {}
+        for p in own:
+            by_symbol.setdefault(p.symbol, []).append(p)
+        with self._lock:
+            for sym, group in by_symbol.items():
+                tick = ticks.get(sym)
+                info = broker_cache.symbol_info(sym)
+                if tick is None or info is None:
+                    continue
+                m, pt = self._plan(group, tick, info)
+                modifies.extend(m)
+                partials.extend(pt)
+
+        results = self._send(modifies, partials) if (modifies or partials) else []
+        failed = sum(1 for r in results if r is None or r.retcode not in _DONE_RETCODES)
+        for request, result in zip(partials, results[len(modifies) :]):
+            if result is not None and result.retcode in _PARTIAL_DONE_RETCODES:
+                ticket = request["position"]
+                with self._lock:
+                    if ticket in self._state:
+                        self._state[ticket]["partial"] = True
+                trade_journal.record_partial(ticket, request["volume"], get_broker().server_time())
+        stats = {
+            "positions": len(own),
+            "modified": len(modifies),
+            "partial": len(partials),
+            "failed": failed,
+            "ms": round((time.perf_counter() - t0) * 1000.0, 3),
+        }
+        self.last_stats = stats
+        if modifies or partials:
+            print(
+                f"[POSMGR] {stats['positions']} positions | SL moved {len(modifies)} | "
+                f"partial close {len(partials)} | failed {failed} | {stats['ms']}ms"
+            )
+        return stats
+
+    def _plan(self, group: List[Any], tick, info) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """ตัดสินใจทั้งกลุ่ม (symbol เดียวกัน) ด้วย numpy → (SLTP requests, partial close requests)"""
+        point = float(getattr(info, "point", 0.0) or settings.TICK_SIZE)
+        digits = int(getattr(info, "digits", 2))
+        stops = float(getattr(info, "trade_stops_level", 0) or 0) * point
+
+        is_buy = np.fromiter((p.type == mt5.POSITION_TYPE_BUY for p in group), dtype=bool, count=len(group))
+        entry = np.fromiter((p.price_open for p in group), dtype=np.float64, count=len(group))
+        sl = np.fromiter((p.sl for p in group), dtype=np.float64, count=len(group))
+        atr = np.fromiter((self._atr_for(p.symbol, p.comment) for p in group), dtype=np.float64, count=len(group))
+        direction = np.where(is_buy, 1.0, -1.0)
+        # ราคาที่ใช้ปิด: BUY = bid / SELL = ask
+        price = np.where(is_buy, float(tick.bid), float(tick.ask))
+        progress = (price - entry) * direction
+        has_atr = atr > 0
+
+        # ทำงานใน "ทิศทางของไม้" (x = ราคา * direction) → SL ที่ดีกว่า = x มากกว่า ทั้ง BUY / SELL
+        neg_inf = np.full(len(group), -np.inf)
+        current_x = np.where(sl > 0, sl * direction, neg_inf)
+        target_x = neg_inf.copy()
+
+        if settings.BREAKEVEN_ATR_MULT > 0:
+            trigger = np.array(
+                [
+                    compute_breakeven_level(p.price_open, "BUY" if b else "SELL", a, settings.BREAKEVEN_ATR_MULT)
+                    for p, b, a in zip(group, is_buy, atr)
+                ]
+            )
+            hit = has_atr & ((price - trigger) * direction >= 0)
+            be_x = (entry + direction * settings.BREAKEVEN_BUFFER_POINTS * point) * direction
+            target_x = np.where(hit, np.maximum(target_x, be_x), target_x)
+
+        if settings.TRAIL_ATR_MULT > 0:
+            on = has_atr & (progress >= settings.TRAIL_START_ATR * atr)
+            trail_x = price * direction - settings.TRAIL_ATR_MULT * atr
+            target_x = np.where(on, np.maximum(target_x, trail_x), target_x)
+
+        # SL ต้องอยู่หลังราคาปัจจุบันอย่างน้อย stops level ของโบรก
+        target_x = np.minimum(target_x, price * direction - max(stops, point))
+        move = target_x > current_x + settings.TRAIL_STEP_POINTS * point
+        new_sl = np.round(target_x * direction, digits)
+
+        modifies = [
+            {
+                "action": mt5.TRADE_ACTION_SLTP,
+                "symbol": group[i].symbol,
+                "position": group[i].ticket,
+                "sl": float(new_sl[i]),
+                "tp": float(group[i].tp),
+                "magic": settings.MT5_MAGIC_NUMBER,
+            }
+            for i in np.flatnonzero(move)
+        ]
+
+        partials: List[Dict[str, Any]] = []
+        if settings.PARTIAL_TP_FRACTION > 0 and settings.PARTIAL_TP_R > 0:
+            for i, p in enumerate(group):
+                state = self._state.get(p.ticket)
+                if state is None:
+                    state = self._initial_state(p)
+                    self._state[p.ticket] = state
+                if state["partial"] or state["risk"] <= 0 or progress[i] < settings.PARTIAL_TP_R * state["risk"]:
+                    continue
+                request = self._partial_request(p, info, price[i])
+                if request is not None:
+                    partials.append(request)
+        return modifies, partials
+
+    @staticmethod
+    def _initial_state(p) -> Dict[str, Any]:
+        """
+        risk จาก SL ตอนส่งออเดอร์ (journal) — SL ปัจจุบันอาจถูกเลื่อนไป breakeven / trailing แล้ว
+        partial = journal มี event partial หรือ volume ลดลงจากตอนเปิดแล้ว (ปิดบางส่วนไปก่อน restart)
+        ไม่อยู่ใน journal (เช่น เปิดก่อนมี journal) → ใช้ SL ปัจจุบันแบบเดิม
+        """
+        trade = trade_journal.get(p.ticket)
+        if trade is None:
+            return {"risk": abs(p.price_open - p.sl) if p.sl else 0.0, "partial": False}
+        sl = trade.get("sl") or p.sl
+        partial = bool(trade.get("partial")) or p.volume < float(trade.get("volume") or 0.0) - 1e-9
+        return {"risk": abs(p.price_open - sl) if sl else 0.0, "partial": partial}
+
+    @staticmethod
+    def _partial_request(p, info, price: float) -> Optional[Dict[str, Any]]:
+        """ปิดบางส่วน = market order ฝั่งตรงข้ามที่อ้าง position (ปัดตาม volume_step, เหลือ >= volume_min)"""
+        step = float(getattr(info, "volume_step", 0.0) or settings.MIN_VOLUME)
+        vmin = float(getattr(info, "volume_min", 0.0) or settings.MIN_VOLUME)
+        volume = np.floor(p.volume * settings.PARTIAL_TP_FRACTION / step + 1e-9) * step
+        volume = round(float(volume), 8)
+        if volume < vmin or p.volume - volume < vmin - 1e-9:
+            return None
+        template = request_template(p.symbol, "SELL" if p.type == mt5.POSITION_TYPE_BUY else "BUY")
+        if template is None:
+            return None
+        request = dict(template)
+        request.update(
+            {
+                "position": p.ticket,
+                "volume": volume,
+                "price": float(price),
+                "comment": p.comment,
+            }
+        )
+        return request
+
+    @staticmethod
+    def _send(modifies: List[Dict[str, Any]], partials: List[Dict[str, Any]]) -> List[Any]:
+        """ส่งทุก request ในรอบเดียว (ถือ MT5_LOCK ครั้งเดียว) แล้ว invalidate cache ครั้งเดียว"""
+        results = []
+        try:
+            with MT5_LOCK:
+                for request in modifies + partials:
+                    results.append(mt5.order_send(request))
+        finally:
+            broker_cache.invalidate()
+        return results
+
+
+position_manager = PositionManager()
@@ -9,6 +9,7 @@ def calculate_position_size(
     risk_percent: float | None = None,
     win_rate: float | None = None,
     avg_rr: float | None = None,
+    drawdown_pct: float | None = None,
 ) -> float:
     """
     คำนวณ volume (lot) แบบ Dynamic Position Sizing
@@ -31,6 +32,8 @@ def calculate_position_size(
         risk_percent: สัดส่วนความเสี่ยง (None = ใช้จาก settings)
         win_rate    : อัตรากำไรโดยประมาณ 0-1 (สำหรับ Kelly)
         avg_rr      : Risk:Reward ratio เฉลี่ย (สำหรับ Kelly)
+        drawdown_pct: drawdown จาก peak equity 0-1 (core.equity_tracker)
+                      None = เทียบ balance กับ INITIAL_BALANCE แบบเดิม
     """
 
     if risk_percent is None:
@@ -67,14 +70,16 @@ def calculate_position_size(
 
     volume = risk_amount / cost_per_lot
 
-    # ── Drawdown protection: ลด size เมื่อ balance ลดลงจาก peak ──────
-    initial_balance = getattr(settings, "INITIAL_BALANCE", balance)
-    if initial_balance > 0 and balance < initial_balance:
-        drawdown_pct = (initial_balance - balance) / initial_balance
-        if drawdown_pct > 0.10:   # drawdown > 10% → ลด size 50%
-            volume *= 0.5
-        elif drawdown_pct > 0.05:  # drawdown > 5% → ลด size 25%
-            volume *= 0.75
+    # ── Drawdown protection: ลด size เมื่อ equity ลดลงจาก peak ───────
+    if drawdown_pct is None:
+        initial_balance = getattr(settings, "INITIAL_BALANCE", balance)
+        drawdown_pct = 0.0
+        if initial_balance > 0 and balance < initial_balance:
+            drawdown_pct = (initial_balance - balance) / initial_balance
+    if drawdown_pct > 0.10:   # drawdown > 10% → ลด size 50%
+        volume *= 0.5
+    elif drawdown_pct > 0.05:  # drawdown > 5% → ลด size 25%
+        volume *= 0.75
 
     # clamp volume ตาม min/max
     volume = max(settings.MIN_VOLUME, min(volume, settings.MAX_VOLUME))
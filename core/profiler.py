@@ -0,0 +1,183 @@
+# core/profiler.py
+"""
+จับเวลาแต่ละ stage ของ loop เทรด (fetch / indicators / ai / llm / order / log / state ...)
+
+- LatencyHistogram: histogram แบบ HDR (log-linear bucket, คลาดเคลื่อน ~3%) บันทึก O(1) ไม่เก็บทุกค่า
+- StageProfiler: `with profiler.stage("fetch"):` → บันทึกเวลาลง histogram ของ stage นั้น
+- iteration(): จับเวลาทั้งรอบ + (เปิดด้วย PERF_PROFILE_SLOWEST) cProfile ทุกรอบ
+  แล้วเก็บไฟล์ .prof ไว้เฉพาะ N รอบที่ช้าที่สุด (เปิดดูด้วย snakeviz / pstats)
+"""
+
+import cProfile
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+# 2^6 sub-bucket ต่อช่วงกำลังสอง → ความละเอียด ~1/32 ของค่า
+_SUB_BITS = 6
+_SUB_COUNT = 1 << _SUB_BITS
+# รองรับถึง ~2^40 µs (ราว 12 วัน) ต่อค่าเดียว
+_BUCKETS = (40 - _SUB_BITS + 2) * _SUB_COUNT
+
+
+def _bucket_index(value_us: int) -> int:
+    bits = value_us.bit_length()
+    if bits <= _SUB_BITS:
+        return value_us
+    shift = bits - _SUB_BITS
+    return min((shift << _SUB_BITS) + (value_us >> shift), _BUCKETS - 1)
+
+
+def _bucket_value(index: int) -> int:
+    """ค่ากลางของ bucket (µs)"""
+    if index < _SUB_COUNT:
+        return index
+    shift = index >> _SUB_BITS
+    low = (index - (shift << _SUB_BITS)) << shift
+    return low + (1 << shift) // 2
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, value_us: int) -> None:
+        value_us = max(int(value_us), 0)
+        self.counts[_bucket_index(value_us)] += 1
+        self.count += 1
+        self.total_us += value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * q / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            if n:
+                seen += n
+                if seen >= target:
+                    return min(_bucket_value(index), self.max_us)
+        return self.max_us
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_us / self.count / 1000.0, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) / 1000.0, 3),
+            "p90_ms": round(self.percentile(90) / 1000.0, 3),
+            "p99_ms": round(self.percentile(99) / 1000.0, 3),
+            "max_ms": round(self.max_us / 1000.0, 3),
+        }
+
+
+class StageProfiler:
+    def __init__(self, slowest_n: int = 0, profile_dir: str = "logs/profiles"):
+        self._lock = threading.Lock()
+        self._hist: Dict[str, LatencyHistogram] = {}
+        self.started_at = time.time()
+        self.slowest_n = max(int(slowest_n), 0)
+        self.profile_dir = profile_dir
+        # min-heap ของ (duration_us, path) → เก็บเฉพาะ N รอบที่ช้าที่สุด
+        self._slowest: List[Tuple[int, str]] = []
+        self._last_logged = time.time()
+        self._seq = itertools.count()
+
+    def record(self, name: str, value_us: int) -> None:
+        with self._lock:
+            hist = self._hist.get(name)
+            if hist is None:
+                hist = self._hist[name] = LatencyHistogram()
+            hist.record(value_us)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter_ns() - t0) // 1000)
+
+    @contextmanager
+    def iteration(self, label: str = "") -> Iterator[None]:
+        """ทั้งรอบของ pipeline → stage "iteration" (+ cProfile ถ้าเปิด PERF_PROFILE_SLOWEST)"""
+        prof = None
+        if self.slowest_n:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # มี profiler อื่นทำงานอยู่ใน thread นี้ (เช่นรันใต้ debugger) → จับเวลาอย่างเดียว
+                prof = None
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed_us = (time.perf_counter_ns() - t0) // 1000
+            if prof is not None:
+                prof.disable()
+                self._keep_if_slow(prof, elapsed_us, label)
+            self.record("iteration", elapsed_us)
+
+    def _keep_if_slow(self, prof: cProfile.Profile, elapsed_us: int, label: str) -> None:
+        with self._lock:
+            if len(self._slowest) >= self.slowest_n and elapsed_us <= self._slowest[0][0]:
+                return
+            safe_label = "".join(c if c.isalnum() else "_" for c in label) or "loop"
+            path = os.path.join(
+                self.profile_dir,
+                f"iter_{elapsed_us // 1000:06d}ms_{safe_label}_{time.strftime('%Y%m%d_%H%M%S')}_{next(self._seq)}.prof",
+            )
+            evicted = None
+            if len(self._slowest) >= self.slowest_n:
+                evicted = heapq.heapreplace(self._slowest, (elapsed_us, path))[1]
+            else:
+                heapq.heappush(self._slowest, (elapsed_us, path))
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            prof.dump_stats(path)
+            if evicted and os.path.exists(evicted):
+                os.remove(evicted)
+        except OSError as e:
+            print("[PERF] profile dump error:", e)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: hist.summary() for name, hist in self._hist.items()}
+
+    def slowest_profiles(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._slowest, reverse=True)
+        return [{"iteration_ms": round(us / 1000.0, 3), "path": path} for us, path in items]
+
+    def flat_record(self) -> Dict[str, Any]:
+        """snapshot แบบ key ชั้นเดียว (perf.<stage>.<metric>) สำหรับเขียนลง AI log แบบ columnar"""
+        record: Dict[str, Any] = {}
+        for name, summary in self.snapshot().items():
+            for metric, value in summary.items():
+                record[f"perf.{name}.{metric}"] = value
+        return record
+
+    def take_log_record(self, interval_sec: float) -> Optional[Dict[str, Any]]:
+        """คืน flat_record() ถ้าครบ interval_sec นับจากครั้งก่อน (หลาย pair เรียกพร้อมกันได้ — ได้แค่ตัวเดียว)"""
+        if interval_sec <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            if now - self._last_logged < interval_sec:
+                return None
+            self._last_logged = now
+        return self.flat_record()
+
+
+profiler = StageProfiler(settings.PERF_PROFILE_SLOWEST, settings.PERF_PROFILE_DIR)
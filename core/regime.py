@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 def detect_regime(df: pd.DataFrame) -> str:
@@ -59,3 +61,55 @@ def detect_regime(df: pd.DataFrame) -> str:
         return "trending"
 
     return "sideways"
+
+
+def _rolling_mean_20(values: np.ndarray) -> np.ndarray:
+    """ค่าเฉลี่ย 20 แท่งล่าสุดของทุกแถว (แถวที่ยังไม่ครบ 20 = ค่าของแถวนั้นเอง)"""
+    out = values.copy()
+    if len(values) >= 20:
+        out[19:] = sliding_window_view(values, 20).mean(axis=1)
+    return out
+
+
+def detect_regime_batch(df: pd.DataFrame) -> np.ndarray:
+    """
+    detect_regime() แบบ vectorized: คืน array ของ regime ทุกแถว
+    แถวที่ k ได้ค่าเท่ากับ detect_regime(df.iloc[: k + 1])
+    """
+    n = len(df)
+
+    def col(name: str, default: float) -> np.ndarray:
+        if name in df.columns:
+            return df[name].to_numpy(dtype=np.float64)
+        return np.full(n, default, dtype=np.float64)
+
+    adx_val = col("ADX", 0)
+    ema_trend = col("EMA_TREND", 0)
+    bb_width = col("BB_WIDTH", 0)
+    bb_pct_b = col("BB_PCT_B", 0.5)
+    atr_val = col("ATR", 0)
+
+    prev_ema_trend = np.empty_like(ema_trend)
+    if n:
+        prev_ema_trend[0] = ema_trend[0]
+        prev_ema_trend[1:] = ema_trend[:-1]
+
+    bb_width_avg = _rolling_mean_20(bb_width) if "BB_WIDTH" in df.columns else bb_width
+    atr_avg = _rolling_mean_20(atr_val) if "ATR" in df.columns else atr_val
+
+    volatile = (atr_val > atr_avg * 1.8) & (bb_width > bb_width_avg * 1.5)
+    trending = (adx_val > 25) & (np.abs(ema_trend) >= 1)
+    ema_trend_changed = ((ema_trend > 0) & (prev_ema_trend < 0)) | ((ema_trend < 0) & (prev_ema_trend > 0))
+    bb_bounce = ((bb_pct_b < 0.10) & (ema_trend > 0)) | ((bb_pct_b > 0.90) & (ema_trend < 0))
+    sideways = (adx_val < 20) & (bb_width < bb_width_avg * 0.85)
+    weak_trend = adx_val > 18
+
+    regime = np.select(
+        [volatile, trending, ema_trend_changed | bb_bounce, sideways, weak_trend],
+        ["volatile", "trending", "reversal", "sideways", "trending"],
+        default="sideways",
+    ).astype(object)
+
+    # len(df) < 50 → "unknown"
+    regime[: min(n, 49)] = "unknown"
+    return regime
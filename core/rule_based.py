@@ -1,6 +1,80 @@
-from typing import Dict
+from typing import Dict, List
+
+import numpy as np
 import pandas as pd
 
+# ── Reason bitmask (สำหรับ compute_rule_based_prob_batch) ─────────────
+# เรียงตามลำดับที่ compute_rule_based_prob() append เข้า reasons
+# → decode_reasons() คืน list เดียวกับ scalar version
+REASON_RSI_OVERSOLD = 1 << 0
+REASON_RSI_LOW = 1 << 1
+REASON_RSI_OVERBOUGHT = 1 << 2
+REASON_RSI_HIGH = 1 << 3
+REASON_RSI_CROSS_UP = 1 << 4
+REASON_RSI_CROSS_DOWN = 1 << 5
+REASON_MACD_POSITIVE = 1 << 6
+REASON_MACD_NEGATIVE = 1 << 7
+REASON_MACD_RISING = 1 << 8
+REASON_MACD_FALLING = 1 << 9
+REASON_MACD_BULL_CROSS = 1 << 10
+REASON_MACD_BEAR_CROSS = 1 << 11
+REASON_EMA_FULL_BULL = 1 << 12
+REASON_EMA_PART_BULL = 1 << 13
+REASON_EMA_FULL_BEAR = 1 << 14
+REASON_EMA_PART_BEAR = 1 << 15
+REASON_BB_NEAR_LOWER = 1 << 16
+REASON_BB_NEAR_UPPER = 1 << 17
+REASON_BB_SQUEEZE_UP = 1 << 18
+REASON_BB_SQUEEZE_DOWN = 1 << 19
+REASON_STOCH_OVERSOLD = 1 << 20
+REASON_STOCH_OVERBOUGHT = 1 << 21
+REASON_STOCH_BULL_CROSS = 1 << 22
+REASON_STOCH_BEAR_CROSS = 1 << 23
+REASON_ADX_VERY_STRONG = 1 << 24
+REASON_ADX_STRONG = 1 << 25
+REASON_VOLUME_SPIKE = 1 << 26
+REASON_BULLISH_ENGULF = 1 << 27
+REASON_BEARISH_ENGULF = 1 << 28
+REASON_HAMMER = 1 << 29
+REASON_SHOOTING_STAR = 1 << 30
+
+# bit → (ข้อความ, คอลัมน์ที่ใช้ format ค่า)
+_REASON_TEXT = [
+    (REASON_RSI_OVERSOLD, "RSI oversold ({:.1f})", "RSI"),
+    (REASON_RSI_LOW, "RSI low ({:.1f})", "RSI"),
+    (REASON_RSI_OVERBOUGHT, "RSI overbought ({:.1f})", "RSI"),
+    (REASON_RSI_HIGH, "RSI high ({:.1f})", "RSI"),
+    (REASON_RSI_CROSS_UP, "RSI crossed above 50", None),
+    (REASON_RSI_CROSS_DOWN, "RSI crossed below 50", None),
+    (REASON_MACD_POSITIVE, "MACD hist > 0", None),
+    (REASON_MACD_NEGATIVE, "MACD hist < 0", None),
+    (REASON_MACD_RISING, "MACD hist rising", None),
+    (REASON_MACD_FALLING, "MACD hist falling", None),
+    (REASON_MACD_BULL_CROSS, "MACD bullish crossover", None),
+    (REASON_MACD_BEAR_CROSS, "MACD bearish crossover", None),
+    (REASON_EMA_FULL_BULL, "EMA fully bullish (9>21>50)", None),
+    (REASON_EMA_PART_BULL, "EMA partially bullish", None),
+    (REASON_EMA_FULL_BEAR, "EMA fully bearish (9<21<50)", None),
+    (REASON_EMA_PART_BEAR, "EMA partially bearish", None),
+    (REASON_BB_NEAR_LOWER, "Price near BB lower ({:.2f})", "BB_PCT_B"),
+    (REASON_BB_NEAR_UPPER, "Price near BB upper ({:.2f})", "BB_PCT_B"),
+    (REASON_BB_SQUEEZE_UP, "BB squeeze breakout UP", None),
+    (REASON_BB_SQUEEZE_DOWN, "BB squeeze breakout DOWN", None),
+    (REASON_STOCH_OVERSOLD, "Stoch oversold (K={:.1f})", "STOCH_K"),
+    (REASON_STOCH_OVERBOUGHT, "Stoch overbought (K={:.1f})", "STOCH_K"),
+    (REASON_STOCH_BULL_CROSS, "Stoch bullish cross (oversold zone)", None),
+    (REASON_STOCH_BEAR_CROSS, "Stoch bearish cross (overbought zone)", None),
+    (REASON_ADX_VERY_STRONG, "Very strong trend (ADX={:.1f})", "ADX"),
+    (REASON_ADX_STRONG, "Strong trend (ADX={:.1f})", "ADX"),
+    (REASON_VOLUME_SPIKE, "Volume spike (x{:.1f})", "VOL_RATIO"),
+    (REASON_BULLISH_ENGULF, "Bullish Engulfing pattern", None),
+    (REASON_BEARISH_ENGULF, "Bearish Engulfing pattern", None),
+    (REASON_HAMMER, "Hammer pattern", None),
+    (REASON_SHOOTING_STAR, "Shooting Star pattern", None),
+]
+
+_REASON_DEFAULTS = {"RSI": 50, "BB_PCT_B": 0.5, "STOCH_K": 50, "ADX": 0, "VOL_RATIO": 1.0}
+
 
 def compute_rule_based_prob(df: pd.DataFrame) -> Dict:
     """
@@ -213,3 +287,219 @@ def compute_rule_based_prob(df: pd.DataFrame) -> Dict:
         "prob_down": float(prob_down),
         "reasons": reasons,
     }
+
+
+def _batch_col(df: pd.DataFrame, name: str, default: float) -> np.ndarray:
+    if name in df.columns:
+        return df[name].to_numpy(dtype=np.float64)
+    return np.full(len(df), default, dtype=np.float64)
+
+
+def _shift_prev(arr: np.ndarray) -> np.ndarray:
+    # prev ของแถวแรก = ตัวมันเอง (เหมือน prev = last เมื่อ len(df) < 2)
+    prev = np.empty_like(arr)
+    if len(arr):
+        prev[0] = arr[0]
+        prev[1:] = arr[:-1]
+    return prev
+
+
+def compute_rule_based_prob_batch(df: pd.DataFrame, with_reasons: bool = False) -> Dict[str, np.ndarray]:
+    """
+    compute_rule_based_prob() แบบ vectorized ทุกแถวในครั้งเดียว
+    แถวที่ k ได้ค่าเท่ากับ compute_rule_based_prob(df.iloc[: k + 1]) ทุกตัว
+    (บวกคะแนนตามลำดับเดียวกับ scalar version → ผลลัพธ์ตรงกันระดับ bit)
+
+    คืนค่า: {"prob_up": ndarray, "prob_down": ndarray}
+    with_reasons=True → เพิ่ม "reason_mask" (uint32, REASON_* bit flags)
+    แปลงกลับเป็นข้อความด้วย decode_reasons(mask, df.iloc[k])
+    """
+    n = len(df)
+    rsi_val = _batch_col(df, "RSI", 50)
+    macd_hist = _batch_col(df, "MACD_HIST", 0)
+    adx_val = _batch_col(df, "ADX", 0)
+    ema_trend = _batch_col(df, "EMA_TREND", 0)
+    bb_pct_b = _batch_col(df, "BB_PCT_B", 0.5)
+    bb_width = _batch_col(df, "BB_WIDTH", 0)
+    stoch_k = _batch_col(df, "STOCH_K", 50)
+    stoch_d = _batch_col(df, "STOCH_D", 50)
+    vol_ratio = _batch_col(df, "VOL_RATIO", 1.0)
+    bullish_engulf = _batch_col(df, "BULLISH_ENGULF", 0) != 0
+    bearish_engulf = _batch_col(df, "BEARISH_ENGULF", 0) != 0
+    hammer = _batch_col(df, "HAMMER", 0) != 0
+    shooting_star = _batch_col(df, "SHOOTING_STAR", 0) != 0
+    close = _batch_col(df, "Close", 0)
+    ema9 = df["EMA9"].to_numpy(dtype=np.float64) if "EMA9" in df.columns else close
+
+    prev_rsi = _shift_prev(rsi_val)
+    prev_macd_hist = _shift_prev(macd_hist)
+    prev_bb_width = _shift_prev(bb_width)
+    prev_stoch_k = _shift_prev(stoch_k)
+    prev_stoch_d = _shift_prev(stoch_d)
+
+    score_up = np.zeros(n, dtype=np.float64)
+    score_down = np.zeros(n, dtype=np.float64)
+
+    reason_mask = np.zeros(n, dtype=np.uint32)
+
+    def flag(cond, bit):
+        nonlocal reason_mask
+        if with_reasons:
+            reason_mask |= np.where(cond, np.uint32(bit), np.uint32(0))
+
+    def add(cond_up, val_up, cond_down, val_down, bit_up=0, bit_down=0):
+        # if / elif แบบ scalar: ฝั่ง down ใช้ได้เฉพาะแถวที่ฝั่ง up ไม่ผ่าน
+        nonlocal score_up, score_down
+        cond_down = ~cond_up & cond_down
+        score_up = score_up + np.where(cond_up, val_up, 0.0)
+        score_down = score_down + np.where(cond_down, val_down, 0.0)
+        if bit_up:
+            flag(cond_up, bit_up)
+        if bit_down:
+            flag(cond_down, bit_down)
+
+    # ── 1) RSI ──────────────────────────────────────────────────────
+    rsi_os = rsi_val < 30
+    rsi_low = ~rsi_os & (rsi_val < 40)
+    rsi_ob = ~rsi_os & ~rsi_low & (rsi_val > 70)
+    rsi_high = ~rsi_os & ~rsi_low & ~rsi_ob & (rsi_val > 60)
+    score_up = score_up + np.where(rsi_os, 0.20, np.where(rsi_low, 0.08, 0.0))
+    score_down = score_down + np.where(rsi_ob, 0.20, np.where(rsi_high, 0.08, 0.0))
+    flag(rsi_os, REASON_RSI_OVERSOLD)
+    flag(rsi_low, REASON_RSI_LOW)
+    flag(rsi_ob, REASON_RSI_OVERBOUGHT)
+    flag(rsi_high, REASON_RSI_HIGH)
+
+    rsi_mid = (45 < rsi_val) & (rsi_val < 55)
+    add(
+        rsi_mid & (rsi_val > 50) & (prev_rsi < 50), 0.06,
+        rsi_mid & (rsi_val < 50) & (prev_rsi > 50), 0.06,
+        REASON_RSI_CROSS_UP, REASON_RSI_CROSS_DOWN,
+    )
+
+    # ── 2) MACD Histogram ──────────────────────────────────────────
+    add(macd_hist > 0, 0.12, macd_hist < 0, 0.12, REASON_MACD_POSITIVE, REASON_MACD_NEGATIVE)
+    add(
+        (macd_hist > prev_macd_hist) & (macd_hist > 0), 0.06,
+        (macd_hist < prev_macd_hist) & (macd_hist < 0), 0.06,
+        REASON_MACD_RISING, REASON_MACD_FALLING,
+    )
+    add(
+        (macd_hist > 0) & (prev_macd_hist <= 0), 0.10,
+        (macd_hist < 0) & (prev_macd_hist >= 0), 0.10,
+        REASON_MACD_BULL_CROSS, REASON_MACD_BEAR_CROSS,
+    )
+
+    # ── 3) EMA Trend Alignment ─────────────────────────────────────
+    ema_full_bull = ema_trend >= 2
+    ema_part_bull = ~ema_full_bull & (ema_trend == 1)
+    ema_full_bear = ~ema_full_bull & ~ema_part_bull & (ema_trend <= -2)
+    ema_part_bear = ~ema_full_bull & ~ema_part_bull & ~ema_full_bear & (ema_trend == -1)
+    score_up = score_up + np.where(ema_full_bull, 0.18, np.where(ema_part_bull, 0.08, 0.0))
+    score_down = score_down + np.where(ema_full_bear, 0.18, np.where(ema_part_bear, 0.08, 0.0))
+    flag(ema_full_bull, REASON_EMA_FULL_BULL)
+    flag(ema_part_bull, REASON_EMA_PART_BULL)
+    flag(ema_full_bear, REASON_EMA_FULL_BEAR)
+    flag(ema_part_bear, REASON_EMA_PART_BEAR)
+
+    above_ema9 = close > ema9
+    add(above_ema9, 0.05, ~above_ema9, 0.05)
+
+    # ── 4) Bollinger Bands ─────────────────────────────────────────
+    bb_low = bb_pct_b < 0.10
+    bb_lowish = ~bb_low & (bb_pct_b < 0.25)
+    bb_high = ~bb_low & ~bb_lowish & (bb_pct_b > 0.90)
+    bb_highish = ~bb_low & ~bb_lowish & ~bb_high & (bb_pct_b > 0.75)
+    score_up = score_up + np.where(bb_low, 0.14, np.where(bb_lowish, 0.06, 0.0))
+    score_down = score_down + np.where(bb_high, 0.14, np.where(bb_highish, 0.06, 0.0))
+    flag(bb_low, REASON_BB_NEAR_LOWER)
+    flag(bb_high, REASON_BB_NEAR_UPPER)
+
+    squeeze = (bb_width > prev_bb_width * 1.2) & (bb_width < 0.015)
+    add(squeeze & (bb_pct_b > 0.5), 0.10, squeeze, 0.10, REASON_BB_SQUEEZE_UP, REASON_BB_SQUEEZE_DOWN)
+
+    # ── 5) Stochastic Oscillator ───────────────────────────────────
+    add(stoch_k < 20, 0.10, stoch_k > 80, 0.10, REASON_STOCH_OVERSOLD, REASON_STOCH_OVERBOUGHT)
+    add(
+        (stoch_k > stoch_d) & (prev_stoch_k <= prev_stoch_d) & (stoch_k < 50), 0.08,
+        (stoch_k < stoch_d) & (prev_stoch_k >= prev_stoch_d) & (stoch_k > 50), 0.08,
+        REASON_STOCH_BULL_CROSS, REASON_STOCH_BEAR_CROSS,
+    )
+
+    # ── 6) ADX Trend Strength (filter / amplifier) ─────────────────
+    adx_mult = np.select(
+        [adx_val > 35, adx_val > 25, adx_val < 15],
+        [1.25, 1.10, 0.85],
+        default=1.0,
+    )
+    flag(adx_val > 35, REASON_ADX_VERY_STRONG)
+    flag(~(adx_val > 35) & (adx_val > 25), REASON_ADX_STRONG)
+
+    # ── 7) Volume Confirmation ─────────────────────────────────────
+    vol_spike = vol_ratio > 1.5
+    flag(vol_spike, REASON_VOLUME_SPIKE)
+    add(
+        vol_spike & ((ema_trend > 0) | (macd_hist > 0)), 0.06,
+        vol_spike & ((ema_trend < 0) | (macd_hist < 0)), 0.06,
+    )
+
+    # ── 8) Candlestick Patterns ────────────────────────────────────
+    score_up = score_up + np.where(bullish_engulf, 0.14, 0.0)
+    score_down = score_down + np.where(bearish_engulf, 0.14, 0.0)
+    score_up = score_up + np.where(hammer, 0.10, 0.0)
+    score_down = score_down + np.where(shooting_star, 0.10, 0.0)
+    flag(bullish_engulf, REASON_BULLISH_ENGULF)
+    flag(bearish_engulf, REASON_BEARISH_ENGULF)
+    flag(hammer, REASON_HAMMER)
+    flag(shooting_star, REASON_SHOOTING_STAR)
+
+    # ── Apply ADX multiplier to directional bias ───────────────────
+    dominant = np.maximum(score_up, score_down) > 0
+    up_wins = score_up > score_down
+    up_bias = 0.5 + (score_up - score_down) * 0.5 * adx_mult
+    down_bias = 0.5 + (score_down - score_up) * 0.5 * adx_mult
+    new_up = np.where(up_wins, up_bias, 1.0 - down_bias)
+    new_down = np.where(up_wins, 1.0 - up_bias, down_bias)
+    score_up = np.where(dominant, new_up, score_up)
+    score_down = np.where(dominant, new_down, score_down)
+
+    total = score_up + score_down + 1e-9
+    prob_up = np.where(
+        score_up > score_down,
+        0.5 + ((score_up - score_down) / total) * 0.45,
+        np.where(
+            score_down > score_up,
+            0.5 - ((score_down - score_up) / total) * 0.45,
+            0.5,
+        ),
+    )
+
+    # Normalize
+    prob_up = np.minimum(0.95, np.maximum(0.05, prob_up))
+    prob_down = 1.0 - prob_up
+
+    result = {
+        "prob_up": prob_up,
+        "prob_down": prob_down,
+    }
+    if with_reasons:
+        result["reason_mask"] = reason_mask
+    return result
+
+
+def decode_reasons(mask: int, row=None) -> List[str]:
+    """
+    แปลง reason_mask ของ 1 แถวกลับเป็น list ข้อความแบบเดียวกับ
+    compute_rule_based_prob()["reasons"] (row = แถวของ df ใช้ format ค่าตัวเลข)
+    """
+    mask = int(mask)
+    reasons = []
+    for bit, text, col in _REASON_TEXT:
+        if not mask & bit:
+            continue
+        if col is None:
+            reasons.append(text)
+        else:
+            value = row.get(col, _REASON_DEFAULTS[col]) if row is not None else _REASON_DEFAULTS[col]
+            reasons.append(text.format(float(value)))
+    return reasons
@@ -1,6 +1,11 @@
 import functools
+import threading
 import traceback
 
+# MetaTrader5 package ไม่รับประกันว่าเรียกพร้อมกันหลาย thread ได้
+# → ทุกการเรียก mt5.* ที่อาจมาจากหลาย worker (หลาย pair / dashboard) ให้ถือ lock นี้
+MT5_LOCK = threading.RLock()
+
 
 def safe_call(default=None):
     """
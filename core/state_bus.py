@@ -0,0 +1,76 @@
+# core/state_bus.py
+"""
+In-process state bus ระหว่าง main_loop (publisher) กับ dashboard (subscriber)
+
+- publish(): serialize state เป็น JSON ครั้งเดียว เก็บไว้ในหน่วยความจำ แล้วแจ้ง subscriber ทุกตัว
+- dashboard ส่ง payload ที่ serialize แล้วนี้ให้ WebSocket ทุก client โดยไม่ต้อง parse ใหม่
+- ไฟล์ last_state.json ยังเขียนอยู่ (แบบ atomic: tmp + os.replace) เป็น fallback
+  สำหรับกรณีรัน dashboard แยก process (uvicorn dashboard.server:app)
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# key ของ pair หลัก (last_state.json)
+PRIMARY = ""
+
+
+def atomic_write_text(path: str, text: str) -> None:
+    """เขียนไฟล์แบบ atomic — reader เห็นไฟล์เก่าหรือไฟล์ใหม่ทั้งก้อน ไม่เห็น JSON ขาดครึ่ง"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class StateBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        # pair_key → (version, state dict, JSON payload)
+        self._states: Dict[str, Tuple[int, Dict[str, Any], str]] = {}
+        self._subscribers: List[Callable[[str, int], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def publish(self, state: Dict[str, Any], pair_key: Optional[str] = None) -> str:
+        """เก็บ state ล่าสุดของ pair แล้วแจ้ง subscriber — คืน JSON payload ที่ serialize แล้ว"""
+        key = pair_key or PRIMARY
+        payload = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._version += 1
+            version = self._version
+            self._states[key] = (version, state, payload)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(key, version)
+            except Exception as e:
+                print("[STATE_BUS] subscriber error:", e)
+        return payload
+
+    def get(self, pair_key: Optional[str] = None) -> Optional[Tuple[int, Dict[str, Any], str]]:
+        with self._lock:
+            return self._states.get(pair_key or PRIMARY)
+
+    def all_states(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: item[1] for key, item in self._states.items() if key != PRIMARY}
+
+    def subscribe(self, callback: Callable[[str, int], None]) -> None:
+        """callback(pair_key, version) ถูกเรียกจาก thread ของ publisher — ต้องสั้นและไม่ block"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, int], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+
+state_bus = StateBus()
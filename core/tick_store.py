@@ -0,0 +1,145 @@
+# core/tick_store.py
+"""
+Tick store แบบ memmap สำหรับ backtest / โบรกจำลอง
+
+เก็บ tick เป็นไฟล์ binary ของ numpy structured records (time, bid, ask) เรียงตามเวลา
+- time = epoch seconds แบบทศนิยม (ms อยู่หลังจุด) เวลาของโบรกแบบเดียวกับแท่งใน bar store
+- CSV (time, bid, ask หรือ time_msc, bid, ask แบบที่ export จาก MT5) ถูกแปลงเป็น <csv>.ticks ครั้งเดียว
+  อ่านทีละ chunk → แปลง tick ทั้งปีได้โดยไม่ต้องโหลดเข้า RAM ทั้งก้อน
+- ค้นหาช่วงเวลาผ่าน index แบบหยาบ (เวลาของ tick ทุก ๆ BLOCK ตัว) แล้วอ่านแค่ block เดียวจาก memmap
+  → np.searchsorted บน field ของ memmap จะ copy ทั้ง column (หลายร้อย MB) ทุกครั้ง จึงไม่ใช้ตรง ๆ
+"""
+
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+TICK_DTYPE = np.dtype([("time", "<f8"), ("bid", "<f8"), ("ask", "<f8")])
+
+# จำนวน tick ต่อ block ของ index (อ่านจาก disk ครั้งละ ~1.5MB)
+BLOCK = 65536
+CSV_CHUNK_ROWS = 1_000_000
+
+
+def frame_to_ticks(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame (time | time_msc, bid, ask) → TICK_DTYPE เรียงตามเวลา"""
+    cols = {c.lower(): c for c in df.columns}
+    out = np.empty(len(df), dtype=TICK_DTYPE)
+    if "time_msc" in cols:
+        out["time"] = df[cols["time_msc"]].to_numpy(dtype=np.float64) / 1000.0
+    else:
+        t = df[cols["time"]]
+        if pd.api.types.is_numeric_dtype(t):
+            out["time"] = t.to_numpy(dtype=np.float64)
+        else:
+            out["time"] = pd.to_datetime(t).to_numpy().astype("datetime64[ms]").astype(np.int64) / 1000.0
+    out["bid"] = df[cols["bid"]].to_numpy(dtype=np.float64)
+    out["ask"] = df[cols["ask"]].to_numpy(dtype=np.float64)
+    out.sort(order="time", kind="stable")
+    return out
+
+
+def convert_csv(csv_path: str, out_path: Optional[str] = None, chunk_rows: int = CSV_CHUNK_ROWS) -> str:
+    """
+    แปลง CSV → ไฟล์ .ticks ทีละ chunk (ใช้ RAM ~chunk_rows แถว)
+    CSV ต้องเรียงตามเวลาอยู่แล้ว (แบบที่ export จาก MT5) — ถ้าย้อนเวลาข้าม chunk → ValueError
+    """
+    out_path = out_path or csv_path + ".ticks"
+    tmp_path = out_path + ".tmp"
+    last_time = -np.inf
+    count = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+                ticks = frame_to_ticks(chunk)
+                if len(ticks) == 0:
+                    continue
+                if ticks["time"][0] < last_time:
+                    raise ValueError(f"[TICKS] {csv_path}: tick ไม่เรียงตามเวลา (แถวที่ ~{count})")
+                f.write(ticks.tobytes())
+                last_time = float(ticks["time"][-1])
+                count += len(ticks)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"[TICKS] {csv_path} → {out_path} ({count:,} ticks)")
+    return out_path
+
+
+class TickStore:
+    """ไฟล์ .ticks 1 ไฟล์ (memmap อ่านอย่างเดียว)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        size = os.path.getsize(path)
+        count = size // TICK_DTYPE.itemsize
+        if count:
+            self._mm = np.memmap(path, dtype=TICK_DTYPE, mode="r", shape=(count,))
+            # index หยาบ: เวลาของ tick ตัวแรกในแต่ละ block (copy แค่ count / BLOCK ค่า)
+            self._index = np.array(self._mm["time"][::BLOCK])
+        else:
+            self._mm = np.empty(0, dtype=TICK_DTYPE)
+            self._index = np.empty(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self._mm)
+
+    def first_time(self) -> Optional[float]:
+        return float(self._mm["time"][0]) if len(self._mm) else None
+
+    def last_time(self) -> Optional[float]:
+        return float(self._mm["time"][-1]) if len(self._mm) else None
+
+    def _locate(self, t: float, side: str) -> int:
+        """= np.searchsorted(time, t, side) แต่อ่านจาก disk แค่ 1 block"""
+        if len(self._mm) == 0:
+            return 0
+        b = max(int(np.searchsorted(self._index, t, side=side)) - 1, 0)
+        lo = b * BLOCK
+        seg = np.array(self._mm["time"][lo : lo + BLOCK])
+        return lo + int(np.searchsorted(seg, t, side=side))
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        """tick ที่ start <= time < end (copy ออกจาก memmap)"""
+        lo = self._locate(start, "left")
+        hi = self._locate(end, "left")
+        return np.array(self._mm[lo:hi]) if hi > lo else np.empty(0, dtype=TICK_DTYPE)
+
+    def iter_chunks(
+        self, start: Optional[float] = None, end: Optional[float] = None, chunk: int = BLOCK
+    ) -> Iterator[np.ndarray]:
+        """วน tick ช่วง [start, end) ทีละ chunk"""
+        lo = self._locate(start, "left") if start is not None else 0
+        hi = self._locate(end, "left") if end is not None else len(self._mm)
+        for i in range(lo, hi, chunk):
+            yield np.array(self._mm[i : min(i + chunk, hi)])
+
+    def read(self) -> np.ndarray:
+        """memmap ทั้งไฟล์ (ไม่ copy)"""
+        return self._mm
+
+
+_STORES: Dict[str, TickStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def open_ticks(source: str) -> TickStore:
+    """
+    source: ไฟล์ .ticks หรือ CSV (แปลงเป็น <csv>.ticks ให้ครั้งแรก / เมื่อ CSV ใหม่กว่า)
+    """
+    path = source
+    if not source.endswith(".ticks"):
+        path = source + ".ticks"
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+            convert_csv(source, path)
+    key = os.path.abspath(path)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None or len(store) != os.path.getsize(path) // TICK_DTYPE.itemsize:
+            store = TickStore(path)
+            _STORES[key] = store
+        return store
@@ -1,17 +1,402 @@
 # core/trade_logger.py
+"""
+Trade journal: บันทึกทุกไม้ที่ fill (append-only JSONL) + index ในหน่วยความจำ
 
+- open  : ผล filled จาก core.order_gateway → context ของสัญญาณ, request, ราคาที่ขอ / ราคาที่ได้,
+          slippage (points, + = เสียเปรียบ), latency
+- close : reconcile กับ deal history ของ MT5 (history_deals_get) ใน background
+          → ราคาออก (เฉลี่ยถ่วง volume ของ deal ปิดทุกตัว รวม partial), กำไรสุทธิ, realized R, เหตุผลที่ปิด
+- partial: position manager ปิดบางส่วนสำเร็จ (retcode DONE) → ไม้นั้นได้ "partial" = volume ที่ปิด
+           (restart แล้วไม่ปิดบางส่วนซ้ำ)
+- ไฟล์เป็น event ต่อบรรทัด ({"event": "open" | "partial" | "close", ...}) → เขียนต่อท้ายอย่างเดียว ไม่ rewrite
+  ทุกครั้งที่ใช้งานอ่านต่อจาก byte ที่อ่านไปแล้ว (tail) เพื่อสร้าง index (ticket / symbol / เวลา) + ตัวนับสะสม
+  → event ที่ process อื่นเขียน (ออเดอร์จาก dashboard) อยู่ใน index ก่อน reconcile / query เสมอ
+  event ซ้ำ (บรรทัดที่ process นี้เขียนเองแล้วอ่านกลับ) apply ซ้ำได้ไม่เปลี่ยนผล
+- เวลาทุกตัว (open_time / exit_time / duration_sec / partial) เป็นนาฬิกาโบรกชุดเดียวกับ deal.time
+  → open_time = เวลาของ order_gateway (get_broker().time()) + get_broker().server_offset()
+- stats() อ่านจากตัวนับสะสม → O(1) ไม่ต้องสแกน log
+
+R = กำไรสุทธิ / เงินที่เสี่ยงตอนเปิด (|entry - SL| / TICK_SIZE * TICK_VALUE * volume) — ไม่มี SL = ไม่มี R
+"""
+
+import bisect
 import json
 import os
+import threading
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional
 
-LOG_PATH = "logs/trades_log.jsonl"
+from .broker import get_broker, mt5
+from .config import settings
+from .stability import MT5_LOCK
+
+LOG_PATH = settings.TRADE_JOURNAL_PATH
 
 
 def log_trade(record: Dict[str, Any]):
-    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    """เขียน record อิสระต่อท้าย journal (replay ข้ามบรรทัดที่ไม่มี "event")"""
+    os.makedirs(os.path.dirname(LOG_PATH) or ".", exist_ok=True)
     record = dict(record)
     if "time" not in record:
         record["time"] = datetime.now(timezone.utc).isoformat()
     with open(LOG_PATH, "a", encoding="utf-8") as f:
         f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _new_totals() -> Dict[str, float]:
+    """ตัวนับสะสมของไม้ที่ปิดแล้ว (win_r_n / loss_r_n = จำนวนไม้ที่มี R)"""
+    return {
+        "closed": 0,
+        "wins": 0,
+        "losses": 0,
+        "win_r_n": 0,
+        "loss_r_n": 0,
+        "sum_win_r": 0.0,
+        "sum_loss_r": 0.0,
+        "profit": 0.0,
+    }
+
+
+class TradeJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._trades: Dict[int, Dict[str, Any]] = {}
+        self._by_symbol: Dict[str, List[int]] = {}
+        # index เวลาเปิด (เรียงเสมอ) คู่กับ ticket
+        self._times: List[float] = []
+        self._time_tickets: List[int] = []
+        self._open: set = set()
+        self._totals: Dict[Optional[str], Dict[str, float]] = {None: _new_totals()}
+        # ticket → {เวลา partial: volume} (key ด้วยเวลา → อ่าน event เดิมซ้ำไม่นับเพิ่ม)
+        self._partials: Dict[int, Dict[float, float]] = {}
+        self._offset = 0  # byte ของไฟล์ที่อ่านแล้ว
+        self._last_reconcile: Optional[float] = None
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+
+    # ── storage ───────────────────────────────────────────────────────
+    def _sync(self) -> None:
+        """
+        (ถือ self._lock อยู่) อ่านบรรทัดที่ต่อท้ายไฟล์ตั้งแต่ครั้งก่อน (ครั้งแรก = ทั้งไฟล์)
+        บรรทัดที่ยังเขียนไม่จบรออ่านรอบหน้า / ไฟล์เล็กลง (ถูกหมุน) = อ่านใหม่ตั้งแต่ต้น
+        ไม้ที่ปิดจาก event ของ process อื่น → แจ้ง subscriber
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self._offset:
+            self._offset = 0
+        if size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            event = record.pop("event", None)
+            if event == "open":
+                self._index_open(record)
+            elif event == "partial":
+                self._apply_partial(record)
+            elif event == "close":
+                trade = self._apply_close(record)
+                if trade is not None:
+                    self._emit(trade)
+
+    def _append(self, event: str, record: Dict[str, Any]) -> None:
+        """(ถือ self._lock อยู่) 1 บรรทัดต่อ event — flush ทันที (ไม้ไม่ได้เกิดถี่ แต่หายไม่ได้)"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"event": event, **record}, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def _index_open(self, trade: Dict[str, Any]) -> None:
+        ticket = int(trade["ticket"])
+        if ticket in self._trades:
+            return
+        trade.setdefault("status", "open")
+        self._trades[ticket] = trade
+        self._by_symbol.setdefault(trade["symbol"].upper(), []).append(ticket)
+        i = bisect.bisect_right(self._times, trade["open_time"])
+        self._times.insert(i, trade["open_time"])
+        self._time_tickets.insert(i, ticket)
+        self._open.add(ticket)
+
+    def _apply_partial(self, partial: Dict[str, Any]) -> None:
+        ticket = int(partial["ticket"])
+        trade = self._trades.get(ticket)
+        if trade is None:
+            return
+        done = self._partials.setdefault(ticket, {})
+        done[float(partial["time"])] = float(partial["volume"])
+        trade["partial"] = round(sum(done.values()), 8)
+
+    def _apply_close(self, close: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        trade = self._trades.get(int(close["ticket"]))
+        if trade is None or trade["status"] == "closed":
+            return None
+        trade.update(close)
+        trade["status"] = "closed"
+        self._open.discard(trade["ticket"])
+        for key in (None, trade["symbol"].upper()):
+            totals = self._totals.setdefault(key, _new_totals())
+            totals["closed"] += 1
+            totals["profit"] += trade["profit"]
+            if trade["profit"] > 0:
+                totals["wins"] += 1
+            else:
+                totals["losses"] += 1
+            r = trade.get("r")
+            if r is not None and r > 0:
+                totals["win_r_n"] += 1
+                totals["sum_win_r"] += r
+            elif r is not None:
+                totals["loss_r_n"] += 1
+                totals["sum_loss_r"] += -r
+        return trade
+
+    # ── open ──────────────────────────────────────────────────────────
+    def record_fill(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """event ที่ filled จาก order_gateway → บันทึกไม้ใหม่ (ticket = position id = order ticket)"""
+        result = event.get("result") or {}
+        ticket = result.get("order") or result.get("deal")
+        if not ticket:
+            return None
+        side = event["side"]
+        price = float(event.get("price") or 0.0)
+        requested = event.get("requested_price")
+        slippage = None
+        if requested and price:
+            diff = price - requested if side == "BUY" else requested - price
+            slippage = round(diff / settings.TICK_SIZE, 2)
+        trade = {
+            "ticket": int(ticket),
+            "order_id": event.get("id"),
+            "source": event.get("source"),
+            "symbol": event["symbol"],
+            "side": side,
+            "volume": float(result.get("volume") or event["volume"]),
+            "sl": event.get("sl"),
+            "tp": event.get("tp"),
+            "comment": event.get("comment"),
+            "open_time": float(event["time"]) + get_broker().server_offset(),
+            "requested_price": requested,
+            "entry_price": price,
+            "slippage_points": slippage,
+            "latency_ms": event.get("latency_ms"),
+            "context": event.get("context"),
+            "request": event.get("request"),
+        }
+        with self._lock:
+            self._sync()
+            if int(ticket) in self._trades:
+                return self._trades[int(ticket)]
+            self._append("open", trade)
+            self._index_open(dict(trade))
+        return trade
+
+    def record_partial(self, ticket: int, volume: float, when: float) -> None:
+        """
+        position manager ปิดบางส่วนสำเร็จ (ไม้ที่ไม่อยู่ใน journal ก็บันทึก — replay ข้ามเอง)
+        when = get_broker().server_time() (เวลาเดียวกับ open_time)
+        """
+        record = {"ticket": int(ticket), "volume": float(volume), "time": float(when)}
+        with self._lock:
+            self._sync()
+            self._append("partial", record)
+            self._apply_partial(record)
+
+    # ── reconcile ─────────────────────────────────────────────────────
+    def poll(self) -> None:
+        """
+        เรียกจาก loop ได้ทุกรอบ — reconcile ไม่เกิน 1 ครั้งต่อ TRADE_JOURNAL_RECONCILE_SEC (นาฬิกาของ backend)
+        MT5 จริง = ปลุก worker thread / โบรกจำลอง = ทำทันทีใน thread ของผู้เรียก (นาฬิกาเดินตาม loop)
+        """
+        now = get_broker().time()
+        if self._last_reconcile is not None and now - self._last_reconcile < settings.TRADE_JOURNAL_RECONCILE_SEC:
+            return
+        self._last_reconcile = now
+        if getattr(get_broker(), "simulated", False):
+            self.reconcile()
+            return
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="trade-journal", daemon=True)
+            self._worker.start()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.reconcile()
+            except Exception as e:
+                print("[JOURNAL] reconcile error:", e)
+
+    def reconcile(self) -> int:
+        """
+        ดึง deal history ครั้งเดียว (ตั้งแต่ไม้ที่เปิดนานสุด) แล้วปิดไม้ใน journal ที่ deal ปิดครบ volume แล้ว
+        (อ่าน event ใหม่ในไฟล์ก่อน → ไม้ที่ dashboard เปิดก็ถูก reconcile) คืนจำนวนไม้ที่ปิดในรอบนี้
+        """
+        with self._lock:
+            self._sync()
+            pending = {t: dict(self._trades[t]) for t in self._open}
+        if not pending:
+            return 0
+
+        start = min(t["open_time"] for t in pending.values()) - 60
+        with MT5_LOCK:
+            deals = mt5.history_deals_get(
+                datetime.fromtimestamp(start, timezone.utc),
+                datetime.fromtimestamp(get_broker().server_time() + 86400, timezone.utc),
+            )
+        by_position: Dict[int, List[Any]] = {}
+        for d in deals or ():
+            if d.position_id in pending:
+                by_position.setdefault(d.position_id, []).append(d)
+
+        closes = []
+        for ticket, trade in pending.items():
+            group = by_position.get(ticket)
+            if not group:
+                continue
+            outs = [d for d in group if d.entry != mt5.DEAL_ENTRY_IN]
+            ins = [d for d in group if d.entry == mt5.DEAL_ENTRY_IN]
+            opened = sum(d.volume for d in ins) or trade["volume"]
+            closed_volume = sum(d.volume for d in outs)
+            if not outs or closed_volume < opened - 1e-9:
+                continue
+            closes.append(self._close_record(trade, ins, outs, closed_volume))
+
+        if closes:
+            with self._lock:
+                for close in closes:
+                    self._append("close", close)
+                    trade = self._apply_close(close)
+                    if trade is not None:
+                        self._emit(trade)
+        return len(closes)
+
+    # ── subscribers ───────────────────────────────────────────────────
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None], replay: bool = True) -> None:
+        """
+        callback(trade) ทุกครั้งที่ไม้ปิด (เรียกขณะถือ lock ของ journal — ต้องสั้น ห้ามเรียก journal กลับ)
+        replay=True = ส่งไม้ที่ปิดไปแล้วทั้งหมดก่อน (เรียงตามเวลาปิด) → ผู้ฟังได้สถานะครบโดยไม่ตกหล่น
+        """
+        with self._lock:
+            self._sync()
+            if replay:
+                closed = [t for t in self._trades.values() if t["status"] == "closed"]
+                for trade in sorted(closed, key=lambda t: t["exit_time"]):
+                    callback(dict(trade))
+            self._subscribers.append(callback)
+
+    def _emit(self, trade: Dict[str, Any]) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(dict(trade))
+            except Exception as e:
+                print("[JOURNAL] subscriber error:", e)
+
+    @staticmethod
+    def _close_record(trade: Dict[str, Any], ins: List[Any], outs: List[Any], closed_volume: float) -> Dict[str, Any]:
+        entry = float(ins[0].price) if ins else trade["entry_price"]
+        profit = sum(d.profit + getattr(d, "commission", 0.0) + getattr(d, "swap", 0.0) for d in outs + ins)
+        last = max(outs, key=lambda d: d.time)
+        r = None
+        if trade.get("sl"):
+            risk = abs(entry - trade["sl"]) / settings.TICK_SIZE * settings.TICK_VALUE * trade["volume"]
+            if risk > 0:
+                r = round(profit / risk, 4)
+        return {
+            "ticket": trade["ticket"],
+            "entry_price": entry,
+            "exit_price": round(sum(d.price * d.volume for d in outs) / closed_volume, 5),
+            "exit_time": float(last.time),
+            "exit_reason": int(last.reason),
+            "exit_deals": len(outs),
+            "duration_sec": round(float(last.time) - trade["open_time"], 1),
+            "profit": round(profit, 2),
+            "r": r,
+        }
+
+    # ── queries ───────────────────────────────────────────────────────
+    def get(self, ticket: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            trade = self._trades.get(int(ticket))
+            return dict(trade) if trade else None
+
+    def trades(
+        self,
+        symbol: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        status: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """ไม้ตามเวลาเปิด (เก่า → ใหม่) — since / until = epoch ของเวลาโบรก, limit = เอาท้ายสุด N ไม้"""
+        with self._lock:
+            self._sync()
+            lo = bisect.bisect_left(self._times, since) if since is not None else 0
+            hi = bisect.bisect_left(self._times, until) if until is not None else len(self._times)
+            out = []
+            for ticket in reversed(self._time_tickets[lo:hi]):
+                trade = self._trades[ticket]
+                if symbol and trade["symbol"].upper() != symbol.upper():
+                    continue
+                if status and trade["status"] != status:
+                    continue
+                out.append(dict(trade))
+                if limit and len(out) >= limit:
+                    break
+            return out[::-1]
+
+    def stats(self, symbol: Optional[str] = None) -> Dict[str, Any]:
+        """win rate / expectancy (R) / avg RR จากตัวนับสะสม — ทั้งพอร์ตหรือราย symbol"""
+        with self._lock:
+            self._sync()
+            totals = dict(self._totals.get(symbol.upper() if symbol else None) or _new_totals())
+            open_count = len(self._open) if not symbol else sum(
+                1 for t in self._by_symbol.get(symbol.upper(), ()) if t in self._open
+            )
+        closed, wins, losses = totals["closed"], totals["wins"], totals["losses"]
+        r_count = totals["win_r_n"] + totals["loss_r_n"]
+        avg_win_r = totals["sum_win_r"] / totals["win_r_n"] if totals["win_r_n"] else None
+        avg_loss_r = totals["sum_loss_r"] / totals["loss_r_n"] if totals["loss_r_n"] else None
+        return {
+            "symbol": symbol,
+            "closed": closed,
+            "open": open_count,
+            "wins": wins,
+            "losses": losses,
+            "win_rate": round(wins / closed, 4) if closed else None,
+            "avg_win_r": round(avg_win_r, 4) if avg_win_r is not None else None,
+            "avg_loss_r": round(avg_loss_r, 4) if avg_loss_r is not None else None,
+            "avg_rr": round(avg_win_r / avg_loss_r, 4) if avg_win_r and avg_loss_r else None,
+            "expectancy_r": (
+                round((totals["sum_win_r"] - totals["sum_loss_r"]) / r_count, 4) if r_count else None
+            ),
+            "net_profit": round(totals["profit"], 2),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+trade_journal = TradeJournal(LOG_PATH)
@@ -3,6 +3,10 @@
 Shared trading utility functions used by both main.py and dashboard/server.py.
 """
 
+from typing import Dict, List, Optional
+
+from .ai_profile import lookup_rr
+
 
 def compute_sl_tp_by_ai(
     entry_price: float,
@@ -12,6 +16,7 @@ def compute_sl_tp_by_ai(
     confidence: float,
     bb_width: float = 0.0,
     adx: float = 0.0,
+    rr_matrix: Optional[Dict[str, List[List[float]]]] = None,
 ) -> "tuple[float, float]":
     """
     ให้ AI ช่วยคิด SL/TP จาก ATR + regime + confidence + BB width + ADX
@@ -23,37 +28,17 @@ def compute_sl_tp_by_ai(
     - volatile → RR 1:1.5 + SL กว้างขึ้น (ป้องกัน whipsaw)
     - sideways → RR 1:1.4 + SL แคบ (ตลาดกรอบ)
 
+    ค่า matrix อยู่ใน core/ai_profile.py (ปรับได้ด้วย profile จาก scripts/optimize.py)
+    rr_matrix: override matrix (ใช้ตอน optimize) — None = matrix ของ profile ปัจจุบัน
+
     side: "BUY" / "SELL"
     return: (sl_price, tp_price)
     """
     atr = max(float(atr), 0.01)
     confidence = max(0.0, min(1.0, float(confidence)))
 
-    # ── Base SL multiplier ────────────────────────────────────────────
-    if regime == "volatile":
-        # ตลาด volatile → SL กว้างขึ้นป้องกันถูก stop ก่อนเวลา
-        atr_mult_sl = 2.2
-        rr = 1.5
-    elif regime == "trending":
-        if confidence > 0.7:
-            atr_mult_sl = 1.8
-            rr = 2.5
-        elif confidence > 0.5:
-            atr_mult_sl = 1.6
-            rr = 2.0
-        else:
-            atr_mult_sl = 1.4
-            rr = 1.8
-    elif regime == "reversal":
-        if confidence > 0.65:
-            atr_mult_sl = 1.5
-            rr = 2.0
-        else:
-            atr_mult_sl = 1.3
-            rr = 1.6
-    else:  # sideways / unknown
-        atr_mult_sl = 1.2
-        rr = 1.4
+    # ── Base SL multiplier + RR จาก matrix ของ AI profile ─────────────
+    atr_mult_sl, rr = lookup_rr(regime, confidence, rr_matrix)
 
     # ── ADX boost: ADX สูง → เทรนด์แข็ง → TP ไกลขึ้น ─────────────────
     if adx > 35:
@@ -3,9 +3,9 @@ import json
 import os
 import glob
 import logging
-import numpy as np
-import pandas as pd
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Tuple
 
 from fastapi import FastAPI, WebSocket, Request, WebSocketDisconnect, APIRouter
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -14,8 +14,15 @@ from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
 from core.config import settings
+from core.state_bus import PRIMARY, state_bus
+from core.ai_logger import get_daily_log_path, list_ai_log_days, load_ai_logs
+from core.profiler import profiler
+from core.ai_eval import AIEvalCache
 from core.data_feed import init_mt5
-from core.mt5_trader import execute_order
+from core.order_gateway import order_gateway
+from core.equity_tracker import equity_tracker
+from core.performance import performance
+from core.trade_logger import trade_journal
 from core.discord_notifier import notify_trade
 from core.trade_utils import compute_sl_tp_by_ai
 
@@ -32,8 +39,7 @@ async def index(request: Request):
     return templates.TemplateResponse("index_v5.html", {"request": request})
 
 
-def load_last_state() -> Dict[str, Any]:
-    path = settings.AI_LAST_STATE_PATH
+def _read_state_file(path: str) -> Dict[str, Any]:
     if not os.path.exists(path):
         return {}
     try:
@@ -43,42 +49,206 @@ def load_last_state() -> Dict[str, Any]:
         return {}
 
 
-# @app.websocket("/ws")
-# async def websocket_endpoint(ws: WebSocket):
-#     await ws.accept()
-#     try:
-#         while True:
-#             state = load_last_state()
-#             await ws.send_json(state)
-#             await asyncio.sleep(settings.DASHBOARD_REFRESH_SEC)  # หรือจะเปลี่ยนเป็น settings.DASHBOARD_REFRESH_SEC ก็ได้ ถ้าไปเพิ่มใน config แล้ว
-#     except Exception:
-#         await ws.close()
+def load_last_state() -> Dict[str, Any]:
+    # รันใน process เดียวกับ main_loop (run_all.py) → อ่านจาก state bus ไม่ต้องแตะ disk
+    item = state_bus.get()
+    if item is not None:
+        return item[1]
+    return _read_state_file(settings.AI_LAST_STATE_PATH)
+
+
+def load_pair_states() -> Dict[str, Dict[str, Any]]:
+    """last_state ของทุก pair (โหมด TRADING_PAIRS) → {"XAUUSDm_M1": {...}, ...}"""
+    states = state_bus.all_states()
+    if states:
+        return states
+    base, ext = os.path.splitext(settings.AI_LAST_STATE_PATH)
+    for path in sorted(glob.glob(f"{base}_*{ext}")):
+        key = os.path.basename(path)[len(os.path.basename(base)) + 1 : -len(ext) or None]
+        state = _read_state_file(path)
+        if state:
+            states[key] = state
+    return states
+
+
+@app.get("/api/pairs")
+async def api_pairs():
+    return JSONResponse({"pairs": load_pair_states()})
+
+
+def _latest_perf_from_log() -> Optional[Dict[str, Any]]:
+    """dashboard แยก process: ใช้ perf record ล่าสุดที่ main.py เขียนลง AI log แทน"""
+    days = list_ai_log_days()
+    if not days:
+        return None
+    df = load_ai_logs(days=days[-1:], where={"record": "perf"})
+    if df.empty:
+        return None
+    row = df.iloc[-1]
+    stages: Dict[str, Dict[str, Any]] = {}
+    for key, value in row.items():
+        parts = str(key).split(".")
+        if len(parts) == 3 and parts[0] == "perf" and value == value:  # ข้าม NaN
+            stages.setdefault(parts[1], {})[parts[2]] = value.item() if hasattr(value, "item") else value
+    return {"time": str(row["time"]), "stages": stages}
+
+
+@app.get("/api/perf")
+async def api_perf():
+    """p50 / p90 / p99 / max (ms) ของแต่ละ stage ใน loop เทรด"""
+    stages = profiler.snapshot()
+    if stages:
+        return {
+            "ok": True,
+            "source": "live",
+            "uptime_sec": round(time.time() - profiler.started_at, 1),
+            "stages": stages,
+            "slowest_profiles": profiler.slowest_profiles(),
+        }
+    latest = await asyncio.to_thread(_latest_perf_from_log)
+    if latest is None:
+        return JSONResponse({"ok": False, "error": "no perf data yet"}, status_code=404)
+    return {"ok": True, "source": "ai_log", **latest}
+
+
+@app.get("/api/orders")
+async def api_orders(limit: int = 50):
+    """ผลออเดอร์ล่าสุดจาก order gateway (status / retcode / latency_ms) ของ process นี้"""
+    return {"ok": True, "orders": order_gateway.recent(max(1, min(limit, 200)))}
+
+
+@app.get("/api/trades")
+async def api_trades(symbol: Optional[str] = None, limit: int = 50):
+    """trade journal: ไม้ล่าสุด (context / slippage / ราคาออก / R) + win rate / expectancy สะสม"""
+    return {
+        "ok": True,
+        "stats": trade_journal.stats(symbol),
+        "trades": trade_journal.trades(symbol=symbol, limit=max(1, min(limit, 500))),
+    }
+
+
+@app.get("/api/performance")
+async def api_performance():
+    """rolling win rate / avg RR / expectancy ต่อ symbol / regime / AI_MODE + ค่าที่ Kelly ใช้ตอนนี้"""
+    win_rate, avg_rr = performance.kelly_inputs(settings.SYMBOL, mode=settings.AI_MODE)
+    return {
+        "ok": True,
+        "kelly": {"enabled": settings.KELLY_CRITERION_ENABLED, "win_rate": win_rate, "avg_rr": avg_rr},
+        "windows": performance.snapshot(),
+    }
+
+
+@app.get("/api/equity")
+async def api_equity(limit: int = 1440):
+    """peak / drawdown / ขาดทุนวัน-สัปดาห์ / แพ้ติดกัน / สถานะ circuit breaker + equity curve ล่าสุด"""
+    curve = equity_tracker.curve(max(1, min(limit, settings.EQUITY_RING_SIZE)))
+    return {
+        "ok": True,
+        "state": equity_tracker.snapshot(),
+        "curve": {name: curve[name].round(2).tolist() for name in curve.dtype.names},
+    }
+
+
+# ---------- WebSocket: broadcaster ตัวเดียว serialize ครั้งเดียวแล้วส่งให้ทุก client ----------
+
+WS_CLIENTS: Set[WebSocket] = set()
+_BROADCAST_TASK: Optional[asyncio.Task] = None
+_STATE_CHANGED: Optional[asyncio.Event] = None
+
+
+def _read_state_file_if_changed(last_mtime: Optional[float]) -> Tuple[Optional[str], Optional[float]]:
+    """
+    dashboard แยก process (ไม่มี state bus) → อ่านไฟล์เฉพาะตอน mtime เปลี่ยน
+    ไฟล์เขียนแบบ atomic จึงไม่เจอ JSON ขาดครึ่ง และส่งข้อความดิบได้เลยไม่ต้อง parse
+    """
+    path = settings.AI_LAST_STATE_PATH
+    try:
+        mtime = os.path.getmtime(path)
+        if mtime == last_mtime:
+            return None, last_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), mtime
+    except OSError:
+        return None, last_mtime
+
+
+async def _send_to_client(ws: WebSocket, payload: str) -> None:
+    try:
+        await ws.send_text(payload)
+    except Exception:
+        WS_CLIENTS.discard(ws)
+
+
+async def _broadcaster() -> None:
+    last_version = -1
+    last_file_mtime: Optional[float] = None
+    while True:
+        try:
+            await asyncio.wait_for(_STATE_CHANGED.wait(), timeout=settings.DASHBOARD_REFRESH_SEC)
+        except asyncio.TimeoutError:
+            pass
+        _STATE_CHANGED.clear()
+
+        item = state_bus.get()
+        if item is not None:
+            # run_all.py: payload serialize มาแล้วจาก publisher
+            if item[0] == last_version:
+                continue
+            last_version, payload = item[0], item[2]
+        else:
+            payload, last_file_mtime = _read_state_file_if_changed(last_file_mtime)
+        if payload is None or not WS_CLIENTS:
+            continue
+        await asyncio.gather(*(_send_to_client(ws, payload) for ws in list(WS_CLIENTS)))
+
+
+def _ensure_broadcaster() -> None:
+    global _BROADCAST_TASK, _STATE_CHANGED
+    if _BROADCAST_TASK is not None and not _BROADCAST_TASK.done():
+        return
+    loop = asyncio.get_running_loop()
+    _STATE_CHANGED = asyncio.Event()
+    event = _STATE_CHANGED
+
+    def _on_publish(pair_key: str, version: int) -> None:
+        # ถูกเรียกจาก thread ของ main_loop → ส่งต่อเข้า event loop แบบ thread-safe
+        if pair_key != PRIMARY:
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # event loop เดิมปิดไปแล้ว (server reload) → เลิกฟัง
+            state_bus.unsubscribe(_on_publish)
+
+    state_bus.subscribe(_on_publish)
+    _BROADCAST_TASK = loop.create_task(_broadcaster())
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
+    _ensure_broadcaster()
     try:
+        # ส่ง state ปัจจุบันให้ทันทีตอนต่อ แล้วให้ broadcaster push เมื่อมี state ใหม่
+        item = state_bus.get()
+        if item is not None:
+            await ws.send_text(item[2])
+        else:
+            await ws.send_json(load_last_state() or {})
+        WS_CLIENTS.add(ws)
         while True:
-            state = load_last_state() or {}
-            await ws.send_json(state)
-            await asyncio.sleep(settings.DASHBOARD_REFRESH_SEC)
+            # client ไม่ได้ส่งอะไรมา — รอไว้เพื่อจับตอน disconnect
+            await ws.receive_text()
     except WebSocketDisconnect:
         # ฝั่ง client ปิดเอง (refresh แท็บ / ปิดหน้า) เคสปกติ ไม่ต้องถือว่าเป็น error
-        # อยาก log ก็ตามสะดวก เช่น:
-        # print("WebSocket disconnected")
         pass
     except asyncio.CancelledError:
         # task ถูก cancel ตอน server shutdown / reload
-        # กลืน error ไปไม่ให้ traceback เด้ง
-        # ถ้าอยากให้ FastAPI จัดการต่อ สามารถ `raise` ต่อได้ แต่ส่วนใหญ่ไม่จำเป็น
-        # raise
         pass
-    except Exception as e:
-        # error จริง ๆ อย่างอื่นค่อย debug ทีหลัง
-        # print(f"Unexpected WebSocket error: {e}")
+    except Exception:
         pass
     finally:
+        WS_CLIENTS.discard(ws)
         # ปิด connection แบบ best-effort (เผื่อมันปิดไปแล้วก็ไม่ต้องสนใจ error)
         try:
             await ws.close()
@@ -86,13 +256,28 @@ async def websocket_endpoint(ws: WebSocket):
             pass
 
 
-
 # ---------- API สำหรับปุ่ม BUY / SELL / AUTO / TRAIN ----------
 
 class OrderRequest(BaseModel):
     side: str  # BUY / SELL / AUTO
 
 
+# init MT5 ครั้งเดียวต่อ process (เดิมเรียก init_mt5() ทุกครั้งที่กดปุ่ม) — ล้มเหลวแล้วลองใหม่ตอนกดครั้งถัดไป
+_MT5_READY = False
+_MT5_INIT_LOCK = threading.Lock()
+
+# รอผลจาก order gateway นานสุดกี่วินาที (ออเดอร์ยังถูกส่งต่อแม้ API timeout)
+ORDER_WAIT_SEC = 30.0
+
+
+def _ensure_mt5() -> bool:
+    global _MT5_READY
+    with _MT5_INIT_LOCK:
+        if not _MT5_READY:
+            _MT5_READY = bool(init_mt5())
+        return _MT5_READY
+
+
 @app.post("/api/order")
 async def api_order(req: OrderRequest):
     side = req.side.upper()
@@ -114,7 +299,14 @@ async def api_order(req: OrderRequest):
         return JSONResponse({"ok": False, "error": "Invalid side"}, status_code=400)
 
     # เตรียม MT5
-    init_mt5()
+    await asyncio.to_thread(_ensure_mt5)
+
+    # circuit breaker เดียวกับ loop (ขาดทุนวัน / สัปดาห์ / drawdown / แพ้ติดกัน)
+    # sample ทุกครั้ง → อ่าน EQUITY_STATE_PATH ที่ loop เขียนล่าสุด (peak / baseline / breaker ที่ทำงานแล้ว)
+    await asyncio.to_thread(equity_tracker.sample, True)
+    halt = equity_tracker.halt_reason()
+    if halt:
+        return JSONResponse({"ok": False, "error": f"circuit breaker: {halt}"}, status_code=409)
     volume = settings.MANUAL_TRADE_VOLUME
 
     # ใช้ข้อมูล AI ล่าสุดช่วยคิด SL/TP ถ้ามีพอ
@@ -134,15 +326,10 @@ async def api_order(req: OrderRequest):
             confidence=confidence,
         )
 
-    # ยิงออเดอร์จริง
-    result = await asyncio.to_thread(
-        execute_order,
-        settings.SYMBOL,
-        side,
-        volume,
-        sl_price,
-        tp_price,
-    )
+    # ยิงออเดอร์จริง (ผ่าน order gateway: order_check → worker ส่ง → event)
+    ticket = order_gateway.send(settings.SYMBOL, side, volume, sl_price, tp_price, source="dashboard")
+    event = await asyncio.to_thread(ticket.wait, ORDER_WAIT_SEC)
+    result = event if event is not None else {"status": "pending", "id": ticket.id}
 
     # ✅ แจ้งเตือน Discord เฉพาะตอนออกออเดอร์ (manual / AUTO)
     try:
@@ -179,139 +366,67 @@ async def api_train_ai():
 
 # ---------- API ประเมินความฉลาดของ AI จากไฟล์ log ----------
 
+# ผลรวมต่อวัน / stream / horizon อัปเดตเฉพาะแถวใหม่ + cache ผลต่อ (ช่วงวัน, horizons, symbol)
+EVAL_CACHE = AIEvalCache()
 
-def _load_latest_ai_log() -> tuple[pd.DataFrame, str]:
-    """
-    โหลดไฟล์ ai_log_*.jsonl ล่าสุดจากโฟลเดอร์ logs
-    """
-    base_dir = os.path.dirname(settings.AI_LOG_PATH) or "logs"
-    pattern = os.path.join(base_dir, "ai_log_*.jsonl")
-    files = sorted([p for p in glob.glob(pattern)])
-    if not files:
-        raise FileNotFoundError("No ai_log_*.jsonl found")
-
-    latest_path = files[-1]
-    rows = []
-    with open(latest_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    df = pd.DataFrame(rows)
-    if df.empty:
-        raise ValueError("latest log file is empty")
-
-    if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"])
-        df.sort_values("time", inplace=True)
-
-    # ให้แน่ใจว่ามีคอลัมน์ close
-    if "close" not in df.columns and "Close" in df.columns:
-        df["close"] = df["Close"]
-
-    return df, latest_path
-
-
-def _eval_ai_core(df: pd.DataFrame, horizon: int = 5, only_confirm: bool = False) -> Dict[str, Any]:
-    df = df.copy()
-
-    if only_confirm:
-        if "confirm_signal" not in df.columns:
-            return {
-                "samples": 0,
-                "direction_acc": None,
-                "winrate": None,
-                "avg_pnl": None,
-                "avg_win": None,
-                "avg_loss": None,
-            }
-        df = df[df["confirm_signal"]].copy()
-        if df.empty:
-            return {
-                "samples": 0,
-                "direction_acc": None,
-                "winrate": None,
-                "avg_pnl": None,
-                "avg_win": None,
-                "avg_loss": None,
-            }
-
-    df["future_close"] = df["close"].shift(-horizon)
-    df = df.dropna(subset=["future_close"])
-
-    if df.empty:
-        return {
-            "samples": 0,
-            "direction_acc": None,
-            "winrate": None,
-            "avg_pnl": None,
-            "avg_win": None,
-            "avg_loss": None,
-        }
-
-    df["future_ret"] = df["future_close"] / df["close"] - 1.0
-
-    df["pred_dir"] = np.where(df["ai_prob_up"] >= df["ai_prob_down"], 1, -1)
-    df["true_dir"] = np.sign(df["future_ret"]).replace(0, 0)
 
-    df["correct"] = df["pred_dir"] == df["true_dir"]
-    df["pnl"] = np.where(df["pred_dir"] == 1, df["future_ret"], -df["future_ret"])
+def _parse_horizons(horizon: int, horizons: Optional[str]) -> list[int]:
+    values = [horizon]
+    if horizons:
+        for item in horizons.split(","):
+            item = item.strip()
+            if item.isdigit() and int(item) > 0:
+                values.append(int(item))
+    return sorted(set(values))
 
-    total = int(len(df))
-    direction_acc = float(df["correct"].mean()) if total else None
-    winrate = float((df["pnl"] > 0).mean()) if total else None
-    avg_pnl = float(df["pnl"].mean()) if total else None
 
-    avg_win = df.loc[df["pnl"] > 0, "pnl"]
-    avg_loss = df.loc[df["pnl"] < 0, "pnl"]
+def _select_days(days: int, start: Optional[str], end: Optional[str]) -> list[str]:
+    """start / end = YYYY-MM-DD (รวมทั้งสองวัน) | ไม่ระบุ = days วันล่าสุดที่มี log"""
+    available = list_ai_log_days()
+    if start or end:
+        return [d for d in available if (not start or d >= start) and (not end or d <= end)]
+    return available[-max(days, 1):]
 
-    avg_win_val = float(avg_win.mean()) if not avg_win.empty else None
-    avg_loss_val = float(-avg_loss.mean()) if not avg_loss.empty else None
-
-    return {
-        "samples": total,
-        "direction_acc": direction_acc,
-        "winrate": winrate,
-        "avg_pnl": avg_pnl,
-        "avg_win": avg_win_val,
-        "avg_loss": avg_loss_val,
-    }
 
 @app.get("/api/eval_ai")
-async def api_eval_ai(horizon: int = 5):
+async def api_eval_ai(
+    horizon: int = 5,
+    horizons: Optional[str] = None,
+    days: int = 1,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    symbol: Optional[str] = None,
+):
     """
-    ประเมินความฉลาดของ AI จากไฟล์ ai_log_*.jsonl ล่าสุด
+    ประเมินความฉลาดของ AI จาก AI log (default = วันล่าสุด)
+    horizons="1,5,10" → คำนวณหลาย horizon ในครั้งเดียว / days, start, end → หลายวัน
     """
-    try:
-        df, latest_path = _load_latest_ai_log()
-    except FileNotFoundError as e:
+    horizon = max(horizon, 1)
+    selected = _select_days(days, start, end)
+    if not selected:
         return JSONResponse(
-            {"ok": False, "error": str(e)},
+            {"ok": False, "error": "No ai_log_* found"},
             status_code=404,
         )
-    except Exception as e:
-        return JSONResponse(
-            {"ok": False, "error": f"load log error: {e}"},
-            status_code=500,
-        )
 
+    horizon_list = _parse_horizons(horizon, horizons)
     try:
-        metrics_all = _eval_ai_core(df, horizon=horizon, only_confirm=False)
-        metrics_confirm = _eval_ai_core(df, horizon=horizon, only_confirm=True)
+        # วันที่ยังไม่เคยโหลดต้องอ่านไฟล์ → ทำใน thread ไม่ block event loop
+        result = await asyncio.to_thread(EVAL_CACHE.evaluate, selected, horizon_list, symbol)
     except Exception as e:
         return JSONResponse(
             {"ok": False, "error": f"eval error: {e}"},
             status_code=500,
         )
 
+    latest_npz = get_daily_log_path(selected[-1], "npz")
+    latest_path = latest_npz if os.path.exists(latest_npz) else get_daily_log_path(selected[-1])
     return {
         "ok": True,
         "log_file": os.path.basename(latest_path),
+        "days": selected,
         "horizon_bars": horizon,
-        "all": metrics_all,
-        "confirm": metrics_confirm,
-    }
\ No newline at end of file
+        "all": result[horizon]["all"],
+        "confirm": result[horizon]["confirm"],
+        "horizons": {str(h): result[h] for h in horizon_list},
+    }
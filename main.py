@@ -1,16 +1,28 @@
+import threading
 import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
 
 from core.config import settings
-from core.data_feed import init_mt5, get_recent_ohlc
-from core.indicators import add_all_indicators
+from core.broker import get_broker
+from core.data_feed import init_mt5, get_latest_bar_time, get_latest_tick, get_recent_ohlc
+from core.incremental_indicators import IncrementalIndicatorEngine
 from core.ai_engine import ExtremeAIEngine
 from core.ai_logger import append_ai_log, write_last_state
-from core.charting import generate_signal_chart
-from core.mt5_trader import execute_order, get_account_balance, get_open_trades_count
+from core.charting import DeferredChart
+from core.mt5_trader import get_account_balance, get_open_trades_count
+from core.order_gateway import order_gateway
+from core.equity_tracker import equity_tracker
+from core.performance import performance
+from core.position_manager import position_manager
 from core.position_sizing import calculate_position_size
-from core.trade_logger import log_trade  # ยังไม่ใช้ แต่เผื่ออนาคต
+from core.trade_logger import trade_journal
 from core.trade_utils import compute_sl_tp_by_ai
+from core.ai_profile import get_mode_thresholds
+from core.profiler import profiler
 from core.llm_advisor import LLMAdvisor
 from core.discord_notifier import (
     notify_bot_started,
@@ -22,13 +34,48 @@ from core.discord_notifier import (
 
 # เขียน log ลงไฟล์สำหรับเทรน ไม่ต้องทุก loop
 AI_LOG_INTERVAL_SEC = getattr(settings, "AI_LOG_INTERVAL_SEC", 5)
-LAST_AI_LOG_TS = 0.0
 
-# ถ้าใช้ AI Insight Panel (Rule vs LSTM + disagreement)
-STATS_AI = {
-    "total_samples": 0,
-    "disagree_samples": 0,
-}
+
+@dataclass
+class PairContext:
+    """
+    state ของ symbol / timeframe หนึ่งคู่ (แต่ละคู่วิ่งบน worker ของตัวเอง)
+    multi=True → แยก order comment / last_state file ต่อคู่
+    """
+
+    symbol: str
+    timeframe: str
+    max_open_trades: int
+    engine: ExtremeAIEngine
+    indicator_engine: IncrementalIndicatorEngine
+    multi: bool = False
+    is_primary: bool = True
+    last_ai_log_ts: float = 0.0
+    # LOOP_MODE=bar_close: เวลาเปิดของแท่งล่าสุดที่ประมวลผลแล้ว + state ล่าสุดสำหรับ intrabar update
+    last_bar_time: Optional[int] = None
+    last_state: Optional[dict] = None
+    # ถ้าใช้ AI Insight Panel (Rule vs LSTM + disagreement)
+    stats_ai: Dict[str, int] = field(
+        default_factory=lambda: {"total_samples": 0, "disagree_samples": 0}
+    )
+
+    @property
+    def label(self) -> str:
+        return f"{self.symbol} {self.timeframe}" if self.multi else self.symbol
+
+    @property
+    def state_key(self) -> Optional[str]:
+        return f"{self.symbol}_{self.timeframe}" if self.multi else None
+
+    @property
+    def order_comment(self) -> str:
+        # comment ของออเดอร์ (MT5 จำกัด 31 ตัวอักษร) — โหมดคู่เดียวใช้ comment เดิม
+        return f"ExtremeAI v4 {self.timeframe}"[:31] if self.multi else "ExtremeAI v4"
+
+    @property
+    def count_comment(self) -> Optional[str]:
+        # โหมดคู่เดียวนับไม้ตาม symbol อย่างเดียวเหมือนเดิม (รวมไม้ที่เปิดจาก dashboard)
+        return self.order_comment if self.multi else None
 
 
 def classify_zone(rsi_value: float) -> str:
@@ -52,7 +99,7 @@ def is_session_active() -> bool:
         start_str, end_str = hours_str.split("-")
         sh, sm = int(start_str.split(":")[0]), int(start_str.split(":")[1])
         eh, em = int(end_str.split(":")[0]), int(end_str.split(":")[1])
-        now_utc = datetime.now(timezone.utc)
+        now_utc = datetime.fromtimestamp(get_broker().time(), timezone.utc)
         now_min = now_utc.hour * 60 + now_utc.minute
         start_min = sh * 60 + sm
         end_min = eh * 60 + em
@@ -111,346 +158,554 @@ def count_confirm_factors(last, ai_res: dict, confirm_side: str) -> int:
     return count
 
 
-def main_loop():
-    global LAST_AI_LOG_TS
+def _notify_order_result(event: dict) -> None:
+    """ผลออเดอร์จาก order gateway (เรียกจาก worker thread) → Discord"""
+    notify_trade(
+        f"{event['side']} {event['volume']} {event['symbol']} [{event['status']}]\n"
+        f"SL={event['sl']:.2f} TP={event['tp']:.2f}\n"
+        f"Result: {event['result'] or event['error']}\n"
+        f"Latency: {event['latency_ms']}"
+    )
+
+
+def build_pair_contexts() -> List[PairContext]:
+    pairs = settings.trading_pairs()
+    multi = len(pairs) > 1
+    contexts = []
+    for i, (symbol, timeframe, max_open) in enumerate(pairs):
+        contexts.append(
+            PairContext(
+                symbol=symbol,
+                timeframe=timeframe,
+                max_open_trades=max_open,
+                engine=ExtremeAIEngine(),
+                # indicator state แบบ incremental: คำนวณเฉพาะแท่งใหม่ / แท่งที่ยังไม่ปิด
+                indicator_engine=IncrementalIndicatorEngine(max_rows=settings.LOOKBACK_BARS),
+                multi=multi,
+                is_primary=(i == 0),
+            )
+        )
+    return contexts
 
-    print("[ExtremeAI v4] starting...")
-    init_mt5()
-    notify_bot_started()
-    engine = ExtremeAIEngine()
-    llm_advisor = LLMAdvisor()
 
-    while True:
-        # ใช้ timezone-aware datetime ป้องกัน warning
-        loop_started = datetime.now(timezone.utc).isoformat()
+def run_pair_iteration(
+    ctx: PairContext,
+    llm_advisor: LLMAdvisor,
+    loop_started: str,
+    closed_before: Optional[int] = None,
+) -> None:
+    """
+    1 รอบของ pipeline (data → indicators → AI → signal → trade → log/state) สำหรับ 1 pair
+    closed_before (epoch seconds) → ใช้เฉพาะแท่งที่เปิดก่อนเวลานี้ (แท่งที่ปิดแล้ว) สำหรับ LOOP_MODE=bar_close
+    เวลาแต่ละ stage เก็บใน core.profiler (ดูได้ที่ /api/perf)
+    """
+    with profiler.iteration(ctx.label):
+        _run_pair_iteration(ctx, llm_advisor, loop_started, closed_before)
+
+    perf_record = profiler.take_log_record(settings.PERF_LOG_INTERVAL_SEC)
+    if perf_record:
+        append_ai_log(
+            {
+                "record": "perf",
+                "time": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),  # รูปแบบเดียวกับแถวของแท่ง
+                **perf_record,
+            }
+        )
+
+
+def _run_pair_iteration(
+    ctx: PairContext,
+    llm_advisor: LLMAdvisor,
+    loop_started: str,
+    closed_before: Optional[int],
+) -> None:
+    # 1) ดึงข้อมูลราคา / OHLC
+    with profiler.stage("fetch"):
+        df_raw = get_recent_ohlc(
+            ctx.symbol,
+            ctx.timeframe,
+            settings.LOOKBACK_BARS + (1 if closed_before is not None else 0),
+        )
+    if df_raw is None or df_raw.empty:
+        print(f"[LOOP][{ctx.label}] no data, skip")
+        return
+    if closed_before is not None:
+        df_raw = df_raw[df_raw["time"] < pd.to_datetime(closed_before, unit="s")]
+        if df_raw.empty:
+            return
+
+    # 2) คำนวณ Indicators (RSI, MACD, ATR, ADX, EMA, BB, Stoch, Volume, Patterns)
+    #    ค่าเดียวกับ add_all_indicators() แต่อัปเดต O(1) ต่อแท่ง
+    with profiler.stage("indicators"):
+        df = ctx.indicator_engine.update_frame(df_raw)
+    if df.empty:
+        print(f"[LOOP][{ctx.label}] indicators empty")
+        return
+
+    # 3) คำนวณ AI (Rule + LSTM)
+    with profiler.stage("ai"):
+        ai_res = ctx.engine.compute_ai(df, stream_key=f"{ctx.symbol}_{ctx.timeframe}")
+    last = df.iloc[-1]
+
+    # --- แยกค่า rule / lstm (ถ้ามี) สำหรับ AI Insight ---
+    prob_up_rule = float(ai_res.get("prob_up_rule", ai_res["prob_up"]))
+    prob_up_lstm = ai_res.get("prob_up_lstm")
+    dir_rule = ai_res.get("direction_rule")
+    dir_lstm = ai_res.get("direction_lstm")
+
+    disagree_rate = None
+    if ai_res.get("use_lstm") and dir_rule and dir_lstm:
+        ctx.stats_ai["total_samples"] += 1
+        if dir_rule != dir_lstm:
+            ctx.stats_ai["disagree_samples"] += 1
+        if ctx.stats_ai["total_samples"]:
+            disagree_rate = (
+                ctx.stats_ai["disagree_samples"] / ctx.stats_ai["total_samples"]
+            )
 
-        try:
-            # 0) Session filter
-            if not is_session_active():
-                time.sleep(settings.LOOP_INTERVAL_SEC)
-                continue
-
-            # 1) ดึงข้อมูลราคา / OHLC
-            df_raw = get_recent_ohlc(
-                settings.SYMBOL,
-                settings.TIMEFRAME,
-                settings.LOOKBACK_BARS,
+    # --- ค่า indicator หลัก ---
+    rsi_val = float(last["RSI"])
+    zone = classify_zone(rsi_val)
+    macd_hist = float(last["MACD_HIST"])
+    price = float(last["Close"])
+    atr_val = float(last["ATR"])
+    adx_val = float(last["ADX"])
+    position_manager.observe(ctx.symbol, ctx.order_comment, atr_val)
+
+    # --- ค่า indicator ใหม่ ---
+    ema_trend = float(last.get("EMA_TREND", 0))
+    bb_pct_b = float(last.get("BB_PCT_B", 0.5))
+    bb_width = float(last.get("BB_WIDTH", 0))
+    stoch_k = float(last.get("STOCH_K", 50))
+    vol_ratio = float(last.get("VOL_RATIO", 1.0))
+
+    prob_up = float(ai_res["prob_up"])
+    prob_down = float(ai_res["prob_down"])
+    regime = ai_res["regime"]
+    confidence = float(ai_res["confidence"])
+
+    # Rule-based reasons (for LLM context)
+    rule_reasons = ai_res.get("rule_based", {}).get("reasons", [])
+
+    # 4) เงื่อนไข PRE-SIGNAL (ใช้ multi-factor)
+    pre = None
+    pre_score = 0
+    if zone in ("Oversold", "Overbought"):
+        pre_score += 1
+    if abs(macd_hist) > 0.15:
+        pre_score += 1
+    if confidence > 0.55:
+        pre_score += 1
+    if abs(ema_trend) >= 1:
+        pre_score += 1
+    if bb_pct_b < 0.20 or bb_pct_b > 0.80:
+        pre_score += 1
+
+    if pre_score >= 2:
+        pre = {
+            "type": "PRE",
+            "side_hint": "BUY" if prob_up > prob_down else "SELL",
+            "score": pre_score,
+        }
+
+    # 5) เงื่อนไข CONFIRM-SIGNAL (เลือกตาม AI_MODE)
+    th_up, th_down, th_conf, macd_margin = get_ai_confirm_thresholds()
+    min_factors = getattr(settings, "MIN_CONFIRM_FACTORS", 2)
+
+    confirm = None
+    # BUY: prob_up สูงพอ, MACD ไม่สวนแรงลง, confidence ถึง
+    if prob_up > th_up and macd_hist > -macd_margin and confidence > th_conf:
+        factors = count_confirm_factors(last, ai_res, "BUY")
+        if factors >= min_factors:
+            confirm = {"type": "CONFIRM", "side": "BUY", "factors": factors}
+    # SELL: prob_down สูงพอ, MACD ไม่สวนแรงขึ้น, confidence ถึง
+    elif prob_down > th_down and macd_hist < macd_margin and confidence > th_conf:
+        factors = count_confirm_factors(last, ai_res, "SELL")
+        if factors >= min_factors:
+            confirm = {"type": "CONFIRM", "side": "SELL", "factors": factors}
+
+    pre_ts = None
+    confirm_ts = None
+
+    # 5b) กราฟสัญญาณ (ถ้ามี PRE หรือ CONFIRM) — วาดจริงใน notification worker ไม่ถ่วง loop
+    chart_path = None
+    if pre or confirm:
+        idx_last = len(df) - 1
+        pre_idx = idx_last if pre else None
+        confirm_idx = idx_last if confirm else None
+        chart_path = DeferredChart(df, pre_idx, confirm_idx)
+
+    # 6) PRE notify
+    if pre:
+        msg = (
+            f"Symbol: {ctx.label}\n"
+            f"Price: {price}\n"
+            f"AI Prob Up: {prob_up:.2%} / Down: {prob_down:.2%}\n"
+            f"RSI: {rsi_val:.2f} ({zone})\n"
+            f"MACD Hist: {macd_hist:.4f}\n"
+            f"EMA Trend: {int(ema_trend):+d}\n"
+            f"BB %B: {bb_pct_b:.2f}\n"
+            f"Regime: {regime}\n"
+            f"Side Hint: {pre['side_hint']}"
+        )
+        notify_pre_signal(msg, chart_path)
+        pre_ts = loop_started
+
+    # 7) CONFIRM notify + auto trade (พร้อม SL/TP จาก AI)
+    llm_result: dict = {}
+    order_ticket = None
+    if confirm and settings.AUTO_TRADE_ENABLED:
+        # 7b) circuit breaker (ขาดทุนวัน / สัปดาห์ / drawdown / แพ้ติดกัน) + MAX_OPEN_TRADES ก่อนเตรียมไม้ใหม่
+        halt = equity_tracker.halt_reason()
+        open_count = get_open_trades_count(ctx.symbol, ctx.count_comment) if not halt else 0
+        if halt:
+            print(f"[LOOP][{ctx.label}] circuit breaker ({halt}), skipping")
+        elif open_count >= ctx.max_open_trades:
+            print(
+                f"[LOOP][{ctx.label}] MAX_OPEN_TRADES reached ({open_count}/{ctx.max_open_trades}), skipping"
             )
-            if df_raw is None or df_raw.empty:
-                print("[LOOP] no data, skip")
-                time.sleep(settings.LOOP_INTERVAL_SEC)
-                continue
-
-            # 2) คำนวณ Indicators (RSI, MACD, ATR, ADX, EMA, BB, Stoch, Volume, Patterns)
-            df = add_all_indicators(df_raw)
-            if df.empty:
-                print("[LOOP] indicators empty")
-                time.sleep(settings.LOOP_INTERVAL_SEC)
-                continue
-
-            # 3) คำนวณ AI (Rule + LSTM)
-            ai_res = engine.compute_ai(df)
-            last = df.iloc[-1]
-
-            # --- แยกค่า rule / lstm (ถ้ามี) สำหรับ AI Insight ---
-            prob_up_rule = float(ai_res.get("prob_up_rule", ai_res["prob_up"]))
-            prob_up_lstm = ai_res.get("prob_up_lstm")
-            dir_rule = ai_res.get("direction_rule")
-            dir_lstm = ai_res.get("direction_lstm")
-
-            disagree_rate = None
-            if ai_res.get("use_lstm") and dir_rule and dir_lstm:
-                STATS_AI["total_samples"] += 1
-                if dir_rule != dir_lstm:
-                    STATS_AI["disagree_samples"] += 1
-                if STATS_AI["total_samples"]:
-                    disagree_rate = (
-                        STATS_AI["disagree_samples"] / STATS_AI["total_samples"]
-                    )
-
-            # --- ค่า indicator หลัก ---
-            rsi_val = float(last["RSI"])
-            zone = classify_zone(rsi_val)
-            macd_hist = float(last["MACD_HIST"])
-            price = float(last["Close"])
-            atr_val = float(last["ATR"])
-            adx_val = float(last["ADX"])
-
-            # --- ค่า indicator ใหม่ ---
-            ema_trend = float(last.get("EMA_TREND", 0))
-            bb_pct_b = float(last.get("BB_PCT_B", 0.5))
-            bb_width = float(last.get("BB_WIDTH", 0))
-            stoch_k = float(last.get("STOCH_K", 50))
-            vol_ratio = float(last.get("VOL_RATIO", 1.0))
-
-            prob_up = float(ai_res["prob_up"])
-            prob_down = float(ai_res["prob_down"])
-            regime = ai_res["regime"]
-            confidence = float(ai_res["confidence"])
-
-            # Rule-based reasons (for LLM context)
-            rule_reasons = ai_res.get("rule_based", {}).get("reasons", [])
-
-            # 4) เงื่อนไข PRE-SIGNAL (ใช้ multi-factor)
-            pre = None
-            pre_score = 0
-            if zone in ("Oversold", "Overbought"):
-                pre_score += 1
-            if abs(macd_hist) > 0.15:
-                pre_score += 1
-            if confidence > 0.55:
-                pre_score += 1
-            if abs(ema_trend) >= 1:
-                pre_score += 1
-            if bb_pct_b < 0.20 or bb_pct_b > 0.80:
-                pre_score += 1
-
-            if pre_score >= 2:
-                pre = {
-                    "type": "PRE",
-                    "side_hint": "BUY" if prob_up > prob_down else "SELL",
-                    "score": pre_score,
-                }
-
-            # 5) เงื่อนไข CONFIRM-SIGNAL (เลือกตาม AI_MODE)
-            th_up, th_down, th_conf, macd_margin = get_ai_confirm_thresholds()
-            min_factors = getattr(settings, "MIN_CONFIRM_FACTORS", 2)
-
-            confirm = None
-            # BUY: prob_up สูงพอ, MACD ไม่สวนแรงลง, confidence ถึง
-            if prob_up > th_up and macd_hist > -macd_margin and confidence > th_conf:
-                factors = count_confirm_factors(last, ai_res, "BUY")
-                if factors >= min_factors:
-                    confirm = {"type": "CONFIRM", "side": "BUY", "factors": factors}
-            # SELL: prob_down สูงพอ, MACD ไม่สวนแรงขึ้น, confidence ถึง
-            elif prob_down > th_down and macd_hist < macd_margin and confidence > th_conf:
-                factors = count_confirm_factors(last, ai_res, "SELL")
-                if factors >= min_factors:
-                    confirm = {"type": "CONFIRM", "side": "SELL", "factors": factors}
-
-            pre_ts = None
-            confirm_ts = None
-
-            # 5b) สร้างกราฟสัญญาณ (ถ้ามี PRE หรือ CONFIRM)
-            chart_path = None
-            if pre or confirm:
-                idx_last = len(df) - 1
-                pre_idx = idx_last if pre else None
-                confirm_idx = idx_last if confirm else None
-                try:
-                    chart_path = generate_signal_chart(df, pre_idx, confirm_idx)
-                except Exception:
-                    chart_path = None
-
-            # 6) PRE notify
-            if pre:
-                msg = (
-                    f"Symbol: {settings.SYMBOL}\n"
-                    f"Price: {price}\n"
-                    f"AI Prob Up: {prob_up:.2%} / Down: {prob_down:.2%}\n"
-                    f"RSI: {rsi_val:.2f} ({zone})\n"
-                    f"MACD Hist: {macd_hist:.4f}\n"
-                    f"EMA Trend: {int(ema_trend):+d}\n"
-                    f"BB %B: {bb_pct_b:.2f}\n"
-                    f"Regime: {regime}\n"
-                    f"Side Hint: {pre['side_hint']}"
-                )
-                notify_pre_signal(msg, chart_path)
-                pre_ts = loop_started
-
-            # 7) CONFIRM notify + auto trade (พร้อม SL/TP จาก AI)
-            llm_result: dict = {}
-            if confirm:
-                factors_str = f"Factors: {confirm['factors']}/5"
-                msg = (
-                    f"Symbol: {settings.SYMBOL}\n"
-                    f"Price: {price}\n"
-                    f"AI Direction: {confirm['side']}\n"
-                    f"AI Prob Up: {prob_up:.2%} / Down: {prob_down:.2%}\n"
-                    f"RSI: {rsi_val:.2f} ({zone})\n"
-                    f"MACD Hist: {macd_hist:.4f}\n"
-                    f"EMA Trend: {int(ema_trend):+d} | BB%B: {bb_pct_b:.2f}\n"
-                    f"Stoch K: {stoch_k:.1f} | Vol: x{vol_ratio:.1f}\n"
-                    f"Regime: {regime} | {factors_str}\n"
-                    f"Confidence: {confidence:.2f}"
-                )
-
-                # 7a) LLM confirmation (GPT + Gemini) — ส่ง context เพิ่มขึ้น
-                market_snapshot = {
-                    "symbol": settings.SYMBOL,
-                    "price": price,
-                    "rsi": rsi_val,
-                    "rsi_zone": zone,
-                    "macd_hist": macd_hist,
-                    "atr": atr_val,
-                    "adx": adx_val,
-                    "regime": regime,
-                    "ai_prob_up": prob_up,
-                    "ai_prob_down": prob_down,
-                    "ai_confidence": confidence,
-                    "ai_direction": ai_res["direction"],
-                    # New context fields
-                    "ema_trend": ema_trend,
-                    "bb_pct_b": bb_pct_b,
-                    "bb_width": bb_width,
-                    "stoch_k": stoch_k,
-                    "vol_ratio": vol_ratio,
-                    "rule_reasons": rule_reasons,
-                }
-                llm_result = llm_advisor.analyze_signal(market_snapshot, confirm["side"])
-
-                # ถ้าเปิด LLM_REQUIRE_CONSENSUS → ต้องให้ LLM เห็นด้วยถึงจะส่ง notify
-                llm_blocks = (
-                    settings.LLM_REQUIRE_CONSENSUS
-                    and settings.LLM_ADVISOR_ENABLED
-                    and not llm_result.get("llm_agrees", True)
-                )
-                if not llm_blocks:
-                    notify_confirm_signal(msg, chart_path)
-                    confirm_ts = loop_started
-                else:
-                    print(
-                        f"[LLM] BLOCKED trade {confirm['side']} — "
-                        f"LLM consensus={llm_result.get('consensus')} "
-                        f"(conf={llm_result.get('consensus_confidence', 0):.2f})"
-                    )
-
-                if settings.AUTO_TRADE_ENABLED and not llm_blocks:
-                    # 7b) ตรวจ MAX_OPEN_TRADES ก่อนเปิดไม้ใหม่
-                    open_count = get_open_trades_count(settings.SYMBOL)
-                    if open_count >= settings.MAX_OPEN_TRADES:
-                        print(
-                            f"[LOOP] MAX_OPEN_TRADES reached ({open_count}/{settings.MAX_OPEN_TRADES}), skipping"
-                        )
-                    else:
-                        # 7c) Dynamic position sizing ตาม account balance + ATR
-                        account_balance = get_account_balance()
-                        volume = calculate_position_size(
-                            balance=account_balance,
-                            atr=atr_val,
-                            risk_percent=settings.RISK_PER_TRADE,
-                        )
-
-                        # 7d) ให้ AI ช่วยคิด SL/TP (ใช้ bb_width + adx เพิ่มเติม)
-                        sl_price, tp_price = compute_sl_tp_by_ai(
-                            entry_price=price,
-                            side=confirm["side"],
-                            atr=atr_val,
-                            regime=regime,
-                            confidence=confidence,
-                            bb_width=bb_width,
-                            adx=adx_val,
-                        )
-
-                        trade_result = execute_order(
-                            settings.SYMBOL,
-                            confirm["side"],
-                            volume,
-                            sl=sl_price,
-                            tp=tp_price,
-                        )
-
-                        notify_trade(
-                            f"{confirm['side']} {volume} {settings.SYMBOL}\n"
-                            f"SL={sl_price:.2f} TP={tp_price:.2f}\n"
-                            f"Result: {trade_result}"
-                        )
-
-            # 8) ดึง Balance ปัจจุบันจาก MT5 (แสดงบน Dashboard)
+        else:
+            # 7c) Dynamic position sizing ตาม account balance + ATR
+            #     Kelly: win rate / avg RR ของไม้ที่ปิดล่าสุดจาก rolling stats (O(1))
             account_balance = get_account_balance()
-            open_trades_count = get_open_trades_count(settings.SYMBOL)
-
-            # 9) AI log line (สำหรับเทรน LSTM — ไม่ต้องเขียนทุก loop)
-            log_record = {
-                "symbol": settings.SYMBOL,
-                "time": str(df["time"].iloc[-1]),
-                "close": price,
-                "rsi": rsi_val,
-                "macd_hist": macd_hist,
-                "atr": atr_val,
-                "adx": adx_val,
-                "ema_trend": ema_trend,
-                "bb_pct_b": bb_pct_b,
-                "bb_width": bb_width,
-                "stoch_k": stoch_k,
-                "vol_ratio": vol_ratio,
-                "ret": float(last["RET"]),
-                "ai_prob_up": prob_up,
-                "ai_prob_down": prob_down,
-                "ai_direction": ai_res["direction"],
-                "ai_confidence": confidence,
-                "regime": regime,
-                "pre_signal": bool(pre),
-                "confirm_signal": bool(confirm),
-            }
+            win_rate, avg_rr = (None, None)
+            if settings.KELLY_CRITERION_ENABLED:
+                win_rate, avg_rr = performance.kelly_inputs(ctx.symbol, regime, settings.AI_MODE)
+            volume = calculate_position_size(
+                balance=account_balance,
+                atr=atr_val,
+                risk_percent=settings.RISK_PER_TRADE,
+                win_rate=win_rate,
+                avg_rr=avg_rr,
+                drawdown_pct=equity_tracker.drawdown_pct if equity_tracker.peak > 0 else None,
+            )
 
-            now_ts = time.time()
-            if now_ts - LAST_AI_LOG_TS >= AI_LOG_INTERVAL_SEC:
-                append_ai_log(log_record)
-                LAST_AI_LOG_TS = now_ts
-
-            # 10) last_state สำหรับ Dashboard / WebSocket (อัปเดตทุก loop)
-            last_state = {
-                "loop_started": loop_started,
-                "symbol": settings.SYMBOL,
-                "timeframe": settings.TIMEFRAME,
-                "price": price,
-                "rsi": rsi_val,
-                "rsi_zone": zone,
-                "macd_hist": macd_hist,
-                "atr": atr_val,
-                "adx": adx_val,
-                "ema_trend": ema_trend,
-                "bb_pct_b": bb_pct_b,
-                "bb_width": bb_width,
-                "stoch_k": stoch_k,
-                "vol_ratio": vol_ratio,
-                "ai_prob_up": prob_up,
-                "ai_prob_down": prob_down,
-                "ai_direction": ai_res["direction"],
-                "ai_confidence": confidence,
-                "regime": regime,
-                "use_lstm": ai_res.get("use_lstm", False),
-                "pre_signal": pre is not None,
-                "confirm_signal": confirm is not None,
-                "pre_timestamp": pre_ts,
-                "confirm_timestamp": confirm_ts,
-                "open_trades": open_trades_count,
-                "account_balance": account_balance,
-                # AI Insight (Rule vs LSTM + disagreement)
-                "ai_prob_rule": prob_up_rule,
-                "ai_prob_lstm": prob_up_lstm,
-                "ai_disagree_rate": disagree_rate,
-                "ai_samples": STATS_AI["total_samples"],
-                "ai_disagree_samples": STATS_AI["disagree_samples"],
-                # LLM Advisor output (latest CONFIRM signal)
-                "llm_consensus": llm_result.get("consensus"),
-                "llm_consensus_confidence": llm_result.get("consensus_confidence"),
-                "llm_agrees": llm_result.get("llm_agrees"),
-                "llm_gpt_rec": llm_result.get("gpt_recommendation"),
-                "llm_gpt_confidence": llm_result.get("gpt_confidence"),
-                "llm_gpt_reasoning": llm_result.get("gpt_reasoning"),
-                "llm_gemini_rec": llm_result.get("gemini_recommendation"),
-                "llm_gemini_confidence": llm_result.get("gemini_confidence"),
-                "llm_gemini_reasoning": llm_result.get("gemini_reasoning"),
-            }
-            write_last_state(last_state)
+            # 7d) ให้ AI ช่วยคิด SL/TP (ใช้ bb_width + adx เพิ่มเติม)
+            sl_price, tp_price = compute_sl_tp_by_ai(
+                entry_price=price,
+                side=confirm["side"],
+                atr=atr_val,
+                regime=regime,
+                confidence=confidence,
+                bb_width=bb_width,
+                adx=adx_val,
+            )
 
+            # 7e) เตรียม request + order_check / margin check ขนานกับ LLM และการแจ้งเตือนด้านล่าง
+            order_ticket = order_gateway.prepare(
+                ctx.symbol,
+                confirm["side"],
+                volume,
+                sl=sl_price,
+                tp=tp_price,
+                comment=ctx.order_comment,
+                context={
+                    "pair": ctx.label,
+                    "timeframe": ctx.timeframe,
+                    "mode": settings.AI_MODE,
+                    "regime": regime,
+                    "confidence": confidence,
+                    "prob_up": prob_up,
+                    "prob_down": prob_down,
+                    "factors": confirm["factors"],
+                    "atr": atr_val,
+                    "adx": adx_val,
+                    "signal_price": price,
+                },
+            )
+
+    if confirm:
+        factors_str = f"Factors: {confirm['factors']}/5"
+        msg = (
+            f"Symbol: {ctx.label}\n"
+            f"Price: {price}\n"
+            f"AI Direction: {confirm['side']}\n"
+            f"AI Prob Up: {prob_up:.2%} / Down: {prob_down:.2%}\n"
+            f"RSI: {rsi_val:.2f} ({zone})\n"
+            f"MACD Hist: {macd_hist:.4f}\n"
+            f"EMA Trend: {int(ema_trend):+d} | BB%B: {bb_pct_b:.2f}\n"
+            f"Stoch K: {stoch_k:.1f} | Vol: x{vol_ratio:.1f}\n"
+            f"Regime: {regime} | {factors_str}\n"
+            f"Confidence: {confidence:.2f}"
+        )
+
+        # 7a) LLM confirmation (GPT + Gemini) — ส่ง context เพิ่มขึ้น
+        market_snapshot = {
+            "symbol": ctx.symbol,
+            "price": price,
+            "rsi": rsi_val,
+            "rsi_zone": zone,
+            "macd_hist": macd_hist,
+            "atr": atr_val,
+            "adx": adx_val,
+            "regime": regime,
+            "ai_prob_up": prob_up,
+            "ai_prob_down": prob_down,
+            "ai_confidence": confidence,
+            "ai_direction": ai_res["direction"],
+            # New context fields
+            "ema_trend": ema_trend,
+            "bb_pct_b": bb_pct_b,
+            "bb_width": bb_width,
+            "stoch_k": stoch_k,
+            "vol_ratio": vol_ratio,
+            "rule_reasons": rule_reasons,
+        }
+        with profiler.stage("llm"):
+            llm_result = llm_advisor.analyze_signal(market_snapshot, confirm["side"])
+
+        # ถ้าเปิด LLM_REQUIRE_CONSENSUS → ต้องให้ LLM เห็นด้วยถึงจะส่ง notify
+        llm_blocks = (
+            settings.LLM_REQUIRE_CONSENSUS
+            and settings.LLM_ADVISOR_ENABLED
+            and not llm_result.get("llm_agrees", True)
+        )
+        if not llm_blocks:
+            notify_confirm_signal(msg, chart_path)
+            confirm_ts = loop_started
+        else:
             print(
-                f"[LOOP] {settings.SYMBOL} price={price:.2f} "
-                f"AI dir={ai_res['direction']} up={prob_up:.2%} "
-                f"regime={regime} EMA={int(ema_trend):+d} BB%B={bb_pct_b:.2f}"
+                f"[LLM] BLOCKED trade {confirm['side']} — "
+                f"LLM consensus={llm_result.get('consensus')} "
+                f"(conf={llm_result.get('consensus_confidence', 0):.2f})"
             )
 
+        if order_ticket is not None:
+            if llm_blocks:
+                order_gateway.cancel(order_ticket, "llm_blocked")
+            else:
+                # 7f) ส่งจาก worker ของ order gateway — loop ไม่ต้องรอโบรกตอบ
+                with profiler.stage("order"):
+                    order_gateway.submit(order_ticket, on_result=_notify_order_result)
+
+    # 8) ดึง Balance ปัจจุบันจาก MT5 (แสดงบน Dashboard)
+    with profiler.stage("account"):
+        account_balance = get_account_balance()
+        open_trades_count = get_open_trades_count(ctx.symbol, ctx.count_comment)
+
+    # 9) AI log line (สำหรับเทรน LSTM — ไม่ต้องเขียนทุก loop)
+    log_record = {
+        "symbol": ctx.symbol,
+        "timeframe": ctx.timeframe,
+        "time": str(df["time"].iloc[-1]),
+        "close": price,
+        "rsi": rsi_val,
+        "macd_hist": macd_hist,
+        "atr": atr_val,
+        "adx": adx_val,
+        "ema_trend": ema_trend,
+        "bb_pct_b": bb_pct_b,
+        "bb_width": bb_width,
+        "stoch_k": stoch_k,
+        "vol_ratio": vol_ratio,
+        "ret": float(last["RET"]),
+        "ai_prob_up": prob_up,
+        "ai_prob_down": prob_down,
+        "ai_direction": ai_res["direction"],
+        "ai_confidence": confidence,
+        "regime": regime,
+        "pre_signal": bool(pre),
+        "confirm_signal": bool(confirm),
+    }
+
+    now_ts = get_broker().time()
+    if now_ts - ctx.last_ai_log_ts >= AI_LOG_INTERVAL_SEC:
+        with profiler.stage("log"):
+            append_ai_log(log_record)
+        ctx.last_ai_log_ts = now_ts
+
+    # 10) last_state สำหรับ Dashboard / WebSocket (อัปเดตทุก loop)
+    last_state = {
+        "loop_started": loop_started,
+        "symbol": ctx.symbol,
+        "timeframe": ctx.timeframe,
+        "price": price,
+        "rsi": rsi_val,
+        "rsi_zone": zone,
+        "macd_hist": macd_hist,
+        "atr": atr_val,
+        "adx": adx_val,
+        "ema_trend": ema_trend,
+        "bb_pct_b": bb_pct_b,
+        "bb_width": bb_width,
+        "stoch_k": stoch_k,
+        "vol_ratio": vol_ratio,
+        "ai_prob_up": prob_up,
+        "ai_prob_down": prob_down,
+        "ai_direction": ai_res["direction"],
+        "ai_confidence": confidence,
+        "regime": regime,
+        "use_lstm": ai_res.get("use_lstm", False),
+        "pre_signal": pre is not None,
+        "confirm_signal": confirm is not None,
+        "pre_timestamp": pre_ts,
+        "confirm_timestamp": confirm_ts,
+        "open_trades": open_trades_count,
+        "account_balance": account_balance,
+        # AI Insight (Rule vs LSTM + disagreement)
+        "ai_prob_rule": prob_up_rule,
+        "ai_prob_lstm": prob_up_lstm,
+        "ai_disagree_rate": disagree_rate,
+        "ai_samples": ctx.stats_ai["total_samples"],
+        "ai_disagree_samples": ctx.stats_ai["disagree_samples"],
+        # LLM Advisor output (latest CONFIRM signal)
+        "llm_consensus": llm_result.get("consensus"),
+        "llm_consensus_confidence": llm_result.get("consensus_confidence"),
+        "llm_agrees": llm_result.get("llm_agrees"),
+        "llm_gpt_rec": llm_result.get("gpt_recommendation"),
+        "llm_gpt_confidence": llm_result.get("gpt_confidence"),
+        "llm_gpt_reasoning": llm_result.get("gpt_reasoning"),
+        "llm_gemini_rec": llm_result.get("gemini_recommendation"),
+        "llm_gemini_confidence": llm_result.get("gemini_confidence"),
+        "llm_gemini_reasoning": llm_result.get("gemini_reasoning"),
+    }
+    with profiler.stage("state"):
+        write_last_state(last_state, ctx.state_key)
+        if ctx.is_primary and ctx.state_key:
+            # pair แรก → เขียน last_state.json หลักด้วย (dashboard เดิมอ่านไฟล์นี้)
+            write_last_state(last_state)
+    ctx.last_state = last_state
+
+    print(
+        f"[LOOP] {ctx.label} price={price:.2f} "
+        f"AI dir={ai_res['direction']} up={prob_up:.2%} "
+        f"regime={regime} EMA={int(ema_trend):+d} BB%B={bb_pct_b:.2f}"
+    )
+
+
+def update_intrabar_price(ctx: PairContext, loop_started: str) -> None:
+    """
+    ทางลัดระหว่างแท่ง (LOOP_MODE=bar_close): อัปเดตแค่ราคาใน last_state จาก tick
+    ไม่คำนวณ indicator / AI ใหม่ — Dashboard ยังเห็นราคาเคลื่อนไหว
+    """
+    if ctx.last_state is None:
+        return
+    tick = get_latest_tick(ctx.symbol)
+    if tick is None:
+        return
+    state = dict(ctx.last_state)
+    state["loop_started"] = loop_started
+    state["price"] = tick["bid"]
+    state["tick_time"] = tick["time"]
+    write_last_state(state, ctx.state_key)
+    if ctx.is_primary and ctx.state_key:
+        write_last_state(state)
+    ctx.last_state = state
+
+
+def run_bar_close_step(ctx: PairContext, llm_advisor: LLMAdvisor, loop_started: str) -> None:
+    """
+    LOOP_MODE=bar_close: ดูเวลาแท่งล่าสุด (1 แท่ง) ทุก LOOP_INTERVAL_SEC
+    - มีแท่งใหม่ = แท่งก่อนหน้าปิดแล้ว → รัน pipeline เต็มครั้งเดียวบนแท่งที่ปิดแล้ว
+    - ยังเป็นแท่งเดิม → อัปเดตราคาอย่างเดียว
+    """
+    bar_time = get_latest_bar_time(ctx.symbol, ctx.timeframe)
+    if bar_time is not None and bar_time != ctx.last_bar_time:
+        run_pair_iteration(ctx, llm_advisor, loop_started, closed_before=bar_time)
+        ctx.last_bar_time = bar_time
+    else:
+        update_intrabar_price(ctx, loop_started)
+
+
+def run_pair_loop(
+    ctx: PairContext,
+    llm_advisor: LLMAdvisor,
+    stop_event: Optional[threading.Event] = None,
+    max_iterations: Optional[int] = None,
+) -> None:
+    """
+    loop ของ 1 pair — pair ที่ช้าไม่ทำให้ pair อื่นรอ เพราะแต่ละ pair มี thread ของตัวเอง
+    max_iterations: หยุดหลังครบ N รอบ (soak test / BROKER_BACKEND=SIM) — None = วิ่งไปเรื่อย ๆ
+    เวลา / การรอมาจาก broker backend → โบรกจำลองเลื่อนนาฬิกาแทนการ sleep จริง
+    """
+    broker = get_broker()
+    broker.register_worker()
+    try:
+        _run_pair_loop(ctx, llm_advisor, broker, stop_event, max_iterations)
+    finally:
+        broker.unregister_worker()
+
+
+def _run_pair_loop(
+    ctx: PairContext,
+    llm_advisor: LLMAdvisor,
+    broker,
+    stop_event: Optional[threading.Event],
+    max_iterations: Optional[int],
+) -> None:
+    iterations = 0
+    while stop_event is None or not stop_event.is_set():
+        if broker.finished:
+            print(f"[LOOP][{ctx.label}] replay finished")
+            break
+        # ใช้ timezone-aware datetime ป้องกัน warning
+        loop_started = datetime.fromtimestamp(broker.time(), timezone.utc).isoformat()
+
+        try:
+            # 0) Session filter
+            if is_session_active():
+                if settings.LOOP_MODE == "BAR_CLOSE":
+                    run_bar_close_step(ctx, llm_advisor, loop_started)
+                else:
+                    run_pair_iteration(ctx, llm_advisor, loop_started)
+            # ดูแลไม้ที่เปิดอยู่ (breakeven / trailing / partial TP) — pass เดียวทั้งพอร์ต ไม่ว่า pair ไหนเรียก
+            if settings.POSITION_MANAGER_ENABLED:
+                with profiler.stage("positions"):
+                    position_manager.run()
+            # ผลปิดของไม้ใน trade journal จาก deal history (ไม่เกินทุก TRADE_JOURNAL_RECONCILE_SEC)
+            trade_journal.poll()
+            # equity curve + circuit breaker (ไม่เกินทุก EQUITY_SAMPLE_SEC)
+            equity_tracker.sample()
         except KeyboardInterrupt:
             print("\n[ExtremeAI v4] stopped by user.")
             break
         except Exception as e:
-            print("[LOOP][ERROR]", e)
-            notify_error(str(e))
+            print(f"[LOOP][ERROR][{ctx.label}]", e)
+            notify_error(f"{ctx.label}: {e}")
+
+        iterations += 1
+        if max_iterations is not None and iterations >= max_iterations:
+            break
 
         # ให้ loop วิ่งตาม config (ตั้งใน .env = 1)
-        time.sleep(settings.LOOP_INTERVAL_SEC)
+        broker.sleep(settings.LOOP_INTERVAL_SEC, stop_event)
+
+
+def main_loop(max_iterations: Optional[int] = None):
+    print("[ExtremeAI v4] starting...")
+    init_mt5()
+    notify_bot_started()
+    llm_advisor = LLMAdvisor()
+    contexts = build_pair_contexts()
+
+    if len(contexts) == 1:
+        run_pair_loop(contexts[0], llm_advisor, max_iterations=max_iterations)
+        return
+
+    print("[ExtremeAI v4] pairs:", ", ".join(ctx.label for ctx in contexts))
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(
+            target=run_pair_loop,
+            args=(ctx, llm_advisor, stop_event, max_iterations),
+            name=f"pair-{ctx.symbol}-{ctx.timeframe}",
+            daemon=True,
+        )
+        for ctx in contexts
+    ]
+    for t in workers:
+        t.start()
+
+    try:
+        while any(t.is_alive() for t in workers):
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print("\n[ExtremeAI v4] stopped by user.")
+    finally:
+        stop_event.set()
+        for t in workers:
+            t.join(timeout=settings.LOOP_INTERVAL_SEC + 5)
+
 
 def get_ai_confirm_thresholds():
     """
@@ -459,26 +714,10 @@ def get_ai_confirm_thresholds():
     SAFE        : ยิงน้อยมาก เน้นชัวร์
     NORMAL      : กลาง ๆ
     AGGRESSIVE  : ยิงบ่อยขึ้น เน้นตามตลาดเร็ว
+
+    ค่าจริงมาจาก AI profile (core/ai_profile.py / AI_PROFILE_PATH)
     """
-    mode = getattr(settings, "AI_MODE", "NORMAL").upper()
-
-    if mode == "SAFE":
-        th_up = 0.65
-        th_down = 0.65
-        th_conf = 0.60
-        macd_margin = 0.00
-    elif mode == "AGGRESSIVE":
-        th_up = 0.53
-        th_down = 0.53
-        th_conf = 0.35
-        macd_margin = 0.07
-    else:  # NORMAL
-        th_up = 0.58
-        th_down = 0.58
-        th_conf = 0.45
-        macd_margin = 0.03
-
-    return th_up, th_down, th_conf, macd_margin
+    return get_mode_thresholds(getattr(settings, "AI_MODE", "NORMAL"))
 
 
 if __name__ == "__main__":
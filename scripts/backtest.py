@@ -2,14 +2,19 @@
 
 import json
 import os
+import sys
+import time
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from core.bar_store import get_bar_store
 from core.config import settings
 from core.indicators import add_all_indicators
 from core.ai_engine import ExtremeAIEngine
+from core.tick_store import TickStore, open_ticks
 
 
 @dataclass
@@ -24,16 +29,24 @@ class Trade:
     result_r: float | None  # กี่เท่าของ risk
 
 
-def backtest(csv_path: str):
-    df_raw = pd.read_csv(csv_path, parse_dates=["time"])
-    df_raw = df_raw.sort_values("time")
+# loop เดิมเริ่มตัดสินใจตั้งแต่แท่งที่ 200 (ให้ indicators / LSTM warm-up ก่อน)
+WARMUP_BARS = 200
 
-    ai = ExtremeAIEngine()
+# วิธีตัดสินการปิดไม้ของ backtest_vectorized()
+#   intrabar = SL/TP โดนเมื่อ High / Low ของแท่งแตะ (แท่งที่แตะทั้งคู่ → ดู tick หรือ path O-L-H-C)
+#   close    = ดูแค่ Close ของแท่ง (แบบเดิม เท่ากับ backtest_loop)
+EXIT_MODELS = ("intrabar", "close")
 
+
+def backtest_loop(df_raw: pd.DataFrame, ai: ExtremeAIEngine) -> List[Trade]:
+    """
+    Backtest แบบเดิม: คำนวณ indicators + AI ใหม่ทุกแท่ง (O(N²))
+    เก็บไว้เป็น reference สำหรับตรวจว่า backtest_vectorized() ได้ไม้เดียวกัน
+    """
     trades: List[Trade] = []
     open_trade: Trade | None = None
 
-    for i in range(200, len(df_raw)):
+    for i in range(WARMUP_BARS, len(df_raw)):
         df_slice = df_raw.iloc[: i + 1].copy()
         df = add_all_indicators(df_slice)
         if df.empty:
@@ -125,6 +138,225 @@ def backtest(csv_path: str):
     if open_trade is not None:
         trades.append(open_trade)
 
+    return trades
+
+
+def _first_touch(high: np.ndarray, low: np.ndarray, start: int, side: str, sl: float, tp: float) -> int:
+    """
+    หา index แรกตั้งแต่ start ที่ช่วง [low, high] ของแท่งแตะ SL หรือ TP (-1 ถ้าไม่แตะเลย)
+    สแกนเป็นช่วง ๆ ขยายขึ้นเรื่อย ๆ → ไม่ต้องเทียบทั้ง array ทุกไม้
+    """
+    chunk = 256
+    n = len(high)
+    while start < n:
+        seg_hi = high[start : start + chunk]
+        seg_lo = low[start : start + chunk]
+        if side == "BUY":
+            hit = (seg_lo <= sl) | (seg_hi >= tp)
+        else:
+            hit = (seg_hi >= sl) | (seg_lo <= tp)
+        idx = np.flatnonzero(hit)
+        if len(idx):
+            return start + int(idx[0])
+        start += chunk
+        chunk = min(chunk * 2, 65536)
+    return -1
+
+
+def _first_exit(price: np.ndarray, start: int, side: str, sl: float, tp: float) -> int:
+    """หา index แรกตั้งแต่ start ที่ราคา (Close) แตะ SL หรือ TP (-1 ถ้าไม่แตะเลย)"""
+    return _first_touch(price, price, start, side, sl, tp)
+
+
+def _resolve_intrabar(
+    o: float,
+    h: float,
+    l: float,
+    c: float,
+    side: str,
+    sl: float,
+    tp: float,
+    ticks: Optional[np.ndarray] = None,
+) -> Tuple[float, str, Optional[float], str]:
+    """
+    แท่งที่ High / Low แตะ SL หรือ TP แล้ว → (ราคาที่ปิด, "sl" | "tp", เวลา tick ที่ปิด | None, วิธีที่ตัดสิน)
+    วิธีที่ตัดสิน:
+      gap  = Open เลยระดับไปแล้ว → ปิดที่ Open
+      bar  = แตะแค่ระดับเดียว
+      tick = แตะทั้งคู่ → ดู tick ของแท่งนั้นว่าตัวไหนโดนก่อน (BUY ปิดด้วย bid / SELL ปิดด้วย ask แบบ SimulatedMT5)
+      path = แตะทั้งคู่และไม่มี tick → O→L→H→C (แท่งเขียว) / O→H→L→C (แท่งแดง) แบบเดียวกับ SimulatedMT5
+    """
+    buy = side == "BUY"
+    if (o <= sl) if buy else (o >= sl):
+        return o, "sl", None, "gap"
+    if (o >= tp) if buy else (o <= tp):
+        return o, "tp", None, "gap"
+
+    hit_sl = l <= sl if buy else h >= sl
+    hit_tp = h >= tp if buy else l <= tp
+    if hit_sl != hit_tp:
+        return (sl, "sl", None, "bar") if hit_sl else (tp, "tp", None, "bar")
+
+    if ticks is not None and len(ticks):
+        quote = ticks["bid"] if buy else ticks["ask"]
+        k_sl = np.flatnonzero(quote <= sl if buy else quote >= sl)
+        k_tp = np.flatnonzero(quote >= tp if buy else quote <= tp)
+        first_sl = int(k_sl[0]) if len(k_sl) else len(quote)
+        first_tp = int(k_tp[0]) if len(k_tp) else len(quote)
+        if min(first_sl, first_tp) < len(quote):
+            if first_sl < first_tp:
+                return sl, "sl", float(ticks["time"][first_sl]), "tick"
+            return tp, "tp", float(ticks["time"][first_tp]), "tick"
+        # tick ของแท่งนี้ไม่แตะเลย (ข้อมูล tick กับแท่งไม่ตรงกัน) → ใช้ path
+
+    low_first = c >= o
+    sl_first = low_first if buy else not low_first
+    return (sl, "sl", None, "path") if sl_first else (tp, "tp", None, "path")
+
+
+def _epoch_seconds(times: pd.Series) -> np.ndarray:
+    return pd.to_datetime(times).to_numpy().astype("datetime64[ms]").astype(np.int64) / 1000.0
+
+
+def backtest_vectorized(
+    df_raw: pd.DataFrame,
+    ai: ExtremeAIEngine,
+    exits: str = "intrabar",
+    ticks: Optional[TickStore] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> List[Trade]:
+    """
+    Backtest แบบ vectorized: คำนวณ indicators ครั้งเดียวทั้ง history,
+    ให้คะแนน rule-based / LSTM / regime ทุกแท่งในครั้งเดียว (compute_ai_batch)
+    แล้วจำลอง SL/TP ด้วย array operations
+
+    exits="close"    → ได้ไม้ชุดเดียวกับ backtest_loop()
+    exits="intrabar" → SL/TP ตาม High / Low ของแท่ง, แท่งที่แตะทั้ง SL และ TP อ่าน tick ช่วงแท่งนั้นจาก ticks
+    stats            → dict ที่จะถูกนับจำนวนไม้ตามวิธีตัดสินการปิด (gap / bar / tick / path)
+    """
+    if exits not in EXIT_MODELS:
+        raise ValueError(f"exits ต้องเป็น {EXIT_MODELS}")
+    df_raw = df_raw.reset_index(drop=True)
+    df = add_all_indicators(df_raw)
+    if df.empty or len(df_raw) <= WARMUP_BARS:
+        return []
+
+    ai_res = ai.compute_ai_batch(df)
+
+    # แท่งที่ i ของ loop เดิม ใช้แถวสุดท้ายของ add_all_indicators(df_raw.iloc[: i + 1])
+    # = แถวสุดท้ายของ df ที่ index (ตำแหน่งใน df_raw) <= i
+    raw_pos = df.index.to_numpy()
+    steps = np.arange(WARMUP_BARS, len(df_raw))
+    rows = np.searchsorted(raw_pos, steps, side="right") - 1
+    steps = steps[rows >= 0]
+    rows = rows[rows >= 0]
+    if len(rows) == 0:
+        return []
+
+    times = df["time"].iloc[rows].reset_index(drop=True)
+    price = df["Close"].to_numpy(dtype=np.float64)[rows]
+    atr = df["ATR"].to_numpy(dtype=np.float64)[rows]
+    adx = df["ADX"].to_numpy(dtype=np.float64)[rows]
+    macd_hist = df["MACD_HIST"].to_numpy(dtype=np.float64)[rows]
+    prob_up = ai_res["prob_up"][rows]
+    prob_down = ai_res["prob_down"][rows]
+    confidence = ai_res["confidence"][rows]
+
+    if exits == "intrabar":
+        # การปิดไม้ดูแท่งดิบของแต่ละ step (ไม่ใช่แถว indicator ล่าสุด)
+        bar_open = df_raw["Open"].to_numpy(dtype=np.float64)[steps]
+        bar_high = df_raw["High"].to_numpy(dtype=np.float64)[steps]
+        bar_low = df_raw["Low"].to_numpy(dtype=np.float64)[steps]
+        bar_close = df_raw["Close"].to_numpy(dtype=np.float64)[steps]
+        bar_times = df_raw["time"].iloc[steps].reset_index(drop=True)
+        bar_start = _epoch_seconds(df_raw["time"])
+        gaps = np.diff(bar_start)
+        bar_sec = float(np.median(gaps[gaps > 0])) if np.any(gaps > 0) else 60.0
+        bar_start = bar_start[steps]
+
+    # logic CONFIRM แบบเดียวกับ backtest_loop()
+    tradable = ~(adx < settings.ADX_TREND_THRESHOLD)
+    buy = tradable & (prob_up > 0.70) & (macd_hist > 0) & (confidence > 0.6)
+    sell = tradable & ~buy & (prob_down > 0.70) & (macd_hist < 0) & (confidence > 0.6)
+    signal_idx = np.flatnonzero(buy | sell)
+
+    trades: List[Trade] = []
+    pos = 0
+    while True:
+        j = int(np.searchsorted(signal_idx, pos, side="left"))
+        if j >= len(signal_idx):
+            break
+        e = int(signal_idx[j])
+        side = "BUY" if buy[e] else "SELL"
+        entry = float(price[e])
+        sl_dist = settings.ATR_SL_MULTIPLIER * float(atr[e])
+        tp_dist = settings.ATR_TP_MULTIPLIER * float(atr[e])
+        if side == "BUY":
+            sl = entry - sl_dist
+            tp = entry + tp_dist
+        else:
+            sl = entry + sl_dist
+            tp = entry - tp_dist
+
+        trade = Trade(
+            entry_time=str(times.iloc[e]),
+            exit_time=None,
+            side=side,
+            entry_price=entry,
+            exit_price=None,
+            sl=sl,
+            tp=tp,
+            result_r=None,
+        )
+
+        if exits == "intrabar":
+            x = _first_touch(bar_high, bar_low, e + 1, side, sl, tp)
+        else:
+            x = _first_exit(price, e + 1, side, sl, tp)
+        if x < 0:
+            # ไม้สุดท้ายยังไม่ปิด
+            trades.append(trade)
+            break
+
+        if exits == "intrabar":
+            bar_ticks = None
+            if ticks is not None:
+                bar_ticks = ticks.window(bar_start[x], bar_start[x] + bar_sec)
+            exit_price, _, tick_time, how = _resolve_intrabar(
+                bar_open[x], bar_high[x], bar_low[x], bar_close[x], side, sl, tp, bar_ticks
+            )
+            if side == "BUY":
+                r = (exit_price - entry) / (entry - sl)
+            else:
+                r = (entry - exit_price) / (sl - entry)
+            exit_time = str(pd.Timestamp(tick_time, unit="s")) if tick_time is not None else str(bar_times.iloc[x])
+            if stats is not None:
+                stats[how] = stats.get(how, 0) + 1
+        else:
+            exit_price = float(price[x])
+            if side == "BUY":
+                if exit_price >= tp:
+                    r = (tp - entry) / (entry - sl)
+                else:
+                    r = (sl - entry) / (entry - sl)
+            else:
+                if exit_price <= tp:
+                    r = (entry - tp) / (sl - entry)
+                else:
+                    r = (entry - sl) / (sl - entry)
+            exit_time = str(times.iloc[x])
+        trade.exit_time = exit_time
+        trade.exit_price = float(exit_price)
+        trade.result_r = r
+        trades.append(trade)
+
+        # แท่งที่ปิดไม้ เปิดไม้ใหม่ได้ทันที (เหมือน loop เดิม)
+        pos = x
+
+    return trades
+
+
+def _report(trades: List[Trade], out_path: str = "logs/backtest_trades.json") -> None:
     # สรุปผล
     Rs = [t.result_r for t in trades if t.result_r is not None]
     wins = [r for r in Rs if r > 0]
@@ -139,11 +371,92 @@ def backtest(csv_path: str):
     if losses:
         print(f"Avg Loss R: {sum(losses)/len(losses):.2f}")
 
-    os.makedirs("logs", exist_ok=True)
-    with open("logs/backtest_trades.json", "w", encoding="utf-8") as f:
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
         json.dump([t.__dict__ for t in trades], f, ensure_ascii=False, indent=2)
 
 
+def load_bars(csv_path: str) -> pd.DataFrame:
+    """
+    csv_path: ไฟล์ CSV หรือ "store:SYMBOL:TF" เพื่ออ่านจาก local bar store (core/bar_store.py)
+    """
+    if csv_path.startswith("store:"):
+        _, symbol, timeframe = csv_path.split(":", 2)
+        return get_bar_store(symbol, timeframe).to_frame()
+    df_raw = pd.read_csv(csv_path, parse_dates=["time"])
+    return df_raw.sort_values("time")
+
+
+def backtest(
+    csv_path: str,
+    mode: str = "vectorized",
+    exits: str = "intrabar",
+    ticks_path: Optional[str] = None,
+) -> List[Trade]:
+    """
+    mode      : "vectorized" (default, เร็ว) | "loop" (แบบเดิมทีละแท่ง, ปิดไม้ตาม Close เท่านั้น)
+    exits     : "intrabar" (default) | "close" — ดู EXIT_MODELS
+    ticks_path: CSV (time, bid, ask) หรือ .ticks สำหรับแท่งที่แตะทั้ง SL และ TP (memmap อ่านเฉพาะแท่งที่ต้องใช้)
+    """
+    df_raw = load_bars(csv_path)
+    ai = ExtremeAIEngine()
+
+    if mode == "loop":
+        trades = backtest_loop(df_raw, ai)
+    else:
+        ticks = open_ticks(ticks_path) if ticks_path else None
+        stats: Dict[str, int] = {}
+        trades = backtest_vectorized(df_raw, ai, exits=exits, ticks=ticks, stats=stats)
+        if exits == "intrabar":
+            print(
+                f"[BACKTEST] intrabar exits: bar={stats.get('bar', 0)} gap={stats.get('gap', 0)} "
+                f"| SL+TP ในแท่งเดียว: tick={stats.get('tick', 0)} path={stats.get('path', 0)}"
+            )
+
+    _report(trades)
+    return trades
+
+
+def check_parity(csv_path: str, bars: Optional[int] = None) -> bool:
+    """
+    รันทั้งสองโหมดบน CSV เดียวกันแล้วเทียบไม้ทีละตัว (vectorized ใช้ exits="close" แบบเดียวกับ loop)
+    bars: ใช้แค่ N แท่งแรก (loop เป็น O(N²) — ทั้งไฟล์ 5,000 แท่งใช้ ~2 นาที)
+    """
+    df_raw = load_bars(csv_path)
+    if bars is not None:
+        df_raw = df_raw.iloc[:bars].reset_index(drop=True)
+    ai = ExtremeAIEngine()
+
+    t0 = time.perf_counter()
+    ref = backtest_loop(df_raw, ai)
+    t1 = time.perf_counter()
+    vec = backtest_vectorized(df_raw, ai, exits="close")
+    t2 = time.perf_counter()
+
+    same = [t.__dict__ for t in ref] == [t.__dict__ for t in vec]
+    print(f"[BACKTEST] loop={len(ref)} trades ({t1 - t0:.2f}s) | vectorized={len(vec)} trades ({t2 - t1:.2f}s)")
+    print("[BACKTEST] parity:", "OK" if same else "MISMATCH")
+    return same
+
+
 if __name__ == "__main__":
     # เตรียมไฟล์ CSV: time,Open,High,Low,Close,Volume
-    backtest("data/backtest_XAUUSD.csv")
+    #   python -m scripts.backtest [csv] [--loop | --check [--bars=N]] [--store] [--close-exits] [--ticks=ticks.csv]
+    #   --bars=N      = --check เฉพาะ N แท่งแรก
+    #   --store       = ใช้ bar store ของ SYMBOL / TIMEFRAME ใน .env แทน CSV
+    #   --close-exits = ปิดไม้ตาม Close แบบเดิม (default = High / Low ของแท่ง)
+    #   --ticks=PATH  = tick (time, bid, ask) หรือ .ticks สำหรับแท่งที่แตะทั้ง SL และ TP
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    path = args[0] if args else "data/backtest_XAUUSD.csv"
+    ticks_path = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--ticks=")), None)
+    if "--store" in sys.argv:
+        path = f"store:{settings.SYMBOL}:{settings.TIMEFRAME}"
+    bars = next((int(a.split("=", 1)[1]) for a in sys.argv[1:] if a.startswith("--bars=")), None)
+    if "--check" in sys.argv:
+        sys.exit(0 if check_parity(path, bars=bars) else 1)
+    backtest(
+        path,
+        mode="loop" if "--loop" in sys.argv else "vectorized",
+        exits="close" if "--close-exits" in sys.argv else "intrabar",
+        ticks_path=ticks_path,
+    )
@@ -1,48 +1,40 @@
-import json
-import os
+import argparse
 
 import numpy as np
 import pandas as pd
-from datetime import datetime
+
+from core.ai_logger import list_ai_log_days, load_ai_logs
 
 
-LOG_PATH = f"logs/ai_log_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
 HORIZON_BARS = 5   # ดูผลลัพธ์ในอนาคตอีกกี่แท่ง (เช่น 5 แท่ง = 5 * TF)
+EVAL_COLUMNS = ["symbol", "timeframe", "close", "ai_prob_up", "ai_prob_down", "ai_confidence", "confirm_signal"]
 
 
-def load_ai_log(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-    rows = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    df = pd.DataFrame(rows)
-    if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"])
-        df.sort_values("time", inplace=True)
+def add_future_return(df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    """
+    future_ret = ผลตอบแทนในอนาคต (อีก horizon แท่งข้างหน้า) ของ symbol / timeframe เดียวกัน
+    ถ้า timeframe = M1, horizon=5 → ประมาณ 5 นาที (แบบเดียวกับ core/ai_eval.py — log หลาย pair ไม่ปนกัน)
+    """
+    df = df.copy()
+    keys = [c for c in ("symbol", "timeframe") if c in df.columns]
+    if keys:
+        df["future_close"] = df.groupby(keys, sort=False, dropna=False)["close"].shift(-horizon)
+    else:
+        df["future_close"] = df["close"].shift(-horizon)
+    df["future_ret"] = df["future_close"] / df["close"] - 1.0
     return df
 
 
 def evaluate_direction(df: pd.DataFrame, horizon: int = 5, only_confirm: bool = False):
-    df = df.copy()
+    # ราคาอนาคตมาจากทุกแถวของ pair ก่อนกรอง confirm (แท่งถัดไปไม่จำเป็นต้องเป็น confirm)
+    df = add_future_return(df, horizon)
 
     if only_confirm:
-        df = df[df.get("confirm_signal", False)].copy()
+        df = df[df["confirm_signal"].fillna(False).astype(bool)] if "confirm_signal" in df.columns else df.iloc[:0]
         if df.empty:
             print("⚠ ไม่มีแถวที่เป็น confirm_signal ใน log นี้")
             return
 
-    # future_ret = ผลตอบแทนในอนาคต (อีก horizon แท่งข้างหน้า)
-    # ถ้า timeframe = M1, horizon=5 → ประมาณ 5 นาที
-    df["future_close"] = df["close"].shift(-horizon)
-    df["future_ret"] = df["future_close"] / df["close"] - 1.0
     df = df.dropna(subset=["future_ret"])
 
     # ทิศที่ AI ทาย: 1 = UP, -1 = DOWN
@@ -112,8 +104,29 @@ def evaluate_by_confidence(df: pd.DataFrame):
 
 
 def main():
-    print("[EVAL_AI] load log from", LOG_PATH)
-    df = load_ai_log(LOG_PATH)
+    parser = argparse.ArgumentParser(description="ประเมิน AI จาก AI log")
+    parser.add_argument("--days", type=int, default=1, help="ย้อนหลังกี่วัน (1 = วันนี้)")
+    parser.add_argument("--start", default=None, help="เวลาเริ่ม เช่น 2025-12-01 (ทับ --days)")
+    parser.add_argument("--end", default=None, help="เวลาสิ้นสุด (ไม่รวม)")
+    parser.add_argument("--symbol", default=None)
+    parser.add_argument("--horizon", type=int, default=HORIZON_BARS)
+    args = parser.parse_args()
+
+    where = {"symbol": args.symbol} if args.symbol else None
+    if args.start is not None:
+        print(f"[EVAL_AI] load log from {args.start} to {args.end or 'now'}")
+        df = load_ai_logs(start=args.start, end=args.end, columns=EVAL_COLUMNS, where=where)
+    else:
+        # --days นับตามเวลาแท่ง (นาฬิกาเดียวกับ column time ไม่ใช่เวลาเครื่อง): วันล่าสุด = วันของแท่งล่าสุดใน log
+        days = max(args.days, 1)
+        df = load_ai_logs(days=list_ai_log_days()[-(days + 1) :], end=args.end, columns=EVAL_COLUMNS, where=where)
+        if not df.empty:
+            start = df["time"].max().normalize() - pd.Timedelta(days=days - 1)
+            print(f"[EVAL_AI] last {days} day(s) of bar time: from {start} to {args.end or 'now'}")
+            df = df[df["time"] >= start].reset_index(drop=True)
+    # record อื่นใน log (เช่น perf) ไม่มีราคา → ตัดทิ้ง
+    if "close" in df.columns:
+        df = df.dropna(subset=["close"])
 
     if df.empty:
         print("⚠ log ว่าง ไม่มีข้อมูลให้ประเมิน")
@@ -124,16 +137,12 @@ def main():
         df["close"] = df["Close"]
 
     # ประเมินทุกแท่ง (เสมือนเข้าไม้ทุกครั้งที่ AI ทาย)
-    df_all = evaluate_direction(df, horizon=HORIZON_BARS, only_confirm=False)
+    df_all = evaluate_direction(df, horizon=args.horizon, only_confirm=False)
 
     # ประเมินเฉพาะจุดที่มี confirm_signal (สัญญาณเทรดจริง)
-    df_conf = evaluate_direction(df, horizon=HORIZON_BARS, only_confirm=True)
-
-    # ทำ future_ret ทิ้งไว้สำหรับ confidence bin
-    df_all["future_close"] = df_all["close"].shift(-HORIZON_BARS)
-    df_all["future_ret"] = df_all["future_close"] / df_all["close"] - 1.0
-    df_all = df_all.dropna(subset=["future_ret"])
+    evaluate_direction(df, horizon=args.horizon, only_confirm=True)
 
+    # df_all มี future_ret (ตาม symbol / timeframe) แล้ว → แบ่งตาม confidence bin
     evaluate_by_confidence(df_all)
 
 
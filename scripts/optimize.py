@@ -0,0 +1,368 @@
+# scripts/optimize.py
+"""
+Walk-forward optimizer สำหรับ threshold ของ AI_MODE + RR matrix ของ SL/TP + AI_AMPLIFY_FACTOR
+
+- คำนวณ indicators / rule-based / LSTM / regime ครั้งเดียวทั้ง history (compute_ai_batch)
+  ทุก candidate ใช้ array ชุดเดียวกัน — เปลี่ยนแค่ threshold / amplify / SL-TP จึงไม่ต้องคำนวณใหม่
+- กระจาย candidate ไปหลาย CPU core ด้วย ProcessPoolExecutor (array ส่งให้ worker ครั้งเดียวตอนเริ่ม)
+- walk-forward: fold ละ [train | test] เลื่อนไปเรื่อย ๆ เลือก candidate ดีสุดจาก train
+  แล้วรายงาน expectancy (R ต่อไม้) บน test ที่ไม่เคยเห็น (out-of-sample)
+- profile สุดท้าย = candidate ดีสุดบนช่วง train ล่าสุด → เขียนเป็น JSON ให้ live loop โหลดผ่าน AI_PROFILE_PATH
+  threshold + amplify_factor + rr_matrix เก็บใต้ modes[<mode>] และรายงานใต้ runs[<mode>]
+  → optimize ทีละ mode ได้โดยไม่ทับค่าของ mode อื่นในไฟล์เดิม
+- ไม่มี candidate ไหนถึง --min-trades บนช่วงสุดท้าย → ไม่แตะไฟล์ profile เดิม และ exit code 1
+
+ใช้:
+  python -m scripts.optimize [csv] [--store] [--mode NORMAL] [--folds 4] [--train-mult 3]
+                             [--min-trades 10] [--workers N] [--out models/ai_profile.json]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.ai_engine import ExtremeAIEngine, amplify_prob_up
+from core.ai_profile import DEFAULT_PROFILE, save_ai_profile
+from core.config import settings
+from core.indicators import add_all_indicators
+from core.trade_utils import compute_sl_tp_by_ai
+from scripts.backtest import WARMUP_BARS, _first_touch, _resolve_intrabar, load_bars
+
+# ช่วงค่าที่ sweep (th ใช้ทั้ง th_up / th_down — ทุก mode เดิมตั้งสองค่าเท่ากัน)
+# sl_scale / rr_scale คูณทั้ง RR matrix default (ค่า 1.0 = matrix เดิม)
+PARAM_GRID: Dict[str, List[float]] = {
+    "th": [0.53, 0.55, 0.58, 0.62, 0.65, 0.70],
+    "th_conf": [0.35, 0.45, 0.55, 0.60],
+    "macd_margin": [0.00, 0.03, 0.07],
+    "amplify": [2.0, 3.0, 4.0],
+    "sl_scale": [0.8, 1.0, 1.25],
+    "rr_scale": [0.8, 1.0, 1.2],
+}
+
+# array ที่ worker ใช้ร่วมกัน (ตั้งใน _init_worker)
+_DATA: Dict[str, np.ndarray] = {}
+
+
+def count_confirm_factors_batch(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """main.count_confirm_factors() แบบ array — คืน (factors ฝั่ง BUY, factors ฝั่ง SELL) ทุกแถว"""
+
+    def col(name: str, default: float) -> np.ndarray:
+        if name not in df.columns:
+            return np.full(len(df), default, dtype=np.float64)
+        return df[name].fillna(default).to_numpy(dtype=np.float64)
+
+    ema_trend = col("EMA_TREND", 0)
+    bb_pct_b = col("BB_PCT_B", 0.5)
+    stoch_k = col("STOCH_K", 50)
+    vol_spike = (col("VOL_RATIO", 1.0) > 1.3).astype(np.int64)
+    bull_pattern = (col("BULLISH_ENGULF", 0) != 0) | (col("HAMMER", 0) != 0)
+    bear_pattern = (col("BEARISH_ENGULF", 0) != 0) | (col("SHOOTING_STAR", 0) != 0)
+
+    buy = (
+        (ema_trend >= 1).astype(np.int64)
+        + (bb_pct_b < 0.35)
+        + (stoch_k < 40)
+        + bull_pattern
+        + vol_spike
+    )
+    sell = (
+        (ema_trend <= -1).astype(np.int64)
+        + (bb_pct_b > 0.65)
+        + (stoch_k > 60)
+        + bear_pattern
+        + vol_spike
+    )
+    return buy, sell
+
+
+def precompute(df_raw: pd.DataFrame, ai: ExtremeAIEngine) -> Dict[str, np.ndarray]:
+    """indicators + คะแนน AI ทั้ง history ครั้งเดียว (ตัดช่วง warm-up ออกแบบเดียวกับ backtest)"""
+    df_raw = df_raw.reset_index(drop=True)
+    df_full = add_all_indicators(df_raw)
+    keep = np.flatnonzero(df_full.index.to_numpy() >= WARMUP_BARS)
+    if len(keep) == 0:
+        return {}
+
+    ai_res = ai.compute_ai_batch(df_full)
+    df = df_full.iloc[keep]
+    buy_factors, sell_factors = count_confirm_factors_batch(df)
+
+    return {
+        "time": df["time"].astype(str).to_numpy(),
+        "open": df["Open"].to_numpy(dtype=np.float64),
+        "high": df["High"].to_numpy(dtype=np.float64),
+        "low": df["Low"].to_numpy(dtype=np.float64),
+        "close": df["Close"].to_numpy(dtype=np.float64),
+        "atr": df["ATR"].to_numpy(dtype=np.float64),
+        "adx": df["ADX"].to_numpy(dtype=np.float64),
+        "bb_width": df["BB_WIDTH"].to_numpy(dtype=np.float64),
+        "macd_hist": df["MACD_HIST"].to_numpy(dtype=np.float64),
+        "raw_prob_up": np.asarray(ai_res["raw_prob_up"], dtype=np.float64)[keep],
+        "regime": np.asarray(ai_res["regime"], dtype=object)[keep],
+        "buy_factors": buy_factors,
+        "sell_factors": sell_factors,
+    }
+
+
+def scaled_rr_matrix(sl_scale: float, rr_scale: float) -> Dict[str, List[List[float]]]:
+    return {
+        regime: [[min_conf, round(sl * sl_scale, 3), round(rr * rr_scale, 3)] for min_conf, sl, rr in rows]
+        for regime, rows in DEFAULT_PROFILE["rr_matrix"].items()
+    }
+
+
+def simulate(data: Dict[str, np.ndarray], params: Dict[str, float], lo: int, hi: int) -> Dict[str, float]:
+    """
+    จำลองไม้บนแถว [lo, hi) ด้วย logic CONFIRM + SL/TP เดียวกับ live loop (ถือทีละไม้)
+    ไม้ที่ยังไม่ปิดเมื่อจบช่วงไม่นับ
+    """
+    prob_up = amplify_prob_up(data["raw_prob_up"][lo:hi], params["amplify"])
+    prob_down = 1.0 - prob_up
+    confidence = np.abs(prob_up - 0.5) * 2.0
+    macd_hist = data["macd_hist"][lo:hi]
+    th, th_conf, margin = params["th"], params["th_conf"], params["macd_margin"]
+    min_factors = getattr(settings, "MIN_CONFIRM_FACTORS", 2)
+
+    # if BUY ... elif SELL — ฝั่ง SELL ถูกพิจารณาเฉพาะแท่งที่เงื่อนไข BUY ไม่ผ่าน
+    buy_base = (prob_up > th) & (macd_hist > -margin) & (confidence > th_conf)
+    sell_base = ~buy_base & (prob_down > th) & (macd_hist < margin) & (confidence > th_conf)
+    buy = buy_base & (data["buy_factors"][lo:hi] >= min_factors)
+    sell = sell_base & (data["sell_factors"][lo:hi] >= min_factors)
+    signal_idx = np.flatnonzero(buy | sell)
+
+    price = data["close"][lo:hi]
+    bar_open, bar_high, bar_low = data["open"][lo:hi], data["high"][lo:hi], data["low"][lo:hi]
+    rr_matrix = scaled_rr_matrix(params["sl_scale"], params["rr_scale"])
+    results: List[float] = []
+    pos = 0
+    while True:
+        j = int(np.searchsorted(signal_idx, pos, side="left"))
+        if j >= len(signal_idx):
+            break
+        e = int(signal_idx[j])
+        side = "BUY" if buy[e] else "SELL"
+        entry = float(price[e])
+        sl, tp = compute_sl_tp_by_ai(
+            entry_price=entry,
+            side=side,
+            atr=float(data["atr"][lo + e]),
+            regime=str(data["regime"][lo + e]),
+            confidence=float(confidence[e]),
+            bb_width=float(data["bb_width"][lo + e]),
+            adx=float(data["adx"][lo + e]),
+            rr_matrix=rr_matrix,
+        )
+        risk = abs(entry - sl)
+        if risk <= 0:
+            pos = e + 1
+            continue
+
+        # ปิดไม้ตาม High / Low ของแท่งแบบเดียวกับ backtest (exits="intrabar", ไม่มี tick)
+        x = _first_touch(bar_high, bar_low, e + 1, side, sl, tp)
+        if x < 0:
+            break
+        exit_price, _, _, _ = _resolve_intrabar(
+            float(bar_open[x]), float(bar_high[x]), float(bar_low[x]), float(price[x]), side, sl, tp
+        )
+        results.append((exit_price - entry) / risk if side == "BUY" else (entry - exit_price) / risk)
+        pos = x
+
+    trades = len(results)
+    wins = sum(1 for r in results if r > 0)
+    return {
+        "trades": trades,
+        "expectancy": float(np.mean(results)) if trades else 0.0,
+        "total_r": float(np.sum(results)) if trades else 0.0,
+        "win_rate": wins / trades if trades else 0.0,
+    }
+
+
+def _init_worker(data: Dict[str, np.ndarray]) -> None:
+    global _DATA
+    _DATA = data
+
+
+def _evaluate_chunk(
+    candidates: List[Dict[str, float]],
+    segments: List[Tuple[int, int]],
+) -> List[List[Dict[str, float]]]:
+    """รันใน worker process: ผลของทุก candidate บนทุก segment"""
+    return [[simulate(_DATA, params, lo, hi) for lo, hi in segments] for params in candidates]
+
+
+def build_candidates(grid: Optional[Dict[str, List[float]]] = None) -> List[Dict[str, float]]:
+    grid = grid or PARAM_GRID
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def walk_forward_splits(n: int, folds: int, train_mult: int) -> Tuple[List[Tuple[Tuple[int, int], Tuple[int, int]]], Tuple[int, int]]:
+    """
+    แบ่ง n แถวเป็น fold แบบ rolling: train ยาว train_mult เท่าของ test
+    คืน ([(train, test), ...], ช่วง train ล่าสุดสำหรับ profile สุดท้าย)
+    """
+    test_len = n // (folds + train_mult)
+    if test_len <= 0:
+        raise ValueError(f"not enough bars for {folds} folds (n={n})")
+    train_len = test_len * train_mult
+    splits = []
+    for k in range(folds):
+        train = (k * test_len, k * test_len + train_len)
+        test = (train[1], train[1] + test_len)
+        splits.append((train, test))
+    final_train = (n - train_len, n)
+    return splits, final_train
+
+
+def _score(stats: Dict[str, float], min_trades: int) -> float:
+    if stats["trades"] < min_trades:
+        return float("-inf")
+    return stats["expectancy"]
+
+
+def optimize(
+    df_raw: pd.DataFrame,
+    mode: str = "NORMAL",
+    folds: int = 4,
+    train_mult: int = 3,
+    min_trades: int = 10,
+    workers: Optional[int] = None,
+    grid: Optional[Dict[str, List[float]]] = None,
+) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    data = precompute(df_raw, ExtremeAIEngine())
+    if not data:
+        raise ValueError("not enough bars after warm-up")
+    n = len(data["close"])
+    t1 = time.perf_counter()
+    print(f"[OPT] precomputed {n} bars in {t1 - t0:.2f}s")
+
+    splits, final_train = walk_forward_splits(n, folds, train_mult)
+    segments = [seg for split in splits for seg in split] + [final_train]
+    candidates = build_candidates(grid)
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, len(candidates) // (workers * 4))
+    chunks = [candidates[i : i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+    print(f"[OPT] {len(candidates)} candidates × {len(segments)} segments on {workers} workers")
+
+    results: List[List[Dict[str, float]]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,)) as pool:
+        for chunk_result in pool.map(_evaluate_chunk, chunks, itertools.repeat(segments)):
+            results.extend(chunk_result)
+    t2 = time.perf_counter()
+    print(f"[OPT] evaluated in {t2 - t1:.2f}s")
+
+    fold_reports = []
+    oos_r: List[float] = []
+    oos_trades = 0
+    for k, (train, test) in enumerate(splits):
+        scores = [_score(res[2 * k], min_trades) for res in results]
+        best = int(np.argmax(scores))
+        is_stats, oos_stats = results[best][2 * k], results[best][2 * k + 1]
+        fold_reports.append(
+            {
+                "fold": k + 1,
+                "train": [data["time"][train[0]], data["time"][train[1] - 1]],
+                "test": [data["time"][test[0]], data["time"][test[1] - 1]],
+                "params": candidates[best],
+                "in_sample": is_stats,
+                "out_of_sample": oos_stats,
+            }
+        )
+        oos_r.append(oos_stats["total_r"])
+        oos_trades += oos_stats["trades"]
+        print(
+            f"[OPT] fold {k + 1}: IS exp={is_stats['expectancy']:+.3f}R ({is_stats['trades']} trades) | "
+            f"OOS exp={oos_stats['expectancy']:+.3f}R ({oos_stats['trades']} trades) | {candidates[best]}"
+        )
+
+    final_scores = [_score(res[-1], min_trades) for res in results]
+    best = int(np.argmax(final_scores))
+    params = candidates[best]
+    if final_scores[best] == float("-inf"):
+        print(f"[OPT] no candidate reached {min_trades} trades on the final window")
+        params = None
+
+    oos_expectancy = sum(oos_r) / oos_trades if oos_trades else 0.0
+    print(f"[OPT] walk-forward OOS expectancy: {oos_expectancy:+.3f}R over {oos_trades} trades")
+
+    run: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "bars": n,
+        "walk_forward": {
+            "folds": fold_reports,
+            "oos_expectancy": oos_expectancy,
+            "oos_trades": oos_trades,
+        },
+    }
+    profile: Dict[str, Any] = {"version": DEFAULT_PROFILE["version"], "runs": {mode: run}}
+    if params is not None:
+        run["params"] = params
+        run["final_window"] = results[best][-1]
+        profile["modes"] = {
+            mode: {
+                "th_up": params["th"],
+                "th_down": params["th"],
+                "th_conf": params["th_conf"],
+                "macd_margin": params["macd_margin"],
+                "amplify_factor": params["amplify"],
+                "rr_matrix": scaled_rr_matrix(params["sl_scale"], params["rr_scale"]),
+            }
+        }
+    return profile
+
+
+def merge_profile(previous: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    รวมผลของ mode ที่เพิ่ง optimize เข้ากับไฟล์ profile เดิม (ไฟล์ดิบ ไม่รวม default)
+    mode อื่น / ค่าระดับบน (amplify_factor, rr_matrix ที่แก้เอง) ของไฟล์เดิมคงไว้
+    """
+    merged = {**previous, "version": result["version"]}
+    for key in ("modes", "runs"):
+        merged[key] = {**previous.get(key, {}), **result.get(key, {})}
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward optimizer → AI profile")
+    parser.add_argument("csv", nargs="?", default="data/backtest_XAUUSD.csv")
+    parser.add_argument("--store", action="store_true", help="ใช้ bar store ของ SYMBOL / TIMEFRAME ใน .env")
+    parser.add_argument("--mode", default=settings.AI_MODE.upper(), choices=list(DEFAULT_PROFILE["modes"]))
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--train-mult", type=int, default=3, help="train ยาวกี่เท่าของ test")
+    parser.add_argument("--min-trades", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=settings.AI_PROFILE_PATH or "models/ai_profile.json")
+    args = parser.parse_args()
+
+    path = f"store:{settings.SYMBOL}:{settings.TIMEFRAME}" if args.store else args.csv
+    result = optimize(
+        load_bars(path),
+        mode=args.mode,
+        folds=args.folds,
+        train_mult=args.train_mult,
+        min_trades=args.min_trades,
+        workers=args.workers,
+    )
+
+    if "modes" not in result:
+        print(f"[OPT] ไม่มี candidate ที่ได้ >= {args.min_trades} ไม้ — ไม่แก้ {args.out}")
+        sys.exit(1)
+
+    # เก็บ mode อื่นที่ profile เดิมมีไว้ (optimize ทีละ mode ได้)
+    previous: Dict[str, Any] = {}
+    if os.path.exists(args.out):
+        with open(args.out, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    save_ai_profile(merge_profile(previous, result), args.out)
+    print(f"[OPT] profile saved → {args.out} (ตั้ง AI_PROFILE_PATH={args.out} ใน .env เพื่อใช้กับ live loop)")
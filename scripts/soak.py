@@ -0,0 +1,172 @@
+# scripts/soak.py
+"""
+Soak / throughput test ของ main.main_loop บนโบรกจำลอง (ไม่ต้องมี MT5)
+
+    python -m scripts.soak data/backtest_XAUUSD.csv                 # replay ทั้งไฟล์
+    python -m scripts.soak --store --bars 20000                     # bar store ของ SYMBOL / TIMEFRAME
+    python -m scripts.soak data.csv --ticks ticks.csv --mode bar_close --interval 5
+
+- ตั้ง BROKER_BACKEND=SIM ก่อน import core.* / main → loop เดิมทั้งหมด (fetch → AI → order → log → state)
+- นาฬิกาจำลองเลื่อน --interval วินาทีต่อรอบ (default = 1 แท่ง) → วัดได้ว่า loop รับได้กี่แท่ง / วินาที
+- ปิด LLM / Discord, เปิด AUTO_TRADE และเขียน log ไปที่ --out (ไม่ปน logs/ ของ bot จริง)
+- จบแล้วตรวจ account ของโบรกจำลอง: balance = ทุนเริ่ม + กำไรของ deal ที่ปิด, equity = balance + กำไรลอย
+  ไม่ตรง → exit code 1
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+TF_SECONDS = {"M1": 60, "M5": 300, "M15": 900, "M30": 1800, "H1": 3600, "H4": 14400, "D1": 86400}
+
+
+def _configure_env(args) -> None:
+    """ต้องตั้งก่อน import core.config (Settings อ่าน env ตอน import)"""
+    env = {
+        "BROKER_BACKEND": "SIM",
+        "SIM_DATA": args.data or "",
+        "SIM_TICKS": args.ticks or "",
+        "SIM_SPEED": str(args.speed),
+        "AUTO_TRADE_ENABLED": "true",
+        "LLM_ADVISOR_ENABLED": "false",
+        "DISCORD_WEBHOOK_URL": "",
+        "AI_LOG_PATH": os.path.join(args.out, "ai_log.jsonl"),
+        "AI_LAST_STATE_PATH": os.path.join(args.out, "last_state.json"),
+        "PERF_PROFILE_DIR": os.path.join(args.out, "profiles"),
+        "TRADE_JOURNAL_PATH": os.path.join(args.out, "trades_log.jsonl"),
+        "BROKER_CACHE_STAMP_PATH": os.path.join(args.out, "broker_cache.stamp"),
+        "EQUITY_STATE_PATH": os.path.join(args.out, "equity_state.json"),
+    }
+    if args.mode:
+        env["LOOP_MODE"] = args.mode.upper()
+    if args.spread is not None:
+        env["SIM_SPREAD_POINTS"] = str(args.spread)
+    if args.slippage is not None:
+        env["SIM_SLIPPAGE_POINTS"] = str(args.slippage)
+    if args.balance is not None:
+        env["SIM_BALANCE"] = str(args.balance)
+    os.environ.update(env)
+
+
+def check_account(sim) -> list:
+    """คืนรายการความไม่สอดคล้องของ account / positions / deals (ว่าง = ผ่าน)"""
+    problems = []
+    account = sim.account_info()
+    positions = sim.positions_get()
+    deals = sim.history_deals_get()
+
+    realized = sum(d.profit for d in deals)
+    if abs(sim.initial_balance + realized - account.balance) > 0.01:
+        problems.append(f"balance {account.balance} != initial {sim.initial_balance} + realized {realized:.2f}")
+    floating = sum(p.profit for p in positions)
+    if abs(account.balance + floating - account.equity) > 0.01:
+        problems.append(f"equity {account.equity} != balance {account.balance} + floating {floating:.2f}")
+
+    opened = {d.position_id: d.volume for d in deals if d.entry == sim.DEAL_ENTRY_IN}
+    closed = {}
+    for d in deals:
+        if d.entry == sim.DEAL_ENTRY_OUT:
+            closed[d.position_id] = closed.get(d.position_id, 0.0) + d.volume
+    open_tickets = {p.ticket: p.volume for p in positions}
+    for ticket, volume in opened.items():
+        remaining = round(volume - closed.get(ticket, 0.0), 8)
+        if remaining > 0 and abs(open_tickets.get(ticket, 0.0) - remaining) > 1e-9:
+            problems.append(f"position {ticket}: deals say {remaining} lots open, positions_get says {open_tickets.get(ticket)}")
+        if remaining <= 0 and ticket in open_tickets:
+            problems.append(f"position {ticket} closed by deals but still in positions_get")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Soak test main_loop บนโบรกจำลอง")
+    parser.add_argument("data", nargs="?", help="CSV หรือ store:SYMBOL:TF (ไม่ใส่ = bar store ของ SYMBOL)")
+    parser.add_argument("--store", action="store_true", help="ใช้ bar store ของ SYMBOL / TIMEFRAME ใน .env")
+    parser.add_argument("--ticks", help="CSV tick (time, bid, ask) — SL/TP ตรวจตาม tick จริง")
+    parser.add_argument("--bars", type=int, help="จำนวนรอบต่อ pair (default = จน replay หมด)")
+    parser.add_argument("--mode", choices=["poll", "bar_close"], help="LOOP_MODE (default ตาม .env)")
+    parser.add_argument("--interval", type=float, help="วินาทีจำลองต่อรอบ (default = 1 แท่งของ TIMEFRAME)")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = เร็วที่สุด, 60 = เร็วกว่าเวลาจริง 60 เท่า")
+    parser.add_argument("--spread", type=float, help="spread (points)")
+    parser.add_argument("--slippage", type=float, help="slippage สูงสุด (points)")
+    parser.add_argument("--balance", type=float, help="ทุนเริ่มต้นของบัญชีจำลอง")
+    parser.add_argument("--out", default=os.path.join("logs", "soak"), help="โฟลเดอร์ log ของรอบ soak")
+    parser.add_argument("--verbose", action="store_true", help="แสดง log [LOOP] ทุกรอบ")
+    args = parser.parse_args(argv)
+
+    if args.store:
+        args.data = ""
+    _configure_env(args)
+
+    import main as bot
+    from core.ai_logger import flush_ai_log
+    from core.broker import get_broker
+    from core.config import settings
+    from core.profiler import profiler
+    from core.trade_logger import trade_journal
+
+    if args.interval is None:
+        settings.LOOP_INTERVAL_SEC = TF_SECONDS.get(settings.TIMEFRAME.upper(), 60)
+    else:
+        settings.LOOP_INTERVAL_SEC = args.interval
+
+    sim = get_broker()
+    start_clock = sim.time()
+    pairs = settings.trading_pairs()
+    print(
+        f"[SOAK] {', '.join(f'{s} {tf}' for s, tf, _ in pairs)} | mode={settings.LOOP_MODE} "
+        f"interval={settings.LOOP_INTERVAL_SEC}s bars={args.bars or 'all'}"
+    )
+
+    t0 = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            devnull = stack.enter_context(open(os.devnull, "w"))
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+        bot.main_loop(max_iterations=args.bars)
+    elapsed = time.perf_counter() - t0
+    flush_ai_log()
+
+    sim_bars = (sim.time() - start_clock) / sim.bar_seconds
+    stages = profiler.snapshot()
+    iterations = stages.get("iteration", {})
+    account = sim.account_info()
+    deals = sim.history_deals_get()
+    closed = [d for d in deals if d.entry == sim.DEAL_ENTRY_OUT]
+    wins = sum(1 for d in closed if d.profit > 0)
+
+    print(f"[SOAK] wall {elapsed:.2f}s | {sim_bars:,.0f} bars replayed → {sim_bars / max(elapsed, 1e-9):,.0f} bars/s")
+    if iterations:
+        print(
+            f"[SOAK] iteration p50={iterations['p50_ms']}ms p99={iterations['p99_ms']}ms "
+            f"max={iterations['max_ms']}ms ({iterations['count']} runs)"
+        )
+        print(
+            "[SOAK] stages p50: "
+            + " ".join(f"{name}={s['p50_ms']}ms" for name, s in stages.items() if name != "iteration")
+        )
+    print(
+        f"[SOAK] trades opened={sum(1 for d in deals if d.entry == sim.DEAL_ENTRY_IN)} closed={len(closed)} "
+        f"wins={wins} | balance={account.balance} equity={account.equity} open={len(sim.positions_get())}"
+    )
+
+    trade_journal.reconcile()
+    journal = trade_journal.stats()
+    print(
+        f"[SOAK] journal closed={journal['closed']} open={journal['open']} win_rate={journal['win_rate']} "
+        f"avg_rr={journal['avg_rr']} expectancy={journal['expectancy_r']}R net={journal['net_profit']}"
+    )
+
+    problems = check_account(sim)
+    if problems:
+        print("[SOAK] ACCOUNT MISMATCH:")
+        for p in problems:
+            print("  -", p)
+        return 1
+    print("[SOAK] account consistent")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
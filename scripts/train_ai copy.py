@@ -1,40 +1,24 @@
-import json
 import os
 
 import pandas as pd
 
+from core.ai_logger import BASE_AI_LOG_DIR, load_ai_logs
 from core.config import settings
 from core.indicators import add_all_indicators
 from core.lstm_model import ExtremeLSTM
 
 
-def load_ai_log(path: str) -> pd.DataFrame:
-    # เดิม: if not os.path.exists(path): raise FileNotFoundError(path)
-    # แก้เป็น: ถ้าไม่เจอไฟล์ ให้แจ้งแล้วคืน DataFrame ว่าง ๆ
-    if not os.path.exists(path):
-        print(f"[TRAIN_AI] log file not found: {path}")
-        return pd.DataFrame()
-
-    rows = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    df = pd.DataFrame(rows)
-    if "time" in df.columns:
-        df["time"] = pd.to_datetime(df["time"])
-        df.sort_values("time", inplace=True)
+def load_ai_log() -> pd.DataFrame:
+    # อ่านทุกวันที่มี (jsonl ของวันนี้ + npz ของวันที่ปิดแล้ว) ผ่าน loader กลาง
+    df = load_ai_logs(columns=["close"], where={"symbol": settings.SYMBOL})
+    if df.empty:
+        print(f"[TRAIN_AI] no AI log found in {BASE_AI_LOG_DIR}")
     return df
 
 
 def main():
-    print("[TRAIN_AI] loading logs from", settings.AI_LOG_PATH)
-    df_log = load_ai_log(settings.AI_LOG_PATH)
+    print("[TRAIN_AI] loading logs from", BASE_AI_LOG_DIR)
+    df_log = load_ai_log()
 
     # กันเคสไม่มี log หรืออ่านแล้วว่าง
     if df_log.empty:
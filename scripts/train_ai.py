@@ -27,7 +27,8 @@ def main():
     symbol = settings.SYMBOL
     timeframe = settings.TIMEFRAME
 
-    print(f"[TRAIN_AI] fetching {bars} bars of {symbol} {timeframe} from MT5...")
+    source = "bar store + MT5" if settings.BAR_STORE_ENABLED else "MT5"
+    print(f"[TRAIN_AI] fetching {bars} bars of {symbol} {timeframe} from {source}...")
     df_raw = get_recent_ohlc(symbol, timeframe, bars)
     if df_raw is None or df_raw.empty:
         print(
@@ -50,7 +51,7 @@ def main():
 
     model = ExtremeLSTM()
     print("[TRAIN_AI] start training...")
-    model.fit(df_ind, epochs=5, batch_size=32)
+    model.fit(df_ind, epochs=5, batch_size=32, normalize=settings.LSTM_NORMALIZE)
 
     os.makedirs(os.path.dirname(settings.LSTM_MODEL_PATH), exist_ok=True)
     model.save(settings.LSTM_MODEL_PATH)
@@ -63,7 +64,8 @@ def main():
         "symbol": symbol,
         "timeframe": timeframe,
         "epochs": 5,
-        "source": "MT5",
+        "normalized": settings.LSTM_NORMALIZE,
+        "source": "BAR_STORE" if settings.BAR_STORE_ENABLED else "MT5",
     }
     os.makedirs("logs", exist_ok=True)
     with open("logs/last_train.json", "w", encoding="utf-8") as f:
@@ -0,0 +1,60 @@
+# tests/conftest.py
+"""
+pytest ของ Extreme-AI — รัน offline ทั้งหมด (ไม่แตะ MT5 terminal จริง)
+
+    python -m pytest -q
+
+- ข้อมูลอ้างอิง: data/reference/EURUSD_H1.csv (แท่ง H1 จริง 5,000 แท่ง ดู README หัวข้อ Tests)
+- BROKER_BACKEND บังคับเป็น SIM ก่อน import core.* (กัน test ไปเรียก MetaTrader5)
+- BROKER_CACHE_STAMP_PATH / EQUITY_STATE_PATH ปิด (ไม่เขียน logs/ ของ bot จริง) — test ที่ต้องใช้ตั้ง path ใน tmp_path เอง
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ["BROKER_BACKEND"] = "SIM"
+os.environ["BROKER_CACHE_STAMP_PATH"] = ""
+os.environ["EQUITY_STATE_PATH"] = ""
+
+REFERENCE_CSV = os.path.join(ROOT, "data", "reference", "EURUSD_H1.csv")
+
+
+@pytest.fixture(scope="session")
+def reference_csv() -> str:
+    return REFERENCE_CSV
+
+
+@pytest.fixture(scope="session")
+def reference_bars() -> pd.DataFrame:
+    """OHLCV จริงจาก REFERENCE_CSV (time, Open, High, Low, Close, Volume) เรียงตามเวลา"""
+    df = pd.read_csv(REFERENCE_CSV, parse_dates=["time"])
+    return df.sort_values("time").reset_index(drop=True)
+
+
+@pytest.fixture
+def default_profile(monkeypatch):
+    """ไม่ใช้ AI profile จาก .env — threshold / RR / amplify = ค่า default"""
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "AI_PROFILE_PATH", "")
+    return settings
+
+
+@pytest.fixture
+def sim_broker(reference_bars):
+    """SimulatedMT5 ของ EURUSD จาก reference_bars (นาฬิกาอยู่ที่แท่ง 300) เป็น backend ของ core.broker.mt5"""
+    from core.broker import SimulatedMT5, set_broker
+
+    sim = SimulatedMT5(balance=10_000.0, spread_points=0.0)
+    sim.add_feed("EURUSD", reference_bars)
+    sim.start(300)
+    set_broker(sim)
+    yield sim
+    set_broker(None)
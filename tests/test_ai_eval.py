@@ -0,0 +1,36 @@
+# tests/test_ai_eval.py
+"""AIEvalCache: วันก่อนหน้าที่ writer ยัง flush ต่อท้ายต้องถูกอ่านใหม่ + cache วันมีขอบเขต"""
+
+import json
+
+from core.ai_eval import AIEvalCache
+from core.ai_logger import get_daily_log_path
+
+
+def _append_day(base_dir, day, closes):
+    with open(get_daily_log_path(day, base_dir=str(base_dir)), "a", encoding="utf-8") as f:
+        for close in closes:
+            row = {"symbol": "EURUSD", "timeframe": "M1", "close": close, "ai_prob_up": 0.6, "ai_prob_down": 0.4}
+            f.write(json.dumps(row) + "\n")
+
+
+def test_day_is_reread_when_writer_flushes_more_rows(tmp_path):
+    day = "2026-01-01"
+    cache = AIEvalCache(base_dir=str(tmp_path), min_refresh_sec=0.0)
+    _append_day(tmp_path, day, [1.0, 1.1, 1.2])
+    assert cache.evaluate([day], [1])[1]["all"]["samples"] == 2
+
+    # buffer ของเมื่อวานถูก flush ตามมาหลังขึ้นวันใหม่
+    _append_day(tmp_path, day, [1.1, 1.0])
+    result = cache.evaluate([day], [1])[1]["all"]
+    assert result["samples"] == 4
+    assert result["winrate"] == 0.5
+
+
+def test_closed_days_are_bounded(tmp_path):
+    days = [f"2026-01-{d:02d}" for d in range(1, 6)]
+    for day in days:
+        _append_day(tmp_path, day, [1.0, 1.1])
+    cache = AIEvalCache(base_dir=str(tmp_path), min_refresh_sec=0.0, max_days=3)
+    assert cache.evaluate(days, [1])[1]["all"]["samples"] == 5
+    assert list(cache._closed) == days[-3:]
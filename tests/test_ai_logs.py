@@ -0,0 +1,71 @@
+# tests/test_ai_logs.py
+"""load_ai_logs กรองด้วยเวลาแท่ง (ไฟล์ตั้งชื่อตามวัน UTC ตอนเขียน) + future return ของ eval_ai แยกตาม pair"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from core.ai_logger import compact_ai_logs, get_daily_log_path, load_ai_logs
+from scripts.eval_ai import add_future_return
+
+
+def _write_day(base_dir, day, rows):
+    with open(get_daily_log_path(day, base_dir=str(base_dir)), "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+def test_rows_near_midnight_are_found_in_adjacent_day_files(tmp_path):
+    # server time นำ UTC 3 ชั่วโมง: แท่ง 00:30 ของวันที่ 2 ถูกเขียนตอน 21:30 UTC ของวันที่ 1
+    _write_day(tmp_path, "2026-01-01", [{"time": "2026-01-01 23:00:00", "close": 1.0}, {"time": "2026-01-02 00:30:00", "close": 2.0}])
+    # server time ตามหลัง UTC: แท่ง 23:30 ของวันที่ 2 ถูกเขียนหลังเที่ยงคืน UTC ลงไฟล์วันที่ 3
+    _write_day(tmp_path, "2026-01-03", [{"time": "2026-01-02 23:30:00", "close": 3.0}, {"time": "2026-01-03 01:00:00", "close": 4.0}])
+
+    df = load_ai_logs(start="2026-01-02", end="2026-01-03", base_dir=str(tmp_path))
+    assert list(df["close"]) == [2.0, 3.0]
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_perf_rows_do_not_break_bar_times(tmp_path, compacted):
+    # perf row เปิดไฟล์วันใหม่ (fetch ล้มหลังเที่ยงคืน) / perf row กลางไฟล์ — รวมรูปแบบเก่าที่มี microsecond
+    _write_day(
+        tmp_path,
+        "2026-01-01",
+        [
+            {"record": "perf", "time": "2026-01-01 00:00:05.123456", "loops": 1},
+            {"time": "2026-01-01 01:00:00", "close": 1.0},
+            {"time": "2026-01-01 02:00:00", "close": 2.0},
+        ],
+    )
+    _write_day(
+        tmp_path,
+        "2026-01-02",
+        [
+            {"time": "2026-01-02 01:00:00", "close": 3.0},
+            {"record": "perf", "time": "2026-01-02 01:30:00", "loops": 2},
+            {"time": "2026-01-02 02:00:00", "close": 4.0},
+        ],
+    )
+    if compacted:
+        assert len(compact_ai_logs(base_dir=str(tmp_path))) == 2
+
+    df = load_ai_logs(start="2026-01-01", end="2026-01-03", base_dir=str(tmp_path))
+    assert df["time"].notna().all()
+    assert list(df["close"].dropna()) == [1.0, 2.0, 3.0, 4.0]
+    perf = df[df["record"] == "perf"]
+    assert list(perf["time"]) == [pd.Timestamp("2026-01-01 00:00:05.123456"), pd.Timestamp("2026-01-02 01:30:00")]
+
+
+def test_future_return_stays_within_each_pair():
+    df = pd.DataFrame(
+        {
+            "symbol": ["A", "B"] * 3,
+            "timeframe": ["M1"] * 6,
+            "close": [1.0, 100.0, 2.0, 200.0, 4.0, 400.0],
+        }
+    )
+    out = add_future_return(df, horizon=1)
+    assert list(out["future_close"].iloc[:4]) == [2.0, 200.0, 4.0, 400.0]
+    assert out["future_close"].iloc[4:].isna().all()
+    assert list(out["future_ret"].iloc[:2]) == [1.0, 1.0]
@@ -0,0 +1,61 @@
+# tests/test_ai_profile.py
+"""ค่าของ AI profile แยกต่อ AI_MODE + การรวมผล optimize ทีละ mode"""
+
+import json
+
+import pytest
+
+from core import ai_profile
+from core.ai_profile import DEFAULT_PROFILE, get_amplify_factor, get_mode_thresholds, lookup_rr
+from scripts.optimize import merge_profile
+
+TRENDING = {"trending": [[0.0, 3.0, 4.0]], "sideways": [[0.0, 1.0, 1.0]]}
+
+
+@pytest.fixture
+def profile_file(tmp_path, monkeypatch):
+    path = tmp_path / "ai_profile.json"
+    monkeypatch.setattr(ai_profile.settings, "AI_PROFILE_PATH", str(path))
+    monkeypatch.setattr(ai_profile.settings, "AI_AMPLIFY_FACTOR", 3.0)
+    monkeypatch.setattr(ai_profile, "_cache", (None, None, DEFAULT_PROFILE))
+
+    def write(profile):
+        path.write_text(json.dumps(profile), encoding="utf-8")
+        ai_profile._cache = (None, None, DEFAULT_PROFILE)
+        return path
+
+    return write
+
+
+def test_lookups_use_values_of_the_mode(profile_file):
+    profile_file(
+        {
+            "amplify_factor": 2.5,
+            "modes": {"SAFE": {"th_up": 0.7, "amplify_factor": 4.0, "rr_matrix": TRENDING}},
+        }
+    )
+    assert get_amplify_factor("SAFE") == 4.0
+    assert lookup_rr("trending", 0.9, mode="safe") == (3.0, 4.0)
+    assert get_mode_thresholds("SAFE")[0] == 0.7
+
+    # mode ที่ไม่มีค่าของตัวเอง → ค่าระดับบนของไฟล์ → default
+    assert get_amplify_factor("NORMAL") == 2.5
+    assert lookup_rr("trending", 0.9, mode="NORMAL") == (1.8, 2.5)
+
+
+def test_merge_keeps_other_modes():
+    previous = {
+        "amplify_factor": 2.0,
+        "modes": {"SAFE": {"th_up": 0.7, "amplify_factor": 4.0, "rr_matrix": TRENDING}},
+        "runs": {"SAFE": {"bars": 100}},
+    }
+    result = {
+        "version": 1,
+        "modes": {"NORMAL": {"th_up": 0.55, "amplify_factor": 3.0, "rr_matrix": TRENDING}},
+        "runs": {"NORMAL": {"bars": 200}},
+    }
+    merged = merge_profile(previous, result)
+    assert merged["modes"]["SAFE"]["amplify_factor"] == 4.0
+    assert merged["modes"]["NORMAL"]["amplify_factor"] == 3.0
+    assert set(merged["runs"]) == {"SAFE", "NORMAL"}
+    assert merged["amplify_factor"] == 2.0
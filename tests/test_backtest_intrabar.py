@@ -0,0 +1,31 @@
+# tests/test_backtest_intrabar.py
+"""_resolve_intrabar ทาง tick: BUY ปิดด้วย bid / SELL ปิดด้วย ask (แบบ SimulatedMT5._first_stop_hit)"""
+
+import numpy as np
+
+from core.tick_store import TICK_DTYPE
+from scripts.backtest import _resolve_intrabar
+
+
+def _ticks(rows):
+    return np.array([(float(t), bid, ask) for t, (bid, ask) in enumerate(rows)], dtype=TICK_DTYPE)
+
+
+def test_sell_uses_ask_for_both_levels():
+    # SELL sl=1.0020 tp=0.9980, spread 0.0010: bid ยังไม่ถึง SL แต่ ask ถึงแล้ว (ก่อน TP)
+    ticks = _ticks([(1.0000, 1.0010), (1.0012, 1.0022), (0.9975, 0.9985), (0.9965, 0.9975)])
+    price, reason, when, how = _resolve_intrabar(1.0, 1.0025, 0.9965, 0.997, "SELL", 1.0020, 0.9980, ticks)
+    assert (price, reason, when, how) == (1.0020, "sl", 1.0, "tick")
+
+
+def test_sell_tp_needs_ask_not_bid():
+    # bid แตะ TP ที่ tick 1 แต่ ask ยังไม่ถึง → TP จริงที่ tick 3 หลัง SL (ask) ที่ tick 2
+    ticks = _ticks([(1.0000, 1.0010), (0.9978, 0.9988), (1.0015, 1.0025), (0.9960, 0.9970)])
+    price, reason, when, how = _resolve_intrabar(1.0, 1.0025, 0.996, 0.997, "SELL", 1.0020, 0.9980, ticks)
+    assert (reason, when) == ("sl", 2.0)
+
+
+def test_buy_uses_bid():
+    ticks = _ticks([(1.0000, 1.0010), (0.9985, 0.9995), (1.0025, 1.0035), (0.9975, 0.9985)])
+    price, reason, when, how = _resolve_intrabar(1.0, 1.0025, 0.9975, 0.998, "BUY", 0.9980, 1.0020, ticks)
+    assert (price, reason, when, how) == (1.0020, "tp", 2.0, "tick")
@@ -0,0 +1,19 @@
+# tests/test_backtest_parity.py
+"""backtest_vectorized(exits="close") ต้องได้ไม้ชุดเดียวกับ backtest_loop() (scripts.backtest.check_parity)"""
+
+from core.ai_engine import ExtremeAIEngine
+from scripts.backtest import backtest_vectorized, check_parity
+
+# loop เป็น O(N²): 900 แท่ง ~20 วินาที
+PARITY_BARS = 900
+
+
+def test_check_parity_on_reference_dataset(default_profile, monkeypatch, reference_csv, reference_bars):
+    # amplify default (3.0) แทบไม่ผ่าน prob > 0.70 บนข้อมูลชุดนี้ → ขยายให้มีไม้ให้เทียบ
+    monkeypatch.setattr(default_profile, "AI_AMPLIFY_FACTOR", 6.0)
+
+    trades = backtest_vectorized(reference_bars.iloc[:PARITY_BARS], ExtremeAIEngine(), exits="close")
+    assert len(trades) >= 10
+    assert {t.side for t in trades} == {"BUY", "SELL"}
+
+    assert check_parity(reference_csv, bars=PARITY_BARS)
@@ -0,0 +1,87 @@
+# tests/test_bar_store.py
+"""BarStore.append เขียนในที่ / sync_bar_store ดึงต่อจากแท่งล่าสุดใน store โดยไม่มี gap"""
+
+import numpy as np
+import pytest
+
+from core import data_feed
+from core.bar_store import BAR_DTYPE, BarStore, get_bar_store
+from core.config import settings
+
+H1 = 3600
+
+
+def _bars(times, close):
+    out = np.zeros(len(times), dtype=BAR_DTYPE)
+    out["time"] = times
+    for name in ("open", "high", "low", "close"):
+        out[name] = close
+    return out
+
+
+def test_append_writes_in_place_without_truncating(tmp_path):
+    store = BarStore(str(tmp_path), "TEST", "M1")
+    store.append(_bars([60, 120, 180], 1.0))
+    view = store.read()  # memmap view ที่ reader ถืออยู่
+
+    # แท่งท้าย (ยังไม่ปิด) ถูก revise + แท่งใหม่ต่อท้าย
+    store.append(_bars([180, 240], 2.0))
+    assert list(view["close"]) == [1.0, 1.0, 2.0]
+    assert list(store.read()["time"]) == [60, 120, 180, 240]
+    assert list(store.read()["close"]) == [1.0, 1.0, 2.0, 2.0]
+
+    # records จบก่อนท้ายไฟล์ → merge (ไม่ทำให้แท่งหลังจากนั้นหาย)
+    store.append(_bars([120], 3.0))
+    assert list(store.read()["time"]) == [60, 120, 180, 240]
+    assert list(store.read()["close"]) == [1.0, 3.0, 2.0, 2.0]
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BAR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(data_feed, "_backfilled", {})
+    return tmp_path
+
+
+def _feed_times(sim):
+    feed = sim._feed("EURUSD")
+    return feed.times[: feed.bar_index(sim.time()) + 1]
+
+
+def test_sync_is_incremental_and_gap_free(sim_broker, store_dir):
+    assert data_feed.sync_bar_store("EURUSD", "H1", 200) == 200
+    store = get_bar_store("EURUSD", "H1")
+
+    sim_broker.sleep(5 * H1)
+    assert data_feed.sync_bar_store("EURUSD", "H1", 200) <= 6  # แท่งเดิมที่ยังไม่ปิด + แท่งใหม่
+
+    # bot หยุดไปนานกว่า min_bars แท่ง → ต้องได้ทุกแท่งที่ขาด
+    sim_broker.sleep(1500 * H1)
+    data_feed.sync_bar_store("EURUSD", "H1", 200)
+    times = store.read()["time"]
+    expected = _feed_times(sim_broker)
+    assert np.array_equal(times, expected[len(expected) - len(times) :])
+    assert times[0] == expected[300 - 200 + 1]
+
+
+def test_short_broker_history_is_backfilled_once(sim_broker, store_dir, monkeypatch):
+    calls = []
+    original = sim_broker.copy_rates_from_pos
+
+    def counting(symbol, tf, start, count):
+        calls.append(count)
+        return original(symbol, tf, start, count)
+
+    monkeypatch.setattr(sim_broker, "copy_rates_from_pos", counting)
+    for _ in range(3):
+        data_feed.sync_bar_store("EURUSD", "H1", 5000)
+    assert calls.count(5000) == 1
+
+
+def test_recent_ohlc_refuses_store_when_mt5_is_down(sim_broker, store_dir, monkeypatch):
+    monkeypatch.setattr(settings, "BAR_STORE_ENABLED", True)
+    monkeypatch.setattr(sim_broker, "simulated", False)
+    assert len(data_feed.get_recent_ohlc("EURUSD", "H1", 100)) == 100
+
+    monkeypatch.setattr(sim_broker, "copy_rates_range", lambda *a, **k: None)
+    assert data_feed.get_recent_ohlc("EURUSD", "H1", 100) is None
@@ -0,0 +1,37 @@
+# tests/test_batch_scoring.py
+"""แบบ batch ต้องได้ค่าเดียวกับแบบ scalar ทุกแถว: แถว k = scalar(df.iloc[: k + 1])"""
+
+import numpy as np
+import pytest
+
+from core.indicators import add_all_indicators
+from core.regime import detect_regime, detect_regime_batch
+from core.rule_based import compute_rule_based_prob, compute_rule_based_prob_batch, decode_reasons
+
+ROWS = 1500
+
+
+@pytest.fixture(scope="module")
+def indicator_frame(reference_bars):
+    return add_all_indicators(reference_bars.iloc[:ROWS])
+
+
+def test_rule_based_batch_matches_scalar(indicator_frame):
+    df = indicator_frame
+    batch = compute_rule_based_prob_batch(df, with_reasons=True)
+    for k in range(len(df)):
+        scalar = compute_rule_based_prob(df.iloc[: k + 1])
+        # บวกคะแนนลำดับเดียวกัน → เท่ากันระดับ bit
+        assert batch["prob_up"][k] == scalar["prob_up"], k
+        assert batch["prob_down"][k] == scalar["prob_down"], k
+        assert decode_reasons(batch["reason_mask"][k], df.iloc[k]) == scalar["reasons"], k
+
+
+def test_regime_batch_matches_scalar(indicator_frame):
+    df = indicator_frame
+    batch = detect_regime_batch(df)
+    scalar = np.array([detect_regime(df.iloc[: k + 1]) for k in range(len(df))])
+    mismatch = np.flatnonzero(batch != scalar)
+    assert mismatch.size == 0, f"first mismatch at row {mismatch[:1]}: {batch[mismatch[:1]]} != {scalar[mismatch[:1]]}"
+    # ข้อมูลจริงต้องผ่านหลาย regime ไม่งั้น test นี้ไม่ได้ตรวจอะไร
+    assert len(set(scalar)) >= 4
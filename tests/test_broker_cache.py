@@ -0,0 +1,70 @@
+# tests/test_broker_cache.py
+"""BrokerStateCache: invalidate ระหว่าง refresh ไม่ให้ snapshot เก่าค้าง + ออเดอร์จาก process อื่น (stamp file)"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.broker import set_broker
+from core.broker_cache import BrokerStateCache
+
+
+class _Backend:
+    def __init__(self):
+        self.positions = []
+        self.calls = 0
+        self.during_fetch = None
+
+    def time(self):
+        return 1_000.0  # นาฬิกาหยุด → TTL ไม่หมดเอง
+
+    def positions_get(self):
+        self.calls += 1
+        snapshot = list(self.positions)
+        if self.during_fetch:
+            self.during_fetch()
+            self.during_fetch = None
+        return snapshot
+
+
+def _pos(symbol="EURUSD", comment="ExtremeAI v4"):
+    return SimpleNamespace(symbol=symbol, comment=comment)
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "BROKER_STATE_TTL_SEC", 60.0)
+    monkeypatch.setattr(settings, "BROKER_CACHE_STAMP_PATH", str(tmp_path / "broker_cache.stamp"))
+    fake = _Backend()
+    set_broker(fake)
+    yield fake
+    set_broker(None)
+
+
+def test_invalidate_during_refresh_drops_the_snapshot(backend):
+    cache = BrokerStateCache()
+
+    def order_filled():
+        backend.positions.append(_pos())
+        cache.invalidate()
+
+    # ออเดอร์ fill ระหว่างที่ positions_get (snapshot ก่อนออเดอร์) กำลังรอ terminal
+    backend.during_fetch = order_filled
+    assert cache.open_positions("EURUSD") == 0
+    assert cache.open_positions("EURUSD") == 1
+    assert backend.calls == 2
+
+
+def test_invalidate_in_another_process_clears_the_cache(backend):
+    main_cache, dashboard_cache = BrokerStateCache(), BrokerStateCache()
+    assert main_cache.open_positions("EURUSD") == 0
+    assert main_cache.open_positions("EURUSD") == 0
+    assert backend.calls == 1
+
+    backend.positions.append(_pos())
+    dashboard_cache.invalidate()  # dashboard ส่งออเดอร์ (process แยก → แตะแค่ stamp file)
+    assert main_cache.open_positions("EURUSD") == 1
+    assert main_cache.open_positions("EURUSD") == 1
+    assert backend.calls == 2
@@ -0,0 +1,51 @@
+# tests/test_equity_tracker.py
+"""circuit breaker: peak / equity ต้นวัน / breaker ที่ทำงานแล้วอยู่ใน EQUITY_STATE_PATH (restart + dashboard ใช้ร่วม)"""
+
+import pytest
+
+from core.config import settings
+from core.equity_tracker import EquityTracker
+
+MONDAY = 1_700_438_400.0  # 2023-11-20 00:00 (เวลาโบรก)
+
+
+@pytest.fixture
+def state_path(monkeypatch, tmp_path):
+    path = str(tmp_path / "equity_state.json")
+    for name, value in (
+        ("EQUITY_STATE_PATH", path),
+        ("INITIAL_BALANCE", 0.0),
+        ("MAX_DAILY_LOSS_PCT", 0.05),
+        ("MAX_WEEKLY_LOSS_PCT", 0.0),
+        ("MAX_DRAWDOWN_PCT", 0.0),
+        ("MAX_CONSECUTIVE_LOSSES", 0),
+    ):
+        monkeypatch.setattr(settings, name, value)
+    return path
+
+
+def test_restart_keeps_daily_breaker_and_peak(state_path):
+    before = EquityTracker(16)
+    before.record(MONDAY + 3600, 10_000.0, 10_000.0)
+    before.record(MONDAY + 7200, 9_400.0, 9_400.0)
+    assert before.halt_reason().startswith("daily loss")
+
+    # restart กลางวัน: equity เด้งกลับ 9,600 (-4% จากต้นวัน) แต่ breaker ของวันนี้ทำงานไปแล้ว
+    after = EquityTracker(16)
+    after.record(MONDAY + 7260, 9_600.0, 9_600.0)
+    assert after.peak == 10_000.0
+    assert after.halt_reason().startswith("daily loss")
+
+    # วันใหม่ = baseline ใหม่ ปลด breaker
+    after.record(MONDAY + 86400 + 60, 9_600.0, 9_600.0)
+    assert after.halt_reason() is None
+
+
+def test_dashboard_tracker_sees_breaker_tripped_by_loop(state_path):
+    loop, dashboard = EquityTracker(16), EquityTracker(16)
+    dashboard.record(MONDAY + 3600, 10_000.0, 10_000.0)
+    loop.record(MONDAY + 3600, 10_000.0, 10_000.0)
+    loop.record(MONDAY + 7200, 9_400.0, 9_400.0)
+
+    dashboard.record(MONDAY + 7300, 9_800.0, 9_800.0)
+    assert dashboard.halt_reason().startswith("daily loss")
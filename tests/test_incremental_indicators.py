@@ -0,0 +1,51 @@
+# tests/test_incremental_indicators.py
+"""IncrementalIndicatorEngine ต้องได้ค่าเดียวกับ add_all_indicators() บน history เดียวกัน"""
+
+import numpy as np
+import pandas as pd
+
+from core.incremental_indicators import COLUMNS, INDICATOR_COLUMNS, IncrementalIndicatorEngine
+from core.indicators import add_all_indicators
+
+# วัดบน data/reference ได้ต่างสูงสุด ~1.25e-9 (BB_PCT_B: ผลรวม rolling ต่างลำดับการบวก)
+TOLERANCE = 1e-8
+
+
+def _assert_same(out: pd.DataFrame, ref: pd.DataFrame) -> None:
+    ref = ref.reset_index(drop=True)[COLUMNS]
+    out = out.reset_index(drop=True)
+    assert list(out.columns) == COLUMNS
+    assert len(out) == len(ref)
+    assert (out["time"].to_numpy() == ref["time"].to_numpy()).all()
+    diff = np.abs(out[INDICATOR_COLUMNS].to_numpy(dtype=np.float64) - ref[INDICATOR_COLUMNS].to_numpy(dtype=np.float64))
+    worst = INDICATOR_COLUMNS[int(diff.max(axis=0).argmax())]
+    assert diff.max() <= TOLERANCE, f"{worst}: {diff.max():.3e}"
+
+
+def test_full_history_matches_add_all_indicators(reference_bars):
+    engine = IncrementalIndicatorEngine(max_rows=len(reference_bars))
+    out = engine.update_frame(reference_bars)
+    _assert_same(out, add_all_indicators(reference_bars))
+
+
+def test_chunked_feed_with_revised_bars(reference_bars):
+    """ป้อนทีละก้อนแบบ live loop: แท่งสุดท้ายของทุกก้อนยังไม่ปิด (ค่าแรก = Open) แล้วถูก revise ในก้อนถัดไป"""
+    bars = reference_bars.iloc[:1500]
+    engine = IncrementalIndicatorEngine(max_rows=300)
+    for end in range(100, len(bars) + 1, 37):
+        chunk = bars.iloc[max(end - 60, 0) : end].copy()
+        forming = chunk.index[-1]
+        chunk.loc[forming, ["High", "Low", "Close"]] = chunk.loc[forming, "Open"]
+        engine.update_frame(chunk)
+    out = engine.update_frame(bars.iloc[-60:])
+    _assert_same(out, add_all_indicators(bars).iloc[-300:])
+
+
+def test_last_row_matches_update(reference_bars):
+    engine = IncrementalIndicatorEngine(max_rows=50)
+    row = None
+    for bar in reference_bars.iloc[:400].itertuples(index=False):
+        row = engine.update(tuple(bar))
+    assert row is not None
+    assert row == engine.last_row()
+    assert engine.bars_seen == 400
@@ -0,0 +1,189 @@
+# tests/test_llm_advisor.py
+"""
+LLMAdvisor กับ stub server ในเครื่อง (http.server ใน thread) ผ่าน OPENAI_BASE_URL
+- ถามพร้อมกัน: provider ที่ช้าเกิน LLM_TIMEOUT_SEC ได้ vote ตาม LLM_FALLBACK_DECISION, รอรวมไม่เกิน budget
+- snapshot เดิม (quantize แล้ว) = cache hit ไม่ยิง stub / หมดอายุ = ถามใหม่ / error ไม่ถูก cache
+
+Gemini: google-generativeai ไม่ใช่ dependency ของ test → model ที่ยิง HTTP ไป stub เดียวกัน (path /gemini)
+"""
+
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import core.llm_advisor as llm_advisor
+from core.config import settings
+
+TIMEOUT = 0.5
+SNAPSHOT = {
+    "symbol": "XAUUSD",
+    "price": 2000.00,
+    "atr": 2.0,
+    "rsi": 61.0,
+    "stoch_k": 72.0,
+    "bb_pct_b": 0.74,
+    "ema_trend": 2,
+    "regime": "trending",
+    "ai_direction": "UP",
+}
+
+
+class _Stub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        # path → (delay วินาที, HTTP status, คำแนะนำ)
+        self.routes = {}
+        self.hits = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = "/gemini" if self.path == "/gemini" else "/openai"
+        delay, status, vote = self.server.routes[path]
+        self.server.hits[path] = self.server.hits.get(path, 0) + 1
+        time.sleep(delay)
+        content = json.dumps({"recommendation": vote[0], "confidence": vote[1], "reasoning": "stub"})
+        if path == "/openai":
+            body = {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": settings.OPENAI_MODEL,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            }
+        else:
+            body = {"text": content}
+        payload = json.dumps(body if status == 200 else {"error": {"message": "stub error"}}).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # client ตัดสายไปแล้ว (timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubGemini:
+    """แทน GenerativeModel: generate_content → POST ไป stub แล้วคืน object ที่มี .text"""
+
+    def __init__(self, url):
+        self.url = url
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        request = urllib.request.Request(self.url, data=json.dumps({"prompt": prompt}).encode(), method="POST")
+        with urllib.request.urlopen(request, timeout=request_options["timeout"]) as r:
+            return SimpleNamespace(text=json.loads(r.read())["text"])
+
+
+@pytest.fixture
+def stub():
+    server = _Stub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_advisor(stub, monkeypatch):
+    url = f"http://127.0.0.1:{stub.server_address[1]}"
+    advisors = []
+
+    def make(gemini=False, fallback="HOLD"):
+        for name, value in (
+            ("LLM_ADVISOR_ENABLED", True),
+            ("OPENAI_API_KEY", "test"),
+            ("OPENAI_BASE_URL", url + "/v1"),
+            ("GEMINI_API_KEY", "test" if gemini else ""),
+            ("LLM_TIMEOUT_SEC", TIMEOUT),
+            ("LLM_FALLBACK_DECISION", fallback),
+            ("LLM_CACHE_TTL_SEC", 60),
+        ):
+            monkeypatch.setattr(settings, name, value)
+        monkeypatch.setattr(llm_advisor, "_make_gemini_model", lambda: _StubGemini(url + "/gemini"))
+        advisor = llm_advisor.LLMAdvisor()
+        advisors.append(advisor)
+        return advisor
+
+    yield make
+    for advisor in advisors:
+        advisor._executor.shutdown(wait=False)
+
+
+@pytest.mark.parametrize(
+    "fallback, gpt_vote, consensus_confidence",
+    [("HOLD", "HOLD", 0.8 * 0.8), ("AGREE", "BUY", (0.5 + 0.8) / 2), ("SKIP", None, 0.8)],
+)
+def test_slow_provider_gets_fallback_vote_within_budget(stub, make_advisor, fallback, gpt_vote, consensus_confidence):
+    pytest.importorskip("openai")
+    stub.routes = {"/openai": (3 * TIMEOUT, 200, ("SELL", 0.9)), "/gemini": (0.0, 200, ("BUY", 0.8))}
+    advisor = make_advisor(gemini=True, fallback=fallback)
+
+    started = time.perf_counter()
+    result = advisor.analyze_signal(SNAPSHOT, "BUY")
+    assert time.perf_counter() - started < 2 * TIMEOUT  # stub ตอบช้า 3 × TIMEOUT
+
+    assert result["gpt_recommendation"] == gpt_vote
+    assert "gpt_error" in result
+    assert result["gemini_recommendation"] == "BUY"
+    assert result["consensus"] == "BUY"
+    assert result["consensus_confidence"] == pytest.approx(consensus_confidence)
+    # ผลที่มี timeout ไม่ถูก cache → ถามใหม่
+    assert advisor.analyze_signal(SNAPSHOT, "BUY")["llm_cached"] is False
+    assert stub.hits == {"/openai": 2, "/gemini": 2}
+
+
+def test_same_snapshot_is_served_from_cache_until_expiry(stub, make_advisor):
+    pytest.importorskip("openai")
+    stub.routes = {"/openai": (0.0, 200, ("BUY", 0.8))}
+    advisor = make_advisor()
+
+    first = advisor.analyze_signal(SNAPSHOT, "BUY")
+    assert first["consensus"] == "BUY" and first["llm_cached"] is False
+
+    # ราคาขยับไม่ถึง 0.25 ATR → snapshot เดียวกัน
+    second = advisor.analyze_signal({**SNAPSHOT, "price": 2000.10}, "BUY")
+    assert second["llm_cached"] is True
+    assert second["consensus"] == "BUY"
+    assert stub.hits == {"/openai": 1}
+
+    # อีกฝั่ง = key ใหม่
+    assert advisor.analyze_signal(SNAPSHOT, "SELL")["llm_cached"] is False
+    assert stub.hits == {"/openai": 2}
+
+    # หมดอายุ → ถามใหม่
+    for key, (ts, result) in list(advisor._cache.items()):
+        advisor._cache[key] = (ts - settings.LLM_CACHE_TTL_SEC - 1, result)
+    assert advisor.analyze_signal(SNAPSHOT, "BUY")["llm_cached"] is False
+    assert stub.hits == {"/openai": 3}
+
+
+def test_error_response_is_not_cached(stub, make_advisor):
+    pytest.importorskip("openai")
+    stub.routes = {"/openai": (0.0, 500, ("BUY", 0.8))}
+    advisor = make_advisor()
+
+    result = advisor.analyze_signal(SNAPSHOT, "BUY")
+    assert "gpt_error" in result
+    assert result["consensus"] == "HOLD"
+    assert advisor.analyze_signal(SNAPSHOT, "BUY")["llm_cached"] is False
+    assert stub.hits == {"/openai": 2}
+
+    # stub กลับมาปกติ → ผลแรกที่ไม่ error ถึงถูก cache
+    stub.routes["/openai"] = (0.0, 200, ("BUY", 0.8))
+    assert advisor.analyze_signal(SNAPSHOT, "BUY")["consensus"] == "BUY"
+    assert advisor.analyze_signal(SNAPSHOT, "BUY")["llm_cached"] is True
+    assert stub.hits == {"/openai": 3}
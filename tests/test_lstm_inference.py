@@ -0,0 +1,113 @@
+# tests/test_lstm_inference.py
+"""
+inference path ของ LSTM ต้องได้ค่าเดียวกับ ExtremeLSTM.predict_prob() (ทีละ window แบบเดิม)
+- predict_prob_batch / FrozenLSTMInference (TorchScript, batch buffer)
+- StreamingLSTMInference (state ต่อ key, revise แท่งที่ยังไม่ปิด, resync ทุก resync_every แท่ง)
+"""
+
+import numpy as np
+import pytest
+import torch
+
+from core.indicators import add_all_indicators
+from core.lstm_model import FEATURE_COLUMNS, ExtremeLSTM, FrozenLSTMInference, StreamingLSTMInference
+
+ROWS = 800
+# forward แบบ batch ต่างจากทีละ window ได้ระดับ float32 rounding (วัดได้ ~1.3e-7)
+BATCH_TOLERANCE = 1e-6
+
+
+@pytest.fixture(scope="module")
+def lstm(frame):
+    """weight สุ่ม seed คงที่ (×4 ให้ prob กระจาย ~0.17-0.80) + normalization stats จากข้อมูลจริง"""
+    torch.manual_seed(7)
+    model = ExtremeLSTM(device="cpu")
+    with torch.no_grad():
+        for p in model.model.parameters():
+            p.mul_(4.0)
+    feats = frame[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+    model.norm_mean = feats.mean(axis=0)
+    model.norm_std = feats.std(axis=0)
+    return model
+
+
+@pytest.fixture(scope="module")
+def frame(reference_bars):
+    return add_all_indicators(reference_bars.iloc[:ROWS]).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def expected(lstm, frame):
+    out = np.full(len(frame), np.nan)
+    for k in range(len(frame)):
+        p = lstm.predict_prob(frame.iloc[: k + 1])
+        if p is not None:
+            out[k] = p
+    assert np.nanstd(out) > 0.05  # model ไม่ได้ตอบ 0.5 ตลอด
+    return out
+
+
+def test_predict_prob_batch_matches_predict_prob(lstm, frame, expected):
+    batch = lstm.predict_prob_batch(frame, batch_size=128)
+    assert np.array_equal(np.isnan(batch), np.isnan(expected))
+    assert np.nanmax(np.abs(batch - expected)) <= BATCH_TOLERANCE
+
+
+def test_frozen_single_window_matches_predict_prob(lstm, frame, expected):
+    frozen = FrozenLSTMInference(lstm, max_batch=16)
+    for k in range(0, len(frame), 7):
+        p = frozen.predict_prob(frame.iloc[: k + 1])
+        if np.isnan(expected[k]):
+            assert p is None
+        else:
+            assert abs(p - expected[k]) <= BATCH_TOLERANCE, k
+
+
+def test_frozen_batch_larger_than_buffer(lstm, frame, expected):
+    frozen = FrozenLSTMInference(lstm, max_batch=16)
+    rows = list(range(100, 150))  # 50 window → 4 forward ของ buffer 16 แถว
+    probs = frozen.predict_windows(np.stack([frozen.window(frame.iloc[: k + 1]) for k in rows]))
+    assert np.max(np.abs(probs - expected[rows])) <= BATCH_TOLERANCE
+
+    # หลาย frame ใน forward เดียว — frame ที่ history ไม่พอได้ None
+    frames = [frame.iloc[:10], frame.iloc[:300], frame.iloc[:301]]
+    result = frozen.predict_frames(frames)
+    assert result[0] is None
+    assert abs(result[1] - expected[299]) <= BATCH_TOLERANCE
+    assert abs(result[2] - expected[300]) <= BATCH_TOLERANCE
+
+
+def test_streaming_resyncs_to_full_window(lstm, frame, expected):
+    resync = 20
+    stream = StreamingLSTMInference(lstm, resync_every=resync)
+    first = 61
+    for k in range(first, 200):
+        p = stream.update("EURUSD", frame.iloc[: k + 1])
+        if (k - first) % resync == 0:
+            # เริ่มต้น / ครบรอบ resync → window เต็ม = predict_prob() พอดี
+            assert abs(p - expected[k]) <= BATCH_TOLERANCE, k
+        else:
+            assert 0.0 < p < 1.0
+    assert stream.last_drift["EURUSD"] < 0.1
+
+
+def test_streaming_revise_matches_closed_bar(lstm, frame):
+    closed = StreamingLSTMInference(lstm, resync_every=1000)
+    revised = StreamingLSTMInference(lstm, resync_every=1000)
+    for k in range(100, 160):
+        # revised เห็นแท่ง k ตอนยังไม่ปิด (ค่า feature ของแท่งก่อนหน้า) ก่อนแล้วค่อยเห็นค่าสุดท้าย
+        forming = frame.iloc[: k + 1].copy()
+        forming.loc[k, FEATURE_COLUMNS] = frame.loc[k - 1, FEATURE_COLUMNS].to_numpy()
+        revised.update("k", forming)
+        a = revised.update("k", frame.iloc[: k + 1])
+        b = closed.update("k", frame.iloc[: k + 1])
+        # แท่งแรก: revised = numpy step, closed = window เต็มของ torch → ต่างระดับ float32 เท่านั้น
+        assert abs(a - b) <= BATCH_TOLERANCE, k
+
+
+def test_streaming_step_matches_torch_cell(lstm, frame, expected):
+    """revise แท่งเดิมด้วยค่าเดิม = 1 step ของ numpy cell จาก state ก่อนแท่งนั้น → ต้องเท่ากับ torch"""
+    stream = StreamingLSTMInference(lstm, resync_every=1000)
+    df = frame.iloc[:400]
+    stream.update("k", df)  # window เต็ม (torch)
+    assert abs(stream.update("k", df) - expected[399]) <= BATCH_TOLERANCE
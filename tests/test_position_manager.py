@@ -0,0 +1,91 @@
+# tests/test_position_manager.py
+"""partial TP: risk จาก SL ตอนเปิด (journal), ส่งไม่ผ่าน = ลองใหม่, สำเร็จแล้วไม่ปิดซ้ำแม้ restart"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import core.position_manager as pm
+from core.broker import SimulatedMT5, set_broker
+from core.config import settings
+from core.trade_logger import TradeJournal
+
+TICKET = 7
+
+
+class _Backend(SimulatedMT5):
+    def __init__(self):
+        super().__init__()
+        self.retcodes = []
+        self.sent = []
+        self.position = SimpleNamespace(
+            ticket=TICKET,
+            symbol="EURUSD",
+            type=self.POSITION_TYPE_BUY,
+            magic=settings.MT5_MAGIC_NUMBER,
+            price_open=1.1000,
+            sl=1.1000,  # ถูกเลื่อนไป breakeven แล้ว
+            tp=1.1300,
+            volume=0.2,
+            comment="ExtremeAI v4",
+        )
+        self.info = SimpleNamespace(
+            point=0.00001, digits=5, trade_stops_level=0, volume_step=0.01, volume_min=0.01, filling_mode=1
+        )
+
+    def time(self):
+        return 1_000.0
+
+    def positions_get(self, *args, **kwargs):
+        return (self.position,)
+
+    def symbol_info(self, symbol):
+        return self.info
+
+    def symbol_info_tick(self, symbol):
+        return SimpleNamespace(bid=1.1105, ask=1.1106)  # กำไร 1.05R ของ SL ตอนเปิด (1.0900)
+
+    def order_send(self, request):
+        self.sent.append(request)
+        return SimpleNamespace(retcode=self.retcodes.pop(0))
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    for name, value in (("BREAKEVEN_ATR_MULT", 0.0), ("TRAIL_ATR_MULT", 0.0), ("PARTIAL_TP_R", 1.0), ("PARTIAL_TP_FRACTION", 0.5)):
+        monkeypatch.setattr(settings, name, value)
+    fake = _Backend()
+    set_broker(fake)
+    journal = TradeJournal(str(tmp_path / "trades_log.jsonl"))
+    journal.record_fill(
+        {
+            "result": {"order": TICKET, "volume": 0.2},
+            "side": "BUY",
+            "symbol": "EURUSD",
+            "price": 1.1000,
+            "volume": 0.2,
+            "sl": 1.0900,
+            "tp": 1.1300,
+            "time": 900.0,
+        }
+    )
+    monkeypatch.setattr(pm, "trade_journal", journal)
+    yield fake
+    set_broker(None)
+
+
+def test_partial_retries_until_done_and_is_not_repeated(backend, monkeypatch, tmp_path):
+    manager = pm.PositionManager()
+    backend.retcodes = [10006, 10009]  # REJECT แล้ว DONE
+
+    assert manager.run(force=True)["failed"] == 1
+    assert manager.run(force=True)["failed"] == 0
+    assert [r["volume"] for r in backend.sent] == [0.1, 0.1]
+    assert manager.run(force=True)["partial"] == 0
+    assert len(backend.sent) == 2
+
+    # restart: journal ใหม่จากไฟล์เดิม + position manager ใหม่ → ไม่ปิดบางส่วนซ้ำ
+    monkeypatch.setattr(pm, "trade_journal", TradeJournal(str(tmp_path / "trades_log.jsonl")))
+    assert pm.trade_journal.get(TICKET)["partial"] == 0.1
+    assert pm.PositionManager().run(force=True)["partial"] == 0
+    assert len(backend.sent) == 2
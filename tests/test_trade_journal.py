@@ -0,0 +1,100 @@
+# tests/test_trade_journal.py
+"""journal: เวลาทุกตัวเป็นนาฬิกาโบรก (deal.time) + อ่าน event ที่ process อื่นต่อท้ายไฟล์ก่อน reconcile"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from core.broker import SimulatedMT5, set_broker
+from core.trade_logger import TradeJournal
+
+TICKET = 11
+UTC_NOW = 1_000_000.0
+OFFSET = 7200.0  # server = UTC+2
+
+
+class _Backend(SimulatedMT5):
+    def __init__(self):
+        super().__init__()
+        self.deals = []
+        self.windows = []
+
+    def time(self):
+        return UTC_NOW
+
+    def server_offset(self):
+        return OFFSET
+
+    def server_time(self):
+        return UTC_NOW + OFFSET
+
+    def history_deals_get(self, date_from, date_to):
+        self.windows.append((date_from.timestamp(), date_to.timestamp()))
+        return tuple(self.deals)
+
+
+def _deal(entry, time_, price, profit=0.0):
+    return SimpleNamespace(
+        position_id=TICKET, entry=entry, time=time_, price=price, volume=0.2, profit=profit, reason=4
+    )
+
+
+def _fill(journal):
+    journal.record_fill(
+        {
+            "result": {"order": TICKET, "volume": 0.2},
+            "side": "BUY",
+            "symbol": "EURUSD",
+            "price": 1.1000,
+            "volume": 0.2,
+            "sl": 1.0900,
+            "tp": 1.1300,
+            "time": UTC_NOW,  # order_gateway: get_broker().time()
+        }
+    )
+
+
+@pytest.fixture
+def backend():
+    fake = _Backend()
+    set_broker(fake)
+    yield fake
+    set_broker(None)
+
+
+def test_reconciles_fill_written_by_another_process(backend, tmp_path):
+    path = str(tmp_path / "trades_log.jsonl")
+    main = TradeJournal(path)
+    closed = []
+    main.subscribe(closed.append)  # โหลดไฟล์ (ยังว่าง) ก่อน dashboard เขียน
+
+    dashboard = TradeJournal(path)
+    _fill(dashboard)
+    dashboard.close()
+
+    opened = UTC_NOW + OFFSET
+    backend.deals = [
+        _deal(backend.DEAL_ENTRY_IN, opened, 1.1000),
+        _deal(backend.DEAL_ENTRY_OUT, opened + 600, 1.1100, profit=200.0),
+    ]
+    assert main.reconcile() == 1
+
+    trade = main.get(TICKET)
+    assert trade["open_time"] == opened
+    assert trade["duration_sec"] == 600.0
+    start, end = backend.windows[0]
+    assert start <= opened <= end and end >= UTC_NOW + OFFSET + 86400
+    assert [t["ticket"] for t in closed] == [TICKET]
+
+    # dashboard เห็นผลปิดของ main ผ่านไฟล์เดียวกัน
+    assert TradeJournal(path).stats()["closed"] == 1
+
+
+def test_partial_event_is_applied_once(backend, tmp_path):
+    path = str(tmp_path / "trades_log.jsonl")
+    journal = TradeJournal(path)
+    _fill(journal)
+    journal.record_partial(TICKET, 0.1, backend.server_time())
+    journal.stats()  # อ่านบรรทัด partial ของตัวเองกลับมา
+    assert journal.get(TICKET)["partial"] == 0.1
+    assert TradeJournal(path).get(TICKET)["partial"] == 0.1